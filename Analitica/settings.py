@@ -234,6 +234,9 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get('DATA_UPLOAD_MAX_MEMORY_SIZE',
 
 # Email backend configuration: prefer Resend HTTPS API if API key provided; fallback to SMTP
 RESEND_API_KEY = os.environ.get('RESEND_API_KEY', '')
+RESEND_API_URL = os.environ.get('RESEND_API_URL', '')  # optional override of https://api.resend.com/emails
+# Parallel requests for emails the batch endpoint cannot take (attachments)
+RESEND_MAX_CONCURRENCY = int(os.environ.get('RESEND_MAX_CONCURRENCY', '4'))
 if RESEND_API_KEY:
     EMAIL_BACKEND = 'core.email_backends.ResendEmailBackend'
 else:
@@ -267,9 +270,15 @@ DEFAULT_SMS_COUNTRY_CODE = os.environ.get('DEFAULT_SMS_COUNTRY_CODE', '254')
 
 # Timetable notifications debounce window (seconds)
 TIMETABLE_NOTIFY_COOLDOWN = int(os.environ.get('TIMETABLE_NOTIFY_COOLDOWN', '120'))
+# Timetable generation: seeded restarts, and worker processes (0 = one per CPU) used by the
+# generate_timetable management command; web requests always search in-process
+TIMETABLE_RESTARTS = int(os.environ.get('TIMETABLE_RESTARTS', '8'))
+TIMETABLE_WORKERS = int(os.environ.get('TIMETABLE_WORKERS', '0'))
 
 # M-Pesa (Daraja) configuration
 MPESA_ENVIRONMENT = os.environ.get('MPESA_ENVIRONMENT', 'sandbox')  # 'sandbox' or 'production'
+# Optional: Daraja host override (e.g. a local stub server); defaults to the environment's Safaricom host
+MPESA_API_BASE_URL = os.environ.get('MPESA_API_BASE_URL', '')
 # Use provided env vars if set; otherwise fall back to values present in core/settings.py
 MPESA_CONSUMER_KEY = os.environ.get('MPESA_CONSUMER_KEY', 'EXGFqWiPKTmwUrCGfKmHbUzj43Ikge7ekz5GVSbdzAk37L0j')
 MPESA_CONSUMER_SECRET = os.environ.get('MPESA_CONSUMER_SECRET', 'lOjIKLlnhiHXxFRDkfkv9m8pm80ZJhNGQpcuuq3ktdyx9GAKk8pP8Aw4VlLRVnU1')
@@ -301,6 +310,10 @@ MPESA_ALLOWED_SHORTCODES = os.environ.get('MPESA_ALLOWED_SHORTCODES', '600000,17
 MPESA_CALLBACK_SECRET = os.environ.get('MPESA_CALLBACK_SECRET', '')
 # Auto-approve successful callbacks without waiting for STK Query (can be disabled via env)
 MPESA_AUTO_APPROVE_ON_CALLBACK = os.environ.get('MPESA_AUTO_APPROVE_ON_CALLBACK', 'true').lower() == 'true'
+# Callback journal (JSON Lines, append-only). Rotates by size or day; old segments gzipped.
+MPESA_CALLBACK_JOURNAL_DIR = os.environ.get('MPESA_CALLBACK_JOURNAL_DIR', str(BASE_DIR / 'logs' / 'mpesa_callbacks'))
+MPESA_CALLBACK_JOURNAL_MAX_BYTES = int(os.environ.get('MPESA_CALLBACK_JOURNAL_MAX_BYTES', str(5 * 1024 * 1024)))
+MPESA_CALLBACK_JOURNAL_GZIP = os.environ.get('MPESA_CALLBACK_JOURNAL_GZIP', 'true').lower() == 'true'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -338,9 +351,13 @@ ROLE_SESSION_LIMITS = {
 
 
 # --- Caching ---
-# Use a persistent, file-based cache to ensure features that depend on cache
-# (e.g., debounce locks in `core/signals.py`) work across server reloads.
-# No external services required (works in dev and small deployments).
+# Two tiers: a small per-process LRU (core.cache_backends.TieredCache) in front
+# of a shared backend that all workers see. The shared tier is Redis when
+# DJANGO_CACHE_REDIS_URL is set; otherwise the persistent file cache (or the
+# database cache table with DJANGO_CACHE_SHARED=db, after `createcachetable`).
+# Features that depend on cross-process state (e.g., debounce locks in
+# `core/signals.py`) keep working across server reloads with any shared tier.
+# Set DJANGO_CACHE_TIERED=false to talk to the shared backend directly.
 CACHE_DIR = BASE_DIR / 'cache'
 try:
     os.makedirs(CACHE_DIR, exist_ok=True)
@@ -349,17 +366,61 @@ except Exception:
     # using FileBasedCache. We keep this guard to avoid breaking imports.
     pass
 
-CACHES = {
-    'default': {
+CACHE_TIMEOUT = int(os.environ.get('DJANGO_CACHE_TIMEOUT', '600'))  # seconds
+CACHE_KEY_PREFIX = os.environ.get('DJANGO_CACHE_KEY_PREFIX', 'analitica')
+CACHE_REDIS_URL = os.environ.get('DJANGO_CACHE_REDIS_URL', '')
+
+if CACHE_REDIS_URL:
+    _shared_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_REDIS_URL,
+    }
+elif os.environ.get('DJANGO_CACHE_SHARED', 'file').lower() == 'db':
+    _shared_cache = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('DJANGO_CACHE_TABLE', 'django_cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', '10000')),
+        },
+    }
+else:
+    _shared_cache = {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': CACHE_DIR,
-        'TIMEOUT': int(os.environ.get('DJANGO_CACHE_TIMEOUT', '600')),  # seconds
-        'KEY_PREFIX': os.environ.get('DJANGO_CACHE_KEY_PREFIX', 'analitica'),
         'OPTIONS': {
             'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', '10000')),
         },
     }
-}
+_shared_cache.update({'TIMEOUT': CACHE_TIMEOUT, 'KEY_PREFIX': CACHE_KEY_PREFIX})
+
+if os.environ.get('DJANGO_CACHE_TIERED', 'true').lower() == 'true':
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache_backends.TieredCache',
+            'TIMEOUT': CACHE_TIMEOUT,
+            'OPTIONS': {
+                'SHARED_ALIAS': 'shared',
+                'LOCAL_MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_LOCAL_MAX_ENTRIES', '2000')),
+                # Upper bound on how stale another worker's write can look here
+                'LOCAL_TIMEOUT': float(os.environ.get('DJANGO_CACHE_LOCAL_TIMEOUT', '10')),
+                # Locks and login handshakes must always be read from the shared tier
+                # (version counters are registered in core.services.cache_versions)
+                'LOCAL_BYPASS_PREFIXES': [
+                    'notification_job:',
+                    'email_login:',
+                    'results_bar_',
+                    'timetable_update_notice_lock',
+                    'timetable_notify:',
+                    'mpesa_token:',
+                    'tiered_cache:',
+                ],
+                'STATS_FLUSH_INTERVAL': float(os.environ.get('DJANGO_CACHE_STATS_FLUSH_INTERVAL', '15')),
+            },
+        },
+        'shared': _shared_cache,
+    }
+else:
+    CACHES = {'default': _shared_cache}
 
 
 # --- Celery (background tasks) ---
@@ -374,3 +435,8 @@ CELERY_TASK_ACKS_LATE = True
 CELERY_WORKER_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_WORKER_PREFETCH_MULTIPLIER', '4'))
 CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', 'false').lower() == 'true'  # handy for local testing without a worker
 
+
+# PDF exports: tables up to this many rows render in the request; larger ones go to a
+# Celery job. Rendered artifacts live under MEDIA_ROOT/pdf_exports/ (see cleanup_pdf_artifacts).
+PDF_INLINE_MAX_ROWS = int(os.environ.get('PDF_INLINE_MAX_ROWS', '300'))
+PDF_ARTIFACT_MAX_AGE = int(os.environ.get('PDF_ARTIFACT_MAX_AGE', str(7 * 24 * 60 * 60)))
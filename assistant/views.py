@@ -144,6 +144,21 @@ def _resolve_exam_by_text(text: str):
     return None, None
 
 
+def _resolve_student_by_text(text: str):
+    """Return (student_obj, display_name) for the best student search index match."""
+    try:
+        from core.models import Student as StudentModel
+        from core.services import student_search
+        matches = student_search.search_students(
+            text, limit=1, queryset=StudentModel.objects.select_related('user').exclude(user__isnull=True)
+        )
+        if matches:
+            return matches[0], f"{matches[0].full_name} ({matches[0].admission_no})"
+    except Exception:
+        return None, None
+    return None, None
+
+
 @login_required(login_url='login')
 def widget(request):
     return render(request, 'assistant/chat_widget.html')
@@ -161,6 +176,10 @@ def _intent_router(text: str, user):
     # Basic intents (with fuzzy matching)
     if _best_fuzzy(t, {'help', 'menu'}):
         return 'help', {}
+    # Student lookups: "student profile for Jane Doe", "find student ADM/001"
+    for trigger in ('student profile for ', 'find student ', 'open student '):
+        if trigger in t:
+            return 'open_student_profile', {'student_text': t.split(trigger, 1)[1].strip()}
     # Greetings
     greetings = {'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening', 'greetings'}
     if _fuzzy_find_in_text(t, greetings):
@@ -505,6 +524,16 @@ def _handle_intent(intent: str, slots: dict, request):
             {"text": "exports"}
         ]
 
+    if intent == 'open_student_profile':
+        fmt = slots.get('respond_format') or request.session.get('assistant_format')
+        if role not in ('admin', 'clerk'):
+            return False, _format_message("Only admins and clerks can look up students from here.", fmt), None, []
+        student, name_match = _resolve_student_by_text(slots.get('student_text'))
+        if not student:
+            return False, _format_message("Couldn't find that student.", fmt), None, [{"text": "students"}]
+        url = f"/student_profile/{student.id}/"
+        return True, _format_message(f"Opening Student Profile: {name_match}.", fmt), {"type": "navigate", "url": url}, []
+
     if intent == 'open_class_profile':
         if role != 'admin':
             fmt = slots.get('respond_format') or request.session.get('assistant_format')
@@ -0,0 +1,274 @@
+"""Two-tier Django cache: a per-process LRU in front of a shared backend.
+
+Configured in settings.CACHES (see Analitica/settings.py)::
+
+    'default': {
+        'BACKEND': 'core.cache_backends.TieredCache',
+        'OPTIONS': {
+            'SHARED_ALIAS': 'shared',      # another CACHES entry (Redis, file or database)
+            'LOCAL_MAX_ENTRIES': 2000,     # LRU size per process
+            'LOCAL_TIMEOUT': 10,           # seconds a local copy may be served
+            'LOCAL_BYPASS_PREFIXES': [...],  # keys always read from the shared tier
+        },
+    }
+
+Writes go to the shared tier first and then refresh the local copy, so the
+writing process sees its own changes immediately; other processes see them
+once their local copy expires (LOCAL_TIMEOUT). Keys whose freshness matters
+across processes must skip the local tier: version counters are registered in
+core.services.cache_versions, other keys (locks, login handshakes) are listed
+in LOCAL_BYPASS_PREFIXES.
+
+Hit/miss/eviction counters are kept per key prefix and periodically published
+to the shared tier so the diagnostics page can aggregate every worker.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+import os
+import pickle
+import socket
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core.services import cache_versions
+
+STATS_FIELDS = ('local_hits', 'shared_hits', 'misses', 'sets', 'deletes', 'evictions')
+STATS_REGISTRY_KEY = 'tiered_cache:stats:procs'
+STATS_KEY_TTL = 24 * 60 * 60
+
+# Django hands every thread its own backend instance; the LRU and counters
+# are per process, so they live at module level keyed by cache name.
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class _LocalStore:
+    def __init__(self):
+        self.data = OrderedDict()  # full key -> (expires_at, pickled value, caller's key)
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+        self.last_flush = time.monotonic()
+
+
+def _store_for(name):
+    store = _stores.get(name)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(name, _LocalStore())
+    return store
+
+
+def key_prefix(key):
+    """Group keys for statistics: 'result_matrix:12:6:..' -> 'result_matrix'."""
+    key = str(key)
+    if key.startswith('views.decorators.cache.'):
+        return '.'.join(key.split('.')[:4])  # cache_page / cache_header
+    return key.split(':', 1)[0][:60]
+
+
+def process_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TieredCache(BaseCache):
+    def __init__(self, name, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._name = name or 'tiered'
+        self._shared_alias = options.get('SHARED_ALIAS', 'shared')
+        self._local_max = int(options.get('LOCAL_MAX_ENTRIES', 2000))
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 10))
+        self._bypass = tuple(options.get('LOCAL_BYPASS_PREFIXES', ()))
+        self._flush_interval = float(options.get('STATS_FLUSH_INTERVAL', 15))
+        self._store = _store_for(self._name)
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # --- local tier -------------------------------------------------------
+    def _local_key(self, key, version):
+        return self.shared.make_key(key, version=version)
+
+    def _cacheable(self, key):
+        key = str(key)
+        return (
+            self._local_max > 0 and self._local_timeout > 0
+            and not key.startswith(self._bypass) and not key.startswith(cache_versions.registered())
+        )
+
+    def _count(self, key, field, n=1):
+        self._store.stats[key_prefix(key)][field] += n
+
+    def _local_get(self, lkey):
+        store = self._store
+        with store.lock:
+            item = store.data.get(lkey)
+            if item is None:
+                return None
+            expires_at, pickled, _key = item
+            if expires_at <= time.monotonic():
+                del store.data[lkey]
+                return None
+            store.data.move_to_end(lkey)
+        return pickled
+
+    def _local_set(self, key, lkey, value, timeout):
+        ttl = self._local_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            remaining = backend_timeout - time.time()
+            if remaining <= 0:
+                self._local_delete(lkey)
+                return
+            ttl = min(ttl, remaining)
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        evicted = []
+        store = self._store
+        with store.lock:
+            store.data[lkey] = (time.monotonic() + ttl, pickled, key)
+            store.data.move_to_end(lkey)
+            while len(store.data) > self._local_max:
+                evicted.append(store.data.popitem(last=False)[1][2])
+        for old_key in evicted:
+            self._count(old_key, 'evictions')
+
+    def _local_delete(self, lkey):
+        with self._store.lock:
+            self._store.data.pop(lkey, None)
+
+    # --- statistics -------------------------------------------------------
+    def _maybe_flush_stats(self):
+        store = self._store
+        now = time.monotonic()
+        if now - store.last_flush < self._flush_interval:
+            return
+        store.last_flush = now
+        self.flush_stats()
+
+    def flush_stats(self):
+        """Publish this process's counters to the shared tier (best effort)."""
+        try:
+            pid = process_id()
+            snapshot = {prefix: dict(fields) for prefix, fields in list(self._store.stats.items())}
+            self.shared.set(f'tiered_cache:stats:{pid}', {
+                'stats': snapshot,
+                'local_entries': len(self._store.data),
+                'local_max_entries': self._local_max,
+                'updated': time.time(),
+            }, timeout=STATS_KEY_TTL)
+            procs = self.shared.get(STATS_REGISTRY_KEY) or []
+            if pid not in procs:
+                self.shared.set(STATS_REGISTRY_KEY, (procs + [pid])[-200:], timeout=STATS_KEY_TTL)
+        except Exception:
+            pass
+
+    def local_stats(self):
+        return {prefix: dict(fields) for prefix, fields in list(self._store.stats.items())}
+
+    # --- cache API ----------------------------------------------------------
+    def get(self, key, default=None, version=None):
+        if self._cacheable(key):
+            lkey = self._local_key(key, version)
+            pickled = self._local_get(lkey)
+            if pickled is not None:
+                self._count(key, 'local_hits')
+                return pickle.loads(pickled)
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            self._count(key, 'misses')
+            self._maybe_flush_stats()
+            return default
+        self._count(key, 'shared_hits')
+        if self._cacheable(key):
+            self._local_set(key, lkey, value, DEFAULT_TIMEOUT)
+        self._maybe_flush_stats()
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        self._count(key, 'sets')
+        if self._cacheable(key):
+            self._local_set(key, self._local_key(key, version), value, timeout)
+        self._maybe_flush_stats()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._count(key, 'sets')
+            if self._cacheable(key):
+                self._local_set(key, self._local_key(key, version), value, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(self._local_key(key, version))
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self._local_key(key, version))
+        self._count(key, 'deletes')
+        return self.shared.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self._local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        if self._cacheable(key) and self._local_get(self._local_key(key, version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def clear(self):
+        with self._store.lock:
+            self._store.data.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+def collect_stats(alias='default'):
+    """Aggregate published counters of every worker (plus this process's live ones).
+
+    Returns (rows, processes): rows sorted by traffic, one per key prefix, with
+    hit ratio; processes lists each worker's local entry count.
+    """
+    backend = caches[alias]
+    if not isinstance(backend, TieredCache):
+        return [], []
+    backend.flush_stats()
+    shared = backend.shared
+    totals = defaultdict(lambda: dict.fromkeys(STATS_FIELDS, 0))
+    processes = []
+    for pid in shared.get(STATS_REGISTRY_KEY) or []:
+        snap = shared.get(f'tiered_cache:stats:{pid}')
+        if not snap:
+            continue
+        processes.append({
+            'id': pid,
+            'local_entries': snap.get('local_entries', 0),
+            'local_max_entries': snap.get('local_max_entries', 0),
+            'updated': datetime.fromtimestamp(snap['updated'], tz=timezone.utc) if snap.get('updated') else None,
+        })
+        for prefix, fields in (snap.get('stats') or {}).items():
+            for f in STATS_FIELDS:
+                totals[prefix][f] += fields.get(f, 0)
+    rows = []
+    for prefix, fields in totals.items():
+        lookups = fields['local_hits'] + fields['shared_hits'] + fields['misses']
+        hits = fields['local_hits'] + fields['shared_hits']
+        rows.append({
+            'prefix': prefix,
+            **fields,
+            'lookups': lookups,
+            'hit_ratio': (hits / lookups * 100.0) if lookups else 0.0,
+            'local_ratio': (fields['local_hits'] / lookups * 100.0) if lookups else 0.0,
+        })
+    rows.sort(key=lambda r: r['lookups'] + r['sets'], reverse=True)
+    return rows, processes
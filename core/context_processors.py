@@ -1,6 +1,6 @@
-from landing.models import SiteSettings
+from landing.site_settings import get_site_settings
 
 def site_settings(request):
     return {
-        'site_settings': SiteSettings.objects.order_by('-updated_at').first()
+        'site_settings': get_site_settings()
     }
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.base import MIMEBase
 import json
 import logging
-from typing import Iterable
+import threading
+from typing import Iterable, NamedTuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from django.core.mail.backends.base import BaseEmailBackend
 from django.core.mail.message import EmailMultiAlternatives, EmailMessage
@@ -12,19 +18,61 @@ from django.core.mail.message import EmailMultiAlternatives, EmailMessage
 logger = logging.getLogger(__name__)
 
 
+# One keep-alive session per process, shared by every backend instance
+# (Django opens a new backend for each get_connection()/send_mail call).
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session(pool_size: int) -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # Only connection failures are retried: a request that reached Resend may have been sent
+                adapter = HTTPAdapter(pool_maxsize=max(pool_size, 1), max_retries=Retry(total=2, connect=2, read=0, status=0))
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class SendResult(NamedTuple):
+    """Outcome of one message: Resend's email id, or the error text."""
+    message: EmailMessage
+    id: str | None
+    error: str | None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
 class ResendEmailBackend(BaseEmailBackend):
     """
     Minimal Django email backend that sends messages via the Resend HTTP API.
     Requires RESEND_API_KEY in Django settings or environment.
-    
+
+    Messages go out through Resend's batch endpoint, up to batch_limit per
+    request, over a pooled keep-alive session. Messages the batch endpoint does
+    not accept (attachments), and every message of a batch Resend rejected as
+    invalid, are sent one per request, at most RESEND_MAX_CONCURRENCY at a time. After send_messages(), self.results holds
+    a SendResult per message in input order.
+
     Docs: https://resend.com/docs/api-reference/emails/send-email
+          https://resend.com/docs/api-reference/emails/send-batch-emails
     """
 
     api_url = "https://api.resend.com/emails"
+    batch_limit = 100  # Resend's maximum emails per batch request
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.api_key = getattr(settings, "RESEND_API_KEY", None)
+        self.api_url = getattr(settings, "RESEND_API_URL", "") or self.api_url
+        self.max_concurrency = max(int(getattr(settings, "RESEND_MAX_CONCURRENCY", 4)), 1)
+        self.results: list[SendResult] = []
         if not self.api_key and not getattr(settings, "DEBUG", False):
             # In production, fail early if key missing.
             raise RuntimeError(
@@ -32,37 +80,88 @@ class ResendEmailBackend(BaseEmailBackend):
             )
 
     def send_messages(self, email_messages: Iterable[EmailMessage]) -> int:
-        if not email_messages:
+        messages = list(email_messages or [])
+        self.results = []
+        if not messages:
+            return 0
+        if not self.api_key:
+            # When DEBUG True but key missing, log and simulate send to avoid breaking flows.
+            logger.warning("RESEND_API_KEY not set. %d email(s) not sent (DEBUG mode).", len(messages))
+            if not self.fail_silently:
+                raise RuntimeError("RESEND_API_KEY not set")
+            self.results = [SendResult(m, None, "RESEND_API_KEY not set") for m in messages]
             return 0
 
-        sent = 0
-        for message in email_messages:
+        results: list[SendResult | None] = [None] * len(messages)
+        batchable, single = [], []
+        for i, message in enumerate(messages):
             try:
-                data = self._build_payload(message)
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json",
-                }
-                if not self.api_key:
-                    # When DEBUG True but key missing, log and simulate send to avoid breaking flows.
-                    logger.warning("RESEND_API_KEY not set. Email to %s not sent (DEBUG mode).", data.get("to"))
-                    if self.fail_silently:
-                        continue
-                    raise RuntimeError("RESEND_API_KEY not set")
-
-                resp = requests.post(self.api_url, headers=headers, data=json.dumps(data), timeout=30)
-                if resp.status_code >= 200 and resp.status_code < 300:
-                    sent += 1
-                else:
-                    detail = resp.text
-                    logger.error("Resend send failed (%s): %s", resp.status_code, detail)
-                    if not self.fail_silently:
-                        raise RuntimeError(f"Resend error {resp.status_code}: {detail}")
+                payload = self._build_payload(message)
             except Exception as e:
-                logger.exception("Email send failed: %s", e)
-                if not self.fail_silently:
-                    raise
-        return sent
+                results[i] = SendResult(message, None, str(e))
+                continue
+            (single if "attachments" in payload else batchable).append((i, payload))
+
+        session = _get_session(self.max_concurrency)
+        for start in range(0, len(batchable), self.batch_limit):
+            chunk = batchable[start:start + self.batch_limit]
+            outcomes, rejected = self._post_batch(session, [p for _i, p in chunk])
+            if rejected:
+                # Resend refuses the whole batch over one bad message (e.g. an invalid
+                # address); send that chunk one by one so only the bad ones fail
+                single.extend(chunk)
+                continue
+            for (i, _payload), (email_id, error) in zip(chunk, outcomes):
+                results[i] = SendResult(messages[i], email_id, error)
+
+        if single:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(single))) as pool:
+                outcomes = pool.map(lambda item: self._post_single(session, item[1]), single)
+                for (i, _payload), (email_id, error) in zip(single, outcomes):
+                    results[i] = SendResult(messages[i], email_id, error)
+
+        self.results = results
+        failed = [r for r in results if not r.ok]
+        for r in failed:
+            logger.error("Resend send to %s failed: %s", r.message.to, r.error)
+        if failed and not self.fail_silently:
+            raise RuntimeError(f"Resend failed for {len(failed)} of {len(messages)} email(s): {failed[0].error}")
+        return len(messages) - len(failed)
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _post_batch(self, session: requests.Session, payloads: list[dict]) -> tuple[list[tuple[str | None, str | None]], bool]:
+        """((id, error) per payload, rejected) for one batch request.
+
+        rejected is True when Resend refused the batch as invalid (4xx other than
+        401/403/429): the payloads can still be sent one at a time.
+        """
+        try:
+            resp = session.post(f"{self.api_url}/batch", headers=self._headers(), data=json.dumps(payloads), timeout=30)
+        except requests.RequestException as e:
+            return [(None, str(e))] * len(payloads), False
+        if not 200 <= resp.status_code < 300:
+            rejected = 400 <= resp.status_code < 500 and resp.status_code not in (401, 403, 429)
+            return [(None, f"Resend error {resp.status_code}: {resp.text}")] * len(payloads), rejected
+        try:
+            ids = [item.get("id") for item in resp.json().get("data") or []]
+        except (ValueError, AttributeError):
+            ids = []
+        ids += [None] * (len(payloads) - len(ids))
+        return [(email_id, None) for email_id in ids[:len(payloads)]], False
+
+    def _post_single(self, session: requests.Session, payload: dict) -> tuple[str | None, str | None]:
+        try:
+            resp = session.post(self.api_url, headers=self._headers(), data=json.dumps(payload), timeout=30)
+        except requests.RequestException as e:
+            return None, str(e)
+        if not 200 <= resp.status_code < 300:
+            return None, f"Resend error {resp.status_code}: {resp.text}"
+        try:
+            return resp.json().get("id"), None
+        except (ValueError, AttributeError):
+            return None, None
 
     def _build_payload(self, message: EmailMessage) -> dict:
         from_email = message.from_email or getattr(settings, "DEFAULT_FROM_EMAIL", "onboarding@resend.dev")
@@ -93,4 +192,19 @@ class ResendEmailBackend(BaseEmailBackend):
             payload["cc"] = cc
         if bcc:
             payload["bcc"] = bcc
+        reply_to = list(getattr(message, "reply_to", []) or [])
+        if reply_to:
+            payload["reply_to"] = reply_to
+        attachments = []
+        for attachment in getattr(message, "attachments", []) or []:
+            if isinstance(attachment, MIMEBase):
+                filename = attachment.get_filename() or "attachment"
+                content = attachment.get_payload(decode=True) or b""
+            else:
+                filename, content = attachment[0], attachment[1]
+                if isinstance(content, str):
+                    content = content.encode()
+            attachments.append({"filename": filename or "attachment", "content": base64.b64encode(content).decode()})
+        if attachments:
+            payload["attachments"] = attachments
         return payload
@@ -1,5 +1,4 @@
 from django import forms
-from decimal import Decimal
 from django.forms import inlineformset_factory
 from django.forms.models import BaseInlineFormSet
 from django.contrib.auth.forms import UserCreationForm
@@ -30,11 +29,12 @@ class MessagingForm(forms.Form):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         from .models import User, Student, FeeAssignment, FeePayment, Term, Class
+        from .services import academic_calendar
         from django.utils import timezone
         from django.db.models import Sum
 
         today = timezone.now().date()
-        current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
+        current_term = academic_calendar.current_term(today)
         students = Student.objects.select_related('user', 'class_group')
 
         min_balance = self.data.get('min_balance')
@@ -662,13 +662,10 @@ class PocketMoneyForm(forms.ModelForm):
         amount = cleaned.get('amount')
         tx_type = cleaned.get('transaction_type')
         if student and amount and tx_type == 'withdrawal':
-            from django.db.models import Sum
-            # Compute current balance (deposits - withdrawals). Adjustments intentionally excluded.
-            deposits = PocketMoney.objects.filter(student=student, transaction_type='deposit', status='approved')\
-                .aggregate(total=Sum('amount'))['total'] or Decimal('0')
-            withdrawals = PocketMoney.objects.filter(student=student, transaction_type='withdrawal', status='approved')\
-                .aggregate(total=Sum('amount'))['total'] or Decimal('0')
-            balance = deposits - withdrawals
+            from .services import pocket_ledger
+            # Current balance (deposits - withdrawals). Adjustments intentionally excluded.
+            totals = pocket_ledger.balance_for(student)
+            balance = totals['deposits'] - totals['withdrawals']
             if amount > balance:
                 self.add_error('amount', f"Withdrawal cannot exceed current balance (KES {balance}).")
         return cleaned
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.services import pdf_jobs
+
+
+class Command(BaseCommand):
+    help = "Delete stored PDF export artifacts older than a maximum age."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-hours', type=float, default=pdf_jobs.ARTIFACT_MAX_AGE / 3600.0,
+                            help='Remove artifacts not modified within this many hours')
+
+    def handle(self, *args, **options):
+        removed = pdf_jobs.purge_artifacts(max_age=options['max_age_hours'] * 3600)
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} PDF artifact(s)."))
@@ -0,0 +1,23 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.services import user_sessions
+
+
+class Command(BaseCommand):
+    help = "Purge UserSession index rows whose session expired or was deleted (optionally backfill existing sessions)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear-expired', action='store_true', help='Also delete expired rows from django_session')
+        parser.add_argument('--backfill', action='store_true', help='Index live sessions created before UserSession existed')
+
+    def handle(self, *args, **options):
+        if options['clear_expired']:
+            removed, _ = Session.objects.filter(expire_date__lte=timezone.now()).delete()
+            self.stdout.write(f"Deleted {removed} expired session(s).")
+        purged = user_sessions.purge_stale()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} stale session index row(s)."))
+        if options['backfill']:
+            added = user_sessions.backfill()
+            self.stdout.write(self.style.SUCCESS(f"Indexed {added} existing session(s)."))
@@ -7,6 +7,7 @@ from django.db import transaction
 from django.utils import timezone
 
 from core.models import Student, Term, FeeAssignment, FeePayment
+from core.services import fee_ledger
 
 
 class Command(BaseCommand):
@@ -175,6 +176,9 @@ class Command(BaseCommand):
         if batch:
             FeePayment.objects.bulk_create(batch)
             count_created += len(batch)
+
+        # bulk_create skips signals: bring the balance ledger up to date in one pass
+        fee_ledger.refresh_all()
         
         self.stdout.write(self.style.SUCCESS(
             f"Created {count_created} FeePayment(s). "
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.services.timetable_scheduler import generate_timetable
+
+
+class Command(BaseCommand):
+    help = "Generate the school timetable, running the search across worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=int(getattr(settings, 'TIMETABLE_WORKERS', 0)),
+                            help='Worker processes (0 = one per CPU, 1 = in-process)')
+        parser.add_argument('--restarts', type=int, default=None, help='Seeded attempts (default TIMETABLE_RESTARTS)')
+        parser.add_argument('--seed', type=int, default=None, help='Base seed, for a reproducible run')
+        parser.add_argument('--keep-existing', action='store_true', help='Keep stored lessons and fill around them')
+
+    def handle(self, *args, **options):
+        report = generate_timetable(
+            overwrite=not options['keep_existing'],
+            seed=options['seed'],
+            restarts=options['restarts'],
+            workers=options['workers'],
+        )
+        search = report.get('meta', {}).get('search', {})
+        self.stdout.write(self.style.SUCCESS(
+            f"Timetable generated. Placed: {report.get('placed', 0)}, Skipped: {report.get('skipped', 0)} "
+            f"({search.get('restarts')} attempt(s) on {search.get('workers')} worker(s), {search.get('seconds')}s)."
+        ))
@@ -0,0 +1,64 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.services import callback_journal
+
+
+def _legacy_entries(text):
+    """Parse the legacy payment_callback_logs.txt (JSON array, possibly several concatenated)."""
+    try:
+        data = json.loads(text)
+        if isinstance(data, list):
+            return data
+    except ValueError:
+        pass
+    # Fall back to collecting balanced top-level {...} objects
+    entries = []
+    buf = []
+    depth = 0
+    for line in text.splitlines():
+        if '{' in line:
+            depth += line.count('{')
+        if depth > 0:
+            buf.append(line)
+        if '}' in line:
+            depth -= line.count('}')
+            if depth <= 0 and buf:
+                try:
+                    entries.append(json.loads('\n'.join(buf).strip().rstrip(',')))
+                except ValueError:
+                    pass
+                buf = []
+                depth = 0
+    return entries
+
+
+class Command(BaseCommand):
+    help = "One-off import of the legacy payment_callback_logs.txt JSON array into the append-only callback journal."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=os.path.join(settings.BASE_DIR, 'payment_callback_logs.txt'),
+            help="Legacy log file to import (default: BASE_DIR/payment_callback_logs.txt).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(f"No legacy log at {path}; nothing to import."))
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = _legacy_entries(f.read())
+        imported = 0
+        for obj in entries:
+            if not isinstance(obj, dict):
+                continue
+            if callback_journal.append(obj.get('status') or 'success', obj.get('details', obj), timestamp=obj.get('timestamp')):
+                imported += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} entries into {callback_journal.journal_dir()}."
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.services import pocket_ledger
+
+
+class Command(BaseCommand):
+    help = "Backfill or verify PocketMoneyBalance rows against approved pocket money transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only report balances that drifted; do not write')
+        parser.add_argument('--limit', type=int, default=50, help='Max drifted values to print in --verify mode')
+        parser.add_argument('--batch-size', type=int, default=pocket_ledger.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            shown = 0
+            drifted = 0
+            for student_id, field, stored, expected in pocket_ledger.find_drift(batch_size=options['batch_size']):
+                drifted += 1
+                if shown < options['limit']:
+                    self.stdout.write(f"student={student_id} {field}: stored={stored} expected={expected}")
+                    shown += 1
+            if drifted:
+                self.stdout.write(self.style.WARNING(f"{drifted} pocket money value(s) drifted. Run without --verify to repair."))
+            else:
+                self.stdout.write(self.style.SUCCESS("Pocket money balances match transactions."))
+            return
+
+        changed = pocket_ledger.refresh_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Pocket money balances rebuilt ({changed} row(s) written or removed)."))
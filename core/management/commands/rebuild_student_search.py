@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.services import student_search
+
+
+class Command(BaseCommand):
+    help = "Backfill or repair the student search index from student names, admission numbers and accounts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=student_search.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        changed = student_search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Student search index rebuilt ({changed} student(s) reindexed)."))
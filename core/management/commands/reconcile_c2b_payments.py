@@ -9,9 +9,9 @@ from core.models import (
     MpesaTransaction,
     FeePayment,
     Student,
-    Term,
     FeeAssignment,
 )
+from core.services import academic_calendar
 
 
 class Command(BaseCommand):
@@ -82,7 +82,7 @@ class Command(BaseCommand):
 
             # Determine current term and outstanding assignment (best-effort)
             today = timezone.now().date()
-            current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+            current_term = academic_calendar.current_term(today)
             outstanding_assignment: Optional[FeeAssignment] = None
             if student and current_term and student.class_group:
                 fee_assignments = FeeAssignment.objects.filter(class_group=student.class_group, term=current_term)
@@ -3,16 +3,17 @@ from django.utils import timezone
 from django.db.models import Sum
 from django.conf import settings
 
-from core.models import Student, FeeAssignment, FeePayment, Term, Teacher, Exam
+from core.models import Student, FeeAssignment, FeePayment, Teacher, Exam
 from core.messaging_utils import send_sms, send_bulk_sms
+from core.services import academic_calendar
 from django.core.mail import send_mail, get_connection
 
 
 def school_name():
     name = getattr(settings, 'SCHOOL_NAME', 'Your School')
     try:
-        from landing.models import SiteSettings
-        s = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        s = get_site_settings()
         if s and s.school_name:
             name = s.school_name
     except Exception:
@@ -54,8 +55,8 @@ class Command(BaseCommand):
                         send_sms(st.phone, msg)
 
         # 5/6/7/8/9) Term-date reminders around closing and opening
-        current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
-        upcoming_term = Term.objects.filter(start_date__gte=today).order_by('start_date').first()
+        current_term = academic_calendar.current_term(today)
+        upcoming_term = academic_calendar.next_term(today)
 
         def notify_all_students(text):
             phones = list(Student.objects.exclude(phone__isnull=True).exclude(phone__exact='').values_list('phone', flat=True))
@@ -11,11 +11,13 @@ from core.models import (
     Term,
     Exam,
     Subject,
-    SubjectGradingScheme,
     Grade,
     Student,
     Class,
 )
+from core.services.result_matrix import invalidate_exam
+from core.services import teacher_dashboard
+from core.services.grading import get_compiled_schemes
 
 
 class Command(BaseCommand):
@@ -102,7 +104,7 @@ class Command(BaseCommand):
         total_updated = 0
 
         # Build a cache for grading schemes
-        grading_map = {gs.subject_id: gs for gs in SubjectGradingScheme.objects.select_related("subject")}
+        grading_map = get_compiled_schemes()
 
         # We will accumulate Grade objects for bulk_create
         to_create: List[Grade] = []
@@ -119,12 +121,10 @@ class Command(BaseCommand):
 
             for s in c_subjects:
                 scheme = grading_map.get(s.id)
-                for st in students:
-                    # Prepare a random score
-                    score = random.randint(score_min, score_max)
-                    grade_letter = None
-                    if scheme:
-                        grade_letter = scheme.get_grade_letter(score)
+                # Prepare random scores and grade the whole column at once
+                scores = [random.randint(score_min, score_max) for _ in students]
+                letters = scheme.grade_many(scores) if scheme else [None] * len(scores)
+                for st, score, grade_letter in zip(students, scores, letters):
 
                     if do_update:
                         # Update-or-create behavior: try to update existing
@@ -152,6 +152,10 @@ class Command(BaseCommand):
             Grade.objects.bulk_create(to_create, batch_size=1000)
             total_created += len(to_create)
 
+        # bulk_create/update bypass signals, so refresh cached result matrices and dashboards explicitly
+        invalidate_exam(exam.id)
+        teacher_dashboard.invalidate()
+
         self.stdout.write(self.style.SUCCESS(
             f"Exam '{exam.name}' ready. Created {total_created} grade rows; Updated {total_updated}."
         ))
@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_balances(apps, schema_editor):
+    """Fill StudentBalance the way core.services.fee_ledger.compute_balances does."""
+    Term = apps.get_model('core', 'Term')
+    Student = apps.get_model('core', 'Student')
+    FeeAssignment = apps.get_model('core', 'FeeAssignment')
+    FeePayment = apps.get_model('core', 'FeePayment')
+    StudentBalance = apps.get_model('core', 'StudentBalance')
+    zero = Decimal('0.00')
+
+    terms = sorted(Term.objects.values_list('id', 'start_date'), key=lambda r: (r[1] is None, r[1] or date.max, r[0]))
+    if not terms:
+        return
+    dated = [t for t in terms if t[1] is not None]
+    starts = [t[1] for t in dated]
+
+    billed = defaultdict(lambda: zero)
+    for cid, tid, total in (
+        FeeAssignment.objects.order_by().values_list('class_group_id', 'term_id').annotate(total=Sum('amount'))
+    ):
+        billed[(cid, tid)] = total or zero
+
+    paid = defaultdict(lambda: zero)
+    pending = defaultdict(lambda: zero)
+    payments = FeePayment.objects.filter(student__isnull=False).exclude(status='rejected').order_by()
+    for sid, tid, status, total in (
+        payments.filter(fee_assignment__isnull=False)
+        .values_list('student_id', 'fee_assignment__term_id', 'status').annotate(total=Sum('amount_paid'))
+    ):
+        (paid if status == 'approved' else pending)[(sid, tid)] += total or zero
+    for sid, paid_at, status, amount in (
+        payments.filter(fee_assignment__isnull=True).values_list('student_id', 'payment_date', 'status', 'amount_paid')
+    ):
+        if paid_at and dated:
+            idx = bisect_right(starts, paid_at.date()) - 1
+            tid = dated[idx][0] if idx >= 0 else terms[0][0]
+        else:
+            tid = terms[-1][0]
+        (paid if status == 'approved' else pending)[(sid, tid)] += amount or zero
+
+    rows = []
+    for sid, cid in Student.objects.order_by('id').values_list('id', 'class_group_id').iterator():
+        carried = zero
+        started = False
+        for tid, _start in terms:
+            b = billed[(cid, tid)] if cid else zero
+            p, pe = paid[(sid, tid)], pending[(sid, tid)]
+            if not started and not (b or p or pe):
+                continue
+            started = True
+            rows.append(StudentBalance(
+                student_id=sid, term_id=tid, billed=b, paid=p, pending=pe,
+                balance=b - p, carried_forward=carried, arrears=carried + b - p,
+            ))
+            carried += b - p
+    StudentBalance.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0059_financemessagehistory_job_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('pending', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('carried_forward', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('arrears', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balances', to='core.student')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_balances', to='core.term')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'balance'], name='core_studen_term_id_a84c4f_idx'), models.Index(fields=['term', 'arrears'], name='core_studen_term_id_a16c51_idx')],
+                'unique_together': {('student', 'term')},
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0060_student_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_key', models.CharField(max_length=40, unique=True)),
+                ('user_agent', models.CharField(blank=True, default='', max_length=300)),
+                ('ip_address', models.CharField(blank=True, default='', max_length=64)),
+                ('login_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expire_date', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='login_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-login_at'], name='core_userse_user_id_617c93_idx'), models.Index(fields=['expire_date'], name='core_userse_expire__e8c816_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0061_user_session'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationjob',
+            name='job_type',
+            field=models.CharField(choices=[('exam_publish', 'Exam Publish Notifications'), ('fee_arrears', 'Fee Arrears Notifications'), ('pdf_render', 'PDF Export')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_grades(apps, schema_editor):
+    """Keep the newest row of each (student, exam, subject) before adding the constraint."""
+    Grade = apps.get_model('core', 'Grade')
+    duplicates = (
+        Grade.objects.values('student_id', 'exam_id', 'subject_id')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    for d in duplicates.iterator():
+        Grade.objects.filter(
+            student_id=d['student_id'], exam_id=d['exam_id'], subject_id=d['subject_id'],
+        ).exclude(id=d['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0062_notificationjob_pdf_render'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_grades, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='grade',
+            constraint=models.UniqueConstraint(fields=('student', 'exam', 'subject'), name='unique_grade_student_exam_subject'),
+        ),
+    ]
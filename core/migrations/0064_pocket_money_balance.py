@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def backfill_balances(apps, schema_editor):
+    PocketMoney = apps.get_model('core', 'PocketMoney')
+    PocketMoneyBalance = apps.get_model('core', 'PocketMoneyBalance')
+    rows = (
+        PocketMoney.objects.filter(status='approved').order_by().values('student_id')
+        .annotate(
+            deposits=Sum('amount', filter=Q(transaction_type='deposit')),
+            withdrawals=Sum('amount', filter=Q(transaction_type='withdrawal')),
+            adjustments=Sum('amount', filter=Q(transaction_type='adjustment')),
+        )
+    )
+    balances = []
+    for r in rows.iterator():
+        d, w, a = r['deposits'] or 0, r['withdrawals'] or 0, r['adjustments'] or 0
+        balances.append(PocketMoneyBalance(
+            student_id=r['student_id'], deposits=d, withdrawals=w, adjustments=a, balance=d - w + a,
+        ))
+    PocketMoneyBalance.objects.bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0063_grade_unique_student_exam_subject'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PocketMoneyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deposits', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('adjustments', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pocket_money_balance', to='core.student')),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copy of core.services.student_search.tokens_for as of this migration
+_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii')
+    return [t[:64] for t in _SPLIT.sub(' ', text.lower()).strip().split()]
+
+
+def tokens_for(admission_no, first_name, last_name, username, email):
+    tokens = set()
+    parts = tokenize(admission_no)
+    for t in parts:
+        tokens.add(('admission', t))
+    if len(parts) > 1:
+        tokens.add(('admission', ''.join(parts)[:64]))
+    for t in tokenize(f"{first_name or ''} {last_name or ''}"):
+        tokens.add(('name', t))
+    for t in tokenize(username):
+        tokens.add(('username', t))
+    for t in tokenize((email or '').split('@')[0]):
+        tokens.add(('email', t))
+    return tokens
+
+
+def backfill_tokens(apps, schema_editor):
+    Student = apps.get_model('core', 'Student')
+    StudentSearchToken = apps.get_model('core', 'StudentSearchToken')
+    rows = Student.objects.values_list('id', 'admission_no', 'user__first_name', 'user__last_name', 'user__username', 'user__email')
+    batch = []
+    for sid, admission_no, first, last, username, email in rows.iterator():
+        batch.extend(
+            StudentSearchToken(student_id=sid, field=field, token=token)
+            for field, token in tokens_for(admission_no, first, last, username, email)
+        )
+        if len(batch) >= 2000:
+            StudentSearchToken.objects.bulk_create(batch)
+            batch = []
+    StudentSearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0064_pocket_money_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('admission', 'Admission number'), ('name', 'Name'), ('username', 'Username'), ('email', 'Email')], max_length=10)),
+                ('token', models.CharField(max_length=64)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='core.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token'], name='core_studen_token_89f283_idx')],
+                'unique_together': {('student', 'field', 'token')},
+            },
+        ),
+        migrations.RunPython(backfill_tokens, migrations.RunPython.noop),
+    ]
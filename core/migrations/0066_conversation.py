@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def preview(text):
+    # Frozen copy of core.services.conversations.preview (PREVIEW_LENGTH 120) as of this migration
+    text = ' '.join((text or '').split())
+    return text if len(text) <= 120 else text[:119] + '…'
+
+
+def backfill_conversations(apps, schema_editor):
+    Message = apps.get_model('core', 'Message')
+    Conversation = apps.get_model('core', 'Conversation')
+    direct = Message.objects.filter(recipient__isnull=False, group__isnull=True, broadcast__isnull=True).order_by()
+    last_ids = {}
+    for sender_id, recipient_id, last_id in direct.values_list('sender_id', 'recipient_id').annotate(last_id=Max('id')):
+        pair = (min(sender_id, recipient_id), max(sender_id, recipient_id))
+        last_ids[pair] = max(last_ids.get(pair, 0), last_id)
+    unread = {
+        (recipient_id, sender_id): n
+        for sender_id, recipient_id, n in direct.filter(is_read=False).values_list('sender_id', 'recipient_id').annotate(n=Count('id'))
+    }
+    last = Message.objects.in_bulk(list(last_ids.values()))
+    rows = []
+    for (a, b), last_id in last_ids.items():
+        message = last[last_id]
+        for user_id, peer_id in {(a, b), (b, a)}:
+            rows.append(Conversation(
+                user_id=user_id, peer_id=peer_id, last_message_id=last_id,
+                last_message_at=message.timestamp, last_message_preview=preview(message.content),
+                unread_count=unread.get((user_id, peer_id), 0),
+            ))
+    Conversation.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0065_student_search_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('last_message_preview', models.CharField(blank=True, default='', max_length=120)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('pinned', models.BooleanField(default=False)),
+                ('muted', models.BooleanField(default=False)),
+                ('archived', models.BooleanField(default=False)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.message')),
+                ('peer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_peer', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at'], name='core_conver_user_id_a43be2_idx')],
+                'unique_together': {('user', 'peer')},
+            },
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
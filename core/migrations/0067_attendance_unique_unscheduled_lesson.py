@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:10
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def drop_duplicate_unscheduled_attendance(apps, schema_editor):
+    """Keep the newest row of each period-less (student, date, subject) before adding the constraint."""
+    Attendance = apps.get_model('core', 'Attendance')
+    duplicates = (
+        Attendance.objects.filter(period__isnull=True)
+        .values('student_id', 'date', 'subject_id')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    for d in duplicates.iterator():
+        Attendance.objects.filter(
+            period__isnull=True, student_id=d['student_id'], date=d['date'], subject_id=d['subject_id'],
+        ).exclude(id=d['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0066_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_unscheduled_attendance, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(condition=models.Q(('period__isnull', True)), fields=('student', 'date', 'subject'), name='unique_attendance_unscheduled_lesson'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import time
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.utils import timezone
 
 # Optional: Extend User model
@@ -17,6 +20,24 @@ class User(AbstractUser):
         verbose_name = 'User'
         verbose_name_plural = 'Users'
 
+class UserSession(models.Model):
+    """Index of logged-in sessions per user, so session lookups never decode the whole Session table."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_sessions')
+    session_key = models.CharField(max_length=40, unique=True)
+    user_agent = models.CharField(max_length=300, blank=True, default='')
+    ip_address = models.CharField(max_length=64, blank=True, default='')
+    login_at = models.DateTimeField(default=timezone.now)
+    expire_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-login_at']),
+            models.Index(fields=['expire_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.user} @ {self.ip_address or '?'} ({self.login_at:%Y-%m-%d %H:%M})"
+
 class Subject(models.Model):
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=10)
@@ -171,6 +192,10 @@ class Grade(models.Model):
             models.Index(fields=['exam']),
             models.Index(fields=['subject']),
         ]
+        constraints = [
+            # One mark per student, exam and subject (bulk upserts conflict on it)
+            models.UniqueConstraint(fields=['student', 'exam', 'subject'], name='unique_grade_student_exam_subject'),
+        ]
 
 class SubjectGradingScheme(models.Model):
     subject = models.OneToOneField(Subject, on_delete=models.CASCADE, related_name='grading_scheme')
@@ -266,6 +291,54 @@ class FeePayment(models.Model):
     # Link back to MpesaTransaction when available (for traceability)
     mpesa_transaction = models.ForeignKey('MpesaTransaction', on_delete=models.SET_NULL, null=True, blank=True, related_name='payments')
 
+class StudentBalance(models.Model):
+    """Materialized fee position of a student for one term (see core.services.fee_ledger).
+
+    paid counts approved payments only; pending holds payments awaiting verification.
+    arrears = carried_forward + balance, i.e. everything outstanding up to this term.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='balances')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='student_balances')
+    billed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    pending = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    carried_forward = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    arrears = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'term')
+        indexes = [
+            models.Index(fields=['term', 'balance']),
+            models.Index(fields=['term', 'arrears']),
+        ]
+
+    def __str__(self):
+        return f"{self.student} - {self.term}: {self.arrears}"
+
+class StudentSearchToken(models.Model):
+    """One normalized search token of a student (see core.services.student_search)."""
+    FIELD_CHOICES = [
+        ('admission', 'Admission number'),
+        ('name', 'Name'),
+        ('username', 'Username'),
+        ('email', 'Email'),
+    ]
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=10, choices=FIELD_CHOICES)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('student', 'field', 'token')
+        indexes = [
+            models.Index(fields=['token']),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} {self.field}:{self.token}"
+
 class MpesaTransaction(models.Model):
     """Tracks STK push requests and their lifecycle for verification."""
     STATUS_CHOICES = [
@@ -461,6 +534,14 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ('student', 'date', 'period')
+        constraints = [
+            # NULL periods never collide in unique_together; unscheduled lessons are keyed by subject
+            models.UniqueConstraint(
+                fields=['student', 'date', 'subject'],
+                condition=models.Q(period__isnull=True),
+                name='unique_attendance_unscheduled_lesson',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.student} - {self.subject.name} - {self.date} - {self.status}"
@@ -549,6 +630,34 @@ class Message(models.Model):
         return f"From {self.sender.username} to {self.recipient.username} at {self.timestamp:%Y-%m-%d %H:%M}"
 
 
+class Conversation(models.Model):
+    """One participant's side of a direct-message thread (see core.services.conversations).
+
+    Each pair of users has two rows, (user, peer) and (peer, user), kept up to
+    date as messages are inserted, so an inbox is a single indexed query.
+    """
+    PREVIEW_LENGTH = 120
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations')
+    peer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_peer')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, default='')
+    unread_count = models.PositiveIntegerField(default=0)
+    pinned = models.BooleanField(default=False)
+    muted = models.BooleanField(default=False)
+    archived = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('user', 'peer')
+        indexes = [
+            models.Index(fields=['user', '-last_message_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} <-> {self.peer_id}"
+
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     message = models.TextField()
@@ -585,6 +694,7 @@ class NotificationJob(models.Model):
     TYPE_CHOICES = [
         ('exam_publish', 'Exam Publish Notifications'),
         ('fee_arrears', 'Fee Arrears Notifications'),
+        ('pdf_render', 'PDF Export'),
     ]
     STATUS_CHOICES = [
         ('queued', 'Queued'),
@@ -600,6 +710,7 @@ class NotificationJob(models.Model):
     success_count = models.PositiveIntegerField(default=0)
     error_count = models.PositiveIntegerField(default=0)
     meta = models.JSONField(default=dict, blank=True)
+    cancel_requested = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -610,31 +721,96 @@ class NotificationJob(models.Model):
             models.Index(fields=['created_at']),
         ]
 
+    # Progress counts are buffered in memory and written every N items or T
+    # seconds; job_status reads the live snapshot from the cache in between.
+    PROGRESS_FLUSH_EVERY = 50
+    PROGRESS_FLUSH_SECONDS = 2.0
+    PROGRESS_CACHE_TIMEOUT = 60 * 60 * 24
+
+    @staticmethod
+    def progress_cache_key(job_id):
+        return f"notification_job:progress:{job_id}"
+
+    @classmethod
+    def cached_progress(cls, job_id):
+        """Last published snapshot of a job (see as_progress), or None."""
+        return cache.get(cls.progress_cache_key(job_id))
+
+    def as_progress(self):
+        pending = self._pending_progress()
+        return {
+            'id': self.id,
+            'status': self.status,
+            'total': self.total,
+            'processed': self.processed + pending['processed'],
+            'success_count': self.success_count + pending['success_count'],
+            'error_count': self.error_count + pending['error_count'],
+            'meta': self.meta,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def _pending_progress(self):
+        pending = self.__dict__.get('_progress')
+        if pending is None:
+            pending = self.__dict__['_progress'] = {
+                'processed': 0, 'success_count': 0, 'error_count': 0, 'flushed_at': time.monotonic(),
+            }
+        return pending
+
+    def _publish_progress(self):
+        try:
+            cache.set(self.progress_cache_key(self.pk), self.as_progress(), timeout=self.PROGRESS_CACHE_TIMEOUT)
+        except Exception:
+            pass  # polling falls back to the database
+
+    def _save_progress(self, **fields):
+        """One UPDATE adding the buffered counts (plus any extra fields), no re-read."""
+        pending = self._pending_progress()
+        updates = {'updated_at': timezone.now(), **fields}
+        for name in ('processed', 'success_count', 'error_count'):
+            if pending[name]:
+                updates[name] = models.F(name) + pending[name]
+        type(self).objects.filter(pk=self.pk).update(**updates)
+        # Single writer per job: the in-memory totals are the stored totals
+        for name in ('processed', 'success_count', 'error_count'):
+            setattr(self, name, getattr(self, name) + pending[name])
+            pending[name] = 0
+        pending['flushed_at'] = time.monotonic()
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = updates['updated_at']
+        self._publish_progress()
+
     def mark_running(self, total=None):
         if total is not None:
             self.total = total
         self.status = 'running'
         self.save(update_fields=['status', 'total', 'updated_at'])
+        self._publish_progress()
 
     def incr(self, success=True, step=1):
-        self.processed = models.F('processed') + step
-        if success:
-            self.success_count = models.F('success_count') + step
-        else:
-            self.error_count = models.F('error_count') + step
-        self.save(update_fields=['processed', 'success_count', 'error_count', 'updated_at'])
-        # Refresh from DB to get actual values after F expressions
-        return type(self).objects.only('processed', 'success_count', 'error_count').get(pk=self.pk)
+        """Count processed items; written every PROGRESS_FLUSH_EVERY items or PROGRESS_FLUSH_SECONDS."""
+        pending = self._pending_progress()
+        pending['processed'] += step
+        pending['success_count' if success else 'error_count'] += step
+        if (pending['processed'] >= self.PROGRESS_FLUSH_EVERY
+                or time.monotonic() - pending['flushed_at'] >= self.PROGRESS_FLUSH_SECONDS):
+            self.flush_progress()
+        return self
+
+    def flush_progress(self):
+        if self._pending_progress()['processed']:
+            self._save_progress()
 
     def mark_done(self):
-        self.status = 'done'
-        self.save(update_fields=['status', 'updated_at'])
+        self._save_progress(status='done')
 
     def mark_failed(self, error_msg=None):
-        self.status = 'failed'
+        meta = self.meta
         if error_msg:
-            self.meta = {**(self.meta or {}), 'error': error_msg}
-        self.save(update_fields=['status', 'meta', 'updated_at'])
+            meta = {**(self.meta or {}), 'error': error_msg}
+        self._save_progress(status='failed', meta=meta)
 
 
 class GradeCommentTemplate(models.Model):
@@ -730,6 +906,22 @@ class PocketMoney(models.Model):
         return self.amount
 
 
+class PocketMoneyBalance(models.Model):
+    """Running pocket money totals of a student (see core.services.pocket_ledger).
+
+    Only approved transactions count. balance = deposits - withdrawals + adjustments.
+    """
+    student = models.OneToOneField(Student, on_delete=models.CASCADE, related_name='pocket_money_balance')
+    deposits = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    withdrawals = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    adjustments = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.student}: KES {self.balance}"
+
+
 # --- Lesson Planning ---
 class LessonPlan(models.Model):
     """Persistent lesson plan allowing many plans per teacher/subject/class.
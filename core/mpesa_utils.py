@@ -4,37 +4,18 @@ from django.conf import settings
 from datetime import datetime
 from urllib.parse import urlsplit, urlunsplit
 
+from .services import daraja
+
 def get_mpesa_access_token():
-    """Fetch an OAuth access token from Daraja.
+    """Return a Daraja OAuth access token (cached and shared, see services.daraja).
 
     Returns the token string on success. Returns None on failure and prints
     debug information so the caller can surface a friendly error.
     """
     try:
-        consumer_key = getattr(settings, 'MPESA_CONSUMER_KEY', None)
-        consumer_secret = getattr(settings, 'MPESA_CONSUMER_SECRET', None)
-        environment = getattr(settings, 'MPESA_ENVIRONMENT', 'sandbox')
-        if not consumer_key or not consumer_secret:
-            print("[M-PESA][ERROR] Missing MPESA_CONSUMER_KEY/MPESA_CONSUMER_SECRET in settings.")
-            return None
-        api_URL = (
-            "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-            if environment == 'sandbox'
-            else "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-        )
-        r = requests.get(api_URL, auth=(consumer_key, consumer_secret), timeout=20)
-        try:
-            data = r.json()
-        except Exception as e:
-            print("[M-PESA][ERROR] OAuth response was not JSON:", e, "status=", r.status_code, "text=", r.text[:300])
-            return None
-        token = data.get('access_token')
-        if not token:
-            print("[M-PESA][ERROR] OAuth JSON did not contain access_token. Body:", data)
-            return None
-        return token
-    except requests.RequestException as e:
-        print("[M-PESA][ERROR] OAuth request failed:", e)
+        return daraja.client().token()
+    except daraja.DarajaError as e:
+        print("[M-PESA][ERROR]", e)
         return None
 
 def initiate_stk_push(phone_number, amount, account_ref, transaction_desc):
@@ -51,12 +32,6 @@ def initiate_stk_push(phone_number, amount, account_ref, transaction_desc):
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     data_to_encode = shortcode + passkey + timestamp
     password = base64.b64encode(data_to_encode.encode()).decode('utf-8')
-    api_url = (
-        "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        if getattr(settings, 'MPESA_ENVIRONMENT', 'sandbox') == 'sandbox'
-        else "https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-    )
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
     # Prefer a configurable callback URL from settings; fall back to current ngrok URL if not set
     callback_url = getattr(settings, 'MPESA_CALLBACK_URL', None) or "https://a3f71df1ab1a.ngrok-free.app/mpesa-callback/"
     payload = {
@@ -73,9 +48,8 @@ def initiate_stk_push(phone_number, amount, account_ref, transaction_desc):
         "TransactionDesc": transaction_desc
     }
     print("[M-PESA] STK Push Request Payload:", payload)
-    print("[M-PESA] STK Push Request Headers:", headers)
     try:
-        response = requests.post(api_url, json=payload, headers=headers, timeout=20)
+        response = daraja.client().post("/mpesa/stkpush/v1/processrequest", payload)
         print("[M-PESA] STK Push Raw Response:", response.text)
         try:
             resp_json = response.json()
@@ -83,7 +57,7 @@ def initiate_stk_push(phone_number, amount, account_ref, transaction_desc):
             print("[M-PESA][ERROR] Could not parse JSON response:", e)
             resp_json = {'error': 'Invalid JSON response', 'raw': response.text}
         return resp_json
-    except requests.RequestException as e:
+    except (requests.RequestException, daraja.DarajaError) as e:
         print("[M-PESA][ERROR] Request to Daraja failed:", e)
         return {'error': str(e)}
 
@@ -92,15 +66,12 @@ def query_stk_status(checkout_request_id):
 
     Returns parsed JSON from Daraja, or {'error': ...} on failure.
     """
-    access_token = get_mpesa_access_token()
     # Use the same STK-specific credentials as used during initiate
     shortcode = getattr(settings, 'MPESA_STK_SHORTCODE', None) or getattr(settings, 'MPESA_SHORTCODE')
     passkey = getattr(settings, 'MPESA_STK_PASSKEY', None) or getattr(settings, 'MPESA_PASSKEY')
     timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
     data_to_encode = shortcode + passkey + timestamp
     password = base64.b64encode(data_to_encode.encode()).decode('utf-8')
-    api_url = "https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query" if settings.MPESA_ENVIRONMENT == 'sandbox' else "https://api.safaricom.co.ke/mpesa/stkpushquery/v1/query"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
     payload = {
         "BusinessShortCode": shortcode,
         "Password": password,
@@ -108,12 +79,12 @@ def query_stk_status(checkout_request_id):
         "CheckoutRequestID": checkout_request_id,
     }
     try:
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=20)
+        resp = daraja.client().post("/mpesa/stkpushquery/v1/query", payload)
         try:
             return resp.json()
         except Exception as e:
             return {"error": f"Invalid JSON response: {e}", "raw": resp.text}
-    except requests.RequestException as e:
+    except (requests.RequestException, daraja.DarajaError) as e:
         return {"error": str(e)}
 
 def _derive_base_from_callback(callback_url: str) -> str:
@@ -155,12 +126,6 @@ def register_c2b_urls():
     if not (val_url and conf_url):
         return {"error": "Validation/Confirmation URLs not configured and base could not be derived"}
 
-    api_url = (
-        "https://sandbox.safaricom.co.ke/mpesa/c2b/v1/registerurl"
-        if getattr(settings, 'MPESA_ENVIRONMENT', 'sandbox') == 'sandbox'
-        else "https://api.safaricom.co.ke/mpesa/c2b/v1/registerurl"
-    )
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
     payload = {
         "ShortCode": shortcode,
         "ResponseType": "Completed",
@@ -168,7 +133,7 @@ def register_c2b_urls():
         "ValidationURL": val_url,
     }
     try:
-        resp = requests.post(api_url, json=payload, headers=headers, timeout=20)
+        resp = daraja.client().post("/mpesa/c2b/v1/registerurl", payload)
         try:
             data = resp.json()
         except Exception:
@@ -176,5 +141,5 @@ def register_c2b_urls():
         data["request"] = payload
         data["status_code"] = resp.status_code
         return data
-    except requests.RequestException as e:
+    except (requests.RequestException, daraja.DarajaError) as e:
         return {"error": str(e)}
@@ -1,26 +1,36 @@
 from io import BytesIO
 from django.http import HttpResponse
 
+PDF_UNAVAILABLE_MESSAGE = "PDF generation is unavailable: 'reportlab' is not installed. Please install it (pip install reportlab)."
 
-def pdf_response_from_rows(filename: str, title: str, header_rows: list[list[str]], columns: list[str], rows: list[list[str]], landscape_mode: bool = True) -> HttpResponse:
-    """Generate a simple PDF table response.
 
-    Lazy-imports reportlab to avoid crashing app startup when the dependency
-    is missing. If reportlab is unavailable, returns a 500 response with a
-    helpful message instead of raising ImportError during URL import.
+def pdf_unavailable_response() -> HttpResponse:
+    return HttpResponse(PDF_UNAVAILABLE_MESSAGE, content_type='text/plain', status=500)
+
+
+def _table_style(colors, TableStyle):
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#fafafa')]),
+    ])
+
+
+def render_blocks_pdf(title: str, header_rows: list[list[str]], blocks, landscape_mode: bool = True, empty_message: str = '') -> bytes:
+    """Render one table per block into PDF bytes.
+
+    blocks is an iterable of (subtitle, columns, rows); subtitle may be empty.
+    Tables after the first start on a new page. Raises ImportError when
+    reportlab is not installed.
     """
-    try:
-        from reportlab.lib.pagesizes import A4, landscape  # type: ignore
-        from reportlab.lib import colors  # type: ignore
-        from reportlab.lib.styles import getSampleStyleSheet  # type: ignore
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle  # type: ignore
-    except Exception:
-        resp = HttpResponse(
-            "PDF generation is unavailable: 'reportlab' is not installed. Please install it (pip install reportlab).",
-            content_type='text/plain',
-            status=500,
-        )
-        return resp
+    from reportlab.lib.pagesizes import A4, landscape  # type: ignore
+    from reportlab.lib import colors  # type: ignore
+    from reportlab.lib.styles import getSampleStyleSheet  # type: ignore
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak  # type: ignore
 
     buffer = BytesIO()
     pagesize = landscape(A4) if landscape_mode else A4
@@ -42,27 +52,49 @@ def pdf_response_from_rows(filename: str, title: str, header_rows: list[list[str
         story.append(Paragraph(title, styles['Title']))
         story.append(Spacer(1, 10))
 
-    # Build table data
-    data = [columns] + rows
-
-    table = Table(data, repeatRows=1)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
-        ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#fafafa')]),
-    ]))
-
-    story.append(table)
+    count = 0
+    for subtitle, columns, rows in blocks:
+        if count:
+            # Page break between blocks to avoid very wide stories
+            story.append(PageBreak())
+        count += 1
+        if subtitle:
+            story.append(Paragraph(subtitle, styles['Heading3']))
+            story.append(Spacer(1, 6))
+        table = Table([columns] + list(rows), repeatRows=1)
+        table.setStyle(_table_style(colors, TableStyle))
+        story.append(table)
+    if not count and empty_message:
+        story.append(Paragraph(empty_message, styles['Normal']))
 
     doc.build(story)
     pdf = buffer.getvalue()
     buffer.close()
+    return pdf
+
+
+def render_rows_pdf(title: str, header_rows: list[list[str]], columns: list[str], rows: list[list[str]], landscape_mode: bool = True) -> bytes:
+    """Render a single table into PDF bytes (see render_blocks_pdf)."""
+    return render_blocks_pdf(title, header_rows, [('', columns, rows)], landscape_mode=landscape_mode)
+
+
+def pdf_response_from_rows(filename: str, title: str, header_rows: list[list[str]], columns: list[str], rows: list[list[str]], landscape_mode: bool = True, user=None) -> HttpResponse:
+    """Generate a simple PDF table response.
+
+    Identical tables are served from a stored artifact; large ones are rendered
+    by a background job (see core.services.pdf_jobs). Lazy-imports reportlab to
+    avoid crashing app startup when the dependency is missing. If reportlab is
+    unavailable, returns a 500 response with a helpful message instead of
+    raising ImportError during URL import. user is the requester allowed to
+    download a queued job's result.
+    """
+    from core.services import pdf_jobs
 
-    resp = HttpResponse(content_type='application/pdf')
-    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
-    resp.write(pdf)
-    return resp
+    params = {
+        'title': title,
+        'header_rows': header_rows,
+        'columns': columns,
+        'rows': [['' if c is None else str(c) for c in row] for row in rows],
+        'landscape_mode': landscape_mode,
+    }
+    return pdf_jobs.respond('rows', params, filename, inline=len(rows) <= pdf_jobs.INLINE_MAX_ROWS, user=user)
@@ -0,0 +1,167 @@
+"""In-memory index of the academic calendar.
+
+Every Term (with its AcademicYear) is loaded in one query into a per-process
+memo, sorted by start date, so "which term is it today", the previous/next
+term and "terms before X" are answered with a bisect instead of a query. The
+memo is guarded by a version key in the shared cache that is bumped whenever
+a Term or AcademicYear is saved or deleted (see core.signals).
+
+The index itself is shared between requests, so the functions below hand
+out copies of its Term instances: callers may modify and save what they get
+without changing the index for everyone else.
+"""
+from bisect import bisect_left, bisect_right
+import copy
+import datetime
+import threading
+
+from django.utils import timezone
+
+from core.models import Term
+from core.services import cache_versions
+
+VERSION_KEY = cache_versions.register("academic_calendar:version")
+
+_lock = threading.Lock()
+_memo = {'version': None, 'index': None}
+
+
+class CalendarIndex:
+    """Terms sorted by (start_date, id); terms without a start date are kept apart.
+
+    Matches Term.objects.filter(start_date__lte=day, end_date__gte=day)
+    .order_by('start_date').first(): when terms overlap, the one that started
+    first wins.
+    """
+
+    __slots__ = ('terms', 'starts', 'undated', 'by_id', 'overlapping')
+
+    def __init__(self, terms):
+        dated = sorted((t for t in terms if t.start_date), key=lambda t: (t.start_date, t.id))
+        self.terms = dated
+        self.starts = [t.start_date for t in dated]
+        self.undated = [t for t in terms if not t.start_date]
+        self.by_id = {t.id: t for t in terms}
+        self.overlapping = any(
+            a.end_date is None or a.end_date >= b.start_date
+            for a, b in zip(dated, dated[1:])
+        )
+
+    def containing(self, day):
+        idx = bisect_right(self.starts, day)
+        if self.overlapping:
+            for term in self.terms[:idx]:
+                if term.end_date and term.end_date >= day:
+                    return term
+            return None
+        if idx and self.terms[idx - 1].end_date and self.terms[idx - 1].end_date >= day:
+            return self.terms[idx - 1]
+        return None
+
+
+def get_index():
+    version = cache_versions.current(VERSION_KEY)
+    if version is not None and _memo['version'] == version:
+        return _memo['index']
+    with _lock:
+        index = CalendarIndex(list(Term.objects.select_related('academic_year')))
+        _memo['version'] = version
+        _memo['index'] = index
+    return index
+
+
+def invalidate():
+    cache_versions.bump(VERSION_KEY)
+    _memo['version'] = None
+
+
+def _copy(term):
+    return copy.copy(term) if term is not None else None
+
+
+def _day(value):
+    if value is None:
+        return timezone.now().date()
+    if isinstance(value, Term):
+        return value.start_date
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def get_term(term_id):
+    """Term by id from the index, or None."""
+    try:
+        return _copy(get_index().by_id.get(int(term_id)))
+    except (TypeError, ValueError):
+        return None
+
+
+def current_term(today=None, fallback=False):
+    """Term whose [start_date, end_date] contains `today` (default: today).
+
+    With fallback=True and no such term, the latest open-ended term that has
+    started is used, then the latest term overall.
+    """
+    index = get_index()
+    day = _day(today)
+    term = index.containing(day)
+    if term is not None or not fallback:
+        return _copy(term)
+    started = index.terms[:bisect_right(index.starts, day)]
+    open_ended = [t for t in started if t.end_date is None]
+    if open_ended:
+        return _copy(open_ended[-1])
+    return latest_term()
+
+
+def latest_term():
+    """Term with the latest start date (an undated term if none is dated)."""
+    index = get_index()
+    if index.terms:
+        return _copy(index.terms[-1])
+    return _copy(index.undated[-1]) if index.undated else None
+
+
+def previous_term(term=None):
+    """Latest term that ended before `term` (default: the current term) started."""
+    term = current_term() if term is None else term
+    if term is None or not term.start_date:
+        return None
+    index = get_index()
+    earlier = index.terms[:bisect_left(index.starts, term.start_date)]
+    if index.overlapping:
+        ended = [t for t in earlier if t.end_date and t.end_date < term.start_date]
+        return _copy(max(ended, key=lambda t: t.end_date)) if ended else None
+    # Without overlaps end dates follow start order: the nearest ended term is the one
+    for t in reversed(earlier):
+        if t.end_date and t.end_date < term.start_date:
+            return _copy(t)
+    return None
+
+
+def next_term(today=None):
+    """First term starting on or after `today` (default: today)."""
+    index = get_index()
+    idx = bisect_left(index.starts, _day(today))
+    return _copy(index.terms[idx]) if idx < len(index.terms) else None
+
+
+def terms_before(value, inclusive=False):
+    """Terms (oldest first) starting before a date or a term's start date.
+
+    inclusive=True also keeps terms starting on that day. Undated terms are
+    never included, as with start_date__lt lookups.
+    """
+    index = get_index()
+    day = _day(value)
+    if day is None:
+        return []
+    idx = (bisect_right if inclusive else bisect_left)(index.starts, day)
+    return [_copy(t) for t in index.terms[:idx]]
+
+
+def all_terms():
+    """Every term, oldest first; undated terms last."""
+    index = get_index()
+    return [_copy(t) for t in index.terms + index.undated]
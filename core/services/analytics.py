@@ -0,0 +1,312 @@
+"""Set-based analytics engine behind the admin finance/academic dashboard.
+
+Every series returned by ``admin_analytics_data`` is computed from grouped SQL
+(``values()`` + ``Sum``/``Avg``/``Count`` with ``TruncMonth``/``TruncDate``) in a
+fixed number of queries, independent of how many payments or grades exist.
+Results are cached per filter combination; fee writes bump a version key so
+the next request recomputes.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from core.models import Class, FeeAssignment, FeePayment, Grade, Student, Subject, Term
+from core.services import academic_calendar, cache_versions
+
+ANALYTICS_TIMEOUT = 5 * 60  # seconds; grade-driven series refresh on expiry
+PASS_THRESHOLD = 50.0
+
+_VERSION_KEY = cache_versions.register("analytics:ver")
+
+
+def invalidate():
+    """Drop every cached analytics payload (fees or assignments changed)."""
+    cache_versions.bump(_VERSION_KEY)
+
+
+def _version():
+    return cache_versions.current(_VERSION_KEY)
+
+
+def _labelled(totals):
+    labels = list(totals.keys()) or ['No Data']
+    return {'labels': labels, 'data': [totals.get(k, 0) for k in labels] or [0]}
+
+
+def _per_day(pay_qs):
+    """{date: total} for the given payments, grouped in SQL."""
+    rows = (
+        pay_qs.annotate(day=TruncDate('payment_date'))
+        .values('day')
+        .annotate(total=Sum('amount_paid'))
+        .order_by()
+    )
+    return {r['day']: float(r['total'] or 0) for r in rows if r['day']}
+
+
+def _cumulative(per_day, start, end):
+    labels, data = [], []
+    running = 0.0
+    cur = start
+    while cur <= end:
+        running += per_day.get(cur, 0.0)
+        labels.append(cur.isoformat())
+        data.append(running)
+        cur += timedelta(days=1)
+    return {'labels': labels, 'data': data}
+
+
+def _band_expression():
+    # Stored letter wins; otherwise fall back to fixed score bands
+    return Case(
+        When(Q(grade_letter__isnull=False) & ~Q(grade_letter=''), then=F('grade_letter')),
+        When(score__gte=80, then=Value('A')),
+        When(score__gte=70, then=Value('B')),
+        When(score__gte=60, then=Value('C')),
+        When(score__gte=50, then=Value('D')),
+        default=Value('E'),
+        output_field=CharField(),
+    )
+
+
+def build_analytics(current_term, class_id=None, category_id=None, compare_prev=False, today=None):
+    """Compute the full analytics payload for one filter combination."""
+    today = today or timezone.now().date()
+
+    # --- Assigned amounts: per-class assignment totals x per-class headcount ---
+    fa_qs = FeeAssignment.objects.all()
+    if current_term:
+        fa_qs = fa_qs.filter(term=current_term)
+    if class_id:
+        fa_qs = fa_qs.filter(class_group_id=class_id)
+    if category_id:
+        fa_qs = fa_qs.filter(fee_category_id=category_id)
+    headcount = dict(
+        Student.objects.filter(class_group__isnull=False)
+        .values('class_group_id').annotate(n=Count('id')).order_by()
+        .values_list('class_group_id', 'n')
+    )
+    assigned_by_class = {
+        r['class_group_id']: float(r['total'] or 0) * headcount.get(r['class_group_id'], 0)
+        for r in fa_qs.values('class_group_id').annotate(total=Sum('amount')).order_by()
+    }
+    total_assigned = sum(assigned_by_class.values())
+
+    # --- Payments in scope ---
+    pay_qs = FeePayment.objects.all()
+    if current_term:
+        pay_qs = pay_qs.filter(fee_assignment__term=current_term)
+    if class_id:
+        pay_qs = pay_qs.filter(fee_assignment__class_group_id=class_id)
+    if category_id:
+        pay_qs = pay_qs.filter(fee_assignment__fee_category_id=category_id)
+
+    total_paid = float(pay_qs.aggregate(total=Sum('amount_paid'))['total'] or 0.0)
+    pie = {'labels': ["Paid", "Unpaid"], 'data': [total_paid, max(total_assigned - total_paid, 0.0)]}
+
+    monthly = (
+        pay_qs.annotate(month=TruncMonth('payment_date'))
+        .values('month').annotate(total=Sum('amount_paid')).order_by('month')
+    )
+    bar = {'labels': [], 'data': []}
+    for r in monthly:
+        if r['month']:
+            bar['labels'].append(r['month'].strftime('%Y-%m'))
+            bar['data'].append(float(r['total'] or 0))
+
+    method_totals = defaultdict(float)
+    for r in pay_qs.values('payment_method').annotate(total=Sum('amount_paid')).order_by():
+        method_totals[r['payment_method'] or 'Unknown'] += float(r['total'] or 0)
+    method = _labelled(method_totals)
+
+    category_totals = defaultdict(float)
+    for r in pay_qs.values('fee_assignment__fee_category__name').annotate(total=Sum('amount_paid')).order_by():
+        category_totals[r['fee_assignment__fee_category__name'] or 'Unknown'] += float(r['total'] or 0)
+    category = _labelled(category_totals)
+
+    # Outstanding by class (Top 10)
+    paid_by_class = {
+        r['fee_assignment__class_group_id']: float(r['total'] or 0)
+        for r in pay_qs.values('fee_assignment__class_group_id').annotate(total=Sum('amount_paid')).order_by()
+    }
+    classes = Class.objects.all()
+    if class_id:
+        classes = classes.filter(id=class_id)
+    class_outstanding = []
+    for cid, name in classes.values_list('id', 'name'):
+        outstanding = assigned_by_class.get(cid, 0.0) - paid_by_class.get(cid, 0.0)
+        if outstanding > 0:
+            class_outstanding.append((name, outstanding))
+    class_outstanding.sort(key=lambda t: t[1], reverse=True)
+    class_out = {
+        'labels': [t[0] for t in class_outstanding[:10]] or ['No Data'],
+        'data': [t[1] for t in class_outstanding[:10]] or [0],
+    }
+
+    # Daily (last 14 days) and cumulative-in-term share one per-day query
+    start_14 = today - timedelta(days=13)
+    window_start = min(start_14, current_term.start_date) if (current_term and current_term.start_date) else start_14
+    per_day = _per_day(pay_qs.filter(payment_date__date__gte=window_start, payment_date__date__lte=today))
+    daily_labels = [start_14 + timedelta(days=i) for i in range(14)]
+    daily = {
+        'labels': [d.isoformat() for d in daily_labels],
+        'data': [per_day.get(d, 0.0) for d in daily_labels],
+    }
+    cum = {'labels': [], 'data': []}
+    if current_term and current_term.start_date:
+        cum = _cumulative(per_day, current_term.start_date, today)
+
+    # Previous term comparison: one per-day query, monthly derived from it
+    cum_prev = {'labels': [], 'data': []}
+    bar_prev = {'labels': [], 'data': []}
+    if compare_prev and current_term and current_term.start_date:
+        prev_term = academic_calendar.previous_term(current_term)
+        if prev_term:
+            pay_prev = FeePayment.objects.filter(fee_assignment__term=prev_term)
+            if class_id:
+                pay_prev = pay_prev.filter(fee_assignment__class_group_id=class_id)
+            if category_id:
+                pay_prev = pay_prev.filter(fee_assignment__fee_category_id=category_id)
+            prev_days = _per_day(pay_prev)
+            m_prev = defaultdict(float)
+            for day, total in prev_days.items():
+                m_prev[day.strftime('%Y-%m')] += total
+            months_prev = sorted(m_prev.keys())
+            bar_prev = {'labels': months_prev, 'data': [m_prev[m] for m in months_prev]}
+            if prev_term.start_date and prev_term.end_date:
+                cum_prev = _cumulative(prev_days, prev_term.start_date, prev_term.end_date)
+
+    # Top debtors in selected class (top 10)
+    top_debtors = []
+    if class_id:
+        assign_qs = FeeAssignment.objects.filter(class_group_id=class_id)
+        if current_term:
+            assign_qs = assign_qs.filter(term=current_term)
+        if category_id:
+            assign_qs = assign_qs.filter(fee_category_id=category_id)
+        assigned_amount = float(assign_qs.aggregate(total=Sum('amount'))['total'] or 0.0)
+        paid_by_student = {
+            r['student_id']: float(r['total'] or 0)
+            for r in (
+                FeePayment.objects
+                .filter(student__class_group_id=class_id, fee_assignment__in=assign_qs)
+                .values('student_id').annotate(total=Sum('amount_paid')).order_by()
+            )
+        }
+        for s in Student.objects.filter(class_group_id=class_id).select_related('user'):
+            balance = max(assigned_amount - paid_by_student.get(s.id, 0.0), 0.0)
+            if balance > 0:
+                top_debtors.append({
+                    'student': (s.user.get_full_name() or s.user.username) if s.user else s.admission_no,
+                    'admission_no': s.admission_no,
+                    'balance': balance,
+                })
+        top_debtors.sort(key=lambda x: x['balance'], reverse=True)
+        top_debtors = top_debtors[:10]
+
+    # --- Academic visualizations ---
+    subject_trend = {'labels': [], 'datasets': []}
+    class_avg = {'labels': [], 'data': []}
+    grade_bands = {'labels': ['A', 'B', 'C', 'D', 'E'], 'data': [0, 0, 0, 0, 0]}
+    pass_rate = {'labels': ['Pass', 'Fail'], 'data': [0, 0]}
+
+    last_terms = list(Term.objects.select_related('academic_year').order_by('-start_date')[:3])[::-1]
+    subject_trend['labels'] = [f"{t.name} {t.academic_year.year}" for t in last_terms]
+
+    grade_scope = Grade.objects.all()
+    if class_id:
+        grade_scope = grade_scope.filter(student__class_group_id=class_id)
+
+    if current_term:
+        # Top 5 subjects by current-term average, then their averages over the last terms
+        top_subject_ids = list(
+            grade_scope.filter(exam__term=current_term)
+            .values('subject_id').annotate(avg=Avg('score')).order_by('-avg')
+            .values_list('subject_id', flat=True)[:5]
+        )
+        if top_subject_ids:
+            trend = {
+                (r['exam__term_id'], r['subject_id']): r['avg']
+                for r in (
+                    grade_scope.filter(exam__term__in=last_terms, subject_id__in=top_subject_ids)
+                    .values('exam__term_id', 'subject_id').annotate(avg=Avg('score')).order_by()
+                )
+            }
+            names = dict(Subject.objects.filter(id__in=top_subject_ids).values_list('id', 'name'))
+            for sid in top_subject_ids:
+                data_points = []
+                for t in last_terms:
+                    avg = trend.get((t.id, sid))
+                    data_points.append(round(avg, 2) if avg is not None else 0)
+                subject_trend['datasets'].append({'label': names.get(sid) or f"Subject {sid}", 'data': data_points})
+
+    if current_term and class_id:
+        level = Class.objects.filter(id=class_id).values_list('level', flat=True).first()
+        if level is not None:
+            # Class averages comparison within the same level
+            avgs = {
+                r['student__class_group_id']: r['avg']
+                for r in (
+                    Grade.objects.filter(exam__term=current_term, student__class_group__level=level)
+                    .values('student__class_group_id').annotate(avg=Avg('score')).order_by()
+                )
+            }
+            for cid, name in Class.objects.filter(level=level).values_list('id', 'name'):
+                avg = avgs.get(cid)
+                class_avg['labels'].append(name)
+                class_avg['data'].append(round(avg, 2) if avg is not None else 0)
+
+        # Grade bands and pass rate for selected class & term
+        term_grades = grade_scope.filter(exam__term=current_term)
+        counts = dict(
+            term_grades.annotate(band=_band_expression())
+            .values('band').annotate(n=Count('id')).order_by()
+            .values_list('band', 'n')
+        )
+        grade_bands['data'] = [counts.get(b, 0) for b in grade_bands['labels']]
+        outcome = term_grades.aggregate(
+            passed=Count('id', filter=Q(score__gte=PASS_THRESHOLD)),
+            failed=Count('id', filter=Q(score__lt=PASS_THRESHOLD)),
+        )
+        pass_rate['data'] = [outcome['passed'] or 0, outcome['failed'] or 0]
+
+    return {
+        'pie': pie,
+        'bar': bar,
+        'bar_prev': bar_prev,
+        'method': method,
+        'class_out': class_out,
+        'category': category,
+        'daily': daily,
+        'cum': cum,
+        'cum_prev': cum_prev,
+        # Academic datasets
+        'subject_trend': subject_trend,
+        'class_avg': class_avg,
+        'grade_bands': grade_bands,
+        'pass_rate': pass_rate,
+        'summary': {
+            'total_assigned': total_assigned,
+            'total_paid': total_paid,
+            'payment_percentage': round((total_paid / total_assigned * 100) if total_assigned else 0, 2),
+        },
+        'top_debtors': top_debtors,
+    }
+
+
+def get_analytics(current_term, class_id=None, category_id=None, compare_prev=False, today=None):
+    """Cached ``build_analytics`` keyed on (term, class, category, compare_prev)."""
+    today = today or timezone.now().date()
+    key = "analytics:{}:{}:{}:{}:{}:{}".format(
+        getattr(current_term, 'id', None), class_id or '', category_id or '',
+        int(bool(compare_prev)), today.isoformat(), _version(),
+    )
+    data = cache.get(key)
+    if data is None:
+        data = build_analytics(current_term, class_id, category_id, compare_prev, today)
+        cache.set(key, data, timeout=ANALYTICS_TIMEOUT)
+    return data
@@ -0,0 +1,122 @@
+"""Register capture: one prefetch, one bulk insert and one bulk update per lesson.
+
+Attendance rows are keyed by (student, date, period). The period is taken from
+the class's DefaultTimetable slot that is running now; when no slot is found
+(unscheduled lesson, weekend) rows are keyed by (student, subject, date) with
+an empty period, as the register has always done (a conditional unique
+constraint keeps those from duplicating).
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.models import Attendance, DefaultTimetable, Student
+
+VALID_STATUSES = {value for value, _label in Attendance.STATUS_CHOICES}
+
+
+def current_period(class_group, subject=None, at=None):
+    """PeriodSlot of the class's timetable entry running at `at` (default now).
+
+    When the running slot belongs to another subject (register taken late or
+    early), the subject's nearest slot the same day is used instead. Returns
+    None when the class has nothing scheduled for the subject that day.
+    """
+    at = timezone.localtime(at) if at else timezone.localtime()
+    entries = list(
+        DefaultTimetable.objects.filter(class_group=class_group, day=at.strftime('%A'))
+        .select_related('period')
+        .only('subject_id', 'period__start_time', 'period__end_time', 'period__label', 'period__is_class_slot')
+    )
+    now = at.time()
+    for entry in entries:
+        if entry.period.start_time <= now <= entry.period.end_time:
+            if subject is None or entry.subject_id == getattr(subject, 'id', subject):
+                return entry.period
+            break
+    if subject is None:
+        return None
+    subject_id = getattr(subject, 'id', subject)
+    own = [e.period for e in entries if e.subject_id == subject_id]
+    if not own:
+        return None
+
+    def distance(period):
+        start = datetime.datetime.combine(at.date(), period.start_time)
+        end = datetime.datetime.combine(at.date(), period.end_time)
+        here = datetime.datetime.combine(at.date(), now)
+        return min(abs((start - here).total_seconds()), abs((end - here).total_seconds()))
+
+    return min(own, key=distance)
+
+
+def record_register(teacher, class_group, subject, statuses, date=None, period=None):
+    """Save a whole register: statuses is {student_id: status}.
+
+    Students outside the class and unknown statuses are reported, not saved.
+    Returns {'created', 'updated', 'unchanged', 'invalid': [{student_id, reason}], 'period_id'}.
+    """
+    date = date or timezone.localdate()
+    report = {'created': 0, 'updated': 0, 'unchanged': 0, 'invalid': [], 'period_id': getattr(period, 'id', None)}
+
+    members = set(Student.objects.filter(class_group=class_group).values_list('id', flat=True))
+    wanted = {}
+    for raw_id, status in statuses.items():
+        try:
+            student_id = int(raw_id)
+        except (TypeError, ValueError):
+            report['invalid'].append({'student_id': raw_id, 'reason': 'Invalid student id'})
+            continue
+        if student_id not in members:
+            report['invalid'].append({'student_id': student_id, 'reason': 'Not in this class'})
+        elif status not in VALID_STATUSES:
+            report['invalid'].append({'student_id': student_id, 'reason': f'Unknown status {status!r}'})
+        else:
+            wanted[student_id] = status
+    if not wanted:
+        return report
+
+    existing = Attendance.objects.filter(student_id__in=list(wanted), date=date)
+    if period is not None:
+        existing = existing.filter(period=period)
+    else:
+        existing = existing.filter(period__isnull=True, subject=subject)
+
+    try:
+        with transaction.atomic():
+            written = _write(existing, wanted, teacher, class_group, subject, date, period)
+    except IntegrityError:
+        # Another submission of the same register inserted first; its rows exist now
+        with transaction.atomic():
+            written = _write(existing, wanted, teacher, class_group, subject, date, period)
+    report['created'], report['updated'], report['unchanged'] = written
+    return report
+
+
+def _write(existing, wanted, teacher, class_group, subject, date, period):
+    """Insert/update the register rows; returns (created, updated, unchanged)."""
+    now = timezone.now()
+    current = {row.student_id: row for row in existing.select_for_update()}
+    to_create, to_update, unchanged = [], [], 0
+    for student_id, status in wanted.items():
+        row = current.get(student_id)
+        if row is None:
+            to_create.append(Attendance(
+                student_id=student_id, subject=subject, teacher=teacher, class_group=class_group,
+                date=date, status=status, timestamp=now, period=period,
+            ))
+        elif (row.status, row.subject_id, row.teacher_id, row.class_group_id) == (status, subject.id, teacher.id, class_group.id):
+            unchanged += 1
+        else:
+            row.status = status
+            row.subject = subject
+            row.teacher = teacher
+            row.class_group = class_group
+            row.timestamp = now
+            to_update.append(row)
+    if to_create:
+        Attendance.objects.bulk_create(to_create, batch_size=500)
+    if to_update:
+        Attendance.objects.bulk_update(to_update, ['status', 'subject', 'teacher', 'class_group', 'timestamp'], batch_size=500)
+    return len(to_create), len(to_update), unchanged
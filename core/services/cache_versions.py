@@ -0,0 +1,55 @@
+"""Version counters behind the versioned caches.
+
+A cached value carries the version of its namespace in its key (or next to
+it); bump() moves the version on, so values built from older data are never
+read again and age out on their own timeout. A missing counter (never set, or
+evicted) starts from time.time_ns(), a value that was never used before.
+
+Counters must be read from the shared cache tier, never from a per-process
+copy. Each module registers its version key, or the prefix of a family of
+keys, with register() and core.cache_backends.TieredCache bypasses its local
+tier for every registered prefix.
+"""
+import time
+
+from django.core.cache import cache
+
+_prefixes = ()
+
+
+def register(prefix):
+    """Declare a version key (or key prefix) as shared-tier only; returns it unchanged."""
+    global _prefixes
+    if prefix not in _prefixes:
+        _prefixes = _prefixes + (prefix,)
+    return prefix
+
+
+def registered():
+    """Tuple of the registered prefixes (str.startswith accepts it as is)."""
+    return _prefixes
+
+
+def bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def current(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def current_many(keys):
+    """Versions of several keys, in order, with one get_many when all exist."""
+    found = cache.get_many(keys)
+    for key in keys:
+        if found.get(key) is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
@@ -0,0 +1,222 @@
+"""Calendar feed shared by the FullCalendar endpoints.
+
+Events and exams overlapping a window are serialized once per window and
+cached as ready-to-send JSON with an ETag; a teacher's responsibilities are
+cached separately per teacher and window, so the shared part is reused across
+roles. Event, Exam, TeacherResponsibility and Term writes bump a version key
+(see core.signals), so the next request rebuilds only the windows it asks for.
+The ETag is a hash of the body: a rebuild that yields the same items keeps it,
+and the client's If-None-Match still gets a 304.
+"""
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.models import Event, Exam, TeacherResponsibility
+from core.services import cache_versions
+
+FEED_TIMEOUT = 10 * 60  # seconds
+DEFAULT_SPAN = datetime.timedelta(days=365)
+
+_VERSION_KEY = cache_versions.register("calendar_feed:ver")
+
+
+def invalidate():
+    cache_versions.bump(_VERSION_KEY)
+
+
+def _version():
+    return cache_versions.current(_VERSION_KEY)
+
+
+def _parse_bound(value):
+    """FullCalendar sends ISO datetimes (or bare dates); anything unparseable is ignored."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.datetime.combine(day, datetime.time.min) if day else None
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Window:
+    """Requested range; without bounds, events are limited to a year either side of today."""
+
+    __slots__ = ('start', 'end', 'default')
+
+    def __init__(self, start=None, end=None):
+        self.start = _parse_bound(start)
+        self.end = _parse_bound(end)
+        self.default = self.start is None and self.end is None
+
+    @property
+    def key(self):
+        if self.default:
+            return f"default:{timezone.localdate().isoformat()}"
+        return f"{self.start.isoformat() if self.start else ''}:{self.end.isoformat() if self.end else ''}"
+
+
+def _event_items(window):
+    qs = Event.objects.filter(is_done=False).exclude(start__isnull=True)
+    if window.default:
+        today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        qs = qs.filter(start__gte=today - DEFAULT_SPAN, start__lte=today + DEFAULT_SPAN)
+    if window.start:
+        # Open-ended events (end is NULL) stay in every window after their start
+        qs = qs.filter(Q(end__gte=window.start) | Q(end__isnull=True))
+    if window.end:
+        qs = qs.filter(start__lte=window.end)
+    return [
+        {
+            'id': f'event-{e.id}',
+            'title': e.title,
+            'start': e.start.isoformat(),
+            'end': e.end.isoformat() if e.end else None,
+            'allDay': e.all_day,
+            'category': e.category,
+        }
+        for e in qs.order_by('start').only('id', 'title', 'start', 'end', 'all_day', 'category')
+    ]
+
+
+def _exams(window):
+    qs = Exam.objects.select_related('term').exclude(start_date__isnull=True)
+    if window.start:
+        qs = qs.filter(end_date__gte=timezone.localtime(window.start).date())
+    if window.end:
+        qs = qs.filter(start_date__lte=timezone.localtime(window.end).date())
+    return qs.order_by('start_date', 'id')
+
+
+def _exam_items(window):
+    items = []
+    for ex in _exams(window):
+        # FullCalendar expects allDay 'end' to be exclusive
+        end = (ex.end_date or ex.start_date) + datetime.timedelta(days=1)
+        items.append({
+            'id': f'exam-{ex.id}',
+            'title': ex.name,
+            'start': ex.start_date.isoformat(),
+            'end': end.isoformat(),
+            'allDay': True,
+            'category': 'exam',
+            'term': str(ex.term),
+            'level': ex.level,
+            'type': ex.get_type_display(),
+        })
+    return items
+
+
+def _responsibility_items(teacher_id, window):
+    qs = TeacherResponsibility.objects.filter(teacher_id=teacher_id)
+    # Include NULLs on the opposite bound so open-ended responsibilities still appear
+    if window.start:
+        qs = qs.filter(Q(end_date__gte=timezone.localtime(window.start).date()) | Q(end_date__isnull=True))
+    if window.end:
+        qs = qs.filter(Q(start_date__lte=timezone.localtime(window.end).date()) | Q(start_date__isnull=True))
+    items = []
+    for r in qs.order_by('id'):
+        base_start = r.start_date or (timezone.localtime(r.assigned_at).date() if r.assigned_at else timezone.localdate())
+        base_end = r.end_date or r.start_date or base_start
+        items.append({
+            'id': f'resp-{r.id}',
+            'title': r.responsibility,
+            'start': base_start.isoformat(),
+            'end': (base_end + datetime.timedelta(days=1)).isoformat(),
+            'allDay': True,
+            'category': 'responsibility',
+            'details': r.details or '',
+        })
+    return items
+
+
+def _cached_items(key, build):
+    items = cache.get(key)
+    if items is None:
+        items = build()
+        cache.set(key, items, timeout=FEED_TIMEOUT)
+    return items
+
+
+def _encode(key, build):
+    """(body, etag) cached under key; build() returns the items."""
+    entry = cache.get(key)
+    if entry is None:
+        body = json.dumps(build(), cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+        entry = (body, '"%s"' % hashlib.md5(body).hexdigest())
+        cache.set(key, entry, timeout=FEED_TIMEOUT)
+    return entry
+
+
+def shared_items(window):
+    """Events and exams overlapping the window, as FullCalendar items."""
+    prefix = f"calendar_feed:{_version()}:{window.key}"
+    return (
+        _cached_items(f"{prefix}:events", lambda: _event_items(window))
+        + _cached_items(f"{prefix}:exams", lambda: _exam_items(window))
+    )
+
+
+def feed(window, teacher_id=None):
+    """(body, etag) of the calendar feed; a teacher's feed adds their responsibilities."""
+    version = _version()
+    scope = f"teacher-{teacher_id}" if teacher_id else "shared"
+
+    def build():
+        items = shared_items(window)
+        if teacher_id:
+            items = items + _cached_items(
+                f"calendar_feed:{version}:{window.key}:resp:{teacher_id}",
+                lambda: _responsibility_items(teacher_id, window),
+            )
+        return items
+
+    return _encode(f"calendar_feed:{version}:{window.key}:{scope}:body", build)
+
+
+def exam_feed(window):
+    """(body, etag) of exam items alone, in the events feed's shape."""
+    return _encode(
+        f"calendar_feed:{_version()}:{window.key}:exams:body",
+        lambda: _cached_items(f"calendar_feed:{_version()}:{window.key}:exams", lambda: _exam_items(window)),
+    )
+
+
+def exam_calendar(window):
+    """(body, etag) of exams in the admin exam calendar's shape (extendedProps, colour)."""
+    def build():
+        items = []
+        for exam in _exams(window):
+            end_date = exam.end_date or exam.start_date
+            if exam.start_date == end_date:
+                # For single-day events, FullCalendar needs the end date to be the next day
+                end_date = end_date + datetime.timedelta(days=1)
+            term_name = exam.term.name if exam.term else 'No Term'
+            items.append({
+                'id': exam.id,
+                'title': exam.name,
+                'start': exam.start_date.isoformat(),
+                'end': end_date.isoformat(),
+                'extendedProps': {
+                    'term': term_name,
+                    'type': exam.get_type_display(),
+                    'description': f"{exam.name} - {term_name}",
+                },
+                'className': 'fc-event-exam',
+                'color': '#0d47a1',
+            })
+        return items
+
+    return _encode(f"calendar_feed:{_version()}:{window.key}:exam_calendar:body", build)
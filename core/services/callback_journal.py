@@ -0,0 +1,193 @@
+"""Append-only journal for M-Pesa callbacks (STK and C2B).
+
+Entries are JSON Lines written with a single ``os.write`` on an ``O_APPEND``
+descriptor, so concurrent gunicorn workers never interleave or rewrite each
+other's records. The active segment rotates when it passes a size limit or
+when the day changes; rotated segments are optionally gzipped. Readers stream
+segments newest-first and only parse as many lines as the requested page needs.
+"""
+from collections import deque
+from datetime import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_NAME = 'callbacks.jsonl'
+_BLOCK = 64 * 1024
+_STALE_TMP = 10 * 60  # seconds before an abandoned .gz.tmp is cleared
+
+
+def journal_dir():
+    path = getattr(settings, 'MPESA_CALLBACK_JOURNAL_DIR', None) or os.path.join(settings.BASE_DIR, 'logs', 'mpesa_callbacks')
+    return str(path)
+
+
+def _active_path():
+    return os.path.join(journal_dir(), ACTIVE_NAME)
+
+
+def _segments():
+    """Rotated segment paths, oldest first (names sort chronologically)."""
+    pattern = os.path.join(journal_dir(), 'callbacks-*.jsonl*')
+    return sorted(p for p in glob.glob(pattern) if p.endswith(('.jsonl', '.jsonl.gz')))
+
+
+def _needs_rotation(path, size_hint=0):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if st.st_size == 0:
+        return False
+    max_bytes = int(getattr(settings, 'MPESA_CALLBACK_JOURNAL_MAX_BYTES', 5 * 1024 * 1024))
+    if max_bytes and st.st_size + size_hint > max_bytes:
+        return True
+    last_day = datetime.fromtimestamp(st.st_mtime, tz=timezone.get_current_timezone()).date()
+    return last_day != timezone.localdate()
+
+
+def _compress_segment(seg):
+    """Gzip one rotated segment; only the worker that creates the .gz.tmp does it."""
+    tmp = seg + '.gz.tmp'
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o640)
+    except FileExistsError:
+        # Another worker is compressing it, unless that worker died mid-way
+        try:
+            if time.time() - os.stat(tmp).st_mtime > _STALE_TMP:
+                _discard(tmp)
+        except OSError:
+            pass
+        return
+    try:
+        with os.fdopen(fd, 'wb') as raw, open(seg, 'rb') as src, gzip.GzipFile(fileobj=raw, mode='wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, seg + '.gz')
+        os.remove(seg)
+    except FileNotFoundError:
+        # Compressed and removed by another worker between our glob and open
+        _discard(tmp)
+    except OSError as e:
+        _discard(tmp)
+        logger.warning("Callback journal: could not compress %s: %s", seg, e)
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _compress_older_segments(keep):
+    # The just-rotated segment is left alone: a worker may still hold it open.
+    for seg in _segments():
+        if seg.endswith('.gz') or seg == keep:
+            continue
+        _compress_segment(seg)
+
+
+def rotate():
+    """Move the active segment aside; safe if several workers race to do it."""
+    active = _active_path()
+    stamp = timezone.localtime().strftime('%Y%m%d-%H%M%S-%f')
+    target = os.path.join(journal_dir(), f'callbacks-{stamp}-{os.getpid()}.jsonl')
+    try:
+        os.rename(active, target)
+    except FileNotFoundError:
+        return None  # another worker rotated first
+    if getattr(settings, 'MPESA_CALLBACK_JOURNAL_GZIP', True):
+        _compress_older_segments(keep=target)
+    return target
+
+
+def append(status, details, timestamp=None):
+    """Record one callback. Never raises: callers must always answer Safaricom."""
+    entry = {'timestamp': timestamp or timezone.now().isoformat(), 'status': status, 'details': details}
+    try:
+        line = (json.dumps(entry, default=str, separators=(',', ':')) + '\n').encode('utf-8')
+        os.makedirs(journal_dir(), exist_ok=True)
+        active = _active_path()
+        if _needs_rotation(active, len(line)):
+            rotate()
+        fd = os.open(active, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        return True
+    except Exception as e:
+        logger.error("Callback journal append failed: %s", e)
+        return False
+
+
+def _reverse_lines(path):
+    """Yield lines of a plain file from last to first, reading fixed-size blocks."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b''
+        while pos > 0:
+            step = min(_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step) + tail
+            parts = chunk.split(b'\n')
+            tail = parts.pop(0)
+            for raw in reversed(parts):
+                if raw.strip():
+                    yield raw
+        if tail.strip():
+            yield tail
+
+
+def _reverse_gz_lines(path, limit):
+    # gzip cannot seek backwards cheaply; keep only the last `limit` lines
+    with gzip.open(path, 'rb') as f:
+        tail = deque((raw for raw in f if raw.strip()), maxlen=limit)
+    while tail:
+        yield tail.pop().rstrip(b'\n')
+
+
+def iter_raw_newest_first(limit=None):
+    """Yield raw JSON lines (bytes) newest first across active and rotated segments."""
+    paths = [_active_path()] + list(reversed(_segments()))
+    produced = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        lines = _reverse_gz_lines(path, (limit - produced) if limit else None) if path.endswith('.gz') else _reverse_lines(path)
+        for raw in lines:
+            yield raw
+            produced += 1
+            if limit and produced >= limit:
+                return
+
+
+def read_page(page=1, per_page=50):
+    """Return (entries, has_next) for a newest-first page; parses only what it returns."""
+    page = max(int(page or 1), 1)
+    start = (page - 1) * per_page
+    entries = []
+    has_next = False
+    for idx, raw in enumerate(iter_raw_newest_first(limit=start + per_page + 1)):
+        if idx < start:
+            continue
+        if len(entries) == per_page:
+            has_next = True
+            break
+        try:
+            entries.append(json.loads(raw))
+        except ValueError:
+            entries.append({'timestamp': None, 'status': 'corrupt', 'details': raw.decode('utf-8', 'replace')})
+    return entries, has_next
+
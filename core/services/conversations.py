@@ -0,0 +1,122 @@
+"""Direct-message conversation index behind the messaging inboxes.
+
+Conversation keeps one row per participant side of a thread: last message,
+its time and a short preview, the unread count of messages received on that
+side, and that side's pin/mute/archive flags. Rows are updated as Message rows
+are inserted or deleted (see core.signals), so listing an inbox is one query
+joining the candidate users to the owner's rows, instead of three Message
+queries per user.
+
+Group and broadcast messages (or messages without a recipient) are not part
+of a conversation.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import BooleanField, F, FilteredRelation, Q, Value
+from django.db.models.functions import Coalesce
+
+from core.models import Conversation, Message
+
+FLAGS = ('pinned', 'muted', 'archived')
+
+
+def preview(text):
+    text = ' '.join((text or '').split())
+    limit = Conversation.PREVIEW_LENGTH
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+def is_direct(message):
+    return bool(message.recipient_id) and not message.group_id and not message.broadcast_id
+
+
+def _upsert(user_id, peer_id, fields, unread=0):
+    updates = dict(fields, unread_count=F('unread_count') + unread)
+    if Conversation.objects.filter(user_id=user_id, peer_id=peer_id).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            Conversation.objects.create(user_id=user_id, peer_id=peer_id, unread_count=unread, **fields)
+    except IntegrityError:
+        # Created concurrently by another message of the same pair
+        Conversation.objects.filter(user_id=user_id, peer_id=peer_id).update(**updates)
+
+
+def record(message):
+    """Fold a newly inserted direct message into both participants' rows."""
+    if not is_direct(message):
+        return
+    fields = {
+        'last_message_id': message.id,
+        'last_message_at': message.timestamp,
+        'last_message_preview': preview(message.content),
+    }
+    _upsert(message.sender_id, message.recipient_id, fields)
+    if message.recipient_id != message.sender_id:
+        _upsert(message.recipient_id, message.sender_id, fields, unread=0 if message.is_read else 1)
+
+
+def _pair(user_id, peer_id):
+    return Message.objects.filter(
+        Q(sender_id=user_id, recipient_id=peer_id) | Q(sender_id=peer_id, recipient_id=user_id),
+        group__isnull=True, broadcast__isnull=True,
+    )
+
+
+def refresh(user_id, peer_id):
+    """Recompute both sides of a pair from Message (after deletes or bulk edits)."""
+    last = _pair(user_id, peer_id).order_by('-timestamp', '-id').first()
+    fields = {
+        'last_message': last,
+        'last_message_at': last.timestamp if last else None,
+        'last_message_preview': preview(last.content) if last else '',
+    }
+    for owner, other in {(user_id, peer_id), (peer_id, user_id)}:
+        unread = Message.objects.filter(
+            sender_id=other, recipient_id=owner, is_read=False, group__isnull=True, broadcast__isnull=True,
+        ).count()
+        Conversation.objects.filter(user_id=owner, peer_id=other).update(unread_count=unread, **fields)
+
+
+def mark_read(user, peer):
+    """Mark peer's messages to user as read; returns how many changed."""
+    updated = Message.objects.filter(sender=peer, recipient=user, is_read=False).update(is_read=True)
+    Conversation.objects.filter(user=user, peer=peer).update(unread_count=0)
+    return updated
+
+
+def set_flag(user, peer, flag, value):
+    """Set pinned/muted/archived on user's side of the conversation with peer."""
+    if flag not in FLAGS:
+        raise ValueError(f"unknown conversation flag: {flag}")
+    conversation, _created = Conversation.objects.get_or_create(user=user, peer=peer)
+    if getattr(conversation, flag) != value:
+        setattr(conversation, flag, value)
+        conversation.save(update_fields=[flag])
+    return conversation
+
+
+def inbox(user, peers):
+    """peers (a User queryset) annotated with user's side of each conversation.
+
+    Ordered pinned first, archived last, then most recent message first;
+    users never messaged come after, by name. Each row gets last_message_at,
+    last_message_preview, unread_count and the flags (None/0/False when
+    there is no conversation yet).
+    """
+    false = Value(False, output_field=BooleanField())
+    return (
+        peers.annotate(conv=FilteredRelation('conversations_as_peer', condition=Q(conversations_as_peer__user=user)))
+        .annotate(
+            last_message_at=F('conv__last_message_at'),
+            last_message_preview=Coalesce(F('conv__last_message_preview'), Value('')),
+            unread_count=Coalesce(F('conv__unread_count'), Value(0)),
+            pinned=Coalesce(F('conv__pinned'), false),
+            muted=Coalesce(F('conv__muted'), false),
+            archived=Coalesce(F('conv__archived'), false),
+        )
+        .order_by(
+            F('pinned').desc(), F('archived').asc(),
+            F('last_message_at').desc(nulls_last=True),
+            'first_name', 'last_name', 'username',
+        )
+    )
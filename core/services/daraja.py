@@ -0,0 +1,198 @@
+"""Safaricom Daraja HTTP client with a shared OAuth token.
+
+core.mpesa_utils used to fetch a new OAuth token for every STK push, status
+query and URL registration, each over a fresh connection. DarajaClient keeps:
+
+* the token in the cache until shortly before its expires_in runs out
+  (REFRESH_MARGIN seconds early), shared by every worker process;
+* a cache lock so only one process refreshes an expiring token while the
+  others wait briefly for it (or keep using the still-valid old token);
+* one pooled requests.Session per process, retrying connection failures and
+  retrying the idempotent OAuth GET on 5xx. STK pushes are never re-sent after
+  reaching Daraja, since that could charge a parent twice;
+* per-process counters of token fetches, cache hits and lock waits (metrics()).
+
+client() returns the process-wide instance built from settings. Set
+MPESA_API_BASE_URL to point it at another host (a local stub server in tests).
+"""
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+logger = logging.getLogger(__name__)
+
+SANDBOX_URL = "https://sandbox.safaricom.co.ke"
+PRODUCTION_URL = "https://api.safaricom.co.ke"
+
+REFRESH_MARGIN = 60      # seconds before expiry a token is refreshed
+DEFAULT_EXPIRES_IN = 3599
+LOCK_TIMEOUT = 30        # seconds a refresh may hold the lock
+LOCK_WAIT = 5.0          # seconds a process waits for another one's refresh
+TIMEOUT = 20             # per request, seconds
+
+METRIC_FIELDS = ('token_fetches', 'token_fetch_errors', 'token_cache_hits', 'token_lock_waits', 'unauthorized_retries')
+
+
+class DarajaError(Exception):
+    """The OAuth token could not be obtained."""
+
+
+def _session(pool_size):
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=2,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class DarajaClient:
+    def __init__(self, consumer_key, consumer_secret, base_url, *, cache=None, session=None,
+                 refresh_margin=REFRESH_MARGIN, timeout=TIMEOUT, pool_size=10):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache if cache is not None else default_cache
+        self.session = session if session is not None else _session(pool_size)
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.stats = dict.fromkeys(METRIC_FIELDS, 0)
+        self._stats_lock = threading.Lock()
+        # Tokens are per app and host; never key the cache on the secret itself
+        app = hashlib.sha256(f"{self.base_url}|{consumer_key}".encode()).hexdigest()[:16]
+        self.token_key = f"mpesa_token:{app}"
+        self.lock_key = f"mpesa_token:lock:{app}"
+
+    def _count(self, field):
+        with self._stats_lock:
+            self.stats[field] += 1
+
+    def metrics(self):
+        with self._stats_lock:
+            return dict(self.stats)
+
+    # --- OAuth token --------------------------------------------------------
+    def _cached(self):
+        """(token, expires_at) from the cache, or (None, 0)."""
+        entry = self.cache.get(self.token_key)
+        if not entry:
+            return None, 0
+        return entry['token'], entry['expires_at']
+
+    def _fetch(self):
+        if not self.consumer_key or not self.consumer_secret:
+            raise DarajaError("Missing MPESA_CONSUMER_KEY/MPESA_CONSUMER_SECRET in settings.")
+        self._count('token_fetches')
+        try:
+            r = self.session.get(
+                f"{self.base_url}/oauth/v1/generate",
+                params={'grant_type': 'client_credentials'},
+                auth=(self.consumer_key, self.consumer_secret),
+                timeout=self.timeout,
+            )
+            data = r.json()
+        except (requests.RequestException, ValueError) as e:
+            self._count('token_fetch_errors')
+            raise DarajaError(f"OAuth request failed: {e}") from e
+        token = data.get('access_token') if isinstance(data, dict) else None
+        if not token:
+            self._count('token_fetch_errors')
+            raise DarajaError(f"OAuth response did not contain access_token (status {r.status_code})")
+        try:
+            expires_in = int(data.get('expires_in') or DEFAULT_EXPIRES_IN)
+        except (TypeError, ValueError):
+            expires_in = DEFAULT_EXPIRES_IN
+        expires_at = time.time() + expires_in
+        ttl = max(int(expires_in - self.refresh_margin), 1)
+        self.cache.set(self.token_key, {'token': token, 'expires_at': expires_at}, timeout=ttl)
+        return token
+
+    def token(self):
+        """A valid access token, from the cache when one is not about to expire."""
+        token, expires_at = self._cached()
+        if token and expires_at - self.refresh_margin > time.time():
+            self._count('token_cache_hits')
+            return token
+        if self.cache.add(self.lock_key, True, timeout=LOCK_TIMEOUT):
+            try:
+                return self._fetch()
+            finally:
+                self.cache.delete(self.lock_key)
+        # Another process is refreshing: an unexpired token is still usable meanwhile
+        if token and expires_at > time.time():
+            self._count('token_cache_hits')
+            return token
+        self._count('token_lock_waits')
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            token, expires_at = self._cached()
+            if token and expires_at > time.time():
+                return token
+            if not self.cache.get(self.lock_key):
+                break
+        return self._fetch()
+
+    def invalidate_token(self):
+        self.cache.delete(self.token_key)
+
+    # --- API calls ----------------------------------------------------------
+    def post(self, path, payload):
+        """POST JSON to Daraja with the bearer token; a 401 refreshes the token once.
+
+        Returns the requests.Response; token and transport errors propagate.
+        """
+        for attempt in range(2):
+            headers = {"Authorization": f"Bearer {self.token()}", "Content-Type": "application/json"}
+            resp = self.session.post(f"{self.base_url}{path}", json=payload, headers=headers, timeout=self.timeout)
+            if resp.status_code != 401 or attempt:
+                return resp
+            # Daraja rejected the token before processing anything, so re-sending is safe
+            self._count('unauthorized_retries')
+            logger.info("Daraja returned 401; refreshing the access token")
+            self.invalidate_token()
+        return resp
+
+
+_client = None
+_client_config = None
+_client_lock = threading.Lock()
+
+
+def _settings_config():
+    environment = getattr(settings, 'MPESA_ENVIRONMENT', 'sandbox')
+    base_url = getattr(settings, 'MPESA_API_BASE_URL', '') or (SANDBOX_URL if environment == 'sandbox' else PRODUCTION_URL)
+    return (
+        getattr(settings, 'MPESA_CONSUMER_KEY', None),
+        getattr(settings, 'MPESA_CONSUMER_SECRET', None),
+        base_url,
+    )
+
+
+def client():
+    """The process-wide DarajaClient (rebuilt if the M-Pesa settings change)."""
+    global _client, _client_config
+    config = _settings_config()
+    if _client is None or _client_config != config:
+        with _client_lock:
+            if _client is None or _client_config != config:
+                _client = DarajaClient(*config)
+                _client_config = config
+    return _client
@@ -0,0 +1,128 @@
+"""Counters behind the admin and clerk overview tiles.
+
+headcounts() gathers the student/teacher/class/subject/fee-category tiles in a
+single UNION ALL of conditional counts and caches the result briefly; Student,
+Teacher, Class, Subject and FeeCategory writes bump a version key (see
+core.signals) so a change shows up on the next load. fee_position() replaces
+the clerk overview's per-assignment student counts with three grouped queries.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, Q, Sum, Value
+
+from core.models import Class, FeeAssignment, FeeCategory, FeePayment, Student, Subject, Teacher
+from core.services import cache_versions
+
+STATS_TIMEOUT = 60  # seconds
+TOP_CLASSES = 8
+
+_VERSION_KEY = cache_versions.register("dashboard_stats:ver")
+
+
+def invalidate():
+    cache_versions.bump(_VERSION_KEY)
+
+
+def _version():
+    return cache_versions.current(_VERSION_KEY)
+
+
+def _zero():
+    return Value(0, output_field=IntegerField())
+
+
+def _counts(qs, kind, total, male=None, female=None):
+    return (
+        qs.order_by()
+        .annotate(kind=Value(kind)).values('kind')  # constant: one aggregate row, no GROUP BY
+        .annotate(total=total, male=male or _zero(), female=female or _zero())
+        .values_list('kind', 'total', 'male', 'female')
+    )
+
+
+def compute_headcounts():
+    current = Q(graduated=False)
+    students = _counts(
+        Student.objects.all(), 'students',
+        Count('id', filter=current),
+        Count('id', filter=current & Q(gender__iexact='male')),
+        Count('id', filter=current & Q(gender__iexact='female')),
+    )
+    teachers = _counts(
+        Teacher.objects.all(), 'teachers',
+        Count('id'),
+        Count('id', filter=Q(gender__iexact='male')),
+        Count('id', filter=Q(gender__iexact='female')),
+    )
+    rows = students.union(
+        teachers,
+        _counts(Class.objects.all(), 'classes', Count('id')),
+        _counts(Subject.objects.all(), 'subjects', Count('id')),
+        _counts(FeeCategory.objects.all(), 'fees', Count('id')),
+        all=True,
+    )
+    found = {kind: (total or 0, male or 0, female or 0) for kind, total, male, female in rows}
+    students = found.get('students', (0, 0, 0))
+    teachers = found.get('teachers', (0, 0, 0))
+    return {
+        'total_students': students[0],
+        'students_boys': students[1],
+        'students_girls': students[2],
+        'total_teachers': teachers[0],
+        'teachers_male': teachers[1],
+        'teachers_female': teachers[2],
+        'total_classes': found.get('classes', (0,))[0],
+        'total_subjects': found.get('subjects', (0,))[0],
+        'total_fees': found.get('fees', (0,))[0],
+    }
+
+
+def headcounts():
+    """Overview tile counters, named as the overview templates expect."""
+    key = f"dashboard_stats:{_version()}:headcounts"
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_headcounts()
+        cache.set(key, stats, timeout=STATS_TIMEOUT)
+    return stats
+
+
+def fee_position(term=None):
+    """Billed, paid and outstanding amounts of a term (all terms when None) plus the top classes by outstanding.
+
+    Billing is each assignment's amount times the current (non-graduated)
+    students of its class; payments count when linked to one of the term's
+    assignments.
+    """
+    assignments = FeeAssignment.objects.all()
+    payments = FeePayment.objects.filter(fee_assignment__isnull=False)
+    if term is not None:
+        assignments = assignments.filter(term=term)
+        payments = payments.filter(fee_assignment__term=term)
+
+    headcount = dict(
+        Student.objects.filter(graduated=False).order_by()
+        .values_list('class_group_id').annotate(n=Count('id'))
+    )
+    assigned = defaultdict(float)
+    for class_id, amount in assignments.order_by().values_list('class_group_id').annotate(total=Sum('amount')):
+        assigned[class_id] += float(amount or 0) * headcount.get(class_id, 0)
+    paid = defaultdict(float)
+    for class_id, amount in payments.order_by().values_list('fee_assignment__class_group_id').annotate(total=Sum('amount_paid')):
+        paid[class_id] += float(amount or 0)
+
+    total_assigned = sum(assigned.values())
+    total_paid = sum(paid.values())
+    class_stats = []
+    for clazz in Class.objects.order_by('level', 'name'):
+        a, p = assigned.get(clazz.id, 0.0), paid.get(clazz.id, 0.0)
+        if a or p:
+            class_stats.append({'class': clazz, 'assigned': a, 'paid': p, 'outstanding': a - p})
+    class_stats.sort(key=lambda r: r['outstanding'], reverse=True)
+    return {
+        'total_assigned': total_assigned,
+        'total_paid': total_paid,
+        'total_outstanding': max(total_assigned - total_paid, 0),
+        'class_stats': class_stats[:TOP_CLASSES],
+    }
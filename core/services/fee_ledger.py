@@ -0,0 +1,219 @@
+"""Materialized per-student fee balances (one StudentBalance row per student and term).
+
+Each row holds what the student's class was billed that term, what the student
+paid (approved payments, plus pending ones kept separately), the balance carried
+forward from earlier terms and the running arrears. Rows are recomputed from the
+source tables for the affected students only, so a signal, the rebuild command
+and a concurrent writer all converge on the same numbers.
+
+Payments are attributed to their fee assignment's term; payments recorded
+without an assignment fall into the latest term that started on or before the
+payment date. Students get a row for every term from their first billed or paid
+term onwards, so "arrears as of term T" is a single indexed filter on term.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from core.models import FeeAssignment, FeePayment, Student, StudentBalance, Term
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+BATCH_SIZE = 500
+
+
+def ordered_terms():
+    """Return terms oldest first as (id, start_date) tuples; undated terms sort last."""
+    rows = Term.objects.values_list('id', 'start_date')
+    return sorted(rows, key=lambda r: (r[1] is None, r[1] or date.max, r[0]))
+
+
+def _term_for_date(terms, starts, pay_date):
+    idx = bisect_right(starts, pay_date) - 1
+    if idx < 0:
+        return terms[0][0] if terms else None
+    return terms[idx][0]
+
+
+def compute_balances(student_ids, terms=None):
+    """Compute ledger rows from source tables for the given students.
+
+    Returns {(student_id, term_id): {'billed', 'paid', 'pending', 'balance',
+    'carried_forward', 'arrears'}} using a fixed number of queries.
+    """
+    student_ids = list(student_ids)
+    if terms is None:
+        terms = ordered_terms()
+    if not student_ids or not terms:
+        return {}
+    dated = [t for t in terms if t[1] is not None]
+    starts = [t[1] for t in dated]
+
+    student_class = dict(Student.objects.filter(id__in=student_ids).values_list('id', 'class_group_id'))
+    class_ids = {cid for cid in student_class.values() if cid}
+
+    billed = defaultdict(lambda: ZERO)  # (class_id, term_id) -> amount
+    for cid, tid, total in (
+        FeeAssignment.objects.filter(class_group_id__in=class_ids)
+        .values_list('class_group_id', 'term_id')
+        .annotate(total=Sum('amount'))
+    ):
+        billed[(cid, tid)] = total or ZERO
+
+    paid = defaultdict(lambda: ZERO)  # (student_id, term_id) -> amount
+    pending = defaultdict(lambda: ZERO)
+    for sid, tid, status, total in (
+        FeePayment.objects.filter(student_id__in=student_ids, fee_assignment__isnull=False)
+        .exclude(status='rejected')
+        .values_list('student_id', 'fee_assignment__term_id', 'status')
+        .annotate(total=Sum('amount_paid'))
+    ):
+        bucket = paid if status == 'approved' else pending
+        bucket[(sid, tid)] += total or ZERO
+    unassigned = (
+        FeePayment.objects.filter(student_id__in=student_ids, fee_assignment__isnull=True)
+        .exclude(status='rejected')
+        .values_list('student_id', 'payment_date', 'status', 'amount_paid')
+    )
+    for sid, paid_at, status, amount in unassigned:
+        tid = _term_for_date(dated, starts, paid_at.date()) if (paid_at and dated) else terms[-1][0]
+        bucket = paid if status == 'approved' else pending
+        bucket[(sid, tid)] += amount or ZERO
+
+    result = {}
+    for sid in student_ids:
+        cid = student_class.get(sid)
+        carried = ZERO
+        started = False
+        for tid, _start in terms:
+            b = billed[(cid, tid)] if cid else ZERO
+            p = paid[(sid, tid)]
+            pe = pending[(sid, tid)]
+            if not started and not (b or p or pe):
+                continue
+            started = True
+            balance = b - p
+            result[(sid, tid)] = {
+                'billed': b,
+                'paid': p,
+                'pending': pe,
+                'balance': balance,
+                'carried_forward': carried,
+                'arrears': carried + balance,
+            }
+            carried += balance
+    return result
+
+
+_FIELDS = ('billed', 'paid', 'pending', 'balance', 'carried_forward', 'arrears')
+
+
+def refresh_students(student_ids, terms=None):
+    """Bring the StudentBalance rows of these students in line with the source tables."""
+    student_ids = {sid for sid in student_ids if sid}
+    if not student_ids:
+        return 0
+    expected = compute_balances(student_ids, terms=terms)
+    changed = 0
+    with transaction.atomic():
+        existing = {
+            (row.student_id, row.term_id): row
+            for row in StudentBalance.objects.select_for_update().filter(student_id__in=student_ids)
+        }
+        to_create, to_update = [], []
+        for key, values in expected.items():
+            row = existing.pop(key, None)
+            if row is None:
+                to_create.append(StudentBalance(student_id=key[0], term_id=key[1], **values))
+            elif any(getattr(row, f) != values[f] for f in _FIELDS):
+                for f in _FIELDS:
+                    setattr(row, f, values[f])
+                to_update.append(row)
+        if existing:
+            StudentBalance.objects.filter(pk__in=[r.pk for r in existing.values()]).delete()
+        if to_create:
+            StudentBalance.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            StudentBalance.objects.bulk_update(to_update, list(_FIELDS) + ['updated_at'], batch_size=BATCH_SIZE)
+        changed = len(to_create) + len(to_update) + len(existing)
+    return changed
+
+
+def refresh_class(class_id):
+    """Refresh every student of a class (a fee assignment for it changed)."""
+    if class_id:
+        refresh_students(Student.objects.filter(class_group_id=class_id).values_list('id', flat=True))
+
+
+def refresh_all(batch_size=BATCH_SIZE):
+    """Recompute the whole ledger in student batches; returns rows written or removed."""
+    terms = ordered_terms()
+    ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+    changed = 0
+    for i in range(0, len(ids), batch_size):
+        changed += refresh_students(ids[i:i + batch_size], terms=terms)
+    stale = StudentBalance.objects.exclude(student_id__in=Student.objects.values('id'))
+    changed += stale.delete()[0]
+    return changed
+
+
+def find_drift(batch_size=BATCH_SIZE):
+    """Yield (student_id, term_id, field, stored, expected) for rows that disagree with the source."""
+    terms = ordered_terms()
+    ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        expected = compute_balances(chunk, terms=terms)
+        stored = {
+            (r['student_id'], r['term_id']): r
+            for r in StudentBalance.objects.filter(student_id__in=chunk).values('student_id', 'term_id', *_FIELDS)
+        }
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key)
+            have = stored.get(key)
+            if want is None or have is None:
+                yield key[0], key[1], 'row', 'present' if have else 'missing', 'present' if want else 'missing'
+                continue
+            for f in _FIELDS:
+                if have[f] != want[f]:
+                    yield key[0], key[1], f, have[f], want[f]
+
+
+def balance_for(student, term=None):
+    """Return the student's StudentBalance for a term, or their latest one when no term is given.
+
+    None means the student has never been billed or paid anything.
+    """
+    if not student:
+        return None
+    rows = StudentBalance.objects.filter(student=student)
+    if term is not None:
+        return rows.filter(term=term).first()
+    return rows.order_by(F('term__start_date').desc(nulls_first=True), '-term_id').first()
+
+
+def student_totals(term_id=None, class_id=None):
+    """Values queryset of per-student ``owed``, ``paid_total`` and ``amount`` (balance).
+
+    With a term: that term's billed/paid figures. Without: totals across every
+    term, grouped per student in one query over the (student, term) index.
+    """
+    qs = StudentBalance.objects.all()
+    if class_id:
+        qs = qs.filter(student__class_group_id=class_id)
+    if term_id:
+        return qs.filter(term_id=term_id).annotate(
+            owed=F('billed'), paid_total=F('paid'), amount=F('balance')
+        ).values('student_id', 'owed', 'paid_total', 'amount')
+    return (
+        qs.values('student_id')
+        .annotate(owed=Sum('billed'), paid_total=Sum('paid'))
+        .annotate(amount=F('owed') - F('paid_total'))
+        .values('student_id', 'owed', 'paid_total', 'amount')
+    )
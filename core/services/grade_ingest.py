@@ -0,0 +1,233 @@
+"""Bulk grade ingestion shared by the mark-entry views and uploads.
+
+Callers feed rows into a GradeIngest and commit once:
+
+    ingest = GradeIngest()
+    ingest.add(row=2, student_id=s.id, exam_id=exam.id, subject_id=subject.id, score='74')
+    ingest.reject(row=3, reason='Unknown admission', admission_no='X1')
+    report = ingest.commit()
+
+validate() (run by commit, or earlier for all-or-nothing callers) checks the
+referenced students, exams and subjects with one query per table, validates
+scores against the subject's grading scheme cap and computes letters through
+the compiled scheme. commit() then prefetches the existing grades in one query
+and writes everything with a single bulk upsert inside one transaction. Bulk
+writes skip Grade signals, so the touched exams' result matrices and the
+teacher dashboard cards of the touched classes are invalidated here.
+"""
+import math
+
+from django.db import transaction
+
+from core.models import Exam, Grade, Student, Subject
+from core.services import result_matrix, teacher_dashboard
+from core.services.grading import get_compiled_schemes
+
+DEFAULT_MAX_SCORE = 100
+BATCH_SIZE = 500
+
+# Fallback bands for subjects without a grading scheme: (min score, letter)
+DEFAULT_BANDS = ((80, 'A'), (60, 'B'), (40, 'C'), (20, 'D'))
+DEFAULT_LETTER = 'F'
+REMARKS = {
+    'A': 'EXCELLENT',
+    'B': 'VERY GOOD',
+    'C': 'GOOD',
+    'D': 'AVERAGE',
+    'E': 'NEEDS IMPROVEMENT',
+    'F': 'NEEDS IMPROVEMENT',
+}
+
+
+def max_score_for(scheme):
+    """Cap of a subject's marks: its grading scheme's top boundary, else DEFAULT_MAX_SCORE."""
+    return scheme.max_score if scheme and scheme.max_score is not None else DEFAULT_MAX_SCORE
+
+
+def default_letter(score):
+    for lower, letter in DEFAULT_BANDS:
+        if score >= lower:
+            return letter
+    return DEFAULT_LETTER
+
+
+def remarks_for(letter):
+    return REMARKS.get((letter or '')[:1].upper(), '')
+
+
+class IngestReport:
+    """Outcome of one commit: a result dict per input row plus counters.
+
+    Each row has 'row', 'status' (created, updated, unchanged, failed or
+    skipped), 'reason' and whatever identifying fields the caller passed.
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: (r['row'] is None, r['row'] or 0))
+        self.counts = {status: 0 for status in ('created', 'updated', 'unchanged', 'failed', 'skipped')}
+        for r in self.rows:
+            self.counts[r['status']] += 1
+
+    @property
+    def saved(self):
+        return self.counts['created'] + self.counts['updated'] + self.counts['unchanged']
+
+    @property
+    def failed(self):
+        return [r for r in self.rows if r['status'] == 'failed']
+
+    @property
+    def ok(self):
+        return not self.counts['failed']
+
+    def as_dict(self):
+        return {'saved': self.saved, 'counts': dict(self.counts), 'rows': self.rows}
+
+
+class GradeIngest:
+    def __init__(self, max_score=None, min_score=0):
+        """max_score overrides the per-subject cap (scheme maximum, else DEFAULT_MAX_SCORE)."""
+        self.max_score = max_score
+        self.min_score = min_score
+        self._pending = {}  # (student_id, exam_id, subject_id) -> result row
+        self._valid = []    # validated rows waiting for commit()
+        self._results = []
+
+    def reject(self, row, reason, **info):
+        """Record a row the caller could not resolve (unknown student, bad subject...)."""
+        self._results.append({'row': row, 'status': 'failed', 'reason': reason, **info})
+
+    def add(self, row, student_id, exam_id, subject_id, score, **info):
+        try:
+            student_id, exam_id, subject_id = int(student_id), int(exam_id), int(subject_id)
+        except (TypeError, ValueError):
+            return self.reject(row, 'Invalid student, exam or subject id', score=score, **info)
+        result = {
+            'row': row, 'student_id': student_id, 'exam_id': exam_id, 'subject_id': subject_id,
+            'score': score, 'status': 'failed', 'reason': '', **info,
+        }
+        if score is None or (isinstance(score, str) and not score.strip()):
+            result['reason'] = 'No score'
+            self._results.append(result)
+            return
+        try:
+            value = float(score)
+        except (TypeError, ValueError):
+            result['reason'] = 'Invalid score'
+            self._results.append(result)
+            return
+        if math.isnan(value) or math.isinf(value):
+            result['reason'] = 'Invalid score'
+            self._results.append(result)
+            return
+        result['score'] = value
+        key = (student_id, exam_id, subject_id)
+        earlier = self._pending.get(key)
+        if earlier is not None:
+            # Last row for the same grade wins
+            earlier['status'] = 'skipped'
+            earlier['reason'] = f"Superseded by row {row}"
+            self._results.append(earlier)
+        self._pending[key] = result
+
+    def _check_references(self, rows):
+        students = set(Student.objects.filter(id__in={r['student_id'] for r in rows}).values_list('id', flat=True))
+        exams = set(Exam.objects.filter(id__in={r['exam_id'] for r in rows}).values_list('id', flat=True))
+        subjects = set(Subject.objects.filter(id__in={r['subject_id'] for r in rows}).values_list('id', flat=True))
+        valid = []
+        for r in rows:
+            if r['student_id'] not in students:
+                r['reason'] = 'Unknown student'
+            elif r['exam_id'] not in exams:
+                r['reason'] = 'Unknown exam'
+            elif r['subject_id'] not in subjects:
+                r['reason'] = 'Unknown subject'
+            else:
+                valid.append(r)
+                continue
+            self._results.append(r)
+        return valid
+
+    def _existing(self, rows):
+        """{(student_id, exam_id, subject_id): (id, score, letter, remarks)} in one query."""
+        keys = {(r['student_id'], r['exam_id'], r['subject_id']) for r in rows}
+        qs = Grade.objects.filter(
+            student_id__in={k[0] for k in keys},
+            exam_id__in={k[1] for k in keys},
+            subject_id__in={k[2] for k in keys},
+        ).values_list('student_id', 'exam_id', 'subject_id', 'id', 'score', 'grade_letter', 'remarks')
+        return {(s, e, sub): rest for s, e, sub, *rest in qs if (s, e, sub) in keys}
+
+    def validate(self):
+        """Check references, caps and letters of the rows added so far, without writing.
+
+        Returns a report of the rows rejected so far; commit() validates implicitly.
+        """
+        rows = list(self._pending.values())
+        self._pending = {}
+        if rows:
+            rows = self._check_references(rows)
+
+        schemes = get_compiled_schemes() if rows else {}
+        for r in rows:
+            scheme = schemes.get(r['subject_id'])
+            cap = self.max_score if self.max_score is not None else max_score_for(scheme)
+            if r['score'] < self.min_score:
+                r['reason'] = f'below minimum ({self.min_score})'
+            elif r['score'] > cap:
+                r['reason'] = f'above cap ({cap})'
+                r['max_score'] = cap
+            else:
+                letter = scheme.letter(r['score']) if scheme else None
+                r['grade_letter'] = letter or default_letter(r['score'])
+                r['remarks'] = remarks_for(r['grade_letter'])
+                self._valid.append(r)
+                continue
+            self._results.append(r)
+        return IngestReport(self._results)
+
+    def commit(self):
+        """Upsert every valid row in one transaction and return the full report."""
+        self.validate()
+        latest = {}
+        for r in self._valid:
+            key = (r['student_id'], r['exam_id'], r['subject_id'])
+            if key in latest:
+                # Same grade validated twice (add() after validate()): last row wins
+                latest[key].update(status='skipped', reason=f"Superseded by row {r['row']}")
+                self._results.append(latest[key])
+            latest[key] = r
+        valid, self._valid = list(latest.values()), []
+        if not valid:
+            return IngestReport(self._results)
+
+        with transaction.atomic():
+            existing = self._existing(valid)
+            to_write = []
+            for r in valid:
+                key = (r['student_id'], r['exam_id'], r['subject_id'])
+                current = existing.get(key)
+                if current is None:
+                    r['status'] = 'created'
+                elif tuple(current[1:]) == (r['score'], r['grade_letter'], r['remarks']):
+                    r['status'] = 'unchanged'
+                else:
+                    r['status'] = 'updated'
+                if r['status'] != 'unchanged':
+                    to_write.append(Grade(
+                        student_id=key[0], exam_id=key[1], subject_id=key[2],
+                        score=r['score'], grade_letter=r['grade_letter'], remarks=r['remarks'],
+                    ))
+                self._results.append(r)
+            if to_write:
+                Grade.objects.bulk_create(
+                    to_write,
+                    batch_size=BATCH_SIZE,
+                    update_conflicts=True,
+                    unique_fields=['student', 'exam', 'subject'],
+                    update_fields=['score', 'grade_letter', 'remarks'],
+                )
+        for exam_id in {g.exam_id for g in to_write}:
+            result_matrix.invalidate_exam(exam_id)
+        teacher_dashboard.invalidate_grades({(g.student_id, g.subject_id) for g in to_write})
+        return IngestReport(self._results)
@@ -0,0 +1,136 @@
+"""Compiled subject grading schemes.
+
+SubjectGradingScheme stores boundaries as JSON ({"A": [80, 100], "B": [70, 79]}).
+A CompiledScheme sorts them once into parallel arrays so a score is graded with
+a bisect, and a whole column of scores with one NumPy ``searchsorted``.
+
+Compiled schemes for every subject are loaded together (one query) into a
+per-process memo, guarded by a version key in the shared cache that is bumped
+whenever a scheme is saved or deleted (see core.signals).
+"""
+from bisect import bisect_right
+from collections import defaultdict
+import threading
+
+import numpy as np
+
+from core.models import Grade, SubjectGradingScheme
+from core.services import cache_versions
+
+VERSION_KEY = cache_versions.register("grading_schemes:version")
+
+_lock = threading.Lock()
+_memo = {'version': None, 'schemes': {}}
+
+
+class CompiledScheme:
+    """Boundaries of one scheme, sorted by lower bound.
+
+    Matches SubjectGradingScheme.get_grade_letter: a score gets the letter whose
+    inclusive [min, max] range contains it, or None when it falls in a gap.
+    Overlapping ranges keep the stored order's precedence (linear fallback).
+    """
+
+    __slots__ = ('letters', 'mins', 'maxs', 'ordered', 'overlapping', 'max_score', '_np_mins', '_np_maxs', '_np_letters')
+
+    def __init__(self, boundaries):
+        ordered = []
+        for letter, bounds in (boundaries or {}).items():
+            try:
+                lo, hi = float(bounds[0]), float(bounds[1])
+            except (TypeError, ValueError, IndexError, KeyError):
+                continue
+            ordered.append((letter, lo, hi))
+        self.ordered = ordered
+        ranges = sorted(ordered, key=lambda r: (r[1], r[2]))
+        self.letters = [r[0] for r in ranges]
+        self.mins = [r[1] for r in ranges]
+        self.maxs = [r[2] for r in ranges]
+        self.overlapping = any(self.mins[i + 1] <= self.maxs[i] for i in range(len(ranges) - 1))
+        self.max_score = max(self.maxs) if self.maxs else None
+        self._np_mins = np.asarray(self.mins, dtype=float)
+        self._np_maxs = np.asarray(self.maxs, dtype=float)
+        self._np_letters = np.asarray(self.letters + [None], dtype=object)
+
+    def letter(self, score):
+        if score is None:
+            return None
+        if self.overlapping:
+            for letter, lo, hi in self.ordered:
+                if lo <= score <= hi:
+                    return letter
+            return None
+        idx = bisect_right(self.mins, score) - 1
+        if idx >= 0 and score <= self.maxs[idx]:
+            return self.letters[idx]
+        return None
+
+    def grade_many(self, scores):
+        """Grade a sequence of scores (None allowed) in one vectorized pass."""
+        if self.overlapping or not self.letters:
+            return [self.letter(s) for s in scores]
+        values = np.asarray([np.nan if s is None else s for s in scores], dtype=float)
+        idx = np.searchsorted(self._np_mins, values, side='right') - 1
+        safe = np.clip(idx, 0, None)
+        hit = (idx >= 0) & (values <= self._np_maxs[safe])  # NaN compares False
+        picked = np.where(hit, safe, len(self.letters))
+        return self._np_letters[picked].tolist()
+
+
+def get_compiled_schemes():
+    """Return {subject_id: CompiledScheme} for every subject that has a scheme."""
+    version = cache_versions.current(VERSION_KEY)
+    if version is not None and _memo['version'] == version:
+        return _memo['schemes']
+    with _lock:
+        schemes = {
+            subject_id: CompiledScheme(boundaries)
+            for subject_id, boundaries in SubjectGradingScheme.objects.values_list('subject_id', 'grade_boundaries')
+        }
+        _memo['version'] = version
+        _memo['schemes'] = schemes
+    return schemes
+
+
+def get_compiled_scheme(subject):
+    """Compiled scheme for a subject (instance or id), or None if it has none."""
+    return get_compiled_schemes().get(getattr(subject, 'id', subject))
+
+
+def invalidate():
+    cache_versions.bump(VERSION_KEY)
+    _memo['version'] = None
+
+
+def grade_column(subject, scores):
+    """Letters for a column of scores of one subject (all None if it has no scheme)."""
+    scheme = get_compiled_scheme(subject)
+    if scheme is None:
+        return [None] * len(scores)
+    return scheme.grade_many(scores)
+
+
+def regrade_exam(exam_id, batch_size=2000):
+    """Rewrite stored grade letters of an exam from the current schemes.
+
+    Subjects without a scheme keep their stored letters. Returns the number of
+    grades changed. Uses bulk_update, so callers must invalidate caches that
+    depend on Grade signals (result matrices).
+    """
+    schemes = get_compiled_schemes()
+    by_subject = defaultdict(list)
+    for pk, subject_id, score, stored in (
+        Grade.objects.filter(exam_id=exam_id, subject_id__in=list(schemes))
+        .values_list('id', 'subject_id', 'score', 'grade_letter')
+    ):
+        by_subject[subject_id].append((pk, score, stored))
+
+    changed = []
+    for subject_id, rows in by_subject.items():
+        letters = schemes[subject_id].grade_many([score for _, score, _ in rows])
+        for (pk, _score, stored), letter in zip(rows, letters):
+            if letter is not None and letter != stored:
+                changed.append(Grade(id=pk, grade_letter=letter))
+    if changed:
+        Grade.objects.bulk_update(changed, ['grade_letter'], batch_size=batch_size)
+    return len(changed)
@@ -0,0 +1,179 @@
+"""Background PDF rendering with content-addressed artifacts.
+
+A render is described by a kind (see RENDERERS) and JSON-serializable params.
+The sha256 of kind, params and a data fingerprint names the artifact under
+MEDIA_ROOT/pdf_exports/, so a repeated identical request is served straight
+from storage. A miss either renders inline (small documents) or creates a
+NotificationJob of type 'pdf_render' and queues core.tasks.render_pdf_job;
+the pending page polls job_status and downloads the artifact when it is done.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import NotificationJob
+from core.pdf_utils import pdf_unavailable_response, render_blocks_pdf, render_rows_pdf
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = 'pdf_exports'
+INLINE_MAX_ROWS = getattr(settings, 'PDF_INLINE_MAX_ROWS', 300)
+ARTIFACT_MAX_AGE = getattr(settings, 'PDF_ARTIFACT_MAX_AGE', 7 * 24 * 60 * 60)
+PENDING_JOB_TTL = 15 * 60
+DOWNLOAD_SALT = 'pdfjob'
+
+
+def _render_rows(params):
+    return render_rows_pdf(params['title'], params['header_rows'], params['columns'], params['rows'], params.get('landscape_mode', True))
+
+
+def _render_result_slip(params):
+    from core.services import result_slip
+    blocks = result_slip.iter_class_blocks(params['exam_id'], params.get('class_id'), params.get('level'))
+    return render_blocks_pdf(params['title'], params['header_rows'], blocks, empty_message='No data for the selected exam/filters')
+
+
+RENDERERS = {
+    'rows': _render_rows,
+    'result_slip': _render_result_slip,
+}
+
+
+def digest_for(kind, params, fingerprint=''):
+    payload = json.dumps([kind, params, fingerprint], sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def artifact_name(digest):
+    return f'{ARTIFACT_DIR}/{digest}.pdf'
+
+
+def has_artifact(digest):
+    return default_storage.exists(artifact_name(digest))
+
+
+def store_artifact(digest, pdf):
+    name = artifact_name(digest)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(pdf))
+    return name
+
+
+def artifact_response(digest, filename):
+    return FileResponse(default_storage.open(artifact_name(digest), 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
+
+
+def download_url(job):
+    return reverse('pdf_job_download', args=[signing.dumps({'job': job.id}, salt=DOWNLOAD_SALT)])
+
+
+def render(kind, params, digest):
+    """Render and store one artifact; returns its storage name."""
+    return store_artifact(digest, RENDERERS[kind](params))
+
+
+def _pending_job(digest):
+    # Jobs older than PENDING_JOB_TTL are assumed lost (worker restarted) and not reused
+    return NotificationJob.objects.filter(
+        job_type='pdf_render', status__in=['queued', 'running'], meta__digest=digest,
+        created_at__gte=timezone.now() - timedelta(seconds=PENDING_JOB_TTL),
+    ).order_by('-created_at').first()
+
+
+def _requester_ids(user):
+    return [user.id] if user is not None and getattr(user, 'is_authenticated', False) else []
+
+
+def can_download(user, job):
+    """Admins and clerks may fetch any export; others only jobs they requested."""
+    if getattr(user, 'role', None) in ('admin', 'clerk'):
+        return True
+    return user.id in ((job.meta or {}).get('requested_by') or [])
+
+
+def enqueue(kind, params, filename, digest, user=None):
+    """Create (or reuse an in-flight) render job for this digest and queue it.
+
+    The requesting user is recorded in meta['requested_by'] (see can_download).
+    """
+    from core.tasks import render_pdf_job
+
+    requester = _requester_ids(user)
+    job = _pending_job(digest)
+    if job:
+        requested_by = list((job.meta or {}).get('requested_by') or [])
+        if requester and requester[0] not in requested_by:
+            job.meta = {**(job.meta or {}), 'requested_by': requested_by + requester}
+            job.save(update_fields=['meta', 'updated_at'])
+        return job
+    job = NotificationJob.objects.create(
+        job_type='pdf_render', status='queued', total=1,
+        meta={'kind': kind, 'digest': digest, 'filename': filename, 'requested_by': requester},
+    )
+    try:
+        render_pdf_job.delay(job.id, kind, params)
+    except Exception as e:
+        job.mark_failed(f'enqueue failed: {e}')
+        raise
+    return job
+
+
+def pending_response(job, filename):
+    html = render_to_string('dashboards/pdf_job_pending.html', {
+        'job': job,
+        'filename': filename,
+        'status_url': reverse('job_status', args=[job.id]),
+        'download_url': download_url(job),
+    })
+    resp = HttpResponse(html, status=202)
+    resp['X-Job-Id'] = str(job.id)
+    return resp
+
+
+def respond(kind, params, filename, inline=False, fingerprint='', user=None):
+    """Serve a PDF export: stored artifact, inline render, or queued job (downloadable by user)."""
+    digest = digest_for(kind, params, fingerprint)
+    if has_artifact(digest):
+        return artifact_response(digest, filename)
+    if not inline:
+        try:
+            return pending_response(enqueue(kind, params, filename, digest, user=user), filename)
+        except Exception as e:
+            # No broker/worker reachable: fall back to rendering in the request
+            logger.warning('PDF job enqueue failed, rendering inline: %s', e)
+    try:
+        render(kind, params, digest)
+    except ImportError:
+        return pdf_unavailable_response()
+    return artifact_response(digest, filename)
+
+
+def purge_artifacts(max_age=None):
+    """Delete stored artifacts older than max_age seconds; returns the count."""
+    max_age = ARTIFACT_MAX_AGE if max_age is None else max_age
+    try:
+        _dirs, files = default_storage.listdir(ARTIFACT_DIR)
+    except FileNotFoundError:
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in files:
+        path = f'{ARTIFACT_DIR}/{name}'
+        try:
+            if default_storage.get_modified_time(path).timestamp() < cutoff:
+                default_storage.delete(path)
+                removed += 1
+        except (NotImplementedError, OSError):
+            continue
+    return removed
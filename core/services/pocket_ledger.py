@@ -0,0 +1,157 @@
+"""Materialized pocket money balances (one PocketMoneyBalance row per student).
+
+Rows are recomputed from the student's approved PocketMoney transactions with
+one conditional aggregate whenever a transaction is saved or deleted (see
+core.signals), so edits, deletes, status changes and moving a transaction to
+another student all converge on the same numbers as the verify command.
+Use save()/delete() so the transaction and its balance commit together.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+
+from core.models import PocketMoney, PocketMoneyBalance, Student
+
+ZERO = Decimal('0.00')
+BATCH_SIZE = 500
+
+_FIELDS = ('deposits', 'withdrawals', 'adjustments', 'balance')
+
+
+def _sum_of(transaction_type, approved_only=True):
+    condition = Q(transaction_type=transaction_type)
+    if approved_only:
+        condition &= Q(status='approved')
+    return Sum('amount', filter=condition)
+
+
+def totals(queryset):
+    """Approved deposit/withdrawal/adjustment sums and the row count of a PocketMoney queryset, in one query."""
+    row = queryset.order_by().aggregate(
+        deposits=_sum_of('deposit'),
+        withdrawals=_sum_of('withdrawal'),
+        adjustments=_sum_of('adjustment'),
+        count=Count('id'),
+    )
+    for f in ('deposits', 'withdrawals', 'adjustments'):
+        row[f] = row[f] or ZERO
+    row['balance'] = row['deposits'] - row['withdrawals'] + row['adjustments']
+    return row
+
+
+def compute_balances(student_ids):
+    """{student_id: {deposits, withdrawals, adjustments, balance}} from the source table.
+
+    Students without approved transactions are left out.
+    """
+    student_ids = list(student_ids)
+    if not student_ids:
+        return {}
+    result = {}
+    for row in (
+        PocketMoney.objects.filter(student_id__in=student_ids, status='approved')
+        .order_by()
+        .values('student_id')
+        .annotate(
+            deposits=_sum_of('deposit', approved_only=False),
+            withdrawals=_sum_of('withdrawal', approved_only=False),
+            adjustments=_sum_of('adjustment', approved_only=False),
+        )
+    ):
+        values = {f: row[f] or ZERO for f in ('deposits', 'withdrawals', 'adjustments')}
+        values['balance'] = values['deposits'] - values['withdrawals'] + values['adjustments']
+        result[row['student_id']] = values
+    return result
+
+
+def _refresh(student_ids):
+    existing = {
+        row.student_id: row
+        for row in PocketMoneyBalance.objects.select_for_update().filter(student_id__in=student_ids)
+    }
+    expected = compute_balances(student_ids)
+    to_create, to_update = [], []
+    for student_id, values in expected.items():
+        row = existing.pop(student_id, None)
+        if row is None:
+            to_create.append(PocketMoneyBalance(student_id=student_id, **values))
+        elif any(getattr(row, f) != values[f] for f in _FIELDS):
+            for f in _FIELDS:
+                setattr(row, f, values[f])
+            to_update.append(row)
+    if existing:
+        PocketMoneyBalance.objects.filter(pk__in=[r.pk for r in existing.values()]).delete()
+    if to_create:
+        PocketMoneyBalance.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+    if to_update:
+        PocketMoneyBalance.objects.bulk_update(to_update, list(_FIELDS) + ['updated_at'], batch_size=BATCH_SIZE)
+    return len(to_create) + len(to_update) + len(existing)
+
+
+def refresh_students(student_ids):
+    """Bring the PocketMoneyBalance rows of these students in line with their transactions."""
+    student_ids = {sid for sid in student_ids if sid}
+    if not student_ids:
+        return 0
+    try:
+        with transaction.atomic():
+            return _refresh(student_ids)
+    except IntegrityError:
+        # A concurrent writer created a student's first balance row; it exists now, so lock and update it
+        with transaction.atomic():
+            return _refresh(student_ids)
+
+
+def save(pocket_money):
+    """Save a PocketMoney transaction and its student's balance atomically."""
+    with transaction.atomic():
+        pocket_money.save()
+    return pocket_money
+
+
+def delete(pocket_money):
+    """Delete a PocketMoney transaction and update its student's balance atomically."""
+    with transaction.atomic():
+        pocket_money.delete()
+
+
+def _student_ids():
+    return list(Student.objects.order_by('id').values_list('id', flat=True))
+
+
+def refresh_all(batch_size=BATCH_SIZE):
+    """Recompute every student's balance in batches; returns rows written or removed."""
+    ids = _student_ids()
+    changed = 0
+    for i in range(0, len(ids), batch_size):
+        changed += refresh_students(ids[i:i + batch_size])
+    return changed
+
+
+def find_drift(batch_size=BATCH_SIZE):
+    """Yield (student_id, field, stored, expected) for balances that disagree with the transactions."""
+    ids = _student_ids()
+    for i in range(0, len(ids), batch_size):
+        chunk = ids[i:i + batch_size]
+        expected = compute_balances(chunk)
+        stored = {
+            r['student_id']: r
+            for r in PocketMoneyBalance.objects.filter(student_id__in=chunk).values('student_id', *_FIELDS)
+        }
+        for student_id in sorted(set(expected) | set(stored)):
+            want = expected.get(student_id)
+            have = stored.get(student_id)
+            if want is None or have is None:
+                yield student_id, 'row', 'present' if have else 'missing', 'present' if want else 'missing'
+                continue
+            for f in _FIELDS:
+                if have[f] != want[f]:
+                    yield student_id, f, have[f], want[f]
+
+
+def balance_for(student):
+    """Totals of a student (instance or id) as a dict; zeros when nothing was approved yet."""
+    student_id = getattr(student, 'id', student)
+    row = PocketMoneyBalance.objects.filter(student_id=student_id).values(*_FIELDS).first()
+    return row or {f: ZERO for f in _FIELDS}
@@ -0,0 +1,175 @@
+"""Precomputed exam result matrix shared by the result slip views.
+
+A matrix is built once per (exam, level) with a fixed number of queries and
+stored in the cache. Grade writes for an exam bump that exam's version key so
+the next read rebuilds it; grading scheme, component and class membership
+changes bump a global version that invalidates every matrix at once.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from core.models import (
+    Grade,
+    Student,
+    Subject,
+    SubjectComponent,
+)
+from core.services.grading import get_compiled_schemes
+from core.services import cache_versions
+
+# Points per grade letter used for the "Points" column on result slips
+LETTER_POINTS = {'A': 4, 'B': 3, 'C': 2, 'D': 1}
+
+MATRIX_TIMEOUT = 24 * 60 * 60  # seconds; versions make stale entries unreachable anyway
+# Part of the cache key: bump when ResultMatrix gains or changes fields
+MATRIX_FORMAT = 2
+
+VERSION_PREFIX = cache_versions.register("result_matrix:ver:")
+_GLOBAL_VERSION_KEY = f"{VERSION_PREFIX}global"
+
+
+def _exam_version_key(exam_id):
+    return f"{VERSION_PREFIX}exam:{exam_id}"
+
+
+def invalidate_exam(exam_id):
+    """Drop cached matrices for one exam (all levels)."""
+    if exam_id:
+        cache_versions.bump(_exam_version_key(exam_id))
+
+
+def invalidate_all():
+    """Drop every cached matrix (schemes, components or class membership changed)."""
+    cache_versions.bump(_GLOBAL_VERSION_KEY)
+
+
+def data_version(exam_id):
+    """Token that changes whenever an exam's results would change (for derived artifacts)."""
+    return f"{cache_versions.current(_exam_version_key(exam_id))}:{cache_versions.current(_GLOBAL_VERSION_KEY)}"
+
+
+class ResultMatrix:
+    """Per-student and per-class results for one exam across one level.
+
+    grades[student_id][subject_id] -> {'score', 'grade_letter', 'remarks'}, including
+    composite (parent) subjects derived from their weighted components. Totals,
+    averages and points are computed over top-level subjects; class and level ranks
+    order students by total (highest first). mean_scores is the plain mean of every
+    stored mark of the student (components included, composites not), and
+    mean_class_ranks orders each class by it, as the teacher slip always has.
+    """
+
+    def __init__(self, exam_id, level):
+        self.exam_id = exam_id
+        self.level = level
+        self.grades = {}
+        self.totals = {}
+        self.averages = {}
+        self.points = {}
+        self.class_ranks = {}
+        self.level_ranks = {}
+        self.mean_scores = {}
+        self.mean_class_ranks = {}
+        self.class_averages = {}
+        self.student_class = {}
+
+    def level_rank_key(self, student):
+        return self.level_ranks.get(student.id, 10 ** 9)
+
+    def class_rank_key(self, student):
+        return self.class_ranks.get(student.id, 10 ** 9)
+
+
+def _rank(student_ids, totals):
+    ordered = sorted(student_ids, key=lambda sid: (-totals.get(sid, 0), sid))
+    return {sid: idx for idx, sid in enumerate(ordered, 1)}
+
+
+def build_result_matrix(exam_id, level):
+    """Compute the matrix from the database (at most 5 queries regardless of level size)."""
+    matrix = ResultMatrix(exam_id, level)
+    matrix.student_class = dict(
+        Student.objects.filter(class_group__level=level).values_list('id', 'class_group_id')
+    )
+    schemes = get_compiled_schemes()
+    components = defaultdict(list)
+    for parent_id, child_id, weight in SubjectComponent.objects.values_list('parent_id', 'child_id', 'weight'):
+        components[parent_id].append((child_id, 1.0 if weight is None else float(weight)))
+    top_ids = set(Subject.objects.filter(part_of__isnull=True).values_list('id', flat=True))
+
+    grades = {sid: {} for sid in matrix.student_class}
+    class_sum = defaultdict(float)
+    class_count = defaultdict(int)
+    student_sum = defaultdict(float)
+    student_count = defaultdict(int)
+    grade_rows = (
+        Grade.objects
+        .filter(exam_id=exam_id, student__class_group__level=level)
+        .values_list('student_id', 'subject_id', 'score', 'grade_letter', 'remarks')
+    )
+    for sid, subject_id, score, stored_letter, remarks in grade_rows:
+        scheme = schemes.get(subject_id)
+        letter = scheme.letter(score) if (scheme and score is not None) else stored_letter
+        grades.setdefault(sid, {})[subject_id] = {'score': score, 'grade_letter': letter, 'remarks': remarks or ''}
+        if score is not None:
+            cid = matrix.student_class.get(sid)
+            class_sum[cid] += float(score)
+            class_count[cid] += 1
+            student_sum[sid] += float(score)
+            student_count[sid] += 1
+
+    # Composite subjects (e.g., English = Language + Composition) when no direct mark exists
+    for sid, row in grades.items():
+        for parent_id, comps in components.items():
+            if parent_id in row:
+                continue
+            total = 0.0
+            have_any = False
+            for child_id, weight in comps:
+                child = row.get(child_id)
+                if child and child.get('score') is not None:
+                    total += float(child['score']) * weight
+                    have_any = True
+            if have_any:
+                scheme = schemes.get(parent_id)
+                letter = scheme.letter(total) if scheme else None
+                row[parent_id] = {'score': total, 'grade_letter': letter, 'remarks': ''}
+
+    by_class = defaultdict(list)
+    for sid, row in grades.items():
+        scores = [v['score'] for subj, v in row.items() if subj in top_ids and v.get('score') is not None]
+        total = sum(scores) if scores else 0
+        matrix.totals[sid] = total
+        matrix.averages[sid] = (total / len(scores)) if scores else 0
+        matrix.mean_scores[sid] = (student_sum[sid] / student_count[sid]) if student_count[sid] else 0
+        matrix.points[sid] = sum(
+            LETTER_POINTS.get(str(v['grade_letter']).upper()[:1], 0)
+            for subj, v in row.items() if subj in top_ids and v.get('grade_letter')
+        )
+        by_class[matrix.student_class.get(sid)].append(sid)
+
+    matrix.grades = grades
+    matrix.level_ranks = _rank(grades.keys(), matrix.totals)
+    for sids in by_class.values():
+        matrix.class_ranks.update(_rank(sids, matrix.totals))
+        matrix.mean_class_ranks.update(_rank(sids, matrix.mean_scores))
+    matrix.class_averages = {
+        cid: (class_sum[cid] / class_count[cid]) if class_count[cid] else 0
+        for cid in by_class
+    }
+    return matrix
+
+
+def get_result_matrix(exam, level):
+    """Return the cached matrix for (exam, level), building it on a miss."""
+    exam_id = getattr(exam, 'id', exam)
+    level = '' if level is None else str(level)
+    key = "result_matrix:{}:{}:{}:{}:{}".format(
+        MATRIX_FORMAT, exam_id, level, cache_versions.current(_exam_version_key(exam_id)), cache_versions.current(_GLOBAL_VERSION_KEY)
+    )
+    matrix = cache.get(key)
+    if matrix is None:
+        matrix = build_result_matrix(exam_id, level)
+        cache.set(key, matrix, timeout=MATRIX_TIMEOUT)
+    return matrix
@@ -0,0 +1,153 @@
+"""Block result slip rows shared by the CSV export and the PDF renderer.
+
+Grades of an exam are read as a values_list projection ordered by class, so
+classes are produced one at a time and only one class's grades are held in
+memory.
+"""
+from collections import OrderedDict
+from itertools import groupby
+
+from core.models import Grade
+from core.services.grading import get_compiled_schemes
+
+CHUNK_SIZE = 2000
+
+# 4-point scale mapping (including +/- variants)
+LETTER_POINTS = {
+    'A+': 4, 'A': 4, 'A-': 4,
+    'B+': 3, 'B': 3, 'B-': 3,
+    'C+': 2, 'C': 2, 'C-': 2,
+    'D+': 1, 'D': 1, 'D-': 1,
+    'E': 0,
+}
+
+
+def points_to_letter(avg):
+    """Map average points back to an approximate mean grade (4-point bands)."""
+    if avg is None:
+        return ''
+    if avg >= 3.5: return 'A'
+    if avg >= 2.5: return 'B'
+    if avg >= 1.5: return 'C'
+    if avg >= 0.5: return 'D'
+    return 'E'
+
+
+def _full_name(first_name, last_name):
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+
+def _class_block(class_name, class_level, grades, schemes):
+    students = OrderedDict()  # student_id -> (admission_no, full name)
+    subjects = {}             # subject_id -> (name, code)
+    grade_map = {}            # (student_id, subject_id) -> (score, letter)
+    for (_cid, _cname, _clevel, student_id, adm, first, last,
+         subject_id, subject_name, subject_code, score, stored) in grades:
+        students.setdefault(student_id, (adm or '', _full_name(first, last)))
+        subjects.setdefault(subject_id, (subject_name, subject_code))
+        letter = stored
+        if not letter:
+            scheme = schemes.get(subject_id)
+            letter = (scheme.letter(score) or '') if scheme else ''
+        grade_map[(student_id, subject_id)] = (score, letter)
+
+    subjects_sorted = sorted(subjects, key=lambda sid: subjects[sid][0].lower())
+    columns = ['Position', 'Admission No', 'Full Name'] + [subjects[sid][1] for sid in subjects_sorted] + ['Total Marks', 'Total Points', 'Avg Points', 'Mean Grade']
+
+    students_sorted = sorted(students.items(), key=lambda kv: (len(kv[1][0]), kv[1][0]))
+    student_rows = []
+    per_subject_points = {sid: [] for sid in subjects_sorted}
+    for student_id, (adm, full_name) in students_sorted:
+        total_points = 0
+        taken = 0
+        total_marks = 0.0
+        subj_cells = []
+        for sid in subjects_sorted:
+            entry = grade_map.get((student_id, sid))
+            if not entry:
+                subj_cells.append('')
+                continue
+            score, letter = entry
+            # subject cell shows marks and letter when available
+            if letter and score is not None:
+                cell = f"{score} ({letter})"
+            elif score is not None:
+                cell = str(score)
+            else:
+                cell = letter
+            subj_cells.append(cell)
+            if letter in LETTER_POINTS:
+                total_points += LETTER_POINTS[letter]
+                per_subject_points[sid].append(LETTER_POINTS[letter])
+                taken += 1
+            # accumulate raw marks for tie-breaker
+            try:
+                total_marks += float(score or 0)
+            except Exception:
+                pass
+        avg_points = round(total_points / taken, 2) if taken else 0
+        mean_grade = points_to_letter(avg_points) if taken else ''
+        student_rows.append({
+            'adm': adm,
+            'row': [adm, full_name] + subj_cells + [round(total_marks, 2), total_points, avg_points, mean_grade],
+            'total_points': total_points,
+            'avg_points': avg_points,
+            'total_marks': total_marks,
+        })
+
+    # Rank by Total Points desc, then total Marks desc
+    student_rows.sort(key=lambda r: (-r['total_points'], -r['total_marks'], len(r['adm']), r['adm']))
+    rows = []
+    position = 0
+    last_points = None
+    last_marks = None
+    for idx, entry in enumerate(student_rows, start=1):
+        pts = entry['total_points']
+        marks = entry['total_marks']
+        if pts != last_points or marks != last_marks:
+            position = idx
+            last_points = pts
+            last_marks = marks
+        rows.append([position] + entry['row'])
+
+    # Class averages row (prefix blanks for Position and Admission No)
+    avg_row = ['', '', 'Class Averages']
+    for sid in subjects_sorted:
+        pts_list = per_subject_points.get(sid, [])
+        if pts_list:
+            subj_avg = round(sum(pts_list) / len(pts_list), 2)
+            avg_row.append(f"{subj_avg} ({points_to_letter(subj_avg)})")
+        else:
+            avg_row.append('')
+    all_totals = [r['total_points'] for r in student_rows]
+    all_avgs = [r['avg_points'] for r in student_rows if r['avg_points']]
+    all_marks = [r['total_marks'] for r in student_rows]
+    class_total_marks_avg = round(sum(all_marks) / len(all_marks), 2) if all_marks else 0
+    class_total_avg = round(sum(all_totals) / len(all_totals), 2) if all_totals else 0
+    class_avg_points = round(sum(all_avgs) / len(all_avgs), 2) if all_avgs else 0
+    class_mean_grade = points_to_letter(class_avg_points) if all_avgs else ''
+    rows.append(avg_row + [class_total_marks_avg, class_total_avg, class_avg_points, class_mean_grade])
+    return columns, rows
+
+
+def iter_class_blocks(exam_id, class_id=None, level=None):
+    """Yield (class title, columns, rows) per class, in (level, name) order.
+
+    rows are ranked student rows followed by the class averages row.
+    """
+    grades = Grade.objects.filter(exam_id=exam_id, student__class_group__isnull=False)
+    if class_id:
+        grades = grades.filter(student__class_group_id=class_id)
+    if level:
+        grades = grades.filter(student__class_group__level=level)
+    grades = grades.order_by(
+        'student__class_group__level', 'student__class_group__name', 'student__class_group_id'
+    ).values_list(
+        'student__class_group_id', 'student__class_group__name', 'student__class_group__level',
+        'student_id', 'student__admission_no', 'student__user__first_name', 'student__user__last_name',
+        'subject_id', 'subject__name', 'subject__code', 'score', 'grade_letter',
+    )
+    schemes = get_compiled_schemes()
+    for (_cid, class_name, class_level), class_grades in groupby(grades.iterator(chunk_size=CHUNK_SIZE), key=lambda g: g[:3]):
+        columns, rows = _class_block(class_name, class_level, class_grades, schemes)
+        yield f"Class: {class_name} (Level {class_level})", columns, rows
@@ -0,0 +1,142 @@
+"""Read model behind the student profile page.
+
+Everything the page shows about one student (fee statement, published exams
+with their averages, the selected exam's grades, class and level ranks) is
+loaded with a fixed number of queries, however many exams, fee assignments or
+classmates there are: one query per table, with per-exam and per-student
+figures aggregated in SQL or in Python from those rows.
+"""
+from django.db.models import Avg
+
+from core.models import Exam, FeeAssignment, FeePayment, Grade
+
+# Points per letter grade for the report card total
+POINTS = {'A': 4, 'B': 3, 'C': 2, 'D': 1}
+
+
+def _rank(rows, student_id):
+    """(rank, total) of student_id among (student_id, average) rows, best first."""
+    ranked = sorted((r for r in rows if r[1] is not None), key=lambda r: r[1], reverse=True)
+    position = next((i for i, (sid, _avg) in enumerate(ranked, start=1) if sid == student_id), None)
+    return position, len(ranked)
+
+
+def _exam_date(exam):
+    day = exam.start_date or (exam.term.start_date if exam.term else None)
+    return day.strftime('%Y-%m-%d') if day else ''
+
+
+class StudentProfile:
+    """Fee, exam and ranking figures of a student; exam_id picks the exam whose grades are shown.
+
+    Only published exams are listed or selectable; without a valid exam_id the
+    latest published exam the student sat is selected.
+    """
+
+    def __init__(self, student, exam_id=None):
+        self.student = student
+        self._load_fees()
+        self._load_exams(exam_id)
+        self._load_ranks()
+
+    def _load_fees(self):
+        student = self.student
+        self.fee_assignments = list(
+            FeeAssignment.objects.filter(class_group_id=student.class_group_id)
+            .select_related('fee_category').order_by('id')
+        ) if student.class_group_id else []
+        by_id = {fa.id: fa for fa in self.fee_assignments}
+        payments = list(
+            FeePayment.objects.filter(student=student)
+            .select_related('fee_assignment__fee_category').order_by('payment_date', 'id')
+        )
+        for fa in self.fee_assignments:
+            fa.paid = 0
+        for p in payments:
+            if p.fee_assignment_id in by_id:
+                by_id[p.fee_assignment_id].paid += p.amount_paid
+        for fa in self.fee_assignments:
+            fa.outstanding = max(fa.amount - fa.paid, 0)
+        self.fee_payments = [p for p in payments if p.fee_assignment_id in by_id]
+        self.total_billed = sum((fa.amount for fa in self.fee_assignments), 0)
+        self.total_paid = sum((p.amount_paid for p in payments), 0)
+        self.balance = self.total_billed - self.total_paid
+
+    def _load_exams(self, exam_id):
+        student = self.student
+        # Published exams the student has grades in, with the student's average per exam
+        exams = list(
+            Exam.objects.filter(grade__student=student, results_published=True)
+            .annotate(average=Avg('grade__score'))
+            .select_related('term__academic_year')
+            .order_by('-start_date', '-id')
+        )
+        self.published_exams = exams
+        self.exam_performance = [
+            {
+                'exam_id': ex.id,
+                'exam_name': ex.name,
+                'date': _exam_date(ex),
+                'average_score': float(ex.average) if ex.average is not None else None,
+            }
+            for ex in reversed(exams)
+        ]
+
+        selected, show_grades = None, True
+        if exam_id:
+            try:
+                requested = int(exam_id)
+            except (TypeError, ValueError):
+                requested = None
+            if requested is not None:
+                selected = next((ex for ex in exams if ex.id == requested), None)
+                if selected is None:
+                    selected = Exam.objects.select_related('term__academic_year').filter(id=requested, results_published=True).first()
+                # An unpublished or unknown exam shows no grades
+                show_grades = selected is not None
+        if selected is None and exams:
+            selected = exams[0]
+        self.selected_exam = selected
+
+        self.grades = list(
+            Grade.objects.filter(student=student, exam=selected).select_related('subject', 'exam').order_by('subject__name')
+        ) if selected is not None and show_grades else []
+        scores = [g.score for g in self.grades]
+        self.average_score = sum(scores) / len(scores) if scores else None
+        self.total_points = sum(POINTS.get(g.grade_letter, 0) for g in self.grades if g.grade_letter)
+
+    def _load_ranks(self):
+        student = self.student
+        self.class_rank = self.class_total = None
+        self.overall_level_rank = self.overall_level_total = None
+        if not student.class_group_id:
+            return
+        # Ranks are by each student's average over all of their grades
+        averages = Grade.objects.order_by().values('student_id').annotate(avg=Avg('score')).values_list('student_id', 'avg')
+        self.class_rank, self.class_total = _rank(
+            averages.filter(student__class_group_id=student.class_group_id), student.id
+        )
+        self.overall_level_rank, self.overall_level_total = _rank(
+            averages.filter(student__class_group__level=student.class_group.level), student.id
+        )
+
+    def context(self):
+        return {
+            'total_billed': self.total_billed,
+            'total_paid': self.total_paid,
+            'balance': self.balance,
+            'fee_assignments': self.fee_assignments,
+            'fee_payments': self.fee_payments,
+            'grades': self.grades,
+            'average_score': self.average_score,
+            'total_points': self.total_points,
+            'exam_performance': self.exam_performance,
+            'class_rank': self.class_rank,
+            'class_total': self.class_total,
+            'stream_rank': self.class_rank,
+            'stream_total': self.class_total,
+            'overall_level_rank': self.overall_level_rank,
+            'overall_level_total': self.overall_level_total,
+            'published_exams': self.published_exams,
+            'selected_exam': self.selected_exam,
+        }
@@ -0,0 +1,193 @@
+"""Student search index: normalized tokens of names, admission numbers, usernames and emails.
+
+Each student has StudentSearchToken rows (lowercase ASCII, accents folded,
+split on anything that is not a letter or digit; admission numbers also get
+their separator-free form). A query term matches a token it prefixes, which is
+a range scan on the token index instead of a LIKE '%q%' over Student and User.
+Terms with no prefix hit fall back to fuzzy matching against tokens sharing the
+first letter, so "jhon" still finds "john". Only the local part of an email is
+indexed; a query containing "@" is looked up as a whole address instead.
+
+Rows are kept in step by Student/User signals (see core.signals); the
+rebuild_student_search command backfills or repairs the whole table. The same
+matcher serves the admin student lists, the pocket money student picker, the
+messaging recipient picker and the assistant's student lookup.
+"""
+from collections import defaultdict
+import difflib
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models.functions import Length
+
+from core.models import Student, StudentSearchToken
+
+BATCH_SIZE = 500
+MAX_CANDIDATES = 2000
+FUZZY_CUTOFF = 0.75
+
+# Relative weight of a hit by source field
+FIELD_WEIGHTS = {'admission': 1.2, 'name': 1.0, 'username': 0.8, 'email': 0.6}
+
+_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase ASCII with accents folded; other characters become spaces."""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii')
+    return _SPLIT.sub(' ', text.lower()).strip()
+
+
+def tokenize(text):
+    return [t[:64] for t in normalize(text).split()]
+
+
+def tokens_for(admission_no, first_name, last_name, username, email):
+    """{(field, token)} indexed for one student."""
+    tokens = set()
+    parts = tokenize(admission_no)
+    for t in parts:
+        tokens.add(('admission', t))
+    if len(parts) > 1:
+        tokens.add(('admission', ''.join(parts)[:64]))
+    for t in tokenize(f"{first_name or ''} {last_name or ''}"):
+        tokens.add(('name', t))
+    for t in tokenize(username):
+        tokens.add(('username', t))
+    for t in tokenize((email or '').split('@')[0]):
+        tokens.add(('email', t))
+    return tokens
+
+
+def _prefix_range(term):
+    """Tokens starting with `term` lie in [term, upper); tokens are ASCII letters and digits."""
+    return {'token__gte': term, 'token__lt': term[:-1] + chr(ord(term[-1]) + 1)}
+
+
+def _tokens(queryset=None):
+    rows = StudentSearchToken.objects.all()
+    if queryset is not None:
+        rows = rows.filter(student__in=queryset.order_by().values('id'))
+    return rows
+
+
+def _prefix_hits(term, queryset=None):
+    hits = {}
+    rows = (
+        _tokens(queryset).filter(**_prefix_range(term))
+        .order_by('token')
+        .values_list('student_id', 'field', 'token')[:MAX_CANDIDATES]
+    )
+    for student_id, field, token in rows:
+        # Exact tokens outrank longer completions
+        score = FIELD_WEIGHTS.get(field, 0.5) * (1.0 if token == term else 0.6 + 0.4 * len(term) / len(token))
+        if score > hits.get(student_id, 0):
+            hits[student_id] = score
+    return hits
+
+
+def _fuzzy_hits(term, queryset=None):
+    vocabulary = list(
+        _tokens(queryset).filter(**_prefix_range(term[0]))
+        .annotate(n=Length('token')).filter(n__gte=len(term) - 2, n__lte=len(term) + 2)
+        .order_by().values_list('token', flat=True).distinct()[:MAX_CANDIDATES]
+    )
+    close = difflib.get_close_matches(term, vocabulary, n=5, cutoff=FUZZY_CUTOFF)
+    if not close:
+        return {}
+    ratios = {t: difflib.SequenceMatcher(None, term, t).ratio() for t in close}
+    hits = {}
+    for student_id, field, token in _tokens(queryset).filter(token__in=close).values_list('student_id', 'field', 'token')[:MAX_CANDIDATES]:
+        score = FIELD_WEIGHTS.get(field, 0.5) * 0.5 * ratios[token]
+        if score > hits.get(student_id, 0):
+            hits[student_id] = score
+    return hits
+
+
+def _by_email(query, queryset=None):
+    """Students whose user email is exactly `query` (case-insensitive)."""
+    qs = Student.objects.all() if queryset is None else queryset
+    return qs.filter(user__email__iexact=query.strip())
+
+
+def search(query, limit=10, queryset=None, fuzzy=True):
+    """Student ids best matching `query`, best first.
+
+    Every query term must match (by prefix, else fuzzily) one of the student's
+    tokens. queryset restricts the candidates (e.g. only current students).
+    """
+    if '@' in (query or ''):
+        ids = list(_by_email(query, queryset).order_by('id').values_list('id', flat=True))
+        return ids[:limit] if limit else ids
+    terms = tokenize(query)
+    if not terms:
+        return []
+    scores = defaultdict(float)
+    candidates = None
+    for term in terms:
+        hits = _prefix_hits(term, queryset)
+        if not hits and fuzzy:
+            hits = _fuzzy_hits(term, queryset)
+        candidates = set(hits) if candidates is None else candidates & set(hits)
+        if not candidates:
+            return []
+        for student_id, score in hits.items():
+            scores[student_id] += score
+    ranked = sorted(candidates, key=lambda sid: (-scores[sid], sid))
+    return ranked[:limit] if limit else ranked
+
+
+def search_students(query, limit=10, queryset=None, fuzzy=True):
+    """Student instances for search(), in rank order."""
+    qs = Student.objects.all() if queryset is None else queryset
+    ids = search(query, limit=limit, queryset=queryset, fuzzy=fuzzy)
+    found = qs.in_bulk(ids)
+    return [found[sid] for sid in ids if sid in found]
+
+
+def filter_queryset(queryset, query):
+    """Narrow a Student queryset to rows whose tokens start with every query term.
+
+    Keeps the queryset's own ordering, for paginated lists.
+    """
+    if '@' in (query or ''):
+        return _by_email(query, queryset)
+    for term in tokenize(query):
+        queryset = queryset.filter(id__in=StudentSearchToken.objects.filter(**_prefix_range(term)).values('student_id'))
+    return queryset
+
+
+def index_students(student_ids):
+    """Rewrite the tokens of these students where they changed; returns students touched."""
+    student_ids = {sid for sid in student_ids if sid}
+    if not student_ids:
+        return 0
+    expected = defaultdict(set)
+    for sid, admission_no, first, last, username, email in (
+        Student.objects.filter(id__in=student_ids)
+        .values_list('id', 'admission_no', 'user__first_name', 'user__last_name', 'user__username', 'user__email')
+    ):
+        expected[sid] = tokens_for(admission_no, first, last, username, email)
+    current = defaultdict(set)
+    for sid, field, token in StudentSearchToken.objects.filter(student_id__in=student_ids).values_list('student_id', 'field', 'token'):
+        current[sid].add((field, token))
+    changed = [sid for sid in student_ids if expected.get(sid, set()) != current.get(sid, set())]
+    if not changed:
+        return 0
+    with transaction.atomic():
+        StudentSearchToken.objects.filter(student_id__in=changed).delete()
+        StudentSearchToken.objects.bulk_create(
+            [StudentSearchToken(student_id=sid, field=field, token=token) for sid in changed for field, token in expected.get(sid, ())],
+            batch_size=BATCH_SIZE,
+        )
+    return len(changed)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Index every student in batches; returns students whose tokens changed."""
+    ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+    changed = 0
+    for i in range(0, len(ids), batch_size):
+        changed += index_students(ids[i:i + batch_size])
+    return changed
@@ -0,0 +1,176 @@
+"""Per-teacher class cards for the teacher dashboard.
+
+One card per (class, subject) the teacher is assigned, plus one per class
+they are class teacher of without a subject assignment. The performance
+figures of every card come from a single Grade query grouped by class,
+subject and student over the current term:
+
+* avg_score: mean mark of the card's grades as a percentage of each
+  subject's maximum score (see grade_ingest.max_score_for),
+* exams_marked / total_exams: the most exams any student on the card has
+  marks in, against the term's exams for the class level,
+* low_performers: students whose mean percentage is below LOW_SCORE (across
+  all subjects on a class-teacher card).
+
+Cards are cached per teacher. The entry remembers the version of every
+(class, subject) it was built from; Grade writes bump those versions (see
+core.signals and GradeIngest), and assignment, class, student, exam or term
+changes bump a global version.
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+
+from core.models import Class, Exam, Grade, Student, TeacherClassAssignment
+from core.services import academic_calendar, cache_versions
+from core.services.grading import get_compiled_schemes
+
+CARDS_TIMEOUT = 10 * 60  # seconds
+LOW_SCORE = 40  # percent of the subject's maximum score
+
+_GLOBAL_VERSION_KEY = cache_versions.register("teacher_dashboard:ver")
+
+
+def _pair_version_key(class_id, subject_id):
+    return f"teacher_dashboard:ver:{class_id}:{subject_id}"
+
+
+def _class_version_key(class_id):
+    return f"teacher_dashboard:ver:{class_id}"
+
+
+def invalidate():
+    """Drop every teacher's cards (assignments, classes, students or exams changed)."""
+    cache_versions.bump(_GLOBAL_VERSION_KEY)
+
+
+def invalidate_grades(pairs):
+    """Grades changed for these (student_id, subject_id) pairs."""
+    pairs = {(sid, subject_id) for sid, subject_id in pairs if sid}
+    if not pairs:
+        return
+    classes = dict(
+        Student.objects.filter(id__in={sid for sid, _ in pairs}, class_group__isnull=False)
+        .values_list('id', 'class_group_id')
+    )
+    touched = {(classes[sid], subject_id) for sid, subject_id in pairs if sid in classes}
+    for class_id, subject_id in touched:
+        cache_versions.bump(_pair_version_key(class_id, subject_id))
+    for class_id in {class_id for class_id, _ in touched}:
+        cache_versions.bump(_class_version_key(class_id))
+
+
+def _cache_key(teacher_id):
+    return f"teacher_dashboard:cards:{teacher_id}"
+
+
+def _dependency_keys(cards):
+    keys = [_GLOBAL_VERSION_KEY]
+    for card in cards:
+        if card['subject'] is None:
+            keys.append(_class_version_key(card['class'].id))
+        else:
+            keys.append(_pair_version_key(card['class'].id, card['subject'].id))
+    return keys
+
+
+def _empty_metrics():
+    return {'avg_score': None, 'exams_marked': 0, 'total_exams': 0, 'low_performers': 0}
+
+
+def _skeleton(teacher):
+    cards = [
+        {'class': a.class_group, 'subject': a.subject, 'is_class_teacher': False}
+        for a in TeacherClassAssignment.objects.filter(teacher=teacher)
+        .select_related('class_group', 'subject').order_by('class_group__name', 'subject__name')
+    ]
+    assigned_class_ids = {c['class'].id for c in cards}
+    cards += [
+        {'class': c, 'subject': None, 'is_class_teacher': True}
+        for c in Class.objects.filter(class_teacher=teacher).exclude(id__in=assigned_class_ids)
+    ]
+    return cards
+
+
+def _fill_metrics(cards, term):
+    if not cards:
+        return cards
+    class_ids = {c['class'].id for c in cards}
+
+    counts = dict(
+        Student.objects.filter(class_group_id__in=class_ids).order_by()
+        .values_list('class_group_id').annotate(n=Count('id'))
+    )
+
+    exam_levels = Exam.objects.all() if term is None else Exam.objects.filter(term=term)
+    exam_levels = list(exam_levels.values_list('level', flat=True))
+
+    scope = Q()
+    for card in cards:
+        if card['subject'] is None:
+            scope |= Q(student__class_group_id=card['class'].id)
+        else:
+            scope |= Q(student__class_group_id=card['class'].id, subject_id=card['subject'].id)
+    grades = Grade.objects.filter(scope)
+    if term is not None:
+        grades = grades.filter(exam__term=term)
+    # (class, subject, student) -> (sum, marks, exams)
+    rows = (
+        grades.order_by()
+        .values_list('student__class_group_id', 'subject_id', 'student_id')
+        .annotate(total=Sum('score'), marks=Count('id'), exams=Count('exam_id', distinct=True))
+    )
+    from core.services.grade_ingest import max_score_for
+    schemes = get_compiled_schemes()
+    by_pair = defaultdict(list)
+    by_class = defaultdict(list)
+    for class_id, subject_id, student_id, total, marks, exams in rows:
+        # Percentages, so subjects marked out of different maxima compare
+        percent = (total or 0.0) * 100.0 / max_score_for(schemes.get(subject_id))
+        by_pair[(class_id, subject_id)].append((student_id, percent, marks, exams))
+        by_class[class_id].append((student_id, percent, marks, exams))
+
+    for card in cards:
+        clazz = card['class']
+        card['student_count'] = counts.get(clazz.id, 0)
+        card.update(_empty_metrics())
+        card['total_exams'] = sum(1 for level in exam_levels if not level or str(level) == str(clazz.level))
+        if card['subject'] is None:
+            found = by_class.get(clazz.id, [])
+        else:
+            found = by_pair.get((clazz.id, card['subject'].id), [])
+        if not found:
+            continue
+        per_student = defaultdict(lambda: [0.0, 0])
+        for student_id, total, marks, _exams in found:
+            per_student[student_id][0] += total
+            per_student[student_id][1] += marks
+        all_marks = sum(m for _t, m in per_student.values())
+        card['avg_score'] = sum(t for t, _m in per_student.values()) / all_marks if all_marks else None
+        # Exams seen by the best-covered student of the card
+        card['exams_marked'] = max(exams for *_rest, exams in found)
+        card['low_performers'] = sum(1 for t, m in per_student.values() if m and t / m < LOW_SCORE)
+    return cards
+
+
+def compute_cards(teacher, term=None):
+    """Card dicts (class, subject, is_class_teacher, student_count and the metrics above)."""
+    return _fill_metrics(_skeleton(teacher), term)
+
+
+def class_cards(teacher):
+    """compute_cards() for the current term, cached per teacher."""
+    key = _cache_key(teacher.id)
+    entry = cache.get(key)
+    if entry is not None:
+        keys, versions, cards = entry
+        if cache_versions.current_many(keys) == versions:
+            return cards
+    cards = _skeleton(teacher)
+    keys = _dependency_keys(cards)
+    # Versions are read before the grades so a write during the computation is not masked
+    versions = cache_versions.current_many(keys)
+    _fill_metrics(cards, academic_calendar.current_term(fallback=True))
+    cache.set(key, (keys, versions, cards), timeout=CARDS_TIMEOUT)
+    return cards
@@ -0,0 +1,283 @@
+"""DB-free timetable search used by timetable_scheduler.
+
+A problem is expressed over integer indexes: classes 0..C-1, days 0..D-1,
+periods 0..P-1 in start-time order and teachers 0..T-1. A class's week is a
+flat list of D*P cells (cell = day * P + period) holding (subject_id, teacher)
+or None. solve() makes one seeded randomized attempt (priority seeding,
+per-period teacher matching with swap repair, final fill) and score() ranks
+attempts. Nothing here imports Django, so attempts can run in worker
+processes started with either fork or spawn.
+"""
+from collections import defaultdict
+import random
+
+EARLY_PERIODS = 4  # Mathematics is preferred in the first periods of the day
+MAX_BLANKS = 2     # the final fill leaves at most this many blanks per class
+
+FREE = -1
+BLOCKED = -2       # teacher cell taken by a lesson kept from an existing timetable
+_KEPT = ('kept', None)  # class cell taken by such a lesson (compared by value: solutions are pickled)
+
+
+class Problem:
+    """Inputs of a search.
+
+    demands[c]: [subject_id, teacher, lessons] still to place for class c
+    pairs[c]: (subject_id, teacher) pairs class c may repeat in the final fill
+    priority / maths: subject ids that should appear daily / early in the day
+    blocked: (class, cell, teacher or None) cells taken by kept lessons
+    """
+
+    def __init__(self, n_classes, n_days, n_periods, n_teachers, demands, pairs, priority=(), maths=(), blocked=()):
+        self.n_classes = n_classes
+        self.n_days = n_days
+        self.n_periods = n_periods
+        self.n_teachers = n_teachers
+        self.demands = demands
+        self.pairs = pairs
+        self.priority = frozenset(priority)
+        self.maths = frozenset(maths)
+        self.blocked = list(blocked)
+
+
+class Solution:
+    def __init__(self, seed, grid, placed, reasons):
+        self.seed = seed
+        self.grid = grid
+        self.placed = placed
+        self.reasons = dict(reasons)
+
+    @property
+    def skipped(self):
+        return sum(self.reasons.values())
+
+    def lessons(self, n_periods):
+        """(class, day, period, subject_id, teacher) of every placed lesson."""
+        for c, row in enumerate(self.grid):
+            for cell, entry in enumerate(row):
+                if entry and entry != _KEPT:
+                    yield (c, cell // n_periods, cell % n_periods, entry[0], entry[1])
+
+
+class _State:
+    """Mutable search state of one attempt."""
+
+    def __init__(self, problem, rng):
+        self.problem = problem
+        self.rng = rng
+        C, D, P, T = problem.n_classes, problem.n_days, problem.n_periods, problem.n_teachers
+        self.P = P
+        self.grid = [[None] * (D * P) for _ in range(C)]
+        self.teacher_at = [[FREE] * (D * P) for _ in range(T)]
+        self.load = [[0] * T for _ in range(D)]
+        self.day_count = defaultdict(int)  # (class, subject_id, day) -> lessons
+        self.remaining = [[list(item) for item in problem.demands[c] if item[2] > 0] for c in range(C)]
+        self.placed = 0
+        self.reasons = defaultdict(int)
+        for c, cell, t in problem.blocked:
+            self.grid[c][cell] = _KEPT
+            if t is not None:
+                self.teacher_at[t][cell] = BLOCKED
+
+    def free(self, c, t, cell):
+        return self.grid[c][cell] is None and self.teacher_at[t][cell] == FREE
+
+    def has(self, c, s, t):
+        return any(item[0] == s and item[1] == t for item in self.remaining[c])
+
+    def place(self, c, cell, s, t, consume=True):
+        day = cell // self.P
+        self.grid[c][cell] = (s, t)
+        self.teacher_at[t][cell] = c
+        self.load[day][t] += 1
+        self.day_count[(c, s, day)] += 1
+        self.placed += 1
+        if consume:
+            items = self.remaining[c]
+            for i, item in enumerate(items):
+                if item[0] == s and item[1] == t:
+                    item = items.pop(i)
+                    item[2] -= 1
+                    if item[2] > 0:
+                        items.append(item)  # round-robin: other subjects come first next time
+                    break
+
+    def move(self, c, t, cell, to_cell):
+        """Move class c's lesson with teacher t to another cell of the same day."""
+        self.grid[c][to_cell] = self.grid[c][cell]
+        self.grid[c][cell] = None
+        self.teacher_at[t][to_cell] = c
+        self.teacher_at[t][cell] = FREE
+
+    def skip(self, reason):
+        self.reasons[reason] += 1
+
+
+def _shuffled(rng, items):
+    items = list(items)
+    rng.shuffle(items)
+    return items
+
+
+def _seed_priority(st, classes, days):
+    """Place each priority subject once per day per class where possible."""
+    pb, rng, P = st.problem, st.rng, st.P
+    early = range(min(EARLY_PERIODS, P))
+    late = range(len(early), P)
+    for c in classes:
+        for d in days:
+            for s, t, _n in list(st.remaining[c]):
+                if s not in pb.priority or st.day_count[(c, s, d)] or not st.has(c, s, t):
+                    continue
+                if s in pb.maths:
+                    order = _shuffled(rng, early) + _shuffled(rng, late)
+                else:
+                    order = _shuffled(rng, range(P))
+                for p in order:
+                    if st.free(c, t, d * P + p):
+                        st.place(c, d * P + p, s, t)
+                        break
+
+
+def _match_period(st, classes, periods, d, p):
+    """Maximum class/teacher matching for one (day, period), then repeats and swaps for classes left free."""
+    pb, P = st.problem, st.P
+    cell = d * P + p
+    load = st.load[d]
+    edges = {}
+    for c in classes:
+        if st.grid[c][cell] is not None or not st.remaining[c]:
+            continue
+        preferred, others = [], []
+        for s, t, n in st.remaining[c]:
+            if n <= 0 or st.teacher_at[t][cell] != FREE:
+                continue
+            if s in pb.maths and p < EARLY_PERIODS:
+                preferred.insert(0, (t, s))
+            elif s in pb.priority:
+                preferred.append((t, s))
+            elif st.day_count[(c, s, d)]:
+                others.append((t, s))  # repeats of a non-priority subject on the same day go last
+            else:
+                others.insert(0, (t, s))
+        options = preferred + others
+        options.sort(key=lambda e: load[e[0]])  # stable: less-loaded teachers first
+        edges[c] = options
+
+    match = {}   # teacher -> class
+    chosen = {}  # (class, teacher) -> subject_id
+
+    def augment(c, seen):
+        for t, s in edges[c]:
+            if t in seen:
+                continue
+            seen.add(t)
+            if t not in match or augment(match[t], seen):
+                match[t] = c
+                chosen[(c, t)] = s
+                return True
+        return False
+
+    # Most-constrained classes first
+    for c in sorted(edges, key=lambda c: len(edges[c])):
+        augment(c, set())
+    for t, c in match.items():
+        if st.free(c, t, cell):
+            st.place(c, cell, chosen[(c, t)], t)
+
+    for c in classes:
+        if st.grid[c][cell] is not None or not st.remaining[c]:
+            continue
+        # One repeat of a non-priority subject is an acceptable fallback
+        placed = False
+        for s, t, _n in list(st.remaining[c]):
+            if st.teacher_at[t][cell] == FREE and s not in pb.priority and st.day_count[(c, s, d)]:
+                st.place(c, cell, s, t)
+                placed = True
+                break
+        if placed:
+            continue
+        # Free a needed teacher by moving their lesson here to another free period of the day
+        swapped = False
+        for s, t, n in list(st.remaining[c]):
+            other = st.teacher_at[t][cell]
+            if n <= 0 or other < 0:
+                continue
+            for p2 in periods:
+                to_cell = d * P + p2
+                if p2 != p and st.free(other, t, to_cell):
+                    st.move(other, t, cell, to_cell)
+                    st.place(c, cell, s, t)
+                    swapped = True
+                    break
+            if swapped:
+                break
+        if not swapped:
+            st.skip('no_match_for_period')
+
+
+def _final_fill(st, classes, days, periods):
+    """Repeat a class's subjects in its empty cells until at most MAX_BLANKS remain."""
+    pb, rng, P = st.problem, st.rng, st.P
+    for c in classes:
+        if not pb.pairs[c]:
+            continue
+        empty = [d * P + p for d in days for p in periods if st.grid[c][d * P + p] is None]
+        base = sorted(pb.pairs[c])
+        for cell in empty[:max(len(empty) - MAX_BLANKS, 0)]:
+            for s, t in _shuffled(rng, base):
+                if st.teacher_at[t][cell] == FREE:
+                    st.place(c, cell, s, t, consume=False)
+                    break
+            else:
+                st.skip('final_fill_no_candidate')
+
+
+def solve(problem, seed):
+    """One randomized attempt; returns a Solution."""
+    rng = random.Random(seed)
+    st = _State(problem, rng)
+    days = _shuffled(rng, range(problem.n_days))
+    periods = _shuffled(rng, range(problem.n_periods))
+    classes = _shuffled(rng, range(problem.n_classes))
+
+    _seed_priority(st, classes, days)
+    for d in days:
+        for p in periods:
+            _match_period(st, classes, periods, d, p)
+    _final_fill(st, classes, days, periods)
+    return Solution(seed, st.grid, st.placed, st.reasons)
+
+
+def score(problem, solution):
+    """Sortable quality of a solution, higher is better.
+
+    (lessons placed against the requested weekly counts, -blank cells of
+    classes with assignments, (class, day, priority subject) combinations
+    covered, Mathematics lessons in the early periods)
+    """
+    P = problem.n_periods
+    placed = defaultdict(int)
+    blanks = coverage = maths_early = 0
+    for c, row in enumerate(solution.grid):
+        seen_days = set()
+        for cell, entry in enumerate(row):
+            if entry is None:
+                if problem.pairs[c]:
+                    blanks += 1
+                continue
+            if entry == _KEPT:
+                continue
+            s, t = entry
+            placed[(c, s, t)] += 1
+            if s in problem.priority:
+                seen_days.add((s, cell // P))
+            if s in problem.maths and cell % P < EARLY_PERIODS:
+                maths_early += 1
+        coverage += len(seen_days)
+    met = sum(
+        min(placed[(c, s, t)], n)
+        for c in range(problem.n_classes)
+        for s, t, n in problem.demands[c]
+    )
+    return (met, -blanks, coverage, maths_early)
@@ -0,0 +1,166 @@
+"""Diff-based DefaultTimetable writes.
+
+A timetable is handled as a grid {(class_id, day, period_id): (subject_id,
+teacher_id)}. replace() and apply_edits() compare the wanted cells with the
+stored rows and apply only the difference (one DELETE, bulk_create,
+bulk_update) in a single transaction. Each batch then sends one
+timetable_changed signal carrying the teachers whose schedule actually
+changed. core.signals queues the notification task from it, coalescing
+batches inside the TIMETABLE_NOTIFY_COOLDOWN window.
+
+Single-row saves made elsewhere (e.g. the Django admin) still reach the
+same path through DefaultTimetable post_save/post_delete. Those receivers
+are muted while a writer batch runs (see suppressed()).
+"""
+from contextlib import contextmanager
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.dispatch import Signal
+
+from core.models import DefaultTimetable, Teacher
+
+BATCH_SIZE = 500
+
+# sender=DefaultTimetable; kwargs: teacher_ids (set), source (str), result (WriteResult)
+timetable_changed = Signal()
+
+# One flag per queued teacher, so concurrent batches never overwrite each other's ids
+PENDING_PREFIX = "timetable_notify:pending:"
+PENDING_TIMEOUT = 24 * 60 * 60  # seconds; flags of deleted teachers expire
+LOCK_KEY = "timetable_update_notice_lock"
+
+_local = threading.local()
+
+
+class WriteResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.teacher_ids = set()
+
+    @property
+    def changed(self):
+        return bool(self.created or self.updated or self.deleted)
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'deleted': self.deleted,
+            'unchanged': self.unchanged,
+            'teachers': len(self.teacher_ids),
+        }
+
+
+@contextmanager
+def suppressed():
+    """Mute the per-row DefaultTimetable receivers; the batch reports its own change."""
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    try:
+        yield
+    finally:
+        _local.depth = depth
+
+
+def is_suppressed():
+    return getattr(_local, 'depth', 0) > 0
+
+
+def _stored(filters=None):
+    """{cell: (id, subject_id, teacher_id)} of the stored rows (optionally filtered)."""
+    qs = DefaultTimetable.objects.all() if filters is None else DefaultTimetable.objects.filter(filters)
+    return {
+        (cid, day, pid): (row_id, sid, tid)
+        for row_id, cid, day, pid, sid, tid in qs.order_by().values_list(
+            'id', 'class_group_id', 'day', 'period_id', 'subject_id', 'teacher_id'
+        )
+    }
+
+
+def _apply(stored, wanted, source):
+    """Write wanted over stored; cells of stored missing from wanted are deleted."""
+    result = WriteResult()
+    to_delete, to_create, to_update = [], [], []
+    for cell, (row_id, sid, tid) in stored.items():
+        if cell not in wanted:
+            to_delete.append(row_id)
+            result.teacher_ids.add(tid)
+    for cell, (sid, tid) in wanted.items():
+        current = stored.get(cell)
+        if current is None:
+            cid, day, pid = cell
+            to_create.append(DefaultTimetable(class_group_id=cid, day=day, period_id=pid, subject_id=sid, teacher_id=tid))
+            result.teacher_ids.add(tid)
+        elif current[1:] != (sid, tid):
+            to_update.append(DefaultTimetable(id=current[0], subject_id=sid, teacher_id=tid))
+            result.teacher_ids.update((current[2], tid))
+        else:
+            result.unchanged += 1
+    result.teacher_ids.discard(None)
+
+    with suppressed(), transaction.atomic():
+        if to_delete:
+            DefaultTimetable.objects.filter(id__in=to_delete).delete()
+        if to_create:
+            DefaultTimetable.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+        if to_update:
+            DefaultTimetable.objects.bulk_update(to_update, ['subject', 'teacher'], batch_size=BATCH_SIZE)
+    result.deleted, result.created, result.updated = len(to_delete), len(to_create), len(to_update)
+    if result.changed:
+        timetable_changed.send(sender=DefaultTimetable, teacher_ids=result.teacher_ids, source=source, result=result)
+    return result
+
+
+def replace(wanted, source='generate'):
+    """Make the whole table equal to wanted ({(class_id, day, period_id): (subject_id, teacher_id)})."""
+    with transaction.atomic():
+        return _apply(_stored(), dict(wanted), source)
+
+
+def apply_edits(edits, source='edit'):
+    """Set or clear (value None) individual cells; other cells are left alone."""
+    edits = dict(edits)
+    if not edits:
+        return WriteResult()
+    from django.db.models import Q
+    cells = Q()
+    for cid, day, pid in edits:
+        cells |= Q(class_group_id=cid, day=day, period_id=pid)
+    with transaction.atomic():
+        stored = _stored(cells)
+        wanted = {cell: value for cell, value in edits.items() if value is not None}
+        return _apply(stored, wanted, source)
+
+
+def _pending_key(teacher_id):
+    return f"{PENDING_PREFIX}{teacher_id}"
+
+
+def queue_notification(teacher_ids, cooldown):
+    """Remember the teachers to notify; the first batch of a cooldown window schedules the task.
+
+    Returns True when a task was scheduled.
+    """
+    teacher_ids = {t for t in teacher_ids if t}
+    if not teacher_ids:
+        return False
+    cache.set_many({_pending_key(t): True for t in teacher_ids}, timeout=PENDING_TIMEOUT)
+    return cache.add(LOCK_KEY, True, timeout=cooldown)
+
+
+def take_pending():
+    """Teacher ids queued since the last notification; reopens the window for the next one.
+
+    The window is reopened before the flags are read: a batch queued meanwhile
+    is either read here or schedules the next task itself.
+    """
+    cache.delete(LOCK_KEY)
+    ids = list(Teacher.objects.order_by('id').values_list('id', flat=True))
+    found = cache.get_many([_pending_key(t) for t in ids])
+    cache.delete_many(list(found))
+    return [t for t in ids if _pending_key(t) in found]
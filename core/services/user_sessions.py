@@ -0,0 +1,128 @@
+"""Per-user session index (core.models.UserSession).
+
+Rows are written on login and removed on logout, revocation or when found
+expired, so "sessions of this user" is an indexed lookup plus one primary-key
+query against django_session instead of decoding every stored session.
+"""
+from django.contrib.sessions.models import Session
+from django.utils import timezone
+
+from core.models import User, UserSession
+
+
+def client_metadata(request):
+    """Return (user_agent, ip) for a request, trimmed to the column sizes."""
+    ua = (request.META.get('HTTP_USER_AGENT') or '')[:300]
+    ip = (
+        (request.META.get('HTTP_X_FORWARDED_FOR') or '').split(',')[0].strip()
+        or request.META.get('REMOTE_ADDR')
+        or ''
+    )
+    return ua, ip[:64]
+
+
+def record_login(user, request):
+    """Index the request's (freshly cycled) session for this user."""
+    session = request.session
+    if not session.session_key:
+        session.save()
+    ua, ip = client_metadata(request)
+    UserSession.objects.update_or_create(
+        session_key=session.session_key,
+        defaults={
+            'user': user,
+            'user_agent': ua,
+            'ip_address': ip,
+            'login_at': timezone.now(),
+            'expire_date': session.get_expiry_date(),
+        },
+    )
+
+
+def forget(session_key):
+    if session_key:
+        UserSession.objects.filter(session_key=session_key).delete()
+
+
+def live_sessions(user):
+    """The user's unexpired sessions, newest login first, with current expiry dates.
+
+    Rows whose Session is gone or expired are dropped on the way.
+    """
+    rows = list(UserSession.objects.filter(user=user).order_by('-login_at'))
+    if not rows:
+        return []
+    expiry = dict(
+        Session.objects.filter(
+            session_key__in=[r.session_key for r in rows], expire_date__gt=timezone.now()
+        ).values_list('session_key', 'expire_date')
+    )
+    live, dead = [], []
+    for row in rows:
+        if row.session_key in expiry:
+            row.expire_date = expiry[row.session_key]
+            live.append(row)
+        else:
+            dead.append(row.pk)
+    if dead:
+        UserSession.objects.filter(pk__in=dead).delete()
+    return live
+
+
+def revoke(session_keys):
+    """End these sessions (log the devices out) and drop their index rows."""
+    session_keys = [k for k in session_keys if k]
+    if not session_keys:
+        return 0
+    Session.objects.filter(session_key__in=session_keys).delete()
+    return UserSession.objects.filter(session_key__in=session_keys).delete()[0]
+
+
+def enforce_limit(user, limit, current_key=None):
+    """Keep the `limit` newest sessions of a user (always including the current one)."""
+    live = live_sessions(user)
+    if len(live) <= limit:
+        return 0
+    live.sort(key=lambda r: r.session_key != current_key)  # stable: current first, then newest
+    return revoke([r.session_key for r in live[limit:]])
+
+
+def purge_stale():
+    """Bulk-delete index rows whose session has expired or no longer exists."""
+    alive = Session.objects.filter(expire_date__gt=timezone.now()).values('session_key')
+    return UserSession.objects.exclude(session_key__in=alive).delete()[0]
+
+
+def backfill():
+    """Index sessions created before the table existed (decodes each session once)."""
+    known = set(UserSession.objects.values_list('session_key', flat=True))
+    rows = []
+    for s in Session.objects.filter(expire_date__gt=timezone.now()).exclude(session_key__in=known).iterator():
+        try:
+            data = s.get_decoded()
+        except Exception:
+            continue
+        uid = data.get('_auth_user_id')
+        if not uid:
+            continue
+        login_at = None
+        raw = data.get('device_login_time') or data.get('login_ts')
+        if raw:
+            try:
+                login_at = timezone.datetime.fromisoformat(raw)
+                if timezone.is_naive(login_at):
+                    login_at = timezone.make_aware(login_at, timezone.get_current_timezone())
+            except ValueError:
+                login_at = None
+        rows.append(UserSession(
+            user_id=uid,
+            session_key=s.session_key,
+            user_agent=(data.get('device_user_agent') or '')[:300],
+            ip_address=(data.get('device_ip') or '')[:64],
+            login_at=login_at or timezone.now(),
+            expire_date=s.expire_date,
+        ))
+    existing_users = set(User.objects.filter(id__in={r.user_id for r in rows}).values_list('id', flat=True))
+    rows = [r for r in rows if int(r.user_id) in existing_users]
+    UserSession.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+    return len(rows)
@@ -1,12 +1,16 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.conf import settings
 from django.core.mail import send_mail, get_connection
 from django.core.cache import cache
+from django.db import transaction
 import logging
 
 from .models import Student, FeePayment, DefaultTimetable, Teacher, User, FeeAssignment, MpesaTransaction, TeacherResponsibility, Exam
+from .models import AcademicYear, Grade, Class, SubjectGradingScheme, SubjectComponent, Term, PocketMoney, Subject, FeeCategory, Event
+from .models import TeacherClassAssignment, Message
+from .services import result_matrix, analytics, fee_ledger, grading, academic_calendar, pocket_ledger, student_search, dashboard_stats, calendar_feed, teacher_dashboard, timetable_writer, conversations
 from .messaging_utils import send_sms, send_bulk_sms
 from .messaging_utils import _normalize_msisdn
 
@@ -15,12 +19,13 @@ logger = logging.getLogger(__name__)
 def _school_name():
     name = getattr(settings, 'SCHOOL_NAME', 'Your School')
     try:
-        from landing.models import SiteSettings
-        s = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        s = get_site_settings()
         if s and s.school_name:
             name = s.school_name
     except Exception:
         pass
+    return name
 
 
 # --- Auto-normalize phone numbers before save ---
@@ -237,82 +242,310 @@ def notify_on_responsibility_assigned(sender, instance: TeacherResponsibility, c
         # Never block DB save due to notification issues
         logger.error("notify_on_responsibility_assigned error: %s", e)
 
-# 4) Notify teachers after timetable updates
-@receiver(post_save, sender=DefaultTimetable)
-def notify_teachers_on_timetable_update(sender, instance: DefaultTimetable, **kwargs):
-    # Debounce with atomic cache.add so only the first save in a burst sends SMS
-    # Cooldown window (seconds) – adjust as needed
-    cooldown = int(getattr(settings, 'TIMETABLE_NOTIFY_COOLDOWN', 120))
-    lock_key = "timetable_update_notice_lock"
+# --- Keep precomputed exam result matrices fresh ---
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def invalidate_result_matrix_on_grade_change(sender, instance: Grade, **kwargs):
     try:
-        # cache.add returns True only if the key did not exist, atomically
-        acquired = cache.add(lock_key, timezone.now().isoformat(), timeout=cooldown)
-        if not acquired:
-            logger.info("Timetable update notice suppressed within cooldown window (%ss)", cooldown)
-            return
+        result_matrix.invalidate_exam(instance.exam_id)
+    except Exception as e:
+        logger.warning("Result matrix invalidation failed for exam %s: %s", instance.exam_id, e)
+    try:
+        teacher_dashboard.invalidate_grades([(instance.student_id, instance.subject_id)])
+    except Exception as e:
+        logger.warning("Teacher dashboard invalidation failed for student %s: %s", instance.student_id, e)
+
+
+@receiver(post_save, sender=SubjectGradingScheme)
+@receiver(post_delete, sender=SubjectGradingScheme)
+@receiver(post_save, sender=SubjectComponent)
+@receiver(post_delete, sender=SubjectComponent)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def invalidate_result_matrices(sender, **kwargs):
+    # Letters, composites or level membership may have changed: drop every matrix
+    try:
+        result_matrix.invalidate_all()
+    except Exception as e:
+        logger.warning("Result matrix invalidation failed: %s", e)
+
+
+@receiver(post_save, sender=SubjectGradingScheme)
+@receiver(post_delete, sender=SubjectGradingScheme)
+def invalidate_compiled_grading_schemes(sender, **kwargs):
+    try:
+        grading.invalidate()
+    except Exception as e:
+        logger.warning("Grading scheme cache invalidation failed: %s", e)
+
+
+# --- Refresh cached dashboard analytics when fees change ---
+@receiver(post_save, sender=FeePayment)
+@receiver(post_delete, sender=FeePayment)
+@receiver(post_save, sender=FeeAssignment)
+@receiver(post_delete, sender=FeeAssignment)
+def invalidate_analytics_on_fee_change(sender, **kwargs):
+    try:
+        analytics.invalidate()
+    except Exception as e:
+        logger.warning("Analytics cache invalidation failed: %s", e)
+
+
+# --- Keep the StudentBalance ledger in step with fees (rebuild_balances repairs drift) ---
+@receiver(post_save, sender=FeePayment)
+@receiver(post_delete, sender=FeePayment)
+def update_balance_on_payment(sender, instance: FeePayment, **kwargs):
+    try:
+        fee_ledger.refresh_students([instance.student_id])
+    except Exception as e:
+        logger.warning("Balance ledger update failed for student %s: %s", instance.student_id, e)
+
+
+@receiver(post_save, sender=FeeAssignment)
+@receiver(post_delete, sender=FeeAssignment)
+def update_balances_on_assignment(sender, instance: FeeAssignment, **kwargs):
+    try:
+        fee_ledger.refresh_class(instance.class_group_id)
+    except Exception as e:
+        logger.warning("Balance ledger update failed for class %s: %s", instance.class_group_id, e)
+
+
+@receiver(pre_save, sender=Student)
+def remember_student_class(sender, instance: Student, **kwargs):
+    try:
+        instance._previous_class_id = (
+            Student.objects.filter(pk=instance.pk).values_list('class_group_id', flat=True).first()
+            if instance.pk else None
+        )
     except Exception:
-        # If cache not configured, we still proceed, but only once per process execution
-        logger.warning("Cache not configured; proceeding without debounce lock")
+        instance._previous_class_id = None
 
-    school = _school_name()
-    msg = f"{school}: Timetable has been updated. Please review your schedule in the portal."
-    raw_phones = Teacher.objects.exclude(phone__isnull=True).exclude(phone__exact='').values_list('phone', flat=True)
-    teacher_phones = sorted({p for p in raw_phones if p})  # unique phones only
-    logger.info("Timetable update detected; unique recipients=%d", len(teacher_phones))
-    if teacher_phones:
-        ok_count, errors = send_bulk_sms(teacher_phones, msg)
-        if errors:
-            logger.error("Timetable SMS errors (%d): %s", len(errors), "; ".join(errors[:10]))
-        logger.info("Timetable SMS sent: success=%d, total=%d", ok_count, len(teacher_phones))
-    else:
-        logger.warning("No teacher phone numbers found; timetable SMS skipped")
-
-    # Also notify by email: per-recipient so each appears in Sent with its own To:
-    try:
-        teacher_emails = list(
-            Teacher.objects.select_related('user')
-            .exclude(user__email__isnull=True)
-            .exclude(user__email__exact='')
-            .values_list('user__email', flat=True)
+
+@receiver(post_save, sender=Student)
+def update_balances_on_class_change(sender, instance: Student, created, **kwargs):
+    # Billing follows the student's class, so a move re-prices every term
+    if not created and getattr(instance, '_previous_class_id', None) == instance.class_group_id:
+        return
+    try:
+        fee_ledger.refresh_students([instance.pk])
+    except Exception as e:
+        logger.warning("Balance ledger update failed for student %s: %s", instance.pk, e)
+
+
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+def update_balances_on_term_change(sender, **kwargs):
+    # Term order drives carry-forward; rebuilding touches every student, so it
+    # runs in a worker once the term change is committed
+    transaction.on_commit(_queue_ledger_rebuild)
+
+
+def _queue_ledger_rebuild():
+    from .tasks import rebuild_fee_ledger
+    try:
+        rebuild_fee_ledger.delay()
+    except Exception as e:
+        # No broker: rebuild now rather than leave the ledger stale
+        logger.warning("Balance ledger rebuild enqueue failed (%s); rebuilding inline", e)
+        try:
+            fee_ledger.refresh_all()
+        except Exception as e:
+            logger.error("Balance ledger rebuild failed: %s", e)
+
+
+# --- Keep the student search index in step with names and admission numbers ---
+_SEARCHED_USER_FIELDS = {'first_name', 'last_name', 'username', 'email'}
+
+
+@receiver(post_save, sender=Student)
+def index_student_for_search(sender, instance: Student, **kwargs):
+    try:
+        student_search.index_students([instance.pk])
+    except Exception as e:
+        logger.warning("Student search indexing failed for student %s: %s", instance.pk, e)
+
+
+@receiver(post_save, sender=User)
+def index_student_user_for_search(sender, instance: User, update_fields=None, **kwargs):
+    # Logins save last_login only; skip saves that cannot change searchable fields
+    if update_fields is not None and not (_SEARCHED_USER_FIELDS & set(update_fields)):
+        return
+    if getattr(instance, 'role', None) != 'student':
+        return
+    try:
+        student_search.index_students(Student.objects.filter(user=instance).values_list('id', flat=True))
+    except Exception as e:
+        logger.warning("Student search indexing failed for user %s: %s", instance.pk, e)
+
+
+# --- Keep PocketMoneyBalance in step with transactions (rebuild_pocket_balances repairs drift) ---
+@receiver(pre_save, sender=PocketMoney)
+def remember_pocket_money_student(sender, instance: PocketMoney, **kwargs):
+    try:
+        instance._previous_student_id = (
+            PocketMoney.objects.filter(pk=instance.pk).values_list('student_id', flat=True).first()
+            if instance.pk else None
         )
-        if not teacher_emails:
-            logger.warning("No teacher emails found; timetable email skipped")
-        else:
-            subject = f"{school}: Timetable updated"
-            body = "Please review your updated schedule in the portal."
-            sent = 0
-            errors = 0
-            # Reuse a single SMTP connection for efficiency
-            with get_connection() as connection:
-                for addr in teacher_emails:
-                    try:
-                        send_mail(
-                            subject=subject,
-                            message=body,
-                            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@example.com'),
-                            recipient_list=[addr],
-                            fail_silently=True,
-                            connection=connection,
-                        )
-                        sent += 1
-                    except Exception:
-                        errors += 1
-            logger.info("Timetable emails sent per-recipient: success=%d, total=%d, errors=%d", sent, len(teacher_emails), errors)
+    except Exception:
+        instance._previous_student_id = None
+
+
+@receiver(post_save, sender=PocketMoney)
+@receiver(post_delete, sender=PocketMoney)
+def update_pocket_money_balance(sender, instance: PocketMoney, **kwargs):
+    # No try/except: a failed balance update must roll the transaction back with it
+    pocket_ledger.refresh_students([instance.student_id, getattr(instance, '_previous_student_id', None)])
+
+
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+@receiver(post_save, sender=AcademicYear)
+@receiver(post_delete, sender=AcademicYear)
+def invalidate_academic_calendar(sender, **kwargs):
+    try:
+        academic_calendar.invalidate()
+    except Exception as e:
+        logger.warning("Academic calendar cache invalidation failed: %s", e)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+@receiver(post_save, sender=FeeCategory)
+@receiver(post_delete, sender=FeeCategory)
+def invalidate_dashboard_stats(sender, **kwargs):
+    try:
+        dashboard_stats.invalidate()
+    except Exception as e:
+        logger.warning("Dashboard stats cache invalidation failed: %s", e)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Exam)
+@receiver(post_delete, sender=Exam)
+@receiver(post_save, sender=TeacherResponsibility)
+@receiver(post_delete, sender=TeacherResponsibility)
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+def invalidate_calendar_feed(sender, **kwargs):
+    try:
+        calendar_feed.invalidate()
+    except Exception as e:
+        logger.warning("Calendar feed cache invalidation failed: %s", e)
+
+
+@receiver(post_save, sender=TeacherClassAssignment)
+@receiver(post_delete, sender=TeacherClassAssignment)
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Exam)
+@receiver(post_delete, sender=Exam)
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+@receiver(post_save, sender=SubjectGradingScheme)
+@receiver(post_delete, sender=SubjectGradingScheme)
+def invalidate_teacher_dashboards(sender, **kwargs):
+    try:
+        teacher_dashboard.invalidate()
     except Exception as e:
-        logger.error("Timetable email send (per-recipient) failed: %s", e)
+        logger.warning("Teacher dashboard cache invalidation failed: %s", e)
+
+
+@receiver(post_save, sender=Message)
+def index_message_conversation(sender, instance: Message, created, **kwargs):
+    if not created:
+        return
+    try:
+        conversations.record(instance)
+    except Exception as e:
+        logger.warning("Conversation index update failed for message %s: %s", instance.pk, e)
+
+
+@receiver(post_delete, sender=Message)
+def reindex_conversation_on_delete(sender, instance: Message, **kwargs):
+    if not conversations.is_direct(instance):
+        return
+    try:
+        conversations.refresh(instance.sender_id, instance.recipient_id)
+    except Exception as e:
+        logger.warning("Conversation index refresh failed for message %s: %s", instance.pk, e)
+
+
+# 4) Notify teachers after timetable updates
+# Writer batches (generation, grid edits) report once via timetable_changed with
+# the teachers whose schedule changed; single-row writes elsewhere (Django admin)
+# go through the same queue. Both are coalesced per TIMETABLE_NOTIFY_COOLDOWN.
+def _queue_timetable_notice(teacher_ids):
+    cooldown = int(getattr(settings, 'TIMETABLE_NOTIFY_COOLDOWN', 120))
+    try:
+        scheduled = timetable_writer.queue_notification(teacher_ids, cooldown)
+    except Exception as e:
+        logger.warning("Timetable notice queue unavailable: %s", e)
+        return
+    if not scheduled:
+        logger.info("Timetable change merged into the pending notice (cooldown %ss)", cooldown)
+        return
+    from .tasks import notify_timetable_changes
+    try:
+        notify_timetable_changes.apply_async(countdown=cooldown)
+    except Exception as e:
+        # No broker: send now rather than drop the notice
+        logger.warning("Timetable notice enqueue failed (%s); sending inline", e)
+        try:
+            notify_timetable_changes()
+        except Exception as e:
+            logger.error("Timetable notice failed: %s", e)
+
+
+@receiver(timetable_writer.timetable_changed)
+def notify_teachers_on_timetable_change(sender, teacher_ids, **kwargs):
+    ids = set(teacher_ids)
+    transaction.on_commit(lambda: _queue_timetable_notice(ids))
+
+
+@receiver(pre_save, sender=DefaultTimetable)
+def remember_timetable_teacher(sender, instance: DefaultTimetable, **kwargs):
+    if timetable_writer.is_suppressed():
+        return
+    try:
+        instance._previous_teacher_id = (
+            DefaultTimetable.objects.filter(pk=instance.pk).values_list('teacher_id', flat=True).first()
+            if instance.pk else None
+        )
+    except Exception:
+        instance._previous_teacher_id = None
+
+
+@receiver(post_save, sender=DefaultTimetable)
+@receiver(post_delete, sender=DefaultTimetable)
+def notify_teachers_on_timetable_update(sender, instance: DefaultTimetable, **kwargs):
+    if timetable_writer.is_suppressed():
+        return
+    ids = {instance.teacher_id, getattr(instance, '_previous_teacher_id', None)}
+    transaction.on_commit(lambda: _queue_timetable_notice(ids))
 
 
 # --- Limit admin to 2 concurrent devices/sessions ---
-from django.contrib.auth.signals import user_logged_in
-from django.contrib.sessions.models import Session
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from .services import user_sessions
 
 
 @receiver(user_logged_in)
 def limit_role_concurrent_sessions(sender, user, request, **kwargs):
     """
-    Keep at most 2 active sessions for admin users.
-    Strategy: on every successful login, set a login timestamp in the current session,
-    then enumerate all sessions and prune the oldest ones for this user beyond the limit.
+    Keep at most N active sessions per role (settings.ROLE_SESSION_LIMITS).
+    Strategy: index the new session in UserSession, then prune this user's oldest
+    sessions beyond the limit. Only this user's sessions are looked at.
     """
     try:
         # Enforce per-role session limits
@@ -325,73 +558,33 @@ def limit_role_concurrent_sessions(sender, user, request, **kwargs):
         if limit < 1:
             limit = 1
 
-        # Mark current session with a login timestamp for ordering
+        if not (request and hasattr(request, 'session')):
+            return
+
+        # Mark current session with a login timestamp and device metadata for the sessions page
         try:
-            if request and hasattr(request, 'session'):
-                request.session['login_ts'] = timezone.now().isoformat()
-                # Capture device metadata for sessions page
-                try:
-                    ua = (request.META.get('HTTP_USER_AGENT') or '')[:300]
-                    ip = (
-                        (request.META.get('HTTP_X_FORWARDED_FOR') or '').split(',')[0].strip()
-                        or request.META.get('REMOTE_ADDR')
-                        or ''
-                    )
-                    request.session['device_user_agent'] = ua
-                    request.session['device_ip'] = ip
-                    request.session['device_login_time'] = timezone.now().isoformat()
-                except Exception:
-                    # Non-fatal; don't block login if headers are missing
-                    pass
-                request.session.modified = True
+            now_iso = timezone.now().isoformat()
+            ua, ip = user_sessions.client_metadata(request)
+            request.session['login_ts'] = now_iso
+            request.session['device_user_agent'] = ua
+            request.session['device_ip'] = ip
+            request.session['device_login_time'] = now_iso
+            request.session.modified = True
         except Exception:
+            # Non-fatal; don't block login if headers are missing
             pass
 
-        # Gather all sessions that belong to this user
-        sessions = []
-        for s in Session.objects.filter(expire_date__gt=timezone.now()):
-            try:
-                data = s.get_decoded()
-                uid = data.get('_auth_user_id')
-                if uid and str(uid) == str(user.pk):
-                    login_ts = data.get('login_ts')
-                    sessions.append((s, login_ts))
-            except Exception:
-                # Skip corrupt/undecodable sessions
-                continue
-
-        # If within limit, nothing to do
-        if len(sessions) <= limit:
-            return
-
-        # Sort by login_ts (newest first); fall back to expire_date then session_key
-        def sort_key(item):
-            s, ts = item
-            # parse ts to datetime if possible
-            dt = None
-            if ts:
-                try:
-                    dt = timezone.datetime.fromisoformat(ts)
-                    if timezone.is_naive(dt):
-                        dt = timezone.make_aware(dt, timezone.get_current_timezone())
-                except Exception:
-                    dt = None
-            return (
-                0 if dt else 1,  # prefer those with timestamp
-                -(dt.timestamp()) if dt else 0,
-                s.expire_date or timezone.now(),
-                s.session_key,
-            )
-
-        sessions.sort(key=sort_key)
-
-        # Keep top 'limit' sessions, delete the rest
-        to_delete = sessions[limit:]
-        for s, _ in to_delete:
-            try:
-                s.delete()
-            except Exception:
-                continue
+        user_sessions.record_login(user, request)
+        user_sessions.enforce_limit(user, limit, current_key=request.session.session_key)
     except Exception as e:
         # Never break login flow due to pruning issues
         logger.error("Admin session limit enforcement failed: %s", e)
+
+
+@receiver(user_logged_out)
+def forget_session_on_logout(sender, request, user, **kwargs):
+    try:
+        if request is not None and hasattr(request, 'session'):
+            user_sessions.forget(request.session.session_key)
+    except Exception as e:
+        logger.warning("Could not drop session index row on logout: %s", e)
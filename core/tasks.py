@@ -3,8 +3,8 @@ from django.core.mail import get_connection, EmailMessage
 from django.conf import settings
 
 from .messaging_utils import send_sms_batch, _normalize_msisdn, _is_valid_ke_msisdn
-from .models import NotificationJob, Grade, Exam, Student, FeeAssignment, FeePayment
-from django.db.models import Sum
+from .models import NotificationJob, Grade, Exam, Student, StudentBalance
+from .services import fee_ledger
 from django.utils import timezone
 from collections import defaultdict
 
@@ -39,6 +39,20 @@ def send_email_bcc_task(self, subject, message, recipient_chunk):
     return len(recipient_chunk)
 
 
+@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_jitter=True, max_retries=3, rate_limit='5/s')
+def send_email_messages_task(self, messages):
+    """Background task: send individual (subject, body, recipient) emails over one connection.
+
+    Returns the number sent; failed recipients are logged by the backend, not retried.
+    """
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', None)
+    with get_connection(fail_silently=True) as connection:
+        return connection.send_messages([
+            EmailMessage(subject=subject, body=body, from_email=from_email, to=[recipient], connection=connection)
+            for subject, body, recipient in messages
+        ]) or 0
+
+
 @shared_task(bind=True)
 def send_exam_publish_notifications(self, job_id, exam_id, base_url):
     """Background: send notifications for published exam and update NotificationJob."""
@@ -61,10 +75,10 @@ def send_exam_publish_notifications(self, job_id, exam_id, base_url):
         from django.core.mail import send_mail
         from django.urls import reverse
         from django.core import signing
-        from landing.models import SiteSettings
+        from landing.site_settings import get_site_settings
 
         school_name = None
-        ss = SiteSettings.objects.first()
+        ss = get_site_settings()
         if ss and ss.school_name:
             school_name = ss.school_name
         if not school_name:
@@ -165,18 +179,11 @@ def send_exam_publish_notifications(self, job_id, exam_id, base_url):
         if phone_recipients:
             send_sms_bulk_task.delay(phone_recipients, f"{school_name}: Results released. Check portal.")
 
-        # Send emails in BCC chunks
+        # Each email carries that student's own results, so they go out per recipient
+        # (the Resend backend batches them, up to 100 per request)
         chunk = 100
         for i in range(0, len(email_messages), chunk):
-            subject = None
-            body = None
-            recipients = []
-            for s, b, e in email_messages[i:i+chunk]:
-                subject = s or subject
-                body = b or body
-                recipients.append(e)
-            if recipients and subject and body:
-                send_email_bcc_task.delay(subject, body, recipients)
+            send_email_messages_task.delay(email_messages[i:i+chunk])
 
         job.mark_done()
     except Exception as e:
@@ -188,31 +195,18 @@ def send_exam_publish_notifications(self, job_id, exam_id, base_url):
 def send_fee_arrears_notifications(self, job_id, current_term_id=None, class_group_id=None):
     job = NotificationJob.objects.get(pk=job_id)
     try:
-        # Compute balances
-        students = Student.objects.select_related('user', 'class_group')
-        if class_group_id:
-            students = students.filter(class_group_id=class_group_id)
+        # Arrears straight from the StudentBalance ledger (one indexed query)
         if current_term_id:
-            terms = [current_term_id]
+            # Running arrears as of the term, including balances carried forward
+            owing = StudentBalance.objects.filter(term_id=current_term_id, arrears__gt=0.01)
+            if class_group_id:
+                owing = owing.filter(student__class_group_id=class_group_id)
+            owing = owing.values_list('student_id', 'arrears')
         else:
-            terms = list(FeeAssignment.objects.values_list('term_id', flat=True).distinct())
-
-        # Pre-aggregate payments by student up to term
-        payments = FeePayment.objects.values('student_id').annotate(total_paid=Sum('amount_paid'))
-        paid_map = {p['student_id']: p['total_paid'] or 0 for p in payments}
-
-        # Pre-aggregate assignments per class
-        assign_map = {}
-        for fa in FeeAssignment.objects.filter(term_id__in=terms).values('class_group_id').annotate(total=Sum('amount')):
-            assign_map[fa['class_group_id']] = fa['total'] or 0
-
-        # Determine arrears list
-        arrears = []
-        for s in students.iterator():
-            total_assigned = assign_map.get(getattr(s.class_group, 'id', None), 0)
-            balance = float(total_assigned) - float(paid_map.get(s.id, 0))
-            if balance > 0.01:
-                arrears.append((s, balance))
+            owing = fee_ledger.student_totals(class_id=class_group_id).filter(amount__gt=0.01).values_list('student_id', 'amount')
+        balances = dict(owing)
+        students = Student.objects.select_related('user', 'class_group').in_bulk(list(balances))
+        arrears = [(students[sid], float(bal)) for sid, bal in balances.items() if sid in students]
 
         job.mark_running(total=len(arrears))
 
@@ -255,3 +249,73 @@ def send_fee_arrears_notifications(self, job_id, current_term_id=None, class_gro
     except Exception as e:
         job.mark_failed(str(e))
         raise
+
+
+@shared_task(bind=True)
+def rebuild_fee_ledger(self):
+    """Background: recompute every StudentBalance row (term order changed)."""
+    return fee_ledger.refresh_all()
+
+
+@shared_task(bind=True, acks_late=True)
+def render_pdf_job(self, job_id, kind, params):
+    """Background: render a PDF export into its content-addressed artifact."""
+    from .services import pdf_jobs
+    job = NotificationJob.objects.get(pk=job_id)
+    try:
+        job.mark_running(total=1)
+        digest = job.meta['digest']
+        if not pdf_jobs.has_artifact(digest):
+            pdf_jobs.render(kind, params, digest)
+        job.meta = {**(job.meta or {}), 'artifact': pdf_jobs.artifact_name(digest), 'download_url': pdf_jobs.download_url(job)}
+        job.save(update_fields=['meta', 'updated_at'])
+        job.incr(success=True)
+        job.mark_done()
+    except Exception as e:
+        job.incr(success=False)
+        job.mark_failed(str(e))
+        raise
+
+
+@shared_task(bind=True)
+def notify_timetable_changes(self):
+    """Background: tell the teachers whose schedule changed since the last notice.
+
+    Teacher ids are queued by core.signals (see timetable_writer.queue_notification);
+    every change in the cooldown window is sent as one SMS/email per teacher.
+    """
+    from .messaging_utils import send_bulk_sms
+    from .models import Teacher
+    from .services import timetable_writer
+    from .signals import _school_name
+
+    teacher_ids = timetable_writer.take_pending()
+    if not teacher_ids:
+        return {'teachers': 0, 'sms': 0, 'emails': 0}
+    teachers = list(
+        Teacher.objects.filter(id__in=teacher_ids).select_related('user').only('phone', 'user__email')
+    )
+    school = _school_name()
+
+    phones = sorted({t.phone for t in teachers if t.phone})
+    sms_ok = 0
+    if phones:
+        sms_ok, _errors = send_bulk_sms(phones, f"{school}: Your timetable has been updated. Please review your schedule in the portal.")
+
+    # Per-recipient so each appears in Sent with its own To:, sent together over one connection
+    emails = sorted({t.user.email for t in teachers if t.user.email})
+    sent = 0
+    if emails:
+        from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'no-reply@example.com')
+        with get_connection(fail_silently=True) as connection:
+            sent = connection.send_messages([
+                EmailMessage(
+                    subject=f"{school}: Timetable updated",
+                    body="Your schedule has changed. Please review it in the portal.",
+                    from_email=from_email,
+                    to=[addr],
+                    connection=connection,
+                )
+                for addr in emails
+            ]) or 0
+    return {'teachers': len(teachers), 'sms': sms_ok, 'emails': sent}
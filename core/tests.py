@@ -1,3 +1,242 @@
-from django.test import TestCase
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
 
-# Create your tests here.
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import mpesa_utils
+from .models import AcademicYear, Class, Exam, FeeAssignment, FeeCategory, FeePayment, Grade, Student, Subject, Term, User
+from .services import daraja
+
+
+class StudentProfileQueryTests(TestCase):
+    """student_profile must not issue more queries as a student sits more exams."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.class_group = Class.objects.create(name='Grade 6 East', level='6')
+        cls.subjects = [Subject.objects.create(name=name, code=name[:3].upper()) for name in ('Maths', 'English', 'Science')]
+        year = AcademicYear.objects.create(year='2026')
+        cls.term = Term.objects.create(
+            name='Term 1', academic_year=year,
+            start_date=datetime.date(2026, 1, 5), end_date=datetime.date(2026, 4, 3),
+        )
+        cls.student = cls._student('pupil1', 'ADM001')
+        cls.classmate = cls._student('pupil2', 'ADM002')
+        category = FeeCategory.objects.create(name='Tuition')
+        assignment = FeeAssignment.objects.create(fee_category=category, class_group=cls.class_group, term=cls.term, amount=1000)
+        FeePayment.objects.create(student=cls.student, fee_assignment=assignment, amount_paid=400)
+        cls.admin = User.objects.create_user('head', password='x', role='admin')
+
+    @classmethod
+    def _student(cls, username, admission_no):
+        user = User.objects.create_user(username, password='x', role='student')
+        return Student.objects.create(
+            user=user, admission_no=admission_no, class_group=cls.class_group,
+            birthdate=datetime.date(2014, 1, 1), gender='female',
+        )
+
+    def _add_exams(self, count):
+        start = Exam.objects.count()
+        for i in range(start, start + count):
+            exam = Exam.objects.create(
+                name=f'Exam {i}', term=self.term, type='others', results_published=True,
+                start_date=datetime.date(2026, 1, 10) + datetime.timedelta(days=i),
+                end_date=datetime.date(2026, 1, 11) + datetime.timedelta(days=i),
+            )
+            for student in (self.student, self.classmate):
+                for subject in self.subjects:
+                    Grade.objects.create(student=student, exam=exam, subject=subject, score=50 + i, grade_letter='C')
+
+    def _profile_queries(self):
+        url = reverse('student_profile', args=[self.student.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_exams(self):
+        self.client.force_login(self.admin)
+        self._add_exams(1)
+        self._profile_queries()  # warm per-process caches (site settings, calendar)
+        baseline, response = self._profile_queries()
+        self.assertEqual(len(response.context['published_exams']), 1)
+
+        self._add_exams(6)
+        after, response = self._profile_queries()
+        self.assertEqual(len(response.context['published_exams']), 7)
+        self.assertEqual(len(response.context['grades']), len(self.subjects))
+        self.assertEqual(response.context['balance'], 600)
+        self.assertEqual(after, baseline)
+
+
+class _DarajaStub(BaseHTTPRequestHandler):
+    """Minimal Daraja: issues numbered tokens and accepts only the latest one."""
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        stub = self.server
+        if not self.path.startswith('/oauth/v1/generate'):
+            return self._reply(404, {})
+        stub.token_requests += 1
+        stub.token = f'token-{stub.token_requests}'
+        self._reply(200, {'access_token': stub.token, 'expires_in': str(stub.expires_in)})
+
+    def do_POST(self):
+        stub = self.server
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        stub.posts.append(self.path)
+        if self.headers.get('Authorization') != f'Bearer {stub.token}':
+            return self._reply(401, {'errorMessage': 'Invalid Access Token'})
+        self._reply(200, {'ResponseCode': '0', 'ResultCode': '0'})
+
+
+class DarajaClientTests(SimpleTestCase):
+    """The OAuth token is fetched once and reused until it is about to expire."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _DarajaStub)
+        self.server.token_requests = 0
+        self.server.token = None
+        self.server.expires_in = 3599
+        self.server.posts = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def _client(self, cache=None):
+        return daraja.DarajaClient('key', 'secret', self.base_url, cache=cache or LocMemCache('daraja-tests', {}))
+
+    def test_token_is_cached_across_requests_and_clients(self):
+        cache = LocMemCache('daraja-shared', {})
+        client = self._client(cache)
+        for _ in range(3):
+            self.assertEqual(client.post('/mpesa/stkpushquery/v1/query', {}).status_code, 200)
+        # A second client (another worker process) shares the cached token
+        self.assertEqual(self._client(cache).token(), 'token-1')
+        self.assertEqual(self.server.token_requests, 1)
+        self.assertEqual(client.metrics()['token_fetches'], 1)
+        self.assertEqual(client.metrics()['token_cache_hits'], 2)
+
+    def test_token_is_refreshed_before_expiry(self):
+        self.server.expires_in = 30  # inside the refresh margin
+        client = self._client()
+        self.assertEqual(client.token(), 'token-1')
+        self.assertEqual(client.token(), 'token-2')
+        self.assertEqual(client.metrics()['token_fetches'], 2)
+
+    def test_rejected_token_is_replaced_once(self):
+        client = self._client()
+        client.token()
+        self.server.token = 'rotated'
+        self.assertEqual(client.post('/mpesa/stkpush/v1/processrequest', {}).status_code, 200)
+        self.assertEqual(self.server.posts, ['/mpesa/stkpush/v1/processrequest'] * 2)
+        self.assertEqual(client.metrics()['unauthorized_retries'], 1)
+
+    def test_mpesa_utils_use_configured_host(self):
+        with override_settings(MPESA_API_BASE_URL=self.base_url, MPESA_CONSUMER_KEY='key', MPESA_CONSUMER_SECRET='secret'):
+            daraja.client().invalidate_token()
+            self.assertEqual(mpesa_utils.query_stk_status('ws_CO_1')['ResultCode'], '0')
+            self.assertEqual(mpesa_utils.query_stk_status('ws_CO_2')['ResultCode'], '0')
+            daraja.client().invalidate_token()
+        self.assertEqual(self.server.token_requests, 1)
+
+
+class _ResendStub(BaseHTTPRequestHandler):
+    """Minimal Resend: /emails and /emails/batch; recipients at fail.test are rejected."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        stub.requests.append((self.path, body))
+        emails = body if self.path.endswith('/batch') else [body]
+        if any(addr.endswith('@fail.test') for email in emails for addr in email['to']):
+            status, reply = 422, {'message': 'invalid recipient'}
+        elif self.path.endswith('/batch'):
+            status, reply = 200, {'data': [{'id': f"id-{email['to'][0]}"} for email in emails]}
+        else:
+            status, reply = 200, {'id': f"id-{body['to'][0]}"}
+        data = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ResendEmailBackendTests(SimpleTestCase):
+    """Messages go out in batches of at most 100, with a result per message."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _ResendStub)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        settings = override_settings(RESEND_API_KEY='re_test', RESEND_API_URL=f'http://127.0.0.1:{self.server.server_port}/emails')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def _backend(self):
+        return get_connection('core.email_backends.ResendEmailBackend', fail_silently=True)
+
+    def _message(self, recipient, attach=False):
+        message = EmailMessage('Results released', f'Hello {recipient}', 'school@example.com', [recipient])
+        if attach:
+            message.attach('slip.pdf', b'%PDF-1.4', 'application/pdf')
+        return message
+
+    def test_messages_are_batched(self):
+        backend = self._backend()
+        messages = [self._message(f'parent{i}@example.com') for i in range(150)]
+        self.assertEqual(backend.send_messages(messages), 150)
+        self.assertEqual([(path, len(body)) for path, body in self.server.requests], [('/emails/batch', 100), ('/emails/batch', 50)])
+        self.assertEqual([r.id for r in backend.results], [f'id-parent{i}@example.com' for i in range(150)])
+
+    def test_attachments_are_sent_singly_and_results_keep_order(self):
+        backend = self._backend()
+        messages = [
+            self._message('a@example.com', attach=True),
+            self._message('b@example.com'),
+            self._message('c@fail.test', attach=True),
+            self._message('d@example.com', attach=True),
+        ]
+        with self.assertLogs('core.email_backends', 'ERROR'):
+            self.assertEqual(backend.send_messages(messages), 3)
+        self.assertEqual([r.message for r in backend.results], messages)
+        self.assertEqual([r.ok for r in backend.results], [True, True, False, True])
+        self.assertIn('422', backend.results[2].error)
+        singles = [body for path, body in self.server.requests if path == '/emails']
+        self.assertEqual(len(singles), 3)
+        self.assertEqual(singles[0]['attachments'][0]['filename'], 'slip.pdf')
+
+    def test_rejected_batch_is_resent_one_by_one(self):
+        backend = self._backend()
+        messages = [self._message('a@example.com'), self._message('b@fail.test'), self._message('c@example.com')]
+        with self.assertLogs('core.email_backends', 'ERROR'):
+            self.assertEqual(backend.send_messages(messages), 2)
+        self.assertEqual([r.ok for r in backend.results], [True, False, True])
+        self.assertEqual(backend.results[0].id, 'id-a@example.com')
+        self.assertEqual([path for path, _body in self.server.requests], ['/emails/batch'] + ['/emails'] * 3)
+        with self.assertLogs('core.email_backends', 'ERROR'), self.assertRaises(RuntimeError):
+            get_connection('core.email_backends.ResendEmailBackend').send_messages(messages)
@@ -63,6 +63,7 @@ urlpatterns = [
     # Admin URLs
     path('admin_overview/', views.admin_overview, name='admin_overview'),
     path('clerk_overview/', views.clerk_overview, name='clerk_overview'),
+    path('api/dashboard/stats/', views.dashboard_stats_api, name='dashboard_stats_api'),
     # Backward-compat/avoid confusion: redirect old path to new route
     path('admin/website-settings/', RedirectView.as_view(url='/admin_website_settings/', permanent=False)),
     path('admin_website_settings/', views.admin_website_settings, name='admin_website_settings'),
@@ -88,6 +89,7 @@ urlpatterns = [
     path('delete_class/<int:class_id>/', views.delete_class, name='delete_class'),
     path('admin_analytics/', views.admin_analytics, name='admin_analytics'),
     path('admin_analytics/data/', views.admin_analytics_data, name='admin_analytics_data'),
+    path('admin_cache_diagnostics/', views.admin_cache_diagnostics, name='admin_cache_diagnostics'),
     path('finance/analytics/', views.finance_analytics, name='finance_analytics'),
     path('attendance/view/', views.view_attendance, name='view_attendance'),
     path('admin_subjects/', views.admin_subjects, name='admin_subjects'),
@@ -110,6 +112,7 @@ urlpatterns = [
     path('api/students/<int:class_id>/', views.api_students_by_class, name='api_students_by_class'),
     path('api/exam/<int:exam_id>/subjects/', views.api_exam_subjects, name='api_exam_subjects'),
     path('api/bulk-grades/', views.api_bulk_grades, name='api_bulk_grades'),
+    path('api/attendance/register/', views.api_attendance_register, name='api_attendance_register'),
     path('api/upload-bulk-grades/', views.api_upload_bulk_grades, name='api_upload_bulk_grades'),
     path('api/download-grade-template/', views.api_download_grade_template, name='api_download_grade_template'),
     path('api/download-class-students/<int:class_id>/', views.api_download_class_students, name='api_download_class_students'),
@@ -197,6 +200,7 @@ urlpatterns = [
     # API and AJAX URLs
     path('api/exam_events/', views.exam_events_api, name='exam_events_api'),
     path('api/job-status/<int:job_id>/', views.job_status, name='job_status'),
+    path('exports/pdf-jobs/<str:token>/', views.pdf_job_download, name='pdf_job_download'),
     path('dashboard/students/add/', views.add_student_ajax, name='add_student_ajax'),
     path('dashboard/teachers/add/', views.add_teacher_ajax, name='add_teacher_ajax'),
     path('dashboard/classes/add/', views.add_class_ajax, name='add_class_ajax'),
@@ -12,6 +12,7 @@ from django.template.loader import render_to_string
 from django.conf import settings
 from landing.forms import SiteSettingsForm, GalleryImageForm, CategoryForm, CategoryMediaForm
 from landing.models import SiteSettings, GalleryImage, Category, CategoryMedia
+from landing.site_settings import get_site_settings
 
 from django.utils import timezone
 from django.views.decorators.http import require_POST
@@ -22,7 +23,7 @@ from django.utils.dateparse import parse_datetime
 from django.db import transaction
 from .messaging_utils import _normalize_msisdn, send_sms
 from .mpesa_utils import initiate_stk_push, query_stk_status
-from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.http import parse_etags, url_has_allowed_host_and_scheme
 
 import datetime
 import openpyxl
@@ -37,6 +38,7 @@ from .models import (
     MpesaC2BLedger,
     SubjectGradingScheme,
     GradeCommentTemplate,
+    StudentBalance,
 )
 from .forms import (
     AddStudentForm, StudentContactUpdateForm, EditStudentClassForm, FeeCategoryForm,
@@ -49,9 +51,17 @@ from django.core.paginator import Paginator
 import csv
 import os
 from django.conf import settings
-from django.http import FileResponse, Http404
+from django.http import FileResponse, Http404, HttpResponseNotModified, StreamingHttpResponse
 from io import BytesIO
 from .pdf_utils import pdf_response_from_rows
+from .services.result_matrix import get_result_matrix, invalidate_exam, data_version as result_matrix_data_version
+from .services.analytics import get_analytics
+from .services import academic_calendar, calendar_feed, callback_journal, dashboard_stats, fee_ledger, pdf_jobs, result_slip, student_search, timetable_writer
+from .services import student_profile as student_profile_service
+from .services import teacher_dashboard as teacher_dashboard_service
+from .services.grade_ingest import GradeIngest
+from .services import attendance as attendance_service
+from .services.grading import regrade_exam
 
 def is_admin(user):
     return user.is_authenticated and getattr(user, 'role', None) == 'admin'
@@ -358,6 +368,72 @@ def _csv_response(filename: str):
     resp['Content-Disposition'] = f'attachment; filename="{filename}"'
     return resp
 
+class _Echo:
+    """File-like sink for csv.writer: write() hands the encoded line back."""
+    def write(self, value):
+        return value
+
+EXPORT_CHUNK_SIZE = 2000
+
+def _csv_streaming_response(filename: str, rows):
+    """Stream `rows` (any iterable of lists) as CSV, school header first.
+
+    Rows are rendered as they are produced, so pair this with
+    `.values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)` to keep memory flat.
+    """
+    writer = csv.writer(_Echo())
+
+    def lines():
+        for row in _site_header_rows():
+            yield writer.writerow(row)
+        for row in rows:
+            yield writer.writerow(row)
+
+    resp = StreamingHttpResponse(lines(), content_type='text/csv')
+    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return resp
+
+def _full_name(first_name, last_name):
+    """Same as User.get_full_name() for projected rows."""
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+_BALANCE_EXPORT_FIELDS = ('id', 'admission_no', 'user__first_name', 'user__last_name', 'class_group__name', 'class_group__level')
+
+def _student_balance_rows(class_id, term_id, in_arrears, min_balance=None, max_balance=None, projected=False):
+    """Return (student, balance, owed, paid) tuples for the arrears exports.
+
+    Figures come from the StudentBalance ledger in one grouped query; students the
+    ledger has never seen count as zero balance (i.e. without arrears). With
+    `projected`, `student` is a dict of _BALANCE_EXPORT_FIELDS instead of a model.
+    """
+    totals = fee_ledger.student_totals(term_id=term_id or None, class_id=class_id or None)
+    totals = totals.filter(amount__gt=0) if in_arrears else totals.filter(amount__lte=0)
+    try:
+        if min_balance not in (None, ''):
+            totals = totals.filter(amount__gte=float(min_balance))
+        if max_balance not in (None, ''):
+            totals = totals.filter(amount__lte=float(max_balance))
+    except ValueError:
+        pass
+    figures = {r['student_id']: (r['amount'], r['owed'], r['paid_total']) for r in totals}
+
+    students = Student.objects.select_related('user', 'class_group')
+    if class_id:
+        students = students.filter(class_group_id=class_id)
+    try:
+        zero_in_range = (min_balance in (None, '') or float(min_balance) <= 0) and (max_balance in (None, '') or float(max_balance) >= 0)
+    except ValueError:
+        zero_in_range = True
+    if not in_arrears and zero_in_range:
+        # Students the ledger has never seen owe nothing
+        seen = StudentBalance.objects.filter(term_id=term_id) if term_id else StudentBalance.objects.all()
+        students = students.filter(Q(id__in=list(figures)) | ~Q(id__in=seen.values('student_id')))
+    else:
+        students = students.filter(id__in=list(figures))
+    if projected:
+        return [(s,) + figures.get(s['id'], (0, 0, 0)) for s in students.values(*_BALANCE_EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)]
+    return [(s,) + figures.get(s.id, (0, 0, 0)) for s in students]
+
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
 def export_students_without_arrears_pdf(request):
@@ -368,33 +444,7 @@ def export_students_without_arrears_pdf(request):
     min_balance = request.GET.get('min_balance')
     max_balance = request.GET.get('max_balance')
 
-    students = Student.objects.select_related('user', 'class_group').all()
-    if class_id:
-        students = students.filter(class_group_id=class_id)
-
-    rows_data = []
-    for s in students:
-        fa_q = FeeAssignment.objects.filter(class_group=s.class_group)
-        if term_id:
-            fa_q = fa_q.filter(term_id=term_id)
-        owed = fa_q.aggregate(total=Sum('amount'))['total'] or 0
-        fp_q = FeePayment.objects.filter(student=s, status='approved')
-        if term_id:
-            fp_q = fp_q.filter(fee_assignment__term_id=term_id)
-        paid = fp_q.aggregate(total=Sum('amount_paid'))['total'] or 0
-        balance = (owed - paid)
-        if balance <= 0:
-            rows_data.append((s, balance, owed, paid))
-
-    try:
-        if min_balance not in (None, ''):
-            mb = float(min_balance)
-            rows_data = [r for r in rows_data if r[1] >= mb]
-        if max_balance not in (None, ''):
-            xb = float(max_balance)
-            rows_data = [r for r in rows_data if r[1] <= xb]
-    except ValueError:
-        pass
+    rows_data = _student_balance_rows(class_id, term_id, False, min_balance, max_balance)
 
     is_desc = order in ['desc', 'za']
     if sort_by == 'admission':
@@ -417,7 +467,7 @@ def export_students_without_arrears_pdf(request):
             paid,
             balance,
         ])
-    return pdf_response_from_rows('students_without_arrears.pdf', 'Students without Arrears', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('students_without_arrears.pdf', 'Students without Arrears', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
@@ -429,33 +479,7 @@ def export_students_with_arrears_pdf(request):
     min_balance = request.GET.get('min_balance')
     max_balance = request.GET.get('max_balance')
 
-    students = Student.objects.select_related('user', 'class_group').all()
-    if class_id:
-        students = students.filter(class_group_id=class_id)
-
-    rows_data = []
-    for s in students:
-        fa_q = FeeAssignment.objects.filter(class_group=s.class_group)
-        if term_id:
-            fa_q = fa_q.filter(term_id=term_id)
-        owed = fa_q.aggregate(total=Sum('amount'))["total"] or 0
-        fp_q = FeePayment.objects.filter(student=s, status='approved')
-        if term_id:
-            fp_q = fp_q.filter(fee_assignment__term_id=term_id)
-        paid = fp_q.aggregate(total=Sum('amount_paid'))["total"] or 0
-        balance = (owed - paid)
-        if balance > 0:
-            rows_data.append((s, balance, owed, paid))
-
-    try:
-        if min_balance not in (None, ''):
-            mb = float(min_balance)
-            rows_data = [r for r in rows_data if r[1] >= mb]
-        if max_balance not in (None, ''):
-            xb = float(max_balance)
-            rows_data = [r for r in rows_data if r[1] <= xb]
-    except ValueError:
-        pass
+    rows_data = _student_balance_rows(class_id, term_id, True, min_balance, max_balance)
 
     is_desc = order in ['desc', 'za']
     if sort_by == 'name':
@@ -478,14 +502,14 @@ def export_students_with_arrears_pdf(request):
             paid,
             balance,
         ])
-    return pdf_response_from_rows('students_with_arrears.pdf', 'Students with Arrears', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('students_with_arrears.pdf', 'Students with Arrears', _site_header_rows(), columns, rows, user=request.user)
 
 def _site_header_rows():
     """Return a list of single-cell rows for school header: name, motto, address, and a spacer."""
     rows = []
     try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        ss = get_site_settings()
         if ss:
             rows.append([getattr(ss, 'school_name', '')])
             motto = getattr(ss, 'school_motto', '')
@@ -509,75 +533,31 @@ def export_students_with_arrears_csv(request):
     min_balance = request.GET.get('min_balance')
     max_balance = request.GET.get('max_balance')
 
-    students = Student.objects.select_related('user', 'class_group').all()
-    if class_id:
-        students = students.filter(class_group_id=class_id)
-
-    # Build balances
-    rows = []
-    for s in students:
-        # Owed: sum of fee assignments for student's class (optionally by term)
-        fa_q = FeeAssignment.objects.filter(class_group=s.class_group)
-        if term_id:
-            fa_q = fa_q.filter(term_id=term_id)
-        owed = fa_q.aggregate(total=Sum('amount'))['total'] or 0
-        # Paid: sum of approved payments for this student (optionally by term via fee_assignment)
-        fp_q = FeePayment.objects.filter(student=s, status='approved')
-        if term_id:
-            fp_q = fp_q.filter(fee_assignment__term_id=term_id)
-        paid = fp_q.aggregate(total=Sum('amount_paid'))['total'] or 0
-        balance = (owed - paid)
-        if balance > 0:
-            rows.append((s, balance, owed, paid))
-
-    # Optional balance range filter
-    try:
-        if min_balance is not None and min_balance != '':
-            mb = float(min_balance)
-            rows = [r for r in rows if r[1] >= mb]
-        if max_balance is not None and max_balance != '':
-            xb = float(max_balance)
-            rows = [r for r in rows if r[1] <= xb]
-    except ValueError:
-        pass
+    rows = _student_balance_rows(class_id, term_id, True, min_balance, max_balance, projected=True)
 
     # Sorting
     is_desc = order in ['desc', 'za']
     if sort_by == 'name':
-        rows.sort(key=lambda r: ((r[0].user.first_name or '') + ' ' + (r[0].user.last_name or '')).strip().lower(), reverse=is_desc)
+        rows.sort(key=lambda r: _full_name(r[0]['user__first_name'], r[0]['user__last_name']).lower(), reverse=is_desc)
     elif sort_by == 'admission':
-        rows.sort(key=lambda r: (len(r[0].admission_no), r[0].admission_no), reverse=is_desc)
+        rows.sort(key=lambda r: (len(r[0]['admission_no']), r[0]['admission_no']), reverse=is_desc)
     else:  # balance
         rows.sort(key=lambda r: r[1], reverse=is_desc)
 
-    resp = _csv_response('students_with_arrears.csv')
-    writer = csv.writer(resp)
-    # Prepend school header
-    try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
-        if ss:
-            writer.writerow([getattr(ss, 'school_name', '')])
-            if getattr(ss, 'school_motto', ''):
-                writer.writerow([ss.school_motto])
-            if getattr(ss, 'contact_address', ''):
-                writer.writerow([ss.contact_address])
-            writer.writerow([])
-    except Exception:
-        pass
-    writer.writerow(['Admission No', 'Full Name', 'Class', 'Level', 'Owed', 'Paid', 'Balance'])
-    for s, balance, owed, paid in rows:
-        user = s.user
-        writer.writerow([
-            s.admission_no,
-            user.get_full_name() if user else '',
-            getattr(s.class_group, 'name', ''),
-            getattr(s.class_group, 'level', ''),
-            owed,
-            paid,
-            balance,
-        ])
-    return resp
+    def data():
+        yield ['Admission No', 'Full Name', 'Class', 'Level', 'Owed', 'Paid', 'Balance']
+        for s, balance, owed, paid in rows:
+            yield [
+                s['admission_no'],
+                _full_name(s['user__first_name'], s['user__last_name']),
+                s['class_group__name'] or '',
+                s['class_group__level'] or '',
+                owed,
+                paid,
+                balance,
+            ]
+
+    return _csv_streaming_response('students_with_arrears.csv', data())
 
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
@@ -589,71 +569,30 @@ def export_students_without_arrears_csv(request):
     min_balance = request.GET.get('min_balance')
     max_balance = request.GET.get('max_balance')
 
-    students = Student.objects.select_related('user', 'class_group').all()
-    if class_id:
-        students = students.filter(class_group_id=class_id)
-
-    rows = []
-    for s in students:
-        fa_q = FeeAssignment.objects.filter(class_group=s.class_group)
-        if term_id:
-            fa_q = fa_q.filter(term_id=term_id)
-        owed = fa_q.aggregate(total=Sum('amount'))['total'] or 0
-        fp_q = FeePayment.objects.filter(student=s, status='approved')
-        if term_id:
-            fp_q = fp_q.filter(fee_assignment__term_id=term_id)
-        paid = fp_q.aggregate(total=Sum('amount_paid'))['total'] or 0
-        balance = (owed - paid)
-        if balance <= 0:
-            rows.append((s, balance, owed, paid))
-
-    # Optional balance range filter (allow negatives too)
-    try:
-        if min_balance is not None and min_balance != '':
-            mb = float(min_balance)
-            rows = [r for r in rows if r[1] >= mb]
-        if max_balance is not None and max_balance != '':
-            xb = float(max_balance)
-            rows = [r for r in rows if r[1] <= xb]
-    except ValueError:
-        pass
+    rows = _student_balance_rows(class_id, term_id, False, min_balance, max_balance, projected=True)
 
     is_desc = order in ['desc', 'za']
     if sort_by == 'admission':
-        rows.sort(key=lambda r: (len(r[0].admission_no), r[0].admission_no), reverse=is_desc)
+        rows.sort(key=lambda r: (len(r[0]['admission_no']), r[0]['admission_no']), reverse=is_desc)
     elif sort_by == 'balance':
         rows.sort(key=lambda r: r[1], reverse=is_desc)
     else:
-        rows.sort(key=lambda r: ((r[0].user.first_name or '') + ' ' + (r[0].user.last_name or '')).strip().lower(), reverse=is_desc)
+        rows.sort(key=lambda r: _full_name(r[0]['user__first_name'], r[0]['user__last_name']).lower(), reverse=is_desc)
+
+    def data():
+        yield ['Admission No', 'Full Name', 'Class', 'Level', 'Owed', 'Paid', 'Balance']
+        for s, balance, owed, paid in rows:
+            yield [
+                s['admission_no'],
+                _full_name(s['user__first_name'], s['user__last_name']),
+                s['class_group__name'] or '',
+                s['class_group__level'] or '',
+                owed,
+                paid,
+                balance,
+            ]
 
-    resp = _csv_response('students_without_arrears.csv')
-    writer = csv.writer(resp)
-    # Prepend school header
-    try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
-        if ss:
-            writer.writerow([getattr(ss, 'school_name', '')])
-            if getattr(ss, 'school_motto', ''):
-                writer.writerow([ss.school_motto])
-            if getattr(ss, 'contact_address', ''):
-                writer.writerow([ss.contact_address])
-            writer.writerow([])
-    except Exception:
-        pass
-    writer.writerow(['Admission No', 'Full Name', 'Class', 'Level', 'Owed', 'Paid', 'Balance'])
-    for s, balance, owed, paid in rows:
-        user = s.user
-        writer.writerow([
-            s.admission_no,
-            user.get_full_name() if user else '',
-            getattr(s.class_group, 'name', ''),
-            getattr(s.class_group, 'level', ''),
-            owed,
-            paid,
-            balance,
-        ])
-    return resp
+    return _csv_streaming_response('students_without_arrears.csv', data())
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
@@ -662,8 +601,8 @@ def export_users_csv(request):
     resp = _csv_response('users.csv')
     writer = csv.writer(resp)
     try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        ss = get_site_settings()
         if ss:
             writer.writerow([getattr(ss, 'school_name', '')])
             if getattr(ss, 'school_motto', ''):
@@ -690,7 +629,7 @@ def export_users_pdf(request):
             getattr(u, 'role', ''), u.is_active,
             u.date_joined.strftime('%Y-%m-%d %H:%M') if getattr(u, 'date_joined', None) else ''
         ])
-    return pdf_response_from_rows('users.pdf', 'Users', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('users.pdf', 'Users', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
@@ -712,8 +651,8 @@ def export_teachers_csv(request):
     resp = _csv_response('teachers.csv')
     writer = csv.writer(resp)
     try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        ss = get_site_settings()
         if ss:
             writer.writerow([getattr(ss, 'school_name', '')])
             if getattr(ss, 'school_motto', ''):
@@ -751,7 +690,7 @@ def export_teachers_pdf(request):
         user = t.user
         name = user.get_full_name() if user else ''
         rows.append([t.id, name, user.username if user else '', getattr(t.department, 'name', ''), t.tsc_number or '', t.staff_id or '', t.phone or '', t.gender or '', (user.email if user else '')])
-    return pdf_response_from_rows('teachers.pdf', 'Teachers', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('teachers.pdf', 'Teachers', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
@@ -778,27 +717,17 @@ def export_students_csv(request):
     else:
         # name
         qs = qs.order_by('-user__first_name', '-user__last_name') if is_desc else qs.order_by('user__first_name', 'user__last_name')
-    resp = _csv_response('students.csv')
-    writer = csv.writer(resp)
-    try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
-        if ss:
-            writer.writerow([getattr(ss, 'school_name', '')])
-            if getattr(ss, 'school_motto', ''):
-                writer.writerow([ss.school_motto])
-            if getattr(ss, 'contact_address', ''):
-                writer.writerow([ss.contact_address])
-            writer.writerow([])
-    except Exception:
-        pass
-    writer.writerow(['Admission No', 'Full Name', 'Username', 'Class', 'Level', 'Gender', 'Phone', 'Graduated'])
-    for s in qs:
-        user = s.user
-        full_name = user.get_full_name() if user else ''
-        username = user.username if user else ''
-        writer.writerow([s.admission_no, full_name, username, getattr(s.class_group, 'name', ''), getattr(s.class_group, 'level', ''), s.gender, s.phone or '', s.graduated])
-    return resp
+    projected = qs.values_list(
+        'admission_no', 'user__first_name', 'user__last_name', 'user__username',
+        'class_group__name', 'class_group__level', 'gender', 'phone', 'graduated',
+    )
+
+    def data():
+        yield ['Admission No', 'Full Name', 'Username', 'Class', 'Level', 'Gender', 'Phone', 'Graduated']
+        for adm, first, last, username, class_name, class_level, gender, phone, graduated in projected.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [adm, _full_name(first, last), username or '', class_name or '', class_level or '', gender, phone or '', graduated]
+
+    return _csv_streaming_response('students.csv', data())
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
@@ -825,7 +754,7 @@ def export_students_pdf(request):
         full_name = user.get_full_name() if user else ''
         username = user.username if user else ''
         rows.append([s.admission_no, full_name, username, getattr(s.class_group, 'name', ''), getattr(s.class_group, 'level', ''), s.gender, s.phone or '', s.graduated])
-    return pdf_response_from_rows('students.pdf', 'Students', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('students.pdf', 'Students', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
@@ -841,8 +770,8 @@ def export_fee_assignments_csv(request):
     resp = _csv_response('fee_assignments.csv')
     writer = csv.writer(resp)
     try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        ss = get_site_settings()
         if ss:
             writer.writerow([getattr(ss, 'school_name', '')])
             if getattr(ss, 'school_motto', ''):
@@ -888,12 +817,12 @@ def export_fee_assignments_pdf(request):
             fa.term.academic_year.year if getattr(fa.term, 'academic_year', None) else '',
             fa.amount,
         ])
-    return pdf_response_from_rows('fee_assignments.pdf', 'Fee Assignments', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('fee_assignments.pdf', 'Fee Assignments', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
 def export_fee_payments_csv(request):
-    qs = FeePayment.objects.select_related('student__user', 'fee_assignment__fee_category', 'fee_assignment__class_group', 'fee_assignment__term__academic_year').all()
+    qs = FeePayment.objects.all()
     # Filters
     method = request.GET.get('method')  # mpesa, cash, bank
     category_id = request.GET.get('category_id')
@@ -907,42 +836,33 @@ def export_fee_payments_csv(request):
         qs = qs.filter(fee_assignment__class_group_id=class_id)
     if term_id:
         qs = qs.filter(fee_assignment__term_id=term_id)
-    qs = qs.order_by('-payment_date')
-    resp = _csv_response('fee_payments.csv')
-    writer = csv.writer(resp)
-    try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
-        if ss:
-            writer.writerow([getattr(ss, 'school_name', '')])
-            if getattr(ss, 'school_motto', ''):
-                writer.writerow([ss.school_motto])
-            if getattr(ss, 'contact_address', ''):
-                writer.writerow([ss.contact_address])
-            writer.writerow([])
-    except Exception:
-        pass
-    writer.writerow(['ID', 'Student', 'Admission No', 'Class', 'Level', 'Fee Category', 'Amount Paid', 'Payment Date', 'Method', 'Reference', 'Phone', 'Status'])
-    for p in qs:
-        student = p.student
-        user = getattr(student, 'user', None)
-        class_group = getattr(student, 'class_group', None)
-        cat = p.fee_assignment.fee_category.name if p.fee_assignment and p.fee_assignment.fee_category else ''
-        writer.writerow([
-            p.id,
-            (user.get_full_name() if user else str(student.id)),
-            getattr(student, 'admission_no', ''),
-            getattr(class_group, 'name', ''),
-            getattr(class_group, 'level', ''),
-            cat,
-            p.amount_paid,
-            p.payment_date.strftime('%Y-%m-%d %H:%M'),
-            p.payment_method or '',
-            p.reference or '',
-            p.phone_number or '',
-            p.status,
-        ])
-    return resp
+    projected = qs.order_by('-payment_date').values_list(
+        'id', 'student_id', 'student__user_id', 'student__user__first_name', 'student__user__last_name',
+        'student__admission_no', 'student__class_group__name', 'student__class_group__level',
+        'fee_assignment__fee_category__name', 'amount_paid', 'payment_date',
+        'payment_method', 'reference', 'phone_number', 'status',
+    )
+
+    def data():
+        yield ['ID', 'Student', 'Admission No', 'Class', 'Level', 'Fee Category', 'Amount Paid', 'Payment Date', 'Method', 'Reference', 'Phone', 'Status']
+        for (pk, student_id, user_id, first, last, adm, class_name, class_level,
+             category, amount, paid_at, method, reference, phone, status) in projected.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                pk,
+                _full_name(first, last) if user_id else str(student_id or ''),
+                adm or '',
+                class_name or '',
+                class_level or '',
+                category or '',
+                amount,
+                paid_at.strftime('%Y-%m-%d %H:%M'),
+                method or '',
+                reference or '',
+                phone or '',
+                status,
+            ]
+
+    return _csv_streaming_response('fee_payments.csv', data())
 
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
@@ -982,21 +902,32 @@ def export_fee_payments_pdf(request):
             p.phone_number or '',
             p.status,
         ])
-    return pdf_response_from_rows('fee_payments.pdf', 'Fee Payments', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('fee_payments.pdf', 'Fee Payments', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def admin_payment_callback_logs(request):
-    import os, json
-    log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'payment_callback_logs.txt')
-    logs = []
-    try:
-        with open(log_path, 'r') as logf:
-            logs = json.load(logf)
-    except Exception:
-        logs = []
+    # Latest 100 journal entries, oldest first as the template expects
+    logs, _ = callback_journal.read_page(1, per_page=100)
+    logs.reverse()
     return render(request, 'dashboards/admin_payment_callback_logs.html', {'logs': logs})
 
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+def admin_cache_diagnostics(request):
+    """Per key-prefix cache hit/miss/eviction counters aggregated across workers."""
+    from .cache_backends import collect_stats
+    rows, processes = collect_stats()
+    cache_conf = settings.CACHES.get('default', {})
+    shared_conf = settings.CACHES.get('shared', cache_conf)
+    return render(request, 'dashboards/admin_cache_diagnostics.html', {
+        'rows': rows,
+        'processes': processes,
+        'tiered': cache_conf.get('BACKEND') == 'core.cache_backends.TieredCache',
+        'local_options': cache_conf.get('OPTIONS', {}),
+        'shared_backend': shared_conf.get('BACKEND', ''),
+    })
+
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
 def admin_mpesa_reconcile(request):
@@ -1106,7 +1037,7 @@ def admin_mpesa_reconcile(request):
         # Choose fee assignment (current term or any)
         from django.db.models import Sum as _Sum
         today = timezone.now().date()
-        current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+        current_term = academic_calendar.current_term(today)
         outstanding_assignment = None
         if student:
             q = FeeAssignment.objects.filter(class_group=student.class_group)
@@ -1257,18 +1188,8 @@ def admin_mpesa_all(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin_or_clerk)
 def admin_payment_log_file(request):
-    """Serve the raw payment callback log file to admin/clerk."""
+    """Raw callback log download (disabled: the journal holds payers' phone numbers)."""
     raise Http404()
-    log_path = os.path.join(settings.BASE_DIR, 'payment_callback_logs.txt')
-    if not os.path.exists(log_path):
-        raise Http404('Log file not found')
-    try:
-        f = open(log_path, 'rb')
-    except OSError:
-        raise Http404('Unable to open log file')
-    response = FileResponse(f, content_type='text/plain')
-    response["Content-Disposition"] = 'inline; filename="payment_callback_logs.txt"'
-    return response
 
 from django.http import JsonResponse
 
@@ -1285,176 +1206,20 @@ def export_result_slip_csv(request):
     level = request.GET.get('level')
     if not exam_id:
         return HttpResponse("Missing exam_id", status=400)
-    # Pull all grades matching filters
-    grades_qs = Grade.objects.select_related(
-        'student__user', 'student__class_group', 'subject', 'exam__term__academic_year'
-    ).filter(exam_id=exam_id)
-    if class_id:
-        grades_qs = grades_qs.filter(student__class_group_id=class_id)
-    if level:
-        grades_qs = grades_qs.filter(student__class_group__level=level)
-
-    # Organize by class -> student -> subject
-    from collections import defaultdict, OrderedDict
-    class_students = defaultdict(OrderedDict)  # {Class: OrderedDict{student_id: Student}}
-    class_subjects = defaultdict(set)          # {Class: set(Subject)}
-    grade_map = {}                             # {(student_id, subject_id): Grade}
-
-    for g in grades_qs:
-        cls = g.student.class_group
-        if not cls:
-            continue
-        class_subjects[cls].add(g.subject)
-        if g.student.id not in class_students[cls]:
-            class_students[cls][g.student.id] = g.student
-        grade_map[(g.student.id, g.subject.id)] = g
-
-    # 4-point scale mapping (including +/- variants)
-    LETTER_POINTS = {
-        'A+': 4, 'A': 4, 'A-': 4,
-        'B+': 3, 'B': 3, 'B-': 3,
-        'C+': 2, 'C': 2, 'C-': 2,
-        'D+': 1, 'D': 1, 'D-': 1,
-        'E': 0,
-    }
-
-    # Map average points back to an approximate mean grade
-    def points_to_letter(avg: float) -> str:
-        if avg is None:
-            return ''
-        if avg >= 3.5: return 'A'
-        if avg >= 2.5: return 'B'
-        if avg >= 1.5: return 'C'
-        if avg >= 0.5: return 'D'
-        return 'E'
-
-    # Helper to compute letter possibly from grading scheme
-    def compute_letter(g: Grade):
-        if g.grade_letter:
-            return g.grade_letter
-        try:
-            scheme = getattr(g.subject, 'grading_scheme', None)
-            if scheme:
-                return scheme.get_grade_letter(g.score) or ''
-        except Exception:
-            pass
-        return ''
-
-    # Build CSV
-    resp = _csv_response('result_slip_block.csv')
-    writer = csv.writer(resp)
-
-    # Header block
-    try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
-        if ss:
-            writer.writerow([getattr(ss, 'school_name', '')])
-            if getattr(ss, 'school_motto', ''):
-                writer.writerow([ss.school_motto])
-            if getattr(ss, 'contact_address', ''):
-                writer.writerow([ss.contact_address])
-            writer.writerow([])
-    except Exception:
-        pass
-
-    # Stable class order
-    classes_sorted = sorted(class_students.keys(), key=lambda c: (c.level, c.name))
-
-    # If no classes (no grades), return empty table header
-    if not classes_sorted:
-        writer.writerow(['No data for the selected exam/filters'])
-        return resp
-
-    for cls in classes_sorted:
-        # Class title row
-        writer.writerow([f"Class: {cls.name} (Level {cls.level})"])
-        # Column headers
-        subjects_sorted = sorted(class_subjects[cls], key=lambda s: s.name.lower())
-        columns = ['Position', 'Admission No', 'Full Name'] + [s.code for s in subjects_sorted] + ['Total Marks', 'Total Points', 'Avg Points', 'Mean Grade']
-        writer.writerow(columns)
-
-        # Prepare student metrics
-        students_sorted = sorted(class_students[cls].values(), key=lambda s: (len(s.admission_no or ''), s.admission_no or ''))
-        student_rows = []
-        per_subject_points = {subj.id: [] for subj in subjects_sorted}
-        for stu in students_sorted:
-            u = stu.user
-            row_prefix = [stu.admission_no, u.get_full_name() if u else '']
-            total_points = 0
-            taken = 0
-            total_marks = 0.0
-            subj_cells = []
-            for subj in subjects_sorted:
-                g = grade_map.get((stu.id, subj.id))
-                if not g:
-                    subj_cells.append('')
-                    continue
-                letter = compute_letter(g)
-                # subject cell shows marks and letter when available
-                if letter and g.score is not None:
-                    cell = f"{g.score} ({letter})"
-                elif g.score is not None:
-                    cell = str(g.score)
-                else:
-                    cell = letter
-                subj_cells.append(cell)
-                if letter in LETTER_POINTS:
-                    total_points += LETTER_POINTS[letter]
-                    per_subject_points[subj.id].append(LETTER_POINTS[letter])
-                    taken += 1
-                # accumulate raw marks for tie-breaker
-                try:
-                    total_marks += float(g.score or 0)
-                except Exception:
-                    pass
-            avg_points = round(total_points / taken, 2) if taken else 0
-            mean_grade = points_to_letter(avg_points) if taken else ''
-            # Store for ranking; position computed after sorting by total_points desc
-            student_rows.append({
-                'stu': stu,
-                'row': row_prefix + subj_cells + [round(total_marks, 2), total_points, avg_points, mean_grade],
-                'total_points': total_points,
-                'avg_points': avg_points,
-                'total_marks': total_marks,
-            })
-
-        # Rank by Total Points desc, then total Marks desc
-        student_rows.sort(key=lambda r: (-r['total_points'], -r.get('total_marks', 0), len(r['stu'].admission_no or ''), r['stu'].admission_no or ''))
-        position = 0
-        last_points = None
-        last_marks = None
-        for idx, entry in enumerate(student_rows, start=1):
-            pts = entry['total_points']
-            marks = entry.get('total_marks', 0)
-            if pts != last_points or marks != last_marks:
-                position = idx
-                last_points = pts
-                last_marks = marks
-            writer.writerow([position] + entry['row'])
-
-        # Class averages row at bottom
-        avg_row_prefix = ['', '', 'Class Averages']
-        for subj in subjects_sorted:
-            pts_list = per_subject_points.get(subj.id, [])
-            if pts_list:
-                subj_avg = round(sum(pts_list) / len(pts_list), 2)
-                avg_row_prefix.append(f"{subj_avg} ({points_to_letter(subj_avg)})")
-            else:
-                avg_row_prefix.append('')
-        # Overall class averages
-        all_totals = [r['total_points'] for r in student_rows]
-        all_avgs = [r['avg_points'] for r in student_rows if r['avg_points']]
-        all_marks = [r['total_marks'] for r in student_rows]
-        class_total_marks_avg = round(sum(all_marks) / len(all_marks), 2) if all_marks else 0
-        class_total_avg = round(sum(all_totals) / len(all_totals), 2) if all_totals else 0
-        class_avg_points = round(sum(all_avgs) / len(all_avgs), 2) if all_avgs else 0
-        class_mean_grade = points_to_letter(class_avg_points) if all_avgs else ''
-        writer.writerow(avg_row_prefix + [class_total_marks_avg, class_total_avg, class_avg_points, class_mean_grade])
-
-        writer.writerow([])  # spacer between classes
-
-    return resp
+    def data():
+        # Classes stream one at a time in (level, name) order
+        any_class = False
+        for title, columns, rows in result_slip.iter_class_blocks(exam_id, class_id, level):
+            any_class = True
+            yield [title]
+            yield columns
+            yield from rows
+            yield []  # spacer between classes
+        # If no classes (no grades), return empty table header
+        if not any_class:
+            yield ['No data for the selected exam/filters']
+
+    return _csv_streaming_response('result_slip_block.csv', data())
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
@@ -1472,208 +1237,21 @@ def export_result_slip_pdf(request):
     except Exam.DoesNotExist:
         return HttpResponse("Invalid exam_id", status=400)
 
-    grades_qs = Grade.objects.select_related(
-        'student__user', 'student__class_group', 'subject', 'exam__term__academic_year'
-    ).filter(exam_id=exam_id)
-    if class_id:
-        grades_qs = grades_qs.filter(student__class_group_id=class_id)
-    if level:
-        grades_qs = grades_qs.filter(student__class_group__level=level)
-
-    from collections import defaultdict, OrderedDict
-    class_students = defaultdict(OrderedDict)
-    class_subjects = defaultdict(set)
-    grade_map = {}
-
-    for g in grades_qs:
-        cls = g.student.class_group
-        if not cls:
-            continue
-        class_subjects[cls].add(g.subject)
-        if g.student.id not in class_students[cls]:
-            class_students[cls][g.student.id] = g.student
-        grade_map[(g.student.id, g.subject.id)] = g
-
-    # 4-point scale mapping (including +/- variants)
-    LETTER_POINTS = {
-        'A+': 4, 'A': 4, 'A-': 4,
-        'B+': 3, 'B': 3, 'B-': 3,
-        'C+': 2, 'C': 2, 'C-': 2,
-        'D+': 1, 'D': 1, 'D-': 1,
-        'E': 0,
-    }
-
-    # Map average points back to an approximate mean grade (4-point bands)
-    def points_to_letter(avg: float) -> str:
-        if avg is None:
-            return ''
-        if avg >= 3.5: return 'A'
-        if avg >= 2.5: return 'B'
-        if avg >= 1.5: return 'C'
-        if avg >= 0.5: return 'D'
-        return 'E'
-
-    def compute_letter(g: Grade):
-        if g.grade_letter:
-            return g.grade_letter
-        try:
-            scheme = getattr(g.subject, 'grading_scheme', None)
-            if scheme:
-                return scheme.get_grade_letter(g.score) or ''
-        except Exception:
-            pass
-        return ''
-
-    # Build PDF using reportlab directly to allow multiple tables per document
-    try:
-        from reportlab.lib.pagesizes import A4, landscape  # type: ignore
-        from reportlab.lib import colors  # type: ignore
-        from reportlab.lib.styles import getSampleStyleSheet  # type: ignore
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak  # type: ignore
-    except Exception:
-        return HttpResponse(
-            "PDF generation is unavailable: 'reportlab' is not installed. Please install it (pip install reportlab).",
-            content_type='text/plain',
-            status=500,
-        )
-
-    buffer = BytesIO()
-    pagesize = landscape(A4)
-    doc = SimpleDocTemplate(buffer, pagesize=pagesize, leftMargin=24, rightMargin=24, topMargin=24, bottomMargin=24)
-    styles = getSampleStyleSheet()
-    story = []
-
-    # School header
-    for line in _site_header_rows() or []:
-        if not line:
-            story.append(Spacer(1, 6))
-        else:
-            story.append(Paragraph(str(line[0]), styles['Heading4']))
-    if _site_header_rows():
-        story.append(Spacer(1, 6))
-
-    # Global title
     term = exam_obj.term
     title = f"Block Result Slip — {exam_obj.name} — {term.name if term else ''} {term.academic_year.year if getattr(term, 'academic_year', None) else ''}"
-    story.append(Paragraph(title, styles['Title']))
-    story.append(Spacer(1, 10))
-
-    classes_sorted = sorted(class_students.keys(), key=lambda c: (c.level, c.name))
-    if not classes_sorted:
-        story.append(Paragraph("No data for the selected exam/filters", styles['Normal']))
-    else:
-        for idx, cls in enumerate(classes_sorted):
-            # Class subtitle
-            story.append(Paragraph(f"Class: {cls.name} (Level {cls.level})", styles['Heading3']))
-            story.append(Spacer(1, 6))
-
-            subjects_sorted = sorted(class_subjects[cls], key=lambda s: s.name.lower())
-            columns = ['Position', 'Admission No', 'Full Name'] + [s.code for s in subjects_sorted] + ['Total Marks', 'Total Points', 'Avg Points', 'Mean Grade']
-
-            # Build rows with metrics
-            rows = []
-            students_sorted = sorted(class_students[cls].values(), key=lambda s: (len(s.admission_no or ''), s.admission_no or ''))
-            per_subject_points = {subj.id: [] for subj in subjects_sorted}
-            student_rows = []
-            for stu in students_sorted:
-                u = stu.user
-                row_prefix = [stu.admission_no, u.get_full_name() if u else '']
-                total_points = 0
-                taken = 0
-                total_marks = 0.0
-                subj_cells = []
-                for subj in subjects_sorted:
-                    g = grade_map.get((stu.id, subj.id))
-                    if not g:
-                        subj_cells.append('')
-                        continue
-                    letter = compute_letter(g)
-                    # subject cell shows marks and letter when available
-                    if letter and getattr(g, 'score', None) is not None:
-                        cell = f"{g.score} ({letter})"
-                    elif getattr(g, 'score', None) is not None:
-                        cell = str(g.score)
-                    else:
-                        cell = letter
-                    subj_cells.append(cell)
-                    if letter in LETTER_POINTS:
-                        total_points += LETTER_POINTS[letter]
-                        per_subject_points[subj.id].append(LETTER_POINTS[letter])
-                        taken += 1
-                    # accumulate raw marks for tie-breaker
-                    try:
-                        total_marks += float(g.score or 0)
-                    except Exception:
-                        pass
-                avg_points = round(total_points / taken, 2) if taken else 0
-                mean_grade = points_to_letter(avg_points) if taken else ''
-                student_rows.append({
-                    'stu': stu,
-                    'row': row_prefix + subj_cells + [round(total_marks, 2), total_points, avg_points, mean_grade],
-                    'total_points': total_points,
-                    'avg_points': avg_points,
-                    'total_marks': total_marks,
-                })
-
-            # Rank by Total Points desc, then total Marks desc and write with Position
-            student_rows.sort(key=lambda r: (-r['total_points'], -r.get('total_marks', 0), len(r['stu'].admission_no or ''), r['stu'].admission_no or ''))
-            position = 0
-            last_points = None
-            last_marks = None
-            for idx, entry in enumerate(student_rows, start=1):
-                pts = entry['total_points']
-                marks = entry.get('total_marks', 0)
-                if pts != last_points or marks != last_marks:
-                    position = idx
-                    last_points = pts
-                    last_marks = marks
-                rows.append([position] + entry['row'])
-
-            # Class averages row (prefix blanks for Position and Admission No)
-            avg_row = ['', '', 'Class Averages']
-            for subj in subjects_sorted:
-                pts_list = per_subject_points.get(subj.id, [])
-                if pts_list:
-                    subj_avg = round(sum(pts_list) / len(pts_list), 2)
-                    avg_row.append(f"{subj_avg} ({points_to_letter(subj_avg)})")
-                else:
-                    avg_row.append('')
-            all_totals = [r['total_points'] for r in student_rows]
-            all_avgs = [r['avg_points'] for r in student_rows if r['avg_points']]
-            all_marks = [r['total_marks'] for r in student_rows]
-            class_total_marks_avg = round(sum(all_marks) / len(all_marks), 2) if all_marks else 0
-            class_total_avg = round(sum(all_totals) / len(all_totals), 2) if all_totals else 0
-            class_avg_points = round(sum(all_avgs) / len(all_avgs), 2) if all_avgs else 0
-            class_mean_grade = points_to_letter(class_avg_points) if all_avgs else ''
-            rows.append(avg_row + [class_total_marks_avg, class_total_avg, class_avg_points, class_mean_grade])
-
-            data = [columns] + rows
-            table = Table(data, repeatRows=1)
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f3f4f6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor('#111827')),
-                ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#d1d5db')),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#fafafa')]),
-            ]))
-
-            story.append(table)
-
-            # Page break between classes to avoid very wide stories
-            if idx < len(classes_sorted) - 1:
-                story.append(PageBreak())
-
-    doc.build(story)
-    pdf = buffer.getvalue()
-    buffer.close()
-
-    filename = 'result_slip_block.pdf'
-    resp = HttpResponse(content_type='application/pdf')
-    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
-    resp.write(pdf)
-    return resp
+    params = {
+        'exam_id': exam_obj.id,
+        'class_id': class_id or None,
+        'level': level or None,
+        'title': title,
+        'header_rows': _site_header_rows(),
+    }
+    # Single-class slips render in the request; whole levels/schools go to a background job.
+    # The fingerprint changes with the exam's grades, so stale artifacts are never served.
+    return pdf_jobs.respond(
+        'result_slip', params, 'result_slip_block.pdf',
+        inline=bool(class_id), fingerprint=result_matrix_data_version(exam_obj.id), user=request.user,
+    )
 
 from django.views.decorators.http import require_GET
 from django.contrib.auth.decorators import login_required
@@ -1682,18 +1260,32 @@ from django.contrib.auth.decorators import login_required
 def job_status(request, job_id):
     """Return JSON status for a `NotificationJob` for quick UI polling."""
     from .models import NotificationJob
-    job = get_object_or_404(NotificationJob, pk=job_id)
-    return JsonResponse({
-        'id': job.id,
-        'status': job.status,
-        'total': job.total,
-        'processed': job.processed,
-        'success_count': job.success_count,
-        'error_count': job.error_count,
-        'meta': job.meta,
-        'created_at': job.created_at.isoformat(),
-        'updated_at': job.updated_at.isoformat(),
-    })
+    # Running jobs publish their progress to the cache; the row is the fallback
+    progress = NotificationJob.cached_progress(job_id)
+    if progress is None:
+        progress = get_object_or_404(NotificationJob, pk=job_id).as_progress()
+    return JsonResponse(progress)
+
+@login_required(login_url='login')
+@require_GET
+def pdf_job_download(request, token):
+    """Serve the artifact of a finished PDF job to its requester (or an admin/clerk).
+
+    The signed token comes from the job's pending page.
+    """
+    from django.core import signing
+    from .models import NotificationJob
+    try:
+        job_id = signing.loads(token, salt=pdf_jobs.DOWNLOAD_SALT, max_age=pdf_jobs.ARTIFACT_MAX_AGE)['job']
+    except (signing.BadSignature, KeyError, TypeError):
+        return HttpResponseForbidden('Invalid or expired link')
+    job = get_object_or_404(NotificationJob, pk=job_id, job_type='pdf_render')
+    if not pdf_jobs.can_download(request.user, job):
+        return HttpResponseForbidden('This export belongs to another user')
+    digest = (job.meta or {}).get('digest')
+    if job.status != 'done' or not digest or not pdf_jobs.has_artifact(digest):
+        raise Http404('PDF is not ready')
+    return pdf_jobs.artifact_response(digest, job.meta.get('filename') or 'export.pdf')
 
 @login_required(login_url='login')
 @user_passes_test(is_admin)
@@ -1717,8 +1309,8 @@ def export_empty_subject_list_csv(request):
     resp = _csv_response('empty_subject_list.csv')
     writer = csv.writer(resp)
     try:
-        from landing.models import SiteSettings
-        ss = SiteSettings.objects.first()
+        from landing.site_settings import get_site_settings
+        ss = get_site_settings()
         if ss:
             writer.writerow([getattr(ss, 'school_name', '')])
             if getattr(ss, 'school_motto', ''):
@@ -1768,7 +1360,7 @@ def export_empty_subject_list_pdf(request):
             subj.name,
             '',
         ])
-    return pdf_response_from_rows('empty_subject_list.pdf', f'Empty Subject List — {subj.name}', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows('empty_subject_list.pdf', f'Empty Subject List — {subj.name}', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 def manage_class_subjects(request, class_id):
@@ -1948,10 +1540,11 @@ def view_attendance(request):
     return render(request, 'attendance/view_attendance.html', context)
 
 
-def can_view_results_for_student(request, student):
+def can_view_results_for_student(request, student, fee_totals=None):
     """
     Centralized helper to decide if results access should be granted for a student
     based on fee arrears and SiteSettings. Admins and the student's class teacher bypass.
+    fee_totals: (billed, paid) when the caller already has them.
 
     Returns: (can_view: bool, message: str, restrict_results_by_fee: bool)
     """
@@ -1960,12 +1553,12 @@ def can_view_results_for_student(request, student):
     restrict_results_by_fee = False
 
     try:
-        from landing.models import SiteSettings
+        from landing.site_settings import get_site_settings
         from .models import FeeAssignment, FeePayment, Teacher
         from django.db.models import Sum
         from django.core.cache import cache
 
-        settings_obj = SiteSettings.objects.first()
+        settings_obj = get_site_settings()
         # Global toggle from settings page
         if settings_obj and settings_obj.restrict_results_by_fee:
             restrict_results_by_fee = True
@@ -1977,20 +1570,23 @@ def can_view_results_for_student(request, student):
         if is_teacher:
             try:
                 teacher = Teacher.objects.filter(user=request.user).first()
-                if teacher and student.class_group and student.class_group.class_teacher_id == teacher.id:
+                if teacher and student.class_group_id and student.class_group.class_teacher_id == teacher.id:
                     is_class_teacher = True
             except Exception:
                 is_class_teacher = False
 
         if not (is_admin or is_class_teacher):
-            total_billed = (
-                FeeAssignment.objects.filter(class_group=student.class_group).aggregate(total=Sum('amount'))['total']
-                or 0
-            )
-            total_paid = (
-                FeePayment.objects.filter(student=student).aggregate(total=Sum('amount_paid'))['total']
-                or 0
-            )
+            if fee_totals is not None:
+                total_billed, total_paid = fee_totals
+            else:
+                total_billed = (
+                    FeeAssignment.objects.filter(class_group=student.class_group).aggregate(total=Sum('amount'))['total']
+                    or 0
+                )
+                total_paid = (
+                    FeePayment.objects.filter(student=student).aggregate(total=Sum('amount_paid'))['total']
+                    or 0
+                )
             billed = float(total_billed or 0)
             paid = float(total_paid or 0)
             balance_amount = max(billed - paid, 0.0)
@@ -2040,9 +1636,9 @@ def student_results_blocked(request):
 
 @login_required(login_url='login')
 def student_profile(request, student_id):
-    from django.utils import timezone
-    student = get_object_or_404(Student, id=student_id)
-    print(f"[DEBUG] Viewing profile for student ID: {student_id}, admission_no: {student.admission_no}, user: {student.user}, full_name: {getattr(student.user, 'get_full_name', lambda: student.user.username)() if student.user else 'NO USER'}")
+    student = get_object_or_404(
+        Student.objects.select_related('user', 'class_group__class_teacher__user'), id=student_id
+    )
     # Authorization: students can only view their own profile
     try:
         user_role = getattr(request.user, 'role', None)
@@ -2062,145 +1658,15 @@ def student_profile(request, student_id):
             return HttpResponseForbidden('Not allowed.')
         except Exception:
             return redirect('student_dashboard')
-    now = timezone.now()
-
-    today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
-
-    # All fee assignments for the student's class (all time)
-    fee_assignments = FeeAssignment.objects.filter(class_group=student.class_group)
-    from django.db.models import Sum, Avg
-    total_billed = fee_assignments.aggregate(total=Sum('amount'))['total'] or 0
+    current_term = academic_calendar.current_term()
 
-    # All payments made by this student (all time)
-    total_paid = FeePayment.objects.filter(student=student).aggregate(total=Sum('amount_paid'))['total'] or 0
-
-    balance = total_billed - total_paid
+    # Fees, published exams with averages, selected exam grades and ranks in a fixed number of queries
+    profile = student_profile_service.StudentProfile(student, exam_id=request.GET.get('exam_id'))
 
     # --- Results access restriction logic (fee-based) ---
-    can_view_results, fee_restriction_message, restrict_results_by_fee = can_view_results_for_student(request, student)
-
-    # --- Exam selection and Performance/Grades Section ---
-    # Build the base grades queryset
-    grades_qs = Grade.objects.filter(student=student).select_related('subject', 'exam')
-
-    # Exams this student has grades in
-    student_exam_ids = list(grades_qs.values_list('exam_id', flat=True).distinct())
-    student_exams = Exam.objects.filter(id__in=student_exam_ids).select_related('term').order_by('-start_date', '-id')
-    # Only published exams are allowed for printing/downloading
-    published_exams = student_exams.filter(results_published=True)
-
-    selected_exam = None
-    exam_id = request.GET.get('exam_id')
-    if exam_id:
-        try:
-            ex = Exam.objects.select_related('term').get(id=exam_id)
-            # If the selected exam is not published, do not show grades for it
-            if ex.results_published:
-                selected_exam = ex
-                grades_qs = grades_qs.filter(exam=selected_exam)
-            else:
-                # Keep grades empty if an unpublished exam was requested
-                grades_qs = grades_qs.none()
-        except Exam.DoesNotExist:
-            grades_qs = grades_qs.none()
-    # If no exam explicitly selected, default to latest published exam the student has grades for
-    if selected_exam is None:
-        latest_published = published_exams.first()
-        if latest_published:
-            selected_exam = latest_published
-            grades_qs = grades_qs.filter(exam=selected_exam)
-
-    grades = grades_qs
-    average_score = grades.aggregate(avg=Avg('score'))['avg'] if hasattr(grades, 'exists') and grades.exists() else None
-
-    # --- Performance over time (all exams ever done, oldest first) ---
-    # IMPORTANT: Use ALL grades for this student (not the filtered grades for selected exam)
-    exam_performance = []
-    # Only consider exams that are done/published
-    all_grades_qs = Grade.objects.filter(student=student, exam__results_published=True)
-    # 1) Preferred: aggregate directly from the student's ALL grades queryset
-    exam_rows = (
-        all_grades_qs
-        .values('exam_id', 'exam__name', 'exam__start_date', 'exam__term__start_date')
-        .annotate(average=Avg('score'))
-        .order_by('exam__start_date', 'exam_id')
+    can_view_results, fee_restriction_message, restrict_results_by_fee = can_view_results_for_student(
+        request, student, fee_totals=(profile.total_billed, profile.total_paid)
     )
-    for row in exam_rows:
-        ex_date = row.get('exam__start_date') or row.get('exam__term__start_date')
-        exam_performance.append({
-            'exam_id': row['exam_id'],
-            'exam_name': row['exam__name'],
-            'date': ex_date.strftime('%Y-%m-%d') if ex_date else '',
-            'average_score': float(row['average']) if row['average'] is not None else None,
-        })
-    # 2) Fallback: if still empty, rebuild via Exam -> Grade join
-    if not exam_performance:
-        student_exam_ids = (
-            Grade.objects
-            .filter(student=student)
-            .values_list('exam_id', flat=True)
-            .distinct()
-        )
-        student_exams = Exam.objects.filter(id__in=student_exam_ids).order_by('start_date', 'id')
-        for ex in student_exams:
-            ex_grades = Grade.objects.filter(student=student, exam=ex)
-            avg_val = ex_grades.aggregate(avg=Avg('score'))['avg'] if ex_grades.exists() else None
-            ex_date = ex.start_date or (getattr(ex, 'term', None).start_date if getattr(ex, 'term', None) else None)
-            exam_performance.append({
-                'exam_id': ex.id,
-                'exam_name': ex.name,
-                'date': ex_date.strftime('%Y-%m-%d') if ex_date else '',
-                'average_score': float(avg_val) if avg_val is not None else None,
-            })
-    # Debug trace (safe prints)
-    try:
-        print(f"[DEBUG] student_profile exam rows count={len(exam_performance)} student_id={student.id}")
-    except Exception:
-        pass
-
-    # --- Ranking Logic ---
-    # Class (stream) ranking
-    class_students = Student.objects.filter(class_group=student.class_group)
-    class_scores = []
-    for s in class_students:
-        grades = Grade.objects.filter(student=s)
-        avg = grades.aggregate(avg=Avg('score'))['avg'] if grades.exists() else None
-        class_scores.append({'student_id': s.id, 'avg': avg})
-    class_scores = [x for x in class_scores if x['avg'] is not None]
-    class_scores.sort(key=lambda x: x['avg'], reverse=True)
-    class_rank = None
-    stream_rank = None
-    for idx, entry in enumerate(class_scores, start=1):
-        if entry['student_id'] == student.id:
-            class_rank = idx
-            stream_rank = idx
-            break
-    class_total = len(class_scores)
-    stream_total = class_total
-
-    # Overall (whole level) ranking
-    overall_level_students = Student.objects.filter(class_group__level=student.class_group.level)
-    overall_level_scores = []
-    for s in overall_level_students:
-        grades = Grade.objects.filter(student=s)
-        avg = grades.aggregate(avg=Avg('score'))['avg'] if grades.exists() else None
-        overall_level_scores.append({'student_id': s.id, 'avg': avg})
-    overall_level_scores = [x for x in overall_level_scores if x['avg'] is not None]
-    overall_level_scores.sort(key=lambda x: x['avg'], reverse=True)
-    overall_level_rank = None
-    for idx, entry in enumerate(overall_level_scores, start=1):
-        if entry['student_id'] == student.id:
-            overall_level_rank = idx
-            break
-    overall_level_total = len(overall_level_scores)
-
-    # Prepare overall level totals (already computed above)
-    # overall_level_rank and overall_level_total are now correctly set
-
-    # --- Total Points Calculation ---
-    points_map = {'A': 4, 'B': 3, 'C': 2, 'D': 1}
-    total_points = sum(points_map.get(g.grade_letter, 0) for g in grades if getattr(g, 'grade_letter', None))
 
     # Handle contact info update POST
     if request.method == 'POST' and 'update_contact' in request.POST:
@@ -2217,30 +1683,13 @@ def student_profile(request, student_id):
     context = {
         'student': student,
         'current_term': current_term,
-        'term': (selected_exam.term if selected_exam else current_term),
-        'total_billed': total_billed,
-        'total_paid': total_paid,
-        'balance': balance,
-        'grades': grades,
-        'average_score': average_score,
-        'exam_performance': exam_performance,
-        'class_rank': class_rank,
-        'class_total': class_total,
-        'overall_level_rank': overall_level_rank,
-        'overall_level_total': overall_level_total,
-        'stream_rank': stream_rank,
-        'stream_total': stream_total,
-        'fee_assignments': fee_assignments,
-        'fee_payments': FeePayment.objects.filter(student=student, fee_assignment__in=fee_assignments),
-        'total_points': total_points,
+        'term': (profile.selected_exam.term if profile.selected_exam else current_term),
+        **profile.context(),
         'contact_form': contact_form,
         # Restriction flags for template/UI
         'can_view_results': can_view_results,
         'fee_restriction_message': fee_restriction_message,
         'restrict_results_by_fee': restrict_results_by_fee,
-        # Exam selection in UI
-        'published_exams': published_exams,
-        'selected_exam': selected_exam,
     }
     return render(request, 'dashboards/student_profile.html', context)
 
@@ -2277,15 +1726,10 @@ def upload_grades(request, teacher_id):
                 adm_map = {str(getattr(s, 'admission_no', '')).strip().upper(): s for s in students_in_class if getattr(s, 'admission_no', None)}
 
                 total_rows = 0
-                saved_count = 0
-                unknown_count = 0
-                invalid_score_count = 0
-                over_cap_count = 0
-                failed_rows = []
-                error_msgs = []
                 log_msgs = []
                 matched_by_adm = 0
                 matched_by_name = 0
+                ingest = GradeIngest()
 
                 for i, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
                     if not row or row[0] is None:
@@ -2327,9 +1771,7 @@ def upload_grades(request, teacher_id):
                     if admission_no:
                         student = adm_map.get(admission_no)
                         if not student:
-                            error_msgs.append(f"Error on row {i}: Admission No '{admission_no}' not found in this class.")
-                            unknown_count += 1
-                            failed_rows.append({'row': i, 'admission_no': admission_no, 'name': str(row[1]) if len(row) > 1 else '', 'reason': 'Unknown admission'})
+                            ingest.reject(i, 'Unknown admission', admission_no=admission_no, name=str(row[1]) if len(row) > 1 else '')
                             continue
                         else:
                             matched_by_adm += 1
@@ -2338,77 +1780,39 @@ def upload_grades(request, teacher_id):
                         student_name = str(row[0]).strip().lower()
                         # If multiple students share this normalized name, mark as ambiguous
                         if name_counts.get(student_name, 0) > 1:
-                            error_msgs.append(f"Error on row {i}: Student name '{row[0]}' is duplicated in this class. Please use Admission No.")
-                            unknown_count += 1
-                            failed_rows.append({'row': i, 'admission_no': '', 'name': str(row[0]), 'reason': 'Ambiguous duplicate name'})
+                            ingest.reject(i, 'Ambiguous duplicate name', admission_no='', name=str(row[0]))
                             continue
                         student = student_map.get(student_name)
                         if not student:
-                            error_msgs.append(f"Error on row {i}: Student '{row[0]}' not found in this class.")
-                            unknown_count += 1
-                            failed_rows.append({'row': i, 'admission_no': '', 'name': str(row[0]), 'reason': 'Unknown name'})
+                            ingest.reject(i, 'Unknown name', admission_no='', name=str(row[0]))
                             continue
                         else:
                             matched_by_name += 1
 
-                    try:
-                        if score_cell in (None, ''):
-                            error_msgs.append(f"Error on row {i}: No score provided.")
-                            invalid_score_count += 1
-                            failed_rows.append({'row': i, 'admission_no': admission_no or '', 'name': str(row[0]), 'reason': 'No score'})
-                            continue
-                        score_float = float(score_cell)
-                        # Enforce grading scheme max limit if configured for this subject
-                        try:
-                            scheme = SubjectGradingScheme.objects.filter(subject=subject).first()
-                            if scheme and isinstance(getattr(scheme, 'grade_boundaries', None), dict) and scheme.grade_boundaries:
-                                max_allowed = None
-                                for bounds in scheme.grade_boundaries.values():
-                                    try:
-                                        # bounds expected as [min, max]
-                                        if bounds and len(bounds) >= 2:
-                                            bmax = float(bounds[1])
-                                            max_allowed = bmax if max_allowed is None else max(max_allowed, bmax)
-                                    except Exception:
-                                        continue
-                                if max_allowed is not None and score_float > max_allowed:
-                                    error_msgs.append(f"Error on row {i}: Score {score_float} exceeds the allowed maximum ({max_allowed}) for this subject's grading scheme.")
-                                    over_cap_count += 1
-                                    failed_rows.append({'row': i, 'admission_no': admission_no or '', 'name': str(row[0]), 'reason': f'above cap ({max_allowed})', 'score': score_float})
-                                    continue
-                        except Exception:
-                            # Fail open if scheme parsing fails; still save
-                            pass
-                        grade_letter, remarks = 'F', 'NEEDS IMPROVEMENT'
-                        if 80 <= score_float <= 100:
-                            grade_letter, remarks = 'A', 'EXCELLENT'
-                        elif 60 <= score_float < 80:
-                            grade_letter, remarks = 'B', 'VERY GOOD'
-                        elif 40 <= score_float < 60:
-                            grade_letter, remarks = 'C', 'GOOD'
-                        elif 20 <= score_float < 40:
-                            grade_letter, remarks = 'D', 'AVERAGE'
-
-                        Grade.objects.update_or_create(
-                            student=student,
-                            exam=exam,
-                            subject=subject,
-                            defaults={'score': score_float, 'grade_letter': grade_letter, 'remarks': remarks}
-                        )
-                        saved_count += 1
-                    except (ValueError, TypeError):
-                        error_msgs.append(f"Error on row {i}: Invalid score '{score_cell}' for student '{row[0]}'. Please enter a number.")
-                        invalid_score_count += 1
-                        failed_rows.append({'row': i, 'admission_no': admission_no or '', 'name': str(row[0]), 'reason': 'Invalid score', 'score': str(score_cell)})
-                        continue
+                    ingest.add(i, student.id, exam.id, subject.id, score_cell, admission_no=admission_no or '', name=str(row[0]))
+
+                # Validate, letter and save every matched row in one transaction
+                report = ingest.commit()
+                saved_count = report.saved
+                failed_rows = [
+                    {k: r.get(k, '') for k in ('row', 'admission_no', 'name', 'reason', 'score')}
+                    for r in report.failed
+                ]
+                unknown_count = sum(1 for r in failed_rows if r['reason'].startswith(('Unknown', 'Ambiguous')))
+                over_cap_count = sum(1 for r in failed_rows if r['reason'].startswith('above cap'))
+                invalid_score_count = len(failed_rows) - unknown_count - over_cap_count
+                error_msgs = [f"Error on row {r['row']}: {r['reason']} ({r['admission_no'] or r['name']})." for r in failed_rows]
 
                 # High-level processing logs
                 if total_rows > 0:
                     log_msgs.append(f"Collected {total_rows} row(s) from sheet.")
                 log_msgs.append(f"Matched by admission: {matched_by_adm}; matched by name: {matched_by_name}.")
-                log_msgs.append(f"Updating grades: saved {saved_count} record(s).")
+                log_msgs.append(
+                    f"Updating grades: saved {saved_count} record(s) "
+                    f"({report.counts['created']} new, {report.counts['updated']} changed, {report.counts['unchanged']} unchanged)."
+                )
                 messages.success(request, 'Grades have been uploaded and processed.')
-                failed_total = unknown_count + invalid_score_count + over_cap_count
+                failed_total = len(failed_rows)
                 messages.info(
                     request,
                     f"Upload summary: processed {total_rows} row(s); saved {saved_count}; failed {failed_total} (unknown students: {unknown_count}, invalid scores: {invalid_score_count}, above cap: {over_cap_count})."
@@ -2581,6 +1985,10 @@ def student_dashboard(request):
     # Optionally, you can add more context data here for performance, fees, notifications, etc.
     return render(request, 'dashboards/student_dashboard.html', {})
 
+# Upcoming events listed on the teacher dashboard
+UPCOMING_EVENTS_LIMIT = 10
+
+
 @login_required(login_url='login')
 def teacher_dashboard(request, teacher_id):
     teacher = get_object_or_404(Teacher.objects.select_related('user'), id=teacher_id)
@@ -2590,67 +1998,28 @@ def teacher_dashboard(request, teacher_id):
         from django.http import HttpResponseForbidden
         return HttpResponseForbidden('You are not allowed to view this dashboard.')
 
-    # Get all classes where the teacher teaches (via TeacherClassAssignment) or is class_teacher
-    assignments = TeacherClassAssignment.objects.filter(teacher=teacher).select_related('class_group', 'subject')
-    assigned_classes = set()
-    assigned_class_ids = set()
-    # Prepare class_cards for dashboard cards (one per class+subject assignment)
-    class_cards = []
-    notifications = []
     greeting_name = f"Mr. {teacher.user.last_name}" if teacher.user.last_name else teacher.user.get_full_name() or teacher.user.username
     teacher_subjects = list(teacher.subjects.values_list('name', flat=True))
-    # We'll collect classes from both assignments and class_teacher role, avoiding duplicates
-    for assign in assignments:
-        assigned_classes.add(assign.class_group)
-        assigned_class_ids.add(assign.class_group.id)
-        class_cards.append({
-            'class': assign.class_group,
-            'subject': assign.subject,
-        })
-    teacher_classes = list(assigned_classes)
-    # Example: get upcoming deadlines (dummy)
-    upcoming_deadlines = Deadline.objects.filter(teacher=teacher).order_by('due_date')[:5]
-    from .models import TeacherResponsibility
-    responsibilities = TeacherResponsibility.objects.filter(teacher=teacher).order_by('-assigned_at')
-
-    # Ensure show_expired is defined if referenced in context/templates
-    show_expired = request.GET.get('show_expired') == '1'
+    notifications = []
 
-    # Now add classes where teacher is class_teacher but not in TeacherClassAssignment
-    from .models import Class
-    extra_classes = Class.objects.filter(class_teacher=teacher).exclude(id__in=assigned_class_ids)
-    for class_obj in extra_classes:
-        students = Student.objects.filter(class_group=class_obj)
-        student_count = students.count()
-        class_cards.append({
-            'class': class_obj,
-            'subject': None,
-            'is_class_teacher': True,
-            'student_count': student_count,
-            'avg_score': None,
-            'exams_marked': 0,
-            'total_exams': 0,
-            'low_performers': 0,
-        })
+    # One card per class+subject assignment plus classes the teacher only class-teaches, with grade metrics
+    class_cards = teacher_dashboard_service.class_cards(teacher)
     # teacher_classes for summary panel: all unique class names
-    # Earlier we append cards with key 'class'; ensure we reference it safely.
-    teacher_classes = list({
-        (c.get('class') or c.get('class_group')).name
-        for c in class_cards
-        if (c.get('class') or c.get('class_group')) is not None
-    })
+    teacher_classes = list({c['class'].name for c in class_cards})
+
+    show_expired = request.GET.get('show_expired') == '1'
 
-    # Fetch upcoming events (deadlines)
+    # Nearest upcoming events, with days_remaining for the countdown badges
     from django.utils import timezone
     now = timezone.now()
-    upcoming_deadlines = Event.objects.filter(is_done=False, start__gte=now).order_by('start')
-
-    # Add days_remaining to each event for countdown
+    upcoming_deadlines = list(
+        Event.objects.filter(is_done=False, start__gte=now)
+        .only('id', 'title', 'start').order_by('start')[:UPCOMING_EVENTS_LIMIT]
+    )
     for event in upcoming_deadlines:
         delta = event.start - now
         event.days_remaining = delta.days + (1 if delta.seconds > 0 else 0)
 
-    # Fetch assigned responsibilities for this teacher
     from .models import TeacherResponsibility
     responsibilities = TeacherResponsibility.objects.filter(teacher=teacher).order_by('-assigned_at')
 
@@ -2932,29 +2301,25 @@ def take_attendance(request, teacher_id, class_id, subject_id):
     subject = get_object_or_404(Subject, id=subject_id)
     students = Student.objects.filter(class_group=class_group).order_by('user__last_name', 'user__first_name')
     
-    # Use today's date for attendance
-    today = timezone.now().date()
+    # Use today's date for attendance, keyed to the lesson running now (if timetabled)
+    today = timezone.localdate()
+    period = attendance_service.current_period(class_group, subject)
 
     if request.method == 'POST':
-        for student in students:
-            status = request.POST.get(f'status_{student.id}')
-            if status:
-                Attendance.objects.update_or_create(
-                    student=student,
-                    subject=subject,
-                    date=today,
-                    defaults={
-                        'teacher': teacher,
-                        'class_group': class_group,
-                        'status': status
-                    }
-                )
+        statuses = {
+            key[len('status_'):]: value
+            for key, value in request.POST.items()
+            if key.startswith('status_') and value
+        }
+        attendance_service.record_register(teacher, class_group, subject, statuses, date=today, period=period)
         messages.success(request, f"Attendance for {class_group.name} - {subject.name} has been saved.")
         return redirect('manage_attendance', teacher_id=teacher.id)
 
     # Get existing attendance records for today to pre-fill the form
     existing_attendance = Attendance.objects.filter(class_group=class_group, subject=subject, date=today)
-    attendance_map = {att.student_id: att.status for att in existing_attendance}
+    if period is not None:
+        existing_attendance = existing_attendance.filter(period=period)
+    attendance_map = dict(existing_attendance.values_list('student_id', 'status'))
 
     context = {
         'teacher': teacher,
@@ -2963,10 +2328,82 @@ def take_attendance(request, teacher_id, class_id, subject_id):
         'students': students,
         'attendance_map': attendance_map,
         'today': today,
+        'period': period,
     }
     return render(request, 'dashboards/take_attendance.html', context)
 
 
+@login_required(login_url='login')
+@require_POST
+def api_attendance_register(request):
+    """Save a whole register in one request (tablets).
+
+    JSON body: {"class_id", "subject_id", "records": [{"student_id", "status"}, ...],
+    optional "date" (YYYY-MM-DD, not in the future), "period_id" and, for admins,
+    "teacher_id"}. Teachers may only submit for classes/subjects they are assigned to.
+    The period defaults to the class's current timetable slot.
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    ids = {}
+    for field in ('class_id', 'subject_id', 'period_id', 'teacher_id'):
+        value = data.get(field)
+        if value in (None, '') and field in ('period_id', 'teacher_id'):
+            ids[field] = None
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).isdigit():
+            return JsonResponse({'error': f'Invalid {field}'}, status=400)
+        ids[field] = int(value)
+    class_group = get_object_or_404(Class, id=ids['class_id'])
+    subject = get_object_or_404(Subject, id=ids['subject_id'])
+
+    user = request.user
+    if getattr(user, 'role', None) == 'admin' and ids['teacher_id']:
+        teacher = get_object_or_404(Teacher, id=ids['teacher_id'])
+    else:
+        teacher = Teacher.objects.filter(user=user).first()
+        if teacher is None:
+            return JsonResponse({'error': 'Only teachers can submit attendance'}, status=403)
+        if not TeacherClassAssignment.objects.filter(teacher=teacher, class_group=class_group, subject=subject).exists():
+            return JsonResponse({'error': 'You are not assigned to this class/subject.'}, status=403)
+
+    date = timezone.localdate()
+    if data.get('date'):
+        from django.utils.dateparse import parse_date
+        try:
+            date = parse_date(str(data['date']))
+        except ValueError:
+            date = None
+        if date is None:
+            return JsonResponse({'error': 'Invalid date'}, status=400)
+        if date > timezone.localdate():
+            return JsonResponse({'error': 'Attendance cannot be recorded for a future date'}, status=400)
+    if ids['period_id']:
+        period = get_object_or_404(PeriodSlot, id=ids['period_id'])
+    elif date == timezone.localdate():
+        period = attendance_service.current_period(class_group, subject)
+    else:
+        period = None
+
+    records = data.get('records') or []
+    if not isinstance(records, list) or not records:
+        return JsonResponse({'error': 'No attendance records provided'}, status=400)
+    statuses = {}
+    for r in records:
+        if not isinstance(r, dict):
+            continue
+        student_id = r.get('student_id')
+        if isinstance(student_id, bool) or not isinstance(student_id, (int, str)):
+            return JsonResponse({'error': 'Invalid student_id in records'}, status=400)
+        statuses[student_id] = r.get('status')
+    report = attendance_service.record_register(teacher, class_group, subject, statuses, date=date, period=period)
+    return JsonResponse({'success': True, 'date': date.isoformat(), **report})
+
+
 @login_required(login_url='login')
 def manage_grades(request, teacher_id):
     teacher = get_object_or_404(Teacher, id=teacher_id)
@@ -3076,46 +2513,20 @@ def input_grades(request, teacher_id, class_id, subject_id, exam_id):
         return redirect('exam_results', teacher_id=teacher.id, class_id=class_group.id, subject_id=subject.id, exam_id=exam.id)
 
     if request.method == 'POST':
-        students = Student.objects.filter(class_group=class_group)
-        # Fetch grading scheme for this subject
-        grading_scheme = getattr(subject, 'grading_scheme', None)
-        max_score = 100  # Default max if no scheme
-        if grading_scheme and grading_scheme.grade_boundaries:
-            # Find the highest max value among all grade boundaries
-            try:
-                max_score = max(v[1] for v in grading_scheme.grade_boundaries.values())
-            except Exception:
-                max_score = 100
-        any_error = False
+        students = Student.objects.filter(class_group=class_group).select_related('user')
+        # Cap comes from the subject's grading scheme (100 when it has none)
+        ingest = GradeIngest()
         for student in students:
             score_str = request.POST.get(f'score_{student.id}')
             if score_str and score_str.strip():
-                try:
-                    score = float(score_str)
-                    if score > max_score:
-                        messages.error(request, f"Score for {student.user.get_full_name()} exceeds the maximum allowed ({max_score}) for this subject.")
-                        any_error = True
-                        continue
-                    grade_letter, remarks = 'F', 'NEEDS IMPROVEMENT'
-                    if 80 <= score <= 100:
-                        grade_letter, remarks = 'A', 'EXCELLENT'
-                    elif 60 <= score < 80:
-                        grade_letter, remarks = 'B', 'VERY GOOD'
-                    elif 40 <= score < 60:
-                        grade_letter, remarks = 'C', 'GOOD'
-                    elif 20 <= score < 40:
-                        grade_letter, remarks = 'D', 'AVERAGE'
-
-                    Grade.objects.update_or_create(
-                        student=student,
-                        exam=exam,
-                        subject=subject,
-                        defaults={'score': score, 'grade_letter': grade_letter, 'remarks': remarks}
-                    )
-                except (ValueError, TypeError):
-                    messages.error(request, f"Invalid score for student {student.id}. Please enter a number.")
-                    any_error = True
-                    continue
+                ingest.add(None, student.id, exam.id, subject.id, score_str, name=student.user.get_full_name() if student.user else str(student.id))
+        report = ingest.commit()
+        any_error = not report.ok
+        for r in report.failed:
+            if r['reason'].startswith('above cap'):
+                messages.error(request, f"Score for {r['name']} exceeds the maximum allowed ({r['max_score']}) for this subject.")
+            else:
+                messages.error(request, f"Invalid score for {r['name']}. Please enter a number.")
         if not any_error:
             messages.success(request, 'Grades saved successfully!')
             return redirect('exam_results', teacher_id=teacher.id, class_id=class_group.id, subject_id=subject.id, exam_id=exam.id)
@@ -3159,6 +2570,13 @@ def publish_exam_results(request, exam_id):
         exam.results_published = True
         exam.published_at = timezone.now()
         exam.save(update_fields=['results_published', 'published_at'])
+        # Stored letters follow the current grading schemes once results go out
+        try:
+            if regrade_exam(exam.id):
+                invalidate_exam(exam.id)
+        except Exception as e:
+            import logging
+            logging.getLogger(__name__).warning('Regrading exam %s on publish failed: %s', exam.id, e)
         # Queue background notifications and return fast with a job id
         try:
             from .models import NotificationJob
@@ -3241,7 +2659,7 @@ def download_result_slip_signed(request, token):
             term.academic_year.year if getattr(term, 'academic_year', None) else '',
         ])
     filename = f"result_slip_{s.admission_no or s.id}.pdf"
-    return pdf_response_from_rows(filename, 'Result Slip', _site_header_rows(), columns, rows)
+    return pdf_response_from_rows(filename, 'Result Slip', _site_header_rows(), columns, rows, user=request.user)
 
 @login_required(login_url='login')
 def unpublish_exam_results(request, exam_id):
@@ -3395,19 +2813,11 @@ def timetable_view(request):
     from django.utils import timezone
     now = timezone.now()
 
-    total_students = Student.objects.filter(graduated=False).count()
-    students_boys = Student.objects.filter(graduated=False, gender__iexact='male').count()
-    students_girls = Student.objects.filter(graduated=False, gender__iexact='female').count()
-    total_teachers = Teacher.objects.count()
-    teachers_male = Teacher.objects.filter(gender__iexact='male').count()
-    teachers_female = Teacher.objects.filter(gender__iexact='female').count()
-    total_classes = Class.objects.count()
-    total_subjects = Subject.objects.count()
-    total_fees = FeeCategory.objects.count()
+    stats = dashboard_stats.headcounts()
 
     # Current term
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
 
     # Upcoming events (next 5, not done, starting today or later)
     upcoming_events = Event.objects.filter(is_done=False, start__gte=now).order_by('start')[:5]
@@ -3416,15 +2826,7 @@ def timetable_view(request):
     responsibilities = TeacherResponsibility.objects.select_related('teacher', 'teacher__user', 'assigned_by').order_by('-assigned_at')[:8]
 
     context = {
-        'total_students': total_students,
-        'students_boys': students_boys,
-        'students_girls': students_girls,
-        'total_teachers': total_teachers,
-        'teachers_male': teachers_male,
-        'teachers_female': teachers_female,
-        'total_classes': total_classes,
-        'total_subjects': total_subjects,
-        'total_fees': total_fees,
+        **stats,
         'current_term': current_term,
         'upcoming_events': upcoming_events,
         'responsibilities': responsibilities,
@@ -3530,12 +2932,7 @@ def admin_students(request):
     students = Student.objects.select_related('user', 'class_group').all()
     search_query = request.GET.get('search', '').strip()
     if search_query:
-        students = students.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(user__email__icontains=search_query) |
-            Q(admission_no__icontains=search_query)
-        )
+        students = student_search.filter_queryset(students, search_query)
     # Extra filters
     gender = request.GET.get('gender', '').strip()
     class_id = request.GET.get('class_id', '').strip()
@@ -3616,7 +3013,7 @@ def admin_students(request):
         'students': students,
         'add_student_form': add_student_form,
         'classes': Class.objects.all().order_by('name'),
-        'site_settings': SiteSettings.objects.first(),
+        'site_settings': get_site_settings(),
     }
     return render(request, 'dashboards/admin_students.html', context)
 
@@ -3804,12 +3201,7 @@ def admin_graduated_students(request):
     # Base queryset: graduated students only
     students = Student.objects.filter(graduated=True).select_related('user', 'class_group')
     if q:
-        students = students.filter(
-            Q(user__first_name__icontains=q) |
-            Q(user__last_name__icontains=q) |
-            Q(user__username__icontains=q) |
-            Q(admission_no__icontains=q)
-        )
+        students = student_search.filter_queryset(students, q)
     if gender:
         students = students.filter(gender__iexact=gender)
     students = students.order_by('user__last_name', 'user__first_name')
@@ -3839,7 +3231,7 @@ def class_profile(request, class_id):
     from .models import Exam
     level_students = Student.objects.filter(class_group__level=class_obj.level)
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
     level_scores = []
     if current_term:
         for s in level_students:
@@ -4000,6 +3392,30 @@ def timetable_view(request):
 from .models import AcademicYear, Term
 from django.views.decorators.csrf import csrf_protect
 
+def _level_comparison(matrix, level):
+    """Peer-class averages and the level-wide student ranking, read from a result matrix.
+
+    Students are ranked by the mean of all their marks for the exam (highest
+    first), the average this table has always shown.
+    """
+    peer_classes = list(Class.objects.filter(level=level))
+    comparison_classes = [c.name for c in peer_classes]
+    class_comparison_averages = {c.name: matrix.class_averages.get(c.id, 0) for c in peer_classes}
+    level_students = sorted(
+        Student.objects.filter(class_group__level=level).select_related('user', 'class_group'),
+        key=lambda s: (-matrix.mean_scores.get(s.id, 0), s.id),
+    )
+    overall_students_ranked = [
+        {
+            'rank': idx,
+            'student': s,
+            'class_name': s.class_group.name if s.class_group else '',
+            'average': matrix.mean_scores.get(s.id, 0),
+        }
+        for idx, s in enumerate(level_students, 1)
+    ]
+    return comparison_classes, class_comparison_averages, overall_students_ranked
+
 @login_required(login_url='login')
 def admin_class_result_slip(request, class_id):
     if request.user.role != 'admin':
@@ -4037,85 +3453,21 @@ def admin_class_result_slip(request, class_id):
             # Prefer latest done exam
             selected_exam = exams.order_by('-start_date').first()
         if selected_exam:
-            # Build grades dict: grades[student.id][subject.id] = {'score': ..., 'grade_letter': ...}
-            grades = {s.id: {} for s in students}
-            grade_qs = Grade.objects.filter(student__in=students, exam=selected_exam)
-            from .models import SubjectGradingScheme, SubjectComponent
-            grading_schemes = {s.id: getattr(s, 'grading_scheme', None) for s in Subject.objects.all()}
-            for g in grade_qs:
-                scheme = grading_schemes.get(g.subject.id)
-                grade_letter = None
-                if scheme:
-                    grade_letter = scheme.get_grade_letter(g.score)
-                grades[g.student.id][g.subject.id] = {'score': g.score, 'grade_letter': grade_letter, 'remarks': getattr(g, 'remarks', '')}
-            # Compute composite subject scores (e.g., English = Language + Composition)
-            parent_components = {}
-            for sc in SubjectComponent.objects.select_related('parent', 'child').all():
-                parent_components.setdefault(sc.parent_id, []).append((sc.child_id, sc.weight))
-            for s in students:
-                for parent_id, comps in parent_components.items():
-                    total = 0.0
-                    has_any = False
-                    for child_id, weight in comps:
-                        child_entry = grades[s.id].get(child_id)
-                        if child_entry and child_entry.get('score') is not None:
-                            total += float(child_entry['score']) * float(weight)
-                            has_any = True
-                    if has_any:
-                        scheme = grading_schemes.get(parent_id)
-                        grade_letter = scheme.get_grade_letter(total) if scheme else None
-                        grades[s.id][parent_id] = {'score': total, 'grade_letter': grade_letter, 'remarks': ''}
-            # Compute totals, averages (optional), points, and ranks based on top-level subjects only
-            top_ids = set(subj.id for subj in subjects)
-            letter_points = {'A': 4, 'B': 3, 'C': 2, 'D': 1}
-            for s in students:
-                subj_scores = [v['score'] for sid, v in grades[s.id].items() if (sid in top_ids) and v.get('score') is not None]
-                totals[s.id] = sum(subj_scores) if subj_scores else 0
-                averages[s.id] = (totals[s.id] / len(subj_scores)) if subj_scores else 0
-                # Compute total points from grade letters for top-level subjects
-                letters = [v.get('grade_letter') for sid, v in grades[s.id].items() if sid in top_ids and v.get('grade_letter')]
-                total_pts = 0
-                for lt in letters:
-                    key = str(lt).upper()[:1]
-                    total_pts += letter_points.get(key, 0)
-                points_sums[s.id] = total_pts
-            # Rank students by totals (not averages)
-            sorted_students = sorted(students, key=lambda s: totals.get(s.id, 0), reverse=True)
-            for idx, s in enumerate(sorted_students, 1):
-                ranks[s.id] = idx
+            # Grades, totals, points and ranks come from the precomputed (exam, level) matrix
+            matrix = get_result_matrix(selected_exam, class_obj.level)
+            grades = matrix.grades
+            totals = {s.id: matrix.totals.get(s.id, 0) for s in students}
+            averages = {s.id: matrix.averages.get(s.id, 0) for s in students}
+            points_sums = {s.id: matrix.points.get(s.id, 0) for s in students}
+            ranks = {s.id: matrix.class_ranks.get(s.id, 9999) for s in students}
             # Sort students by rank before passing to template
             students = sorted(students, key=lambda s: ranks.get(s.id, 9999))
-    # --- Class-level comparison ---
+    # --- Class-level comparison and overall ranking across all classes at this level ---
     comparison_classes = []
     class_comparison_averages = {}
-    if selected_exam and class_obj.level:
-        peer_classes = Class.objects.filter(level=class_obj.level)
-        for peer_class in peer_classes:
-            peer_students = Student.objects.filter(class_group=peer_class)
-            peer_grades = Grade.objects.filter(student__in=peer_students, exam=selected_exam)
-            peer_scores = [g.score for g in peer_grades if g.score is not None]
-            avg_score = sum(peer_scores) / len(peer_scores) if peer_scores else 0
-            class_comparison_averages[peer_class.name] = avg_score
-            comparison_classes.append(peer_class.name)
-    # --- Overall student ranking across all classes at this level ---
     overall_students_ranked = []
     if selected_exam and class_obj.level:
-        all_level_classes = Class.objects.filter(level=class_obj.level)
-        all_level_students = Student.objects.filter(class_group__in=all_level_classes).select_related('user', 'class_group')
-        student_averages = {}
-        for s in all_level_students:
-            grades_qs = Grade.objects.filter(student=s, exam=selected_exam)
-            scores = [g.score for g in grades_qs if g.score is not None]
-            avg = sum(scores) / len(scores) if scores else 0
-            student_averages[s.id] = avg
-        ranked_students = sorted(all_level_students, key=lambda s: student_averages.get(s.id, 0), reverse=True)
-        for idx, s in enumerate(ranked_students, 1):
-            overall_students_ranked.append({
-                'rank': idx,
-                'student': s,
-                'class_name': s.class_group.name if s.class_group else '',
-                'average': student_averages.get(s.id, 0)
-            })
+        comparison_classes, class_comparison_averages, overall_students_ranked = _level_comparison(matrix, class_obj.level)
     class_performance = [
         {'name': cname, 'average': class_comparison_averages.get(cname, 0)}
         for cname in comparison_classes
@@ -4205,73 +3557,19 @@ def admin_block_result_slip(request):
                 Student.objects.filter(class_group__in=classes)
                 .select_related('user', 'class_group')
             )
-            # Build grades dict: grades[student.id][subject.id] = {score, grade_letter}
-            grades = {s.id: {} for s in all_students}
-            grade_qs = Grade.objects.filter(student__in=all_students, exam=selected_exam)
-            for g in grade_qs:
-                # Many schemas store grade letter on Grade model already; if not present, leave None
-                grade_letter = getattr(g, 'grade_letter', None)
-                grades[g.student_id][g.subject_id] = {'score': g.score, 'grade_letter': grade_letter}
-            # Aggregate composite (parent) subjects from their child components if direct grade missing
-            # Preload components per parent
-            parent_components = {
-                p.id: list(SubjectComponent.objects.filter(parent=p).select_related('child'))
-                for p in subjects
-            }
-            # Preload grading schemes for parents
-            grading_by_parent = {
-                sg.subject_id: sg for sg in SubjectGradingScheme.objects.filter(subject__in=subjects)
-            }
-            for s in all_students:
-                for parent in subjects:
-                    # Skip if we already have a direct grade for the parent
-                    if grades.get(s.id, {}).get(parent.id):
-                        continue
-                    comps = parent_components.get(parent.id, [])
-                    if not comps:
-                        continue
-                    total = 0.0
-                    have_any = False
-                    for sc in comps:
-                        child_val = grades.get(s.id, {}).get(sc.child_id)
-                        if child_val and child_val.get('score') is not None:
-                            have_any = True
-                            w = sc.weight if sc.weight is not None else 1.0
-                            total += float(child_val['score']) * float(w)
-                    if have_any:
-                        # Derive grade letter from parent's grading scheme if available
-                        letter = None
-                        sg = grading_by_parent.get(parent.id)
-                        if sg:
-                            try:
-                                letter = sg.get_grade_letter(total)
-                            except Exception:
-                                letter = None
-                        grades[s.id][parent.id] = {'score': total, 'grade_letter': letter}
-            # Compute totals and averages per student using top-level subjects only
-            for s in all_students:
-                top_ids = set(subj.id for subj in subjects)
-                subj_scores = [val['score'] for sid, val in grades[s.id].items() if sid in top_ids and val.get('score') is not None]
-                totals[s.id] = sum(subj_scores) if subj_scores else 0
-                averages[s.id] = (totals[s.id] / len(subj_scores)) if subj_scores else 0
-            # Compute total points per student from grade letters (A=4, B=3, C=2, D=1)
-            letter_points = {'A': 4, 'B': 3, 'C': 2, 'D': 1}
-            for s in all_students:
-                top_ids = set(subj.id for subj in subjects)
-                letters = [val.get('grade_letter') for sid, val in grades[s.id].items() if sid in top_ids and val.get('grade_letter')]
-                total_pts = 0
-                for lt in letters:
-                    key = str(lt).upper()[:1]
-                    total_pts += letter_points.get(key, 0)
-                points_dict[s.id] = total_pts
+            # Grades, totals, averages, points and level ranks from the precomputed matrix
+            matrix = get_result_matrix(selected_exam, level)
+            grades = matrix.grades
+            totals = matrix.totals
+            averages = matrix.averages
+            points_dict = matrix.points
             # Compute balances similar to admin_fees view, but in bulk to avoid per-student queries
             all_fee_categories = list(FeeCategory.objects.all())
             if selected_term:
-                previous_terms = Term.objects.filter(start_date__lt=selected_term.start_date).order_by('start_date')
-                last_term = previous_terms.last() if previous_terms.exists() else None
+                previous_terms = academic_calendar.terms_before(selected_term)
             else:
-                previous_terms = Term.objects.all().order_by('start_date')
-                last_term = previous_terms.last() if previous_terms.exists() else None
+                previous_terms = academic_calendar.all_terms()
+            last_term = previous_terms[-1] if previous_terms else None
 
             # Pre-aggregate amounts to cut N+1 queries
             student_ids = list(all_students.values_list('id', flat=True))
@@ -4300,7 +3598,7 @@ def admin_block_result_slip(request):
             # Previous terms billed per class
             billed_prev_by_class = {}
             paid_prev_by_student = {}
-            if previous_terms.exists():
+            if previous_terms:
                 billed_prev_by_class = {
                     row['class_group_id']: float(row['total'] or 0)
                     for row in (
@@ -4323,7 +3621,7 @@ def admin_block_result_slip(request):
             # Optional last term extra outstanding component
             last_billed_by_class = {}
             last_paid_by_student = {}
-            if last_term and not previous_terms.filter(pk=last_term.pk).exists():
+            if last_term and last_term not in previous_terms:
                 last_billed_by_class = {
                     row['class_group_id']: float(row['total'] or 0)
                     for row in (
@@ -4348,11 +3646,11 @@ def admin_block_result_slip(request):
                 total_billed = billed_current_by_class.get(getattr(s.class_group, 'id', None), 0.0)
                 paid_total = paid_by_student.get(s.id, 0.0)
                 outstanding = 0.0
-                if previous_terms.exists():
+                if previous_terms:
                     prev_billed = billed_prev_by_class.get(getattr(s.class_group, 'id', None), 0.0)
                     prev_paid = paid_prev_by_student.get(s.id, 0.0)
                     outstanding += (prev_billed - prev_paid)
-                if last_term and not previous_terms.filter(pk=last_term.pk).exists():
+                if last_term and last_term not in previous_terms:
                     last_billed = last_billed_by_class.get(getattr(s.class_group, 'id', None), 0.0)
                     last_paid = last_paid_by_student.get(s.id, 0.0)
                     outstanding += (last_billed - last_paid)
@@ -4461,7 +3759,9 @@ def teacher_class_result_slip(request, class_id):
     selected_exam = None
     grades = {}
     averages = {}
+    totals = {}
     ranks = {}
+    points_sums = {}
     if terms:
         # Get selected term from GET or default to latest
         term_id = request.GET.get('term')
@@ -4480,53 +3780,22 @@ def teacher_class_result_slip(request, class_id):
         if not selected_exam:
             selected_exam = exams.order_by('-start_date').first()
         if selected_exam:
-            # Build grades dict: grades[student.id][subject.id] = Grade instance
-            all_level_classes = Class.objects.filter(level=class_obj.level)
-            all_level_students = Student.objects.filter(class_group__in=all_level_classes).select_related('user', 'class_group')
-            grades = {s.id: {} for s in all_level_students}
-            grade_qs = Grade.objects.filter(student__in=all_level_students, exam=selected_exam)
-            for g in grade_qs:
-                grades[g.student.id][g.subject.id] = g
-            # Compute averages and ranks
-            for s in students:
-                subj_scores = [g.score for g in grades[s.id].values() if hasattr(g, 'score') and g.score is not None]
-                averages[s.id] = sum(subj_scores) / len(subj_scores) if subj_scores else 0
-            sorted_students = sorted(students, key=lambda s: averages[s.id], reverse=True)
-            for idx, s in enumerate(sorted_students, 1):
-                ranks[s.id] = idx
+            # Level-wide grades and ranks come from the precomputed (exam, level) matrix
+            matrix = get_result_matrix(selected_exam, class_obj.level)
+            grades = matrix.grades
+            totals = {s.id: matrix.totals.get(s.id, 0) for s in students}
+            # The teacher slip averages and ranks over every stored mark (see ResultMatrix.mean_scores)
+            averages = {s.id: matrix.mean_scores.get(s.id, 0) for s in students}
+            points_sums = {s.id: matrix.points.get(s.id, 0) for s in students}
+            ranks = {s.id: matrix.mean_class_ranks.get(s.id, 9999) for s in students}
             # Sort students by rank before passing to template
             students = sorted(students, key=lambda s: ranks.get(s.id, 9999))
-    # --- Class-level comparison ---
+    # --- Class-level comparison and overall ranking across all classes at this level ---
     comparison_classes = []
     class_comparison_averages = {}
-    if selected_exam and class_obj.level:
-        peer_classes = Class.objects.filter(level=class_obj.level)
-        for peer_class in peer_classes:
-            peer_students = Student.objects.filter(class_group=peer_class)
-            peer_grades = Grade.objects.filter(student__in=peer_students, exam=selected_exam)
-            peer_scores = [g.score for g in peer_grades if g.score is not None]
-            avg_score = sum(peer_scores) / len(peer_scores) if peer_scores else 0
-            class_comparison_averages[peer_class.name] = avg_score
-            comparison_classes.append(peer_class.name)
-    # --- Overall student ranking across all classes at this level ---
     overall_students_ranked = []
     if selected_exam and class_obj.level:
-        all_level_classes = Class.objects.filter(level=class_obj.level)
-        all_level_students = Student.objects.filter(class_group__in=all_level_classes).select_related('user', 'class_group')
-        student_averages = {}
-        for s in all_level_students:
-            grades_qs = Grade.objects.filter(student=s, exam=selected_exam)
-            scores = [g.score for g in grades_qs if g.score is not None]
-            avg = sum(scores) / len(scores) if scores else 0
-            student_averages[s.id] = avg
-        ranked_students = sorted(all_level_students, key=lambda s: student_averages.get(s.id, 0), reverse=True)
-        for idx, s in enumerate(ranked_students, 1):
-            overall_students_ranked.append({
-                'rank': idx,
-                'student': s,
-                'class_name': s.class_group.name if s.class_group else '',
-                'average': student_averages.get(s.id, 0)
-            })
+        comparison_classes, class_comparison_averages, overall_students_ranked = _level_comparison(matrix, class_obj.level)
     class_performance = [
         {'name': cname, 'average': class_comparison_averages.get(cname, 0)}
         for cname in comparison_classes
@@ -4541,7 +3810,9 @@ def teacher_class_result_slip(request, class_id):
         'selected_exam': selected_exam,
         'grades': grades,
         'averages': averages,
+        'totals': totals,
         'ranks': ranks,
+        'points_sums': points_sums,
         'comparison_classes': comparison_classes,
         'class_comparison_averages': class_comparison_averages,
         'overall_students_ranked': overall_students_ranked,
@@ -4778,7 +4049,7 @@ class AdminAnalyticsView(ListView):
 
         # --- Analytics calculations ---
         today = timezone.now().date()
-        current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+        current_term = academic_calendar.current_term(today)
         context['current_term'] = current_term
 
         # Average performance per subject (across all grades)
@@ -4929,8 +4200,6 @@ def admin_analytics_data(request):
       fee_category: category id (optional)
       compare_prev: '1' to include previous-term comparison series
     """
-    from collections import defaultdict
-    from datetime import timedelta
     # Filters
     term_id = request.GET.get('term')
     class_id = request.GET.get('class_group')
@@ -4940,299 +4209,11 @@ def admin_analytics_data(request):
     today = timezone.now().date()
     current_term = None
     if term_id:
-        current_term = Term.objects.filter(id=term_id).first()
+        current_term = academic_calendar.get_term(term_id)
     if not current_term:
-        current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
-
-    fa_qs = FeeAssignment.objects.all()
-    if current_term:
-        fa_qs = fa_qs.filter(term=current_term)
-    if class_id:
-        fa_qs = fa_qs.filter(class_group_id=class_id)
-    if category_id:
-        fa_qs = fa_qs.filter(fee_category_id=category_id)
-
-    # Totals assigned
-    total_assigned = 0.0
-    for fa in fa_qs:
-        num_students = Student.objects.filter(class_group=fa.class_group).count()
-        total_assigned += float(getattr(fa, 'amount', 0)) * num_students
-
-    # Payments filtered
-    pay_qs = FeePayment.objects.select_related('student', 'fee_assignment', 'fee_assignment__term', 'fee_assignment__class_group', 'fee_assignment__fee_category')
-    if current_term:
-        pay_qs = pay_qs.filter(fee_assignment__term=current_term)
-    if class_id:
-        pay_qs = pay_qs.filter(fee_assignment__class_group_id=class_id)
-    if category_id:
-        pay_qs = pay_qs.filter(fee_assignment__fee_category_id=category_id)
-
-    total_paid = float(pay_qs.aggregate(total=Sum('amount_paid'))['total'] or 0.0)
-    unpaid_value = max(total_assigned - total_paid, 0.0)
-
-    # Pie: Paid vs Unpaid
-    pie = {
-        'labels': ["Paid", "Unpaid"],
-        'data': [total_paid, unpaid_value],
-    }
-
-    # Payments over time (monthly)
-    monthly_totals = defaultdict(float)
-    for p in pay_qs:
-        if p.payment_date:
-            m = p.payment_date.strftime('%Y-%m')
-            monthly_totals[m] += float(p.amount_paid)
-    months_sorted = sorted(monthly_totals.keys())
-    bar = {
-        'labels': months_sorted,
-        'data': [monthly_totals[m] for m in months_sorted],
-    }
-
-    # Payments by method
-    method_totals = defaultdict(float)
-    for p in pay_qs:
-        method_totals[p.payment_method or 'Unknown'] += float(p.amount_paid)
-    method = {
-        'labels': list(method_totals.keys()) or ['No Data'],
-        'data': [method_totals[k] for k in (list(method_totals.keys()) or ['No Data'])] or [0],
-    }
-
-    # Outstanding by class (Top 10)
-    class_outstanding = []
-    classes = Class.objects.all()
-    if class_id:
-        classes = classes.filter(id=class_id)
-    for c in classes:
-        fa_cls = FeeAssignment.objects.filter(class_group=c)
-        if current_term:
-            fa_cls = fa_cls.filter(term=current_term)
-        if category_id:
-            fa_cls = fa_cls.filter(fee_category_id=category_id)
-        assigned_total = 0.0
-        num_students = Student.objects.filter(class_group=c).count()
-        for fa in fa_cls:
-            assigned_total += float(getattr(fa, 'amount', 0)) * num_students
-        paid_total = FeePayment.objects.filter(fee_assignment__in=fa_cls).aggregate(total=Sum('amount_paid'))['total'] or 0.0
-        outstanding = float(assigned_total) - float(paid_total)
-        if outstanding > 0:
-            class_outstanding.append((c.name, outstanding))
-    class_outstanding.sort(key=lambda t: t[1], reverse=True)
-    class_out = {
-        'labels': [t[0] for t in class_outstanding[:10]] or ['No Data'],
-        'data': [t[1] for t in class_outstanding[:10]] or [0],
-    }
-
-    # Payments by category (current filter scope)
-    cat_totals = defaultdict(float)
-    for p in pay_qs:
-        cat = getattr(getattr(p.fee_assignment, 'fee_category', None), 'name', 'Unknown')
-        cat_totals[cat] += float(p.amount_paid)
-    category = {
-        'labels': list(cat_totals.keys()) or ['No Data'],
-        'data': [cat_totals[k] for k in (list(cat_totals.keys()) or ['No Data'])] or [0],
-    }
-
-    # Daily payments last 14 days
-    start_14 = today - timedelta(days=13)
-    daily_map = defaultdict(float)
-    for p in pay_qs.filter(payment_date__date__gte=start_14, payment_date__date__lte=today):
-        d = p.payment_date.date().isoformat() if p.payment_date else None
-        if d:
-            daily_map[d] += float(p.amount_paid)
-    daily_labels = [(start_14 + timedelta(days=i)).isoformat() for i in range(14)]
-    daily = {
-        'labels': daily_labels,
-        'data': [daily_map[d] for d in daily_labels],
-    }
-
-    # Cumulative for current term
-    cum_labels, cum_paid = [], []
-    if current_term:
-        cur = current_term.start_date
-        per_day = defaultdict(float)
-        for p in pay_qs.filter(payment_date__date__gte=current_term.start_date, payment_date__date__lte=today):
-            k = p.payment_date.date().isoformat() if p.payment_date else None
-            if k:
-                per_day[k] += float(p.amount_paid)
-        total = 0.0
-        while cur <= today:
-            key = cur.isoformat()
-            total += per_day[key]
-            cum_labels.append(key)
-            cum_paid.append(total)
-            cur += timedelta(days=1)
-
-    # Previous term comparison
-    cum_prev = {'labels': [], 'data': []}
-    bar_prev = {'labels': [], 'data': []}
-    if compare_prev and current_term:
-        prev_term = Term.objects.filter(end_date__lt=current_term.start_date).order_by('-end_date').first()
-        if prev_term:
-            pay_prev = FeePayment.objects.filter(fee_assignment__term=prev_term)
-            if class_id:
-                pay_prev = pay_prev.filter(fee_assignment__class_group_id=class_id)
-            if category_id:
-                pay_prev = pay_prev.filter(fee_assignment__fee_category_id=category_id)
-            # monthly
-            m_prev = defaultdict(float)
-            for p in pay_prev:
-                if p.payment_date:
-                    m = p.payment_date.strftime('%Y-%m')
-                    m_prev[m] += float(p.amount_paid)
-            months_prev = sorted(m_prev.keys())
-            bar_prev = {'labels': months_prev, 'data': [m_prev[m] for m in months_prev]}
-            # cumulative over prev term
-            per_day_prev = defaultdict(float)
-            cur = prev_term.start_date
-            end = prev_term.end_date
-            for p in pay_prev.filter(payment_date__date__gte=prev_term.start_date, payment_date__date__lte=prev_term.end_date):
-                k = p.payment_date.date().isoformat() if p.payment_date else None
-                if k:
-                    per_day_prev[k] += float(p.amount_paid)
-            labels_prev, data_prev = [], []
-            running = 0.0
-            while cur <= end:
-                k = cur.isoformat()
-                running += per_day_prev[k]
-                labels_prev.append(k)
-                data_prev.append(running)
-                cur += timedelta(days=1)
-            cum_prev = {'labels': labels_prev, 'data': data_prev}
-
-    # Top debtors in selected class (top 10)
-    top_debtors = []
-    if class_id:
-        cls = Class.objects.filter(id=class_id).first()
-        if cls:
-            students = Student.objects.filter(class_group=cls)
-            # Assigned for each student = sum of assignments for the class (respecting filters)
-            assign_qs = FeeAssignment.objects.filter(class_group=cls)
-            if current_term:
-                assign_qs = assign_qs.filter(term=current_term)
-            if category_id:
-                assign_qs = assign_qs.filter(fee_category_id=category_id)
-            assigned_amount = sum(float(getattr(a, 'amount', 0)) for a in assign_qs)
-            for s in students:
-                paid = FeePayment.objects.filter(student=s, fee_assignment__in=assign_qs).aggregate(total=Sum('amount_paid'))['total'] or 0.0
-                balance = max(assigned_amount - float(paid), 0.0)
-                if balance > 0:
-                    top_debtors.append({
-                        'student': getattr(s.user, 'get_full_name', lambda: s.user.username)() if s.user else s.admission_no,
-                        'admission_no': s.admission_no,
-                        'balance': balance,
-                    })
-            top_debtors.sort(key=lambda x: x['balance'], reverse=True)
-            top_debtors = top_debtors[:10]
-
-    # --- Academic Visualizations ---
-    # Helpers for grading bands and pass threshold
-    def band_from_score(score: float):
-        # Fallback bands if no SubjectGradingScheme is present
-        if score is None:
-            return 'E'
-        if score >= 80:
-            return 'A'
-        if score >= 70:
-            return 'B'
-        if score >= 60:
-            return 'C'
-        if score >= 50:
-            return 'D'
-        return 'E'
-
-    PASS_THRESHOLD = 50.0
-
-    # Resolve current_term again for grades context
-    # subject trend over last 3 terms (top 5 subjects by current-term average)
-    subject_trend = {'labels': [], 'datasets': []}
-    class_avg = {'labels': [], 'data': []}
-    grade_bands = {'labels': ['A', 'B', 'C', 'D', 'E'], 'data': [0, 0, 0, 0, 0]}
-    pass_rate = {'labels': ['Pass', 'Fail'], 'data': [0, 0]}
-
-    # Determine last 3 terms chronologically
-    last_terms = list(Term.objects.order_by('-start_date')[:3])[::-1]
-    term_label_map = {t.id: f"{t.name} {t.academic_year.year}" for t in last_terms}
-    subject_trend['labels'] = [term_label_map[t.id] for t in last_terms]
-
-    # Compute per-subject avg for current term to pick top subjects
-    if current_term:
-        from collections import defaultdict as _dd
-        cur_term_scores = _dd(list)
-        q = Grade.objects.filter(exam__term=current_term)
-        if class_id:
-            q = q.filter(student__class_group_id=class_id)
-        for g in q.select_related('subject'):
-            cur_term_scores[g.subject_id].append(g.score)
-        subj_avgs = []
-        for sid, scores in cur_term_scores.items():
-            if scores:
-                subj_avgs.append((sid, sum(scores) / len(scores)))
-        subj_avgs.sort(key=lambda x: x[1], reverse=True)
-        top_subject_ids = [sid for sid, _ in subj_avgs[:5]]
-        # Build datasets across last terms
-        for sid in top_subject_ids:
-            data_points = []
-            for t in last_terms:
-                q = Grade.objects.filter(exam__term=t, subject_id=sid)
-                if class_id:
-                    q = q.filter(student__class_group_id=class_id)
-                vals = list(q.values_list('score', flat=True))
-                data_points.append(round(sum(vals) / len(vals), 2) if vals else 0)
-            subj_name = Subject.objects.filter(id=sid).values_list('name', flat=True).first() or f"Subject {sid}"
-            subject_trend['datasets'].append({'label': subj_name, 'data': data_points})
-
-    # Class averages comparison within same level for selected class and term
-    if current_term and class_id:
-        cls = Class.objects.filter(id=class_id).first()
-        if cls:
-            level_classes = Class.objects.filter(level=cls.level)
-            for c in level_classes:
-                q = Grade.objects.filter(exam__term=current_term, student__class_group=c)
-                vals = list(q.values_list('score', flat=True))
-                avg = round(sum(vals) / len(vals), 2) if vals else 0
-                class_avg['labels'].append(c.name)
-                class_avg['data'].append(avg)
-
-    # Grade bands and pass rate for selected class & term
-    if current_term and class_id:
-        q = Grade.objects.filter(exam__term=current_term, student__class_group_id=class_id)
-        counts = {'A': 0, 'B': 0, 'C': 0, 'D': 0, 'E': 0}
-        passed = 0
-        failed = 0
-        for g in q:
-            b = g.grade_letter or None
-            if not b:
-                b = band_from_score(g.score)
-            counts[b] = counts.get(b, 0) + 1
-            if (g.score or 0) >= PASS_THRESHOLD:
-                passed += 1
-            else:
-                failed += 1
-        grade_bands['data'] = [counts.get('A', 0), counts.get('B', 0), counts.get('C', 0), counts.get('D', 0), counts.get('E', 0)]
-        pass_rate['data'] = [passed, failed]
+        current_term = academic_calendar.current_term(today)
 
-    return JsonResponse({
-        'pie': pie,
-        'bar': bar,
-        'bar_prev': bar_prev,
-        'method': method,
-        'class_out': class_out,
-        'category': category,
-        'daily': daily,
-        'cum': {'labels': cum_labels, 'data': cum_paid},
-        'cum_prev': cum_prev,
-        # Academic datasets
-        'subject_trend': subject_trend,
-        'class_avg': class_avg,
-        'grade_bands': grade_bands,
-        'pass_rate': pass_rate,
-        'summary': {
-            'total_assigned': total_assigned,
-            'total_paid': total_paid,
-            'payment_percentage': round((total_paid / total_assigned * 100) if total_assigned else 0, 2),
-        },
-        'top_debtors': top_debtors,
-    })
+    return JsonResponse(get_analytics(current_term, class_id, category_id, compare_prev, today))
 
 @login_required(login_url='login')
 def admin_analytics(request):
@@ -5458,35 +4439,26 @@ def teacher_exam_entry(request, teacher_id, class_id, subject_id, exam_id):
                 from django.http import HttpResponseForbidden
                 return HttpResponseForbidden('You are not assigned to this class/subject.')
         
-        # Validate scores
-        for score in scores:
-            try:
-                score = float(score)
-                if score < 0 or score > 100:
-                    messages.error(request, 'Scores must be between 0 and 100')
-                    return redirect('teacher_exam_entry', teacher_id=teacher_id, 
-                                  class_id=class_id, subject_id=subject_id, exam_id=exam_id)
-            except ValueError:
+        # Validate everything first; nothing is saved unless every score is valid
+        ingest = GradeIngest(max_score=100)
+        for student_id, score in zip(student_ids, scores):
+            ingest.add(None, student_id, exam.id, subject.id, score)
+        pending = ingest.validate()
+        if pending.failed:
+            reason = pending.failed[0]['reason']
+            if reason.startswith(('above cap', 'below minimum')):
+                messages.error(request, 'Scores must be between 0 and 100')
+            elif reason in ('Invalid score', 'No score'):
                 messages.error(request, 'Invalid score format')
-                return redirect('teacher_exam_entry', teacher_id=teacher_id, 
-                              class_id=class_id, subject_id=subject_id, exam_id=exam_id)
-
-        # Save scores
-        try:
-            for student_id, score in zip(student_ids, scores):
-                student = Student.objects.get(id=student_id)
-                Grade.objects.update_or_create(
-                    student=student,
-                    exam=exam,
-                    subject=subject,
-                    defaults={'score': score}
-                )
-            messages.success(request, 'Scores saved successfully')
-        except Exception as e:
-            messages.error(request, f'Error saving scores: {str(e)}')
+            else:
+                messages.error(request, f'Error saving scores: {reason}')
             return redirect('teacher_exam_entry', teacher_id=teacher_id, 
                           class_id=class_id, subject_id=subject_id, exam_id=exam_id)
 
+        # Save scores
+        ingest.commit()
+        messages.success(request, 'Scores saved successfully')
+
         return redirect('teacher_exam_entry', teacher_id=teacher_id, 
                        class_id=class_id, subject_id=subject_id, exam_id=exam_id)
 
@@ -5552,26 +4524,45 @@ def upload_marksheet(request):
 
         errors = []
         try:
+            def _cell(value):
+                if isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                return str(value).strip()
+
+            # Resolve students and subjects from in-memory maps (a few queries for the whole sheet)
+            adm_values = set()
+            if 'admission_no' in df.columns:
+                adm_values = {_cell(v) for v in df['admission_no'] if pd.notna(v)}
+            students_by_adm = {s.admission_no: s.id for s in Student.objects.filter(admission_no__in=adm_values).only('id', 'admission_no')}
+            students_by_name = {}
+            if 'student_name' in df.columns:
+                for sid, username, first, last in Student.objects.values_list('id', 'user__username', 'user__first_name', 'user__last_name'):
+                    keys = {(username or '').lower(), f"{first or ''} {last or ''}".strip().lower()}
+                    for key in keys - {''}:
+                        students_by_name.setdefault(key, set()).add(sid)
+            subjects_by_code = {}
+            subjects_by_name = {}
+            for sid, code, name in Subject.objects.values_list('id', 'code', 'name'):
+                subjects_by_code.setdefault((code or '').lower(), set()).add(sid)
+                subjects_by_name.setdefault((name or '').lower(), set()).add(sid)
+            exam_cache = {}
+            ingest = GradeIngest()
+
             for index, row in df.iterrows():
                 try:
                     # Find Student
-                    student = None
+                    student_id = None
                     if 'admission_no' in df.columns and pd.notna(row.get('admission_no')):
-                        student = Student.objects.get(admission_no=row['admission_no'])
+                        student_id = students_by_adm.get(_cell(row['admission_no']))
+                        if student_id is None:
+                            errors.append(f"Row {index+2}: Student with admission number '{_cell(row['admission_no'])}' not found.")
+                            continue
                     elif 'student_name' in df.columns and pd.notna(row.get('student_name')):
                         full_name = str(row['student_name']).strip()
-                        parts = full_name.split(' ', 1)
-                        first_name = parts[0]
-                        last_name = parts[1] if len(parts) > 1 else ''
-                        
-                        user_qs = User.objects.filter(
-                            Q(username__iexact=full_name) |
-                            (Q(first_name__iexact=first_name) & Q(last_name__iexact=last_name))
-                        )
-                        
-                        if user_qs.count() == 1:
-                            student = Student.objects.get(user=user_qs.first())
-                        elif user_qs.count() > 1:
+                        matches = students_by_name.get(full_name.lower(), set())
+                        if len(matches) == 1:
+                            student_id = next(iter(matches))
+                        elif len(matches) > 1:
                             errors.append(f"Row {index+2}: Multiple students found for name '{full_name}'. Use admission number.")
                             continue
                         else:
@@ -5582,38 +4573,43 @@ def upload_marksheet(request):
                         continue
 
                     # Find Subject
-                    subject = None
+                    subject_id = None
                     if 'subject_code' in df.columns and pd.notna(row.get('subject_code')):
-                        subject = Subject.objects.get(code__iexact=str(row['subject_code']).strip())
+                        matches = subjects_by_code.get(str(row['subject_code']).strip().lower(), set())
+                        if len(matches) != 1:
+                            errors.append(f"Row {index+2}: Subject code '{str(row['subject_code']).strip()}' not found.")
+                            continue
+                        subject_id = next(iter(matches))
                     elif 'subject_name' in df.columns and pd.notna(row.get('subject_name')):
                         subject_identifier = str(row['subject_name']).strip()
-                        subject_qs = Subject.objects.filter(
-                            Q(name__iexact=subject_identifier) | Q(code__iexact=subject_identifier)
-                        )
-                        if subject_qs.count() == 1:
-                            subject = subject_qs.first()
+                        matches = subjects_by_name.get(subject_identifier.lower(), set()) | subjects_by_code.get(subject_identifier.lower(), set())
+                        if len(matches) == 1:
+                            subject_id = next(iter(matches))
                         else:
                             errors.append(f"Row {index+2}: Subject '{subject_identifier}' not found or is ambiguous.")
                             continue
                     else:
                         errors.append(f"Row {index+2}: Missing subject identifier.")
                         continue
-                    
-                    # Get or create other objects
-                    academic_year, _ = AcademicYear.objects.get_or_create(year=row['academic_year'])
-                    term, _ = Term.objects.get_or_create(name=row['term'], academic_year=academic_year)
-                    exam, _ = Exam.objects.get_or_create(name=row['exam_name'], term=term, defaults={'date': datetime.date.today()})
 
-                    # Update or create grade
-                    Grade.objects.update_or_create(
-                        student=student,
-                        subject=subject,
-                        exam=exam,
-                        defaults={'score': row['score']}
-                    )
+                    # Get or create other objects (once per distinct exam in the sheet)
+                    exam_key = (row['academic_year'], row['term'], row['exam_name'])
+                    if exam_key not in exam_cache:
+                        academic_year, _ = AcademicYear.objects.get_or_create(year=row['academic_year'])
+                        term, _ = Term.objects.get_or_create(name=row['term'], academic_year=academic_year)
+                        today = datetime.date.today()
+                        exam, _ = Exam.objects.get_or_create(name=row['exam_name'], term=term, defaults={'start_date': today, 'end_date': today})
+                        exam_cache[exam_key] = exam.id
+
+                    ingest.add(index + 2, student_id, exam_cache[exam_key], subject_id, row['score'])
                 except Exception as e:
                     errors.append(f'Row {index+2}: An unexpected error occurred: {e}')
 
+            # Update or create every grade in one transaction
+            report = ingest.commit()
+            for r in report.failed:
+                errors.append(f"Row {r['row']}: {r['reason']} (score '{r.get('score', '')}').")
+
             if errors:
                 for error in errors:
                     messages.error(request, error)
@@ -5793,7 +4789,7 @@ def admin_payment(request):
     from django.contrib import messages
     from .mpesa_utils import initiate_stk_push
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
     students = Student.objects.select_related('user', 'class_group').all().order_by('user__last_name', 'user__first_name')
     selected_student_id = request.GET.get('student_id')
 
@@ -6130,7 +5126,7 @@ def student_fees(request):
         return redirect('login')
 
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
     fee_assignments = FeeAssignment.objects.filter(class_group=student.class_group, term=current_term)
     fee_payments = FeePayment.objects.filter(student=student, fee_assignment__in=fee_assignments)
     success = False
@@ -6199,27 +5195,13 @@ def student_fees(request):
 
     from .forms import StudentContactUpdateForm
     contact_form = StudentContactUpdateForm(instance=student, user_instance=student.user)
-    # Compute total outstanding balance (arrears from previous terms + current term balance)
+    # Total outstanding = running arrears up to the current term from the balance ledger,
+    # less this term's payments still awaiting verification
     total_outstanding = 0
     try:
-        # Current term billed and paid
-        billed_current = fee_assignments.aggregate(total=Sum('amount'))['total'] or 0
-        paid_current = fee_payments.aggregate(total=Sum('amount_paid'))['total'] or 0
-
-        # Previous terms arrears
-        previous_terms = Term.objects.none()
-        if current_term:
-            previous_terms = Term.objects.filter(start_date__lt=current_term.start_date).order_by('start_date')
-        else:
-            previous_terms = Term.objects.all().order_by('start_date')
-
-        prev_assignments = FeeAssignment.objects.filter(class_group=student.class_group, term__in=previous_terms)
-        billed_prev = prev_assignments.aggregate(total=Sum('amount'))['total'] or 0
-        paid_prev = FeePayment.objects.filter(student=student, fee_assignment__term__in=previous_terms).aggregate(total=Sum('amount_paid'))['total'] or 0
-
-        total_outstanding = (billed_prev + billed_current) - (paid_prev + paid_current)
-        if total_outstanding < 0:
-            total_outstanding = 0
+        ledger = fee_ledger.balance_for(student, current_term)
+        if ledger is not None:
+            total_outstanding = max(ledger.arrears - ledger.pending, 0)
     except Exception:
         # Fail-safe: keep zero if any issue occurs
         total_outstanding = 0
@@ -6352,11 +5334,8 @@ def admin_fees(request):
 
             # Compute balance components similar to the page aggregates
             today = timezone.now().date()
-            current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
-            if current_term:
-                previous_terms = Term.objects.filter(start_date__lt=current_term.start_date)
-            else:
-                previous_terms = Term.objects.none()
+            current_term = academic_calendar.current_term(today)
+            previous_terms = academic_calendar.terms_before(current_term) if current_term else []
 
             # Cache billed current for each class in current term
             billed_current_by_class = {}
@@ -6370,7 +5349,7 @@ def admin_fees(request):
 
             # Prev billed by class
             prev_billed_by_class = {}
-            if previous_terms.exists():
+            if previous_terms:
                 for row in (
                     FeeAssignment.objects.filter(term__in=previous_terms)
                     .values('class_group_id')
@@ -6386,7 +5365,7 @@ def admin_fees(request):
                 )
             }
             paid_prev_by_student = {}
-            if previous_terms.exists():
+            if previous_terms:
                 for r in (
                     FeePayment.objects.filter(fee_assignment__term__in=previous_terms)
                     .values('student_id')
@@ -6436,15 +5415,12 @@ def admin_fees(request):
             messages.error(request, 'Please correct the errors in the Optional Charges enrollment form.')
 
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
     all_classes = Class.objects.all()
     all_fee_categories = FeeCategory.objects.all()
 
     # Compute previous terms ONCE
-    if current_term:
-        previous_terms = Term.objects.filter(start_date__lt=current_term.start_date)
-    else:
-        previous_terms = Term.objects.none()
+    previous_terms = academic_calendar.terms_before(current_term) if current_term else []
 
     # Base students queryset (select related to avoid extra queries)
     students_qs = Student.objects.filter(graduated=False).select_related('user', 'class_group')
@@ -6471,7 +5447,7 @@ def admin_fees(request):
 
     # Precompute total billed for all previous terms per class
     prev_billed = {}
-    if previous_terms.exists():
+    if previous_terms:
         for row in (
             FeeAssignment.objects.filter(term__in=previous_terms)
             .values('class_group_id')
@@ -6486,7 +5462,7 @@ def admin_fees(request):
         paid_all_by_student[row['student_id']] = float(row['total'] or 0)
     # Precompute total paid in previous terms per student
     paid_prev_by_student = {}
-    if previous_terms.exists():
+    if previous_terms:
         for row in (
             FeePayment.objects.filter(fee_assignment__term__in=previous_terms)
             .values('student_id')
@@ -6715,9 +5691,28 @@ def admin_users(request):
         'role_choices': role_choices
     })
 
-# API and AJAX placeholders
+def _calendar_response(request, feed):
+    """JSON response for a (body, etag) calendar feed; 304 when the client already has it."""
+    body, etag = feed
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _calendar_window(request):
+    return calendar_feed.Window(request.GET.get('start'), request.GET.get('end'))
+
+
+@login_required(login_url='login')
 def exam_events_api(request):
-    return JsonResponse([], safe=False)
+    """Exam items of the calendar feed, for calendars that only show exams."""
+    return _calendar_response(request, calendar_feed.exam_feed(_calendar_window(request)))
+
+# API and AJAX placeholders
 
 @require_POST
 def add_student_ajax(request):
@@ -6738,125 +5733,13 @@ def add_subject_ajax(request):
 from django.core.serializers.json import DjangoJSONEncoder
 
 def events_json(request):
-    from .models import Event, Exam, TeacherResponsibility, Teacher
-    from django.utils import timezone
-    from django.core.serializers.json import DjangoJSONEncoder
-    from django.utils.dateparse import parse_datetime
-    from datetime import timedelta
-    now = timezone.now()
+    """Events, exams and (for teachers) own responsibilities overlapping FullCalendar's start/end window."""
     if not request.user.is_authenticated or request.user.role not in ['admin', 'teacher']:
         return JsonResponse([], safe=False)
-    # Optional window from FullCalendar (ISO strings)
-    start_param = request.GET.get('start')
-    end_param = request.GET.get('end')
-    try:
-        window_start = parse_datetime(start_param) if start_param else None
-        window_end = parse_datetime(end_param) if end_param else None
-    except Exception:
-        window_start = window_end = None
-
-    # Build base queryset
-    events_qs = Event.objects.filter(is_done=False)
-    if window_start:
-        # Include open-ended events (end is NULL) so they are not excluded
-        from django.db.models import Q
-        events_qs = events_qs.filter(Q(end__gte=window_start) | Q(end__isnull=True))  # overlapping or open-ended
-    if window_end:
-        events_qs = events_qs.filter(start__lte=window_end)
-    # Fallback window ±1 year to avoid empty feed if params missing
-    if not window_start and not window_end:
-        one_year = timedelta(days=365)
-        events_qs = events_qs.filter(start__gte=now - one_year, start__lte=now + one_year)
-    # Ensure start exists
-    events_qs = events_qs.exclude(start__isnull=True).order_by('start')
-    event_list = []
-    for e in events_qs:
-        event_list.append({
-            'id': f'event-{e.id}',
-            'title': e.title,
-            'start': e.start.isoformat(),
-            'end': e.end.isoformat() if e.end else None,
-            'allDay': e.all_day,
-            'category': e.category,
-        })
-    # Exam events (add as allDay events)
-    exams_qs = Exam.objects.select_related('term').all()
-    # Filter exams into the same window if provided
-    if window_start:
-        exams_qs = exams_qs.filter(end_date__gte=window_start)  # overlapping
-    if window_end:
-        exams_qs = exams_qs.filter(start_date__lte=window_end)
-    for ex in exams_qs:
-        # Use start_date and end_date for calendar events (allDay: end should be exclusive)
-        if not ex.start_date:
-            continue  # skip exams without a start date (FullCalendar requires start)
-        start = ex.start_date.isoformat()
-        # FullCalendar expects allDay 'end' to be exclusive
-        try:
-            end_base = ex.end_date or ex.start_date
-            end = (end_base + timedelta(days=1)).isoformat()
-        except Exception:
-            end = start
-        event_list.append({
-            'id': f'exam-{ex.id}',
-            'title': ex.name,
-            'start': start,
-            'end': end,
-            'allDay': True,
-            'category': 'exam',
-            'term': str(ex.term),
-            'level': ex.level,
-            'type': ex.get_type_display() if hasattr(ex, 'get_type_display') else '',
-        })
-
-    # Teacher responsibilities for the logged-in teacher
-    try:
-        # If the current user maps to a Teacher, include their responsibilities
-        teacher = getattr(request.user, 'teacher', None)
-        if not teacher:
-            teacher = Teacher.objects.select_related('user').filter(user=request.user).first()
-        if teacher:
-            from django.db.models import Q
-            resp_qs = TeacherResponsibility.objects.filter(teacher=teacher)
-            # Window filtering: treat as allDay from start_date to end_date (inclusive)
-            # Include NULLs on the opposite bound so open-ended responsibilities still appear
-            if window_start:
-                resp_qs = resp_qs.filter(Q(end_date__gte=window_start.date()) | Q(end_date__isnull=True))
-            if window_end:
-                resp_qs = resp_qs.filter(Q(start_date__lte=window_end.date()) | Q(start_date__isnull=True))
-            resp_added = 0
-            for r in resp_qs:
-                    # derive start/end
-                    base_start = r.start_date or (r.assigned_at.date() if getattr(r, 'assigned_at', None) else timezone.now().date())
-                    base_end = r.end_date or r.start_date or base_start
-                    r_start = base_start.isoformat()
-                    # Exclusive end for allDay
-                    try:
-                        r_end = (base_end + timedelta(days=1)).isoformat()
-                    except Exception:
-                        r_end = base_start.isoformat()
-                    event_list.append({
-                        'id': f'resp-{r.id}',
-                        'title': r.responsibility,
-                        'start': r_start,
-                        'end': r_end,
-                        'allDay': True,
-                        'category': 'responsibility',
-                        'details': r.details or '',
-                    })
-                    resp_added += 1
-            try:
-                print(f"[events_json] responsibilities added: {resp_added} for teacher={teacher.id}")
-            except Exception:
-                pass
-    except Exception:
-        # keep feed resilient
-        pass
-    try:
-        print(f"[events_json] user={request.user.id} role={getattr(request.user,'role',None)} events={len(event_list)} window=({window_start},{window_end})")
-    except Exception:
-        pass
-    return JsonResponse(event_list, safe=False, encoder=DjangoJSONEncoder)
+    teacher_id = None
+    if request.user.role == 'teacher':
+        teacher_id = Teacher.objects.filter(user=request.user).values_list('id', flat=True).first()
+    return _calendar_response(request, calendar_feed.feed(_calendar_window(request), teacher_id=teacher_id))
 
 
 from django.contrib.auth.decorators import login_required
@@ -6889,9 +5772,7 @@ def event_create(request):
         # If term is not provided, assign current term
         if not data.get('term'):
             today = timezone.now().date()
-            current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
-            if not current_term:
-                current_term = Term.objects.order_by('-start_date').first()
+            current_term = academic_calendar.current_term(today) or academic_calendar.latest_term()
             if current_term:
                 data['term'] = current_term.id
         print('[EVENT_CREATE][DEBUG] data after term assignment:', dict(data))
@@ -6931,7 +5812,7 @@ def event_delete(request):
     return JsonResponse({'status': 'ok'})
 
 def events_feed(request):
-    return JsonResponse([], safe=False)
+    return events_json(request)
 
 def custom_login_view(request):
     # Always log out any existing user/session on visiting login page
@@ -7008,12 +5889,7 @@ def admin_students_partial(request):
         except (TypeError, ValueError):
             pass
     if q:
-        from django.db.models import Q
-        students = students.filter(
-            Q(user__first_name__icontains=q) |
-            Q(user__last_name__icontains=q) |
-            Q(admission_no__icontains=q)
-        )
+        students = student_search.filter_queryset(students, q)
     paginator = Paginator(students, per_page)
     students_page = paginator.get_page(page)
     context = {
@@ -7370,30 +6246,7 @@ def delete_exam(request, exam_id):
 def exam_calendar_api(request):
     """API endpoint to provide exam data for FullCalendar"""
     try:
-        exams = Exam.objects.select_related('term').all()
-        events = []
-        for exam in exams:
-            # Calculate end date for calendar display (add 1 day if same day)
-            end_date = exam.end_date
-            if exam.start_date == exam.end_date:
-                # For single-day events, FullCalendar needs the end date to be the next day
-                from datetime import timedelta
-                end_date = exam.end_date + timedelta(days=1)
-            
-            events.append({
-                'id': exam.id,
-                'title': exam.name,
-                'start': exam.start_date.isoformat(),
-                'end': end_date.isoformat(),
-                'extendedProps': {
-                    'term': exam.term.name if exam.term else 'No Term',
-                    'type': exam.get_type_display() if hasattr(exam, 'get_type_display') else 'Exam',
-                    'description': f"{exam.name} - {exam.term.name if exam.term else 'No Term'}"
-                },
-                'className': 'fc-event-exam',
-                'color': '#0d47a1'
-            })
-        return JsonResponse(events, safe=False)
+        return _calendar_response(request, calendar_feed.exam_calendar(_calendar_window(request)))
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -7490,42 +6343,26 @@ def api_bulk_grades(request):
         if not grades_data:
             return JsonResponse({'error': 'No grades data provided'}, status=400)
         
-        saved_count = 0
-        errors = []
-        
-        for grade_item in grades_data:
-            try:
-                student_id = grade_item.get('student_id')
-                subject_id = grade_item.get('subject_id')
-                exam_id = grade_item.get('exam_id')
-                grade_value = grade_item.get('grade')
-                
-                if not all([student_id, subject_id, exam_id, grade_value is not None]):
-                    errors.append(f"Missing required fields for grade entry")
-                    continue
-                
-                # Get the objects
-                student = get_object_or_404(Student, id=student_id)
-                subject = get_object_or_404(Subject, id=subject_id)
-                exam = get_object_or_404(Exam, id=exam_id)
-                
-                # Create or update grade
-                grade, created = Grade.objects.update_or_create(
-                    student=student,
-                    subject=subject,
-                    exam=exam,
-                    defaults={'grade': grade_value}
-                )
-                saved_count += 1
-                
-            except Exception as e:
-                errors.append(f"Error saving grade for student {student_id}: {str(e)}")
+        # One validation pass and one bulk upsert for the whole batch
+        ingest = GradeIngest()
+        for i, grade_item in enumerate(grades_data):
+            student_id = grade_item.get('student_id')
+            subject_id = grade_item.get('subject_id')
+            exam_id = grade_item.get('exam_id')
+            grade_value = grade_item.get('grade')
+            if not all([student_id, subject_id, exam_id, grade_value is not None]):
+                ingest.reject(i, 'Missing required fields for grade entry', student_id=student_id)
                 continue
-        
+            ingest.add(i, student_id, exam_id, subject_id, grade_value)
+        report = ingest.commit()
+        saved_count = report.saved
+        errors = [f"Error saving grade for student {r.get('student_id')}: {r['reason']}" for r in report.failed]
+
         return JsonResponse({
             'success': True,
             'saved_count': saved_count,
-            'errors': errors
+            'errors': errors,
+            'report': report.as_dict(),
         })
         
     except Exception as e:
@@ -7659,8 +6496,8 @@ def api_download_grade_template(request):
             df.to_excel(writer, sheet_name='Grades', index=False)
             # Insert school header rows using openpyxl
             try:
-                from landing.models import SiteSettings
-                ss = SiteSettings.objects.first()
+                from landing.site_settings import get_site_settings
+                ss = get_site_settings()
                 if ss:
                     wb = writer.book
                     ws = wb['Grades']
@@ -7753,8 +6590,8 @@ def api_download_class_students(request, class_id):
             if not simple:
                 # Insert school header rows using openpyxl for legacy format
                 try:
-                    from landing.models import SiteSettings
-                    ss = SiteSettings.objects.first()
+                    from landing.site_settings import get_site_settings
+                    ss = get_site_settings()
                     if ss:
                         wb = writer.book
                         ws = wb['Students']
@@ -7848,18 +6685,10 @@ def admin_overview(request):
 
     now = timezone.now()
 
-    total_students = Student.objects.filter(graduated=False).count()
-    students_boys = Student.objects.filter(graduated=False, gender__iexact='male').count()
-    students_girls = Student.objects.filter(graduated=False, gender__iexact='female').count()
-    total_teachers = Teacher.objects.count()
-    teachers_male = Teacher.objects.filter(gender__iexact='male').count()
-    teachers_female = Teacher.objects.filter(gender__iexact='female').count()
-    total_classes = Class.objects.count()
-    total_subjects = Subject.objects.count()
-    total_fees = FeeCategory.objects.count()
+    stats = dashboard_stats.headcounts()
 
     today = now.date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
 
     upcoming_events = Event.objects.filter(is_done=False, start__gte=now).order_by('start')[:5]
 
@@ -7885,15 +6714,7 @@ def admin_overview(request):
         )
 
     context = {
-        'total_students': total_students,
-        'students_boys': students_boys,
-        'students_girls': students_girls,
-        'total_teachers': total_teachers,
-        'teachers_male': teachers_male,
-        'teachers_female': teachers_female,
-        'total_classes': total_classes,
-        'total_subjects': total_subjects,
-        'total_fees': total_fees,
+        **stats,
         'current_term': current_term,
         'upcoming_events': upcoming_events,
         'responsibilities': responsibilities,
@@ -7909,23 +6730,10 @@ def clerk_overview(request):
     from django.utils import timezone
     from .models import Term, Class, Student, FeeAssignment, FeePayment
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
-
-    # Compute totals for the current term
-    fee_assignments = FeeAssignment.objects.all()
-    if current_term:
-        fee_assignments = fee_assignments.filter(term=current_term)
+    current_term = academic_calendar.current_term(today)
 
-    # Total assigned = sum(amount * students_in_class) for assignments in term
-    total_assigned = 0.0
-    for fa in fee_assignments.select_related('class_group'):
-        num_students = Student.objects.filter(class_group=fa.class_group, graduated=False).count()
-        total_assigned += float(getattr(fa, 'amount', 0)) * num_students
-
-    # Total paid for payments linked to those assignments
-    from django.db.models import Sum
-    total_paid = FeePayment.objects.filter(fee_assignment__in=fee_assignments).aggregate(total=Sum('amount_paid'))['total'] or 0.0
-    total_outstanding = float(total_assigned) - float(total_paid)
+    # Totals for the current term and top classes by outstanding, in grouped queries
+    position = dashboard_stats.fee_position(current_term)
 
     # Recent payments
     recent_payments = (
@@ -7933,33 +6741,27 @@ def clerk_overview(request):
         .order_by('-payment_date')[:10]
     )
 
-    # Top classes by outstanding
-    class_stats = []
-    classes = Class.objects.all().order_by('level', 'name')
-    for clazz in classes:
-        class_assignments = fee_assignments.filter(class_group=clazz)
-        assigned = 0.0
-        for fa in class_assignments:
-            num_students = Student.objects.filter(class_group=clazz, graduated=False).count()
-            assigned += float(getattr(fa, 'amount', 0)) * num_students
-        paid = FeePayment.objects.filter(fee_assignment__in=class_assignments).aggregate(total=Sum('amount_paid'))['total'] or 0.0
-        outstanding = float(assigned) - float(paid)
-        if assigned or paid:
-            class_stats.append({'class': clazz, 'assigned': assigned, 'paid': paid, 'outstanding': outstanding})
-    # Sort by outstanding desc and take top 8
-    class_stats.sort(key=lambda r: r['outstanding'], reverse=True)
-    class_stats = class_stats[:8]
-
     context = {
         'current_term': current_term,
-        'total_assigned': total_assigned,
-        'total_paid': total_paid,
-        'total_outstanding': total_outstanding if total_outstanding > 0 else 0,
+        **position,
         'recent_payments': recent_payments,
-        'class_stats': class_stats,
     }
     return render(request, 'dashboards/clerk_overview.html', context)
 
+
+@login_required(login_url='login')
+@require_GET
+def dashboard_stats_api(request):
+    """JSON for the overview tiles: headcounts for admins, current-term fee totals for admins and clerks."""
+    if not is_admin_or_clerk(request.user):
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    data = {}
+    if request.user.role == 'admin':
+        data['headcounts'] = dashboard_stats.headcounts()
+    position = dashboard_stats.fee_position(academic_calendar.current_term())
+    data['fees'] = {k: v for k, v in position.items() if k != 'class_stats'}
+    return JsonResponse(data)
+
 @login_required
 def timetable_view(request):
     """Displays the timetable for a selected class."""
@@ -8203,7 +7005,7 @@ def timetable_edit_api(request):
 
         # If subject is empty, delete the entry
         if not subject_id:
-            DefaultTimetable.objects.filter(class_group=class_group, period=period, day=day).delete()
+            timetable_writer.apply_edits({(class_group.id, day, period.id): None})
             return JsonResponse({'success': True, 'message': 'Slot cleared successfully.'})
 
         # Reject component (child) subjects for timetable allocation
@@ -8247,30 +7049,14 @@ def timetable_edit_api(request):
             else:
                 return JsonResponse({'success': False, 'error': 'All assigned teachers for this subject are busy at this time.'}, status=400)
 
-        # Get or create the timetable entry
-        slot, created = DefaultTimetable.objects.get_or_create(
-            class_group=class_group,
-            period=period,
-            day=day,
-            defaults={'subject_id': subject_id, 'teacher_id': chosen_teacher_id}
-        )
-
-        if not created:
-            # If it already exists, update it
-            slot.subject_id = subject_id
-            slot.teacher_id = chosen_teacher_id
-            slot.save()
-        
-        # Fetch teacher name for the response
-        teacher_name = ''
-        if slot.teacher:
-            teacher_name = slot.teacher.user.get_full_name()
+        timetable_writer.apply_edits({(class_group.id, day, period.id): (subj_obj.id, chosen_teacher_id)})
+        teacher_name = teacher_obj.user.get_full_name() if teacher_obj else ''
 
         return JsonResponse({
             'success': True,
             'message': 'Timetable updated successfully.',
             'entry': {
-                'subject_name': slot.subject.name,
+                'subject_name': subj_obj.name,
                 'teacher_name': teacher_name
             }
         })
@@ -8358,28 +7144,8 @@ def mpesa_callback(request):
         merchant_request_id = stk_callback.get('MerchantRequestID')
         checkout_request_id = stk_callback.get('CheckoutRequestID')
         logger.info(f"[M-PESA CALLBACK] Received: {data}")
-        # Log callback to file for admin viewing
-        import os
-        from datetime import datetime
-        log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'payment_callback_logs.txt')
-        try:
-            # Ensure the log file exists and append safely
-            os.makedirs(os.path.dirname(log_path), exist_ok=True)
-            with open(log_path, 'a+') as logf:
-                logf.seek(0)
-                try:
-                    logs = json.load(logf)
-                except Exception:
-                    logs = []
-                logs.append({
-                    'timestamp': datetime.now().isoformat(),
-                    'status': 'success' if result_code == 0 else 'failed',
-                    'details': data
-                })
-                json.dump(logs, logf, indent=2)
-                logf.truncate()
-        except Exception as logerr:
-            logger.error(f"[M-PESA CALLBACK] Could not write callback log: {logerr}")
+        # Journal callback for admin viewing (append-only JSON Lines)
+        callback_journal.append('success' if result_code == 0 else 'failed', data)
         # Helper: normalize phone to 2547XXXXXXXX
         def _normalize(msisdn: str) -> str:
             if not msisdn:
@@ -8441,30 +7207,13 @@ def mpesa_callback(request):
                     student = Student.objects.filter(phone__in=list(set(phone_variants))).first()
             if not student:
                 logger.warning(f"[M-PESA CALLBACK] No student found with phone {phone}. Logging unmatched payment.")
-                # Log unmatched callback for audit
-                unmatched_log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'payment_callback_logs.txt')
-                try:
-                    os.makedirs(os.path.dirname(unmatched_log_path), exist_ok=True)
-                    with open(unmatched_log_path, 'a+') as logf:
-                        logf.seek(0)
-                        try:
-                            logs = json.load(logf)
-                        except Exception:
-                            logs = []
-                        logs.append({
-                            'timestamp': datetime.now().isoformat(),
-                            'status': 'unmatched',
-                            'details': {
-                                'phone': phone,
-                                'amount': amount,
-                                'reference': mpesa_receipt,
-                                'raw': data
-                            }
-                        })
-                        json.dump(logs, logf, indent=2)
-                        logf.truncate()
-                except Exception as logerr:
-                    logger.error(f"[M-PESA CALLBACK] Could not write unmatched callback log: {logerr}")
+                # Journal unmatched callback for audit
+                callback_journal.append('unmatched', {
+                    'phone': phone,
+                    'amount': amount,
+                    'reference': mpesa_receipt,
+                    'raw': data,
+                })
                 return JsonResponse({"ResultCode": 0, "ResultDesc": "Student not found, but callback logged"})
             # Ensure there is at least a stub MpesaTransaction for traceability
             if not tx:
@@ -8486,7 +7235,7 @@ def mpesa_callback(request):
                     logger.error(f"[M-PESA CALLBACK] Could not create stub MpesaTransaction: {e}")
             # Find current term
             today = timezone.now().date()
-            current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+            current_term = academic_calendar.current_term(today)
             if not current_term:
                 logger.warning(f"[M-PESA CALLBACK] No current term found for today {today}; proceeding without linking to a specific term.")
             # Find unpaid FeeAssignment(s) for student's class in current term
@@ -8647,7 +7396,7 @@ def mpesa_callback(request):
                 student = Student.objects.filter(phone=phone).first()
                 if student:
                     today = timezone.now().date()
-                    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+                    current_term = academic_calendar.current_term(today)
                     fee_assignments = FeeAssignment.objects.filter(class_group=student.class_group, term=current_term)
                     assignment = fee_assignments.first() if fee_assignments.exists() else None
                     # Idempotency: don't double-record
@@ -8897,27 +7646,8 @@ def mpesa_c2b_confirmation(request):
     except Exception as e:
         logger.error(f"[C2B CONFIRMATION] Ledger persist error: {e}")
 
-    # Log to file for audit
-    try:
-        import os
-        from datetime import datetime
-        log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'payment_callback_logs.txt')
-        os.makedirs(os.path.dirname(log_path), exist_ok=True)
-        with open(log_path, 'a+') as logf:
-            logf.seek(0)
-            try:
-                logs = json.load(logf)
-            except Exception:
-                logs = []
-            logs.append({
-                'timestamp': datetime.now().isoformat(),
-                'status': 'c2b_confirmation',
-                'details': data
-            })
-            json.dump(logs, logf, indent=2)
-            logf.truncate()
-    except Exception as logerr:
-        logger.error(f"[C2B CONFIRMATION] Could not write log: {logerr}")
+    # Journal for audit
+    callback_journal.append('c2b_confirmation', data)
 
     if not trans_id:
         return JsonResponse({"ResultCode": 0, "ResultDesc": "Missing TransID"})
@@ -8949,7 +7679,7 @@ def mpesa_c2b_confirmation(request):
     # Find current term and an outstanding assignment
     from django.db.models import Sum as _Sum
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+    current_term = academic_calendar.current_term(today)
     outstanding_assignment = None
     if student and current_term:
         fee_assignments = FeeAssignment.objects.filter(class_group=student.class_group, term=current_term)
@@ -10,6 +10,9 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from .messaging_utils import send_sms_to_users
+from .services import academic_calendar, conversations, student_search
+
+INBOX_PAGE_SIZE = 50
 
 from django import forms
 from django.http import JsonResponse
@@ -20,15 +23,11 @@ def send_bulk_fee_arrears_notice(request):
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Invalid request method.'}, status=405)
     # Fast path: create a job and enqueue background task
-    from .models import NotificationJob, Term
+    from .models import NotificationJob
     from .tasks import send_fee_arrears_notifications
     from django.utils import timezone
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
-    if not current_term:
-        current_term = Term.objects.filter(start_date__lte=today, end_date__isnull=True).order_by('-start_date').first()
-    if not current_term:
-        current_term = Term.objects.order_by('-start_date').first()
+    current_term = academic_calendar.current_term(today, fallback=True)
     class_group_id = request.POST.get('class_group_id')
     job = NotificationJob.objects.create(job_type='fee_arrears', status='queued', meta={'term_id': getattr(current_term, 'id', None), 'class_group_id': class_group_id})
     send_fee_arrears_notifications.delay(job.id, getattr(current_term, 'id', None), int(class_group_id) if class_group_id else None)
@@ -102,14 +101,10 @@ def admin_send_message(request):
 @user_passes_test(is_admin)
 def admin_send_arrears_message(request):
     today = timezone.now().date()
-    current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
-    if not current_term:
-        current_term = Term.objects.filter(start_date__lte=today, end_date__isnull=True).order_by('-start_date').first()
-    if not current_term:
-        current_term = Term.objects.order_by('-start_date').first()
+    current_term = academic_calendar.current_term(today, fallback=True)
     all_students = Student.objects.select_related('user', 'class_group').all()
     # Calculate total assigned and paid per student
-    terms_up_to_current = Term.objects.filter(start_date__lte=current_term.start_date)
+    terms_up_to_current = academic_calendar.terms_before(current_term, inclusive=True)
     arrears_students = []
     for student in all_students:
         assignments_for_student = FeeAssignment.objects.filter(class_group=student.class_group, term__in=terms_up_to_current)
@@ -200,9 +195,16 @@ def get_users_by_category(request):
     from .models import User, Student, Teacher, Class
     from django.db.models import Q, Sum
     category = request.GET.get('category')
+    q = (request.GET.get('q') or '').strip()
     users = []
     # --- Category logic ---
-    if category == 'all_students':
+    if q and (category == 'all_students' or (category or '').startswith('level_')):
+        # Name/admission lookup through the student search index, best match first
+        students = Student.objects.select_related('user').exclude(user__isnull=True)
+        if category.startswith('level_'):
+            students = students.filter(class_group__level=category.split('_', 1)[1])
+        users = [s.user for s in student_search.search_students(q, limit=50, queryset=students)]
+    elif category == 'all_students':
         users = User.objects.filter(role='student').order_by('username')
     elif category == 'students_with_balance':
         # Students with fee balance > 0
@@ -258,71 +260,43 @@ def get_users_by_category(request):
 @user_passes_test(is_admin)
 def admin_messaging(request):
     from core.models import User, Message
+    from django.core.paginator import Paginator
     category = request.GET.get('recipient_category', '')
     recipient_id = request.GET.get('recipient')
-    recipients = []
     selected_user = None
     chat_history = []
-    from core.models import Message
-    if category == 'student':
-        recipients = User.objects.filter(role='student')
-    elif category == 'teacher':
-        recipients = User.objects.filter(role='teacher')
-    elif category == 'admin':
-        recipients = User.objects.filter(role='admin')
-    # Annotate each recipient with their latest message timestamp (sent or received)
-    recipients = list(recipients)
-    def latest_msg_time(user):
-        msg = Message.objects.filter(
-            (Q(sender=request.user, recipient=user) | Q(sender=user, recipient=request.user))
-        ).order_by('-timestamp').first()
-        return msg.timestamp if msg else None
-    from datetime import datetime
-    from django.utils import timezone
-    recipients.sort(key=lambda u: latest_msg_time(u) or timezone.make_aware(datetime.min), reverse=True)
-    # Per-user unread badge: store last opened timestamp for each user in session
-    now = timezone.now().isoformat()
-    last_opened_map = request.session.get('messaging_last_opened', {})
-    # Compute unread message count since last opened for each user
+    page_obj = None
     recipients_list = []
-    for u in recipients:
-        last_opened = last_opened_map.get(str(u.id))
-        if last_opened:
+    if category in ('student', 'teacher', 'admin'):
+        peers = User.objects.filter(role=category)
+        # One indexed query per page: users joined to this admin's side of each conversation
+        page_obj = Paginator(conversations.inbox(request.user, peers), INBOX_PAGE_SIZE).get_page(request.GET.get('page'))
+        recipients_list = [
+            {
+                'id': u.id,
+                'name': u.get_full_name() or u.username,
+                'role': u.role,
+                'unread_count': u.unread_count,
+                'last_message_at': u.last_message_at,
+                'last_message_preview': u.last_message_preview,
+                'pinned': u.pinned,
+                'muted': u.muted,
+                'archived': u.archived,
+            }
+            for u in page_obj
+        ]
+        # Resolve selected_user if provided
+        if recipient_id:
             try:
-                last_opened_dt = datetime.fromisoformat(last_opened)
-                if timezone.is_naive(last_opened_dt):
-                    last_opened_dt = timezone.make_aware(last_opened_dt)
-            except Exception:
-                last_opened_dt = timezone.make_aware(datetime.fromtimestamp(0))
-        else:
-            last_opened_dt = timezone.make_aware(datetime.fromtimestamp(0))
-        # Find the latest admin reply to this user
-        last_admin_reply = Message.objects.filter(sender=request.user, recipient=u).order_by('-timestamp').first()
-        if last_admin_reply:
-            last_admin_time = last_admin_reply.timestamp
-        else:
-            last_admin_time = timezone.make_aware(datetime.fromtimestamp(0))
-        # Count all messages from user sent after admin's last message
-        unread_count = Message.objects.filter(sender=u, recipient=request.user, timestamp__gt=last_admin_time).count()
-        recipients_list.append({
-            'id': u.id,
-            'name': u.get_full_name() or u.username,
-            'role': u.role,
-            'unread_count': unread_count,
-        })
-    # Resolve selected_user if provided
-    if recipient_id:
-        try:
-            selected_user = next((u for u in recipients if str(u.id) == str(recipient_id)), None)
-        except Exception:
-            selected_user = None
-    # If a chat is opened (selected_user), update last_opened and mark messages as read
-    if selected_user:
-        # Mark messages from selected_user to admin as read
-        from core.models import Message
-        Message.objects.filter(sender=selected_user, recipient=request.user, is_read=False).update(is_read=True)
-        last_opened_map[str(selected_user.id)] = timezone.now().isoformat()
-        request.session['messaging_last_opened'] = last_opened_map
+                selected_user = peers.filter(id=int(recipient_id)).first()
+            except (TypeError, ValueError):
+                selected_user = None
+    # Opening a chat marks the user's messages to this admin as read
+    if selected_user and request.method != 'POST':
+        conversations.mark_read(request.user, selected_user)
+        for r in recipients_list:
+            if r['id'] == selected_user.id:
+                r['unread_count'] = 0
     # Handle sending a message
     if request.method == 'POST' and selected_user:
         content = request.POST.get('message', '').strip()
@@ -377,6 +351,7 @@ def admin_messaging(request):
         ]
     context = {
         'recipients': recipients_list,
+        'page_obj': page_obj,
         'selected_category': category,
         'selected_recipient_id': str(recipient_id) if recipient_id else '',
         'selected_user': {'id': selected_user.id, 'name': selected_user.get_full_name() or selected_user.username, 'role': selected_user.role} if selected_user else None,
@@ -440,29 +415,26 @@ def mark_read(request):
         other = User.objects.get(id=int(rid))
     except Exception:
         return JsonResponse({'success': False})
-    updated = Message.objects.filter(sender=other, recipient=request.user, is_read=False).update(is_read=True)
+    updated = conversations.mark_read(request.user, other)
     return JsonResponse({'success': True, 'updated': updated})
 
 @login_required
 @user_passes_test(is_admin)
 @require_POST
 def conversation_action(request):
-    """Pin/mute/archive conversation using session storage (no DB migration)."""
+    """Pin/mute/archive the admin's side of a conversation."""
+    from core.models import User
     rid = request.POST.get('recipient')
     action = request.POST.get('action')  # pin|unpin|mute|unmute|archive|unarchive
-    store = request.session.get('messaging_flags', {'pinned': [], 'muted': [], 'archived': []})
-    lists = {'pin': 'pinned', 'unpin': 'pinned', 'mute': 'muted', 'unmute': 'muted', 'archive': 'archived', 'unarchive': 'archived'}
-    if action not in lists:
+    flags = {'pin': 'pinned', 'unpin': 'pinned', 'mute': 'muted', 'unmute': 'muted', 'archive': 'archived', 'unarchive': 'archived'}
+    if action not in flags:
         return JsonResponse({'success': False, 'error': 'invalid action'}, status=400)
-    key = lists[action]
-    arr = set(map(str, store.get(key, [])))
-    if action in ('pin', 'mute', 'archive'):
-        arr.add(str(rid))
-    else:
-        arr.discard(str(rid))
-    store[key] = list(arr)
-    request.session['messaging_flags'] = store
-    return JsonResponse({'success': True, 'flags': store})
+    try:
+        other = User.objects.get(id=int(rid))
+    except (TypeError, ValueError, User.DoesNotExist):
+        return JsonResponse({'success': False, 'error': 'invalid recipient'}, status=400)
+    conversation = conversations.set_flag(request.user, other, flags[action], not action.startswith('un'))
+    return JsonResponse({'success': True, 'flags': {flag: getattr(conversation, flag) for flag in conversations.FLAGS}})
 
 @login_required
 @user_passes_test(is_admin)
@@ -474,49 +446,17 @@ def upload_attachment(request):
 @login_required
 @user_passes_test(is_admin_or_clerk)
 def admin_payment_logs(request):
-    import os, json, re
-    from datetime import datetime
-    logs_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'payment_callback_logs.txt')
-    logs = ''
+    import json
+    from .services import callback_journal
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    # Newest-first page streamed from the journal; only this page is parsed
+    parsed, has_next = callback_journal.read_page(page, per_page=50)
+    logs = '\n'.join(json.dumps(obj, indent=2, default=str) for obj in parsed)
     entries = []
-    if os.path.exists(logs_path):
-        with open(logs_path, 'r', encoding='utf-8') as f:
-            logs = f.read()
-        # Try to parse as a JSON array first
-        def try_parse_json_array(text):
-            try:
-                data = json.loads(text)
-                if isinstance(data, list):
-                    return data
-            except Exception:
-                return None
-            return None
-        parsed = try_parse_json_array(logs)
-        # If not a valid array, attempt to extract JSON objects heuristically
-        if parsed is None:
-            chunks = []
-            buf = []
-            depth = 0
-            for line in logs.splitlines():
-                # Capture between balanced braces
-                if '{' in line:
-                    cnt = line.count('{')
-                    depth += cnt
-                if depth > 0:
-                    buf.append(line)
-                if '}' in line:
-                    depth -= line.count('}')
-                    if depth <= 0 and buf:
-                        chunks.append('\n'.join(buf))
-                        buf = []
-                        depth = 0
-            arr = []
-            for ch in chunks:
-                try:
-                    arr.append(json.loads(ch))
-                except Exception:
-                    continue
-            parsed = arr
+    if parsed:
         # Map parsed objects into friendly entries
         def get_item(items, name):
             try:
@@ -526,10 +466,12 @@ def admin_payment_logs(request):
             except Exception:
                 return None
             return None
-        for obj in parsed or []:
+        for obj in parsed:
             timestamp = obj.get('timestamp')
             status = obj.get('status') or 'success'
             details = obj.get('details') or obj
+            if not isinstance(details, dict):
+                details = {}
             body = ((details or {}).get('Body')) or details
             stk = ((body or {}).get('stkCallback')) or body
             meta = ((stk or {}).get('CallbackMetadata') or {}).get('Item')
@@ -553,29 +495,13 @@ def admin_payment_logs(request):
                 'merchant_request_id': merchant_id,
                 'checkout_request_id': checkout_id,
             })
-        # Sort entries latest -> oldest
-        def sort_key(e):
-            dt = None
-            # Try ISO-like timestamp first
-            ts = e.get('timestamp')
-            if ts:
-                try:
-                    dt = datetime.fromisoformat(ts.replace('Z','+00:00'))
-                except Exception:
-                    dt = None
-            # Fallback to Mpesa TransactionDate format YYYYMMDDHHMMSS
-            if dt is None:
-                td = e.get('transaction_date')
-                if td and isinstance(td, (str, int)):
-                    s = str(td)
-                    try:
-                        dt = datetime.strptime(s, '%Y%m%d%H%M%S')
-                    except Exception:
-                        dt = None
-            # Fallback to minimal value to push unknowns to the end
-            return dt or datetime.min
-        entries.sort(key=sort_key, reverse=True)
-    context = {'logs': logs, 'entries': entries}
+    context = {
+        'logs': logs,
+        'entries': entries,
+        'page': page,
+        'has_prev': page > 1,
+        'has_next': has_next,
+    }
     return render(request, 'dashboards/admin_payment_logs.html', context)
 
 @login_required
@@ -217,7 +217,6 @@ def email_login_confirm(request, token: str):
     })
 
 
-from django.contrib.sessions.models import Session
 from django.contrib.auth.decorators import login_required
 def login_status(request, request_id: str):
     """Polled by the original device. If accepted, log in this session and return redirect URL."""
@@ -244,23 +243,19 @@ def login_status(request, request_id: str):
 @login_required(login_url='login')
 def session_devices(request):
     """List active sessions for the current user across devices."""
-    user = request.user
-    sessions = []
-    for s in Session.objects.all():
-        try:
-            data = s.get_decoded()
-        except Exception:
-            continue
-        if str(data.get('_auth_user_id')) != str(user.id):
-            continue
-        sessions.append({
-            'session_key': s.session_key,
-            'expire_date': s.expire_date,
-            'ua': data.get('device_user_agent', ''),
-            'ip': data.get('device_ip', ''),
-            'login_time': data.get('device_login_time', ''),
-            'current': (s.session_key == request.session.session_key),
-        })
+    from .services import user_sessions
+    current_key = request.session.session_key
+    sessions = [
+        {
+            'session_key': row.session_key,
+            'expire_date': row.expire_date,
+            'ua': row.user_agent,
+            'ip': row.ip_address,
+            'login_time': row.login_at,
+            'current': (row.session_key == current_key),
+        }
+        for row in user_sessions.live_sessions(request.user)
+    ]
     # Sort: current first, then newest by expire_date
     sessions.sort(key=lambda x: (not x['current'], x['expire_date'] or 0))
     return render(request, 'auth/sessions.html', {'sessions': sessions})
@@ -269,17 +264,20 @@ def session_devices(request):
 @login_required(login_url='login')
 def revoke_session(request, key: str):
     """Allow a user to revoke a specific session (log out that device)."""
+    from .models import UserSession
+    from .services import user_sessions
     if request.method != 'POST':
         return redirect('session_devices')
-    try:
-        # Prevent removing current session via this endpoint for safety
-        if key == request.session.session_key:
-            messages.info(request, 'You are currently using this session.')
-            return redirect('session_devices')
-        Session.objects.get(session_key=key).delete()
-        messages.success(request, 'Device session revoked.')
-    except Session.DoesNotExist:
+    # Prevent removing current session via this endpoint for safety
+    if key == request.session.session_key:
+        messages.info(request, 'You are currently using this session.')
+        return redirect('session_devices')
+    # Only the owner's own sessions can be revoked
+    if not UserSession.objects.filter(user=request.user, session_key=key).exists():
         messages.error(request, 'Session not found or already expired.')
+        return redirect('session_devices')
+    user_sessions.revoke([key])
+    messages.success(request, 'Device session revoked.')
     return redirect('session_devices')
 
 
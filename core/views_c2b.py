@@ -9,12 +9,12 @@ from .models import (
     MpesaTransaction,
     FeePayment,
     Student,
-    Term,
     FeeAssignment,
     OptionalOffer,
     StudentOptionalCharge,
     OptionalChargePayment,
 )
+from .services import academic_calendar
 
 
 @csrf_exempt
@@ -255,7 +255,7 @@ def c2b_confirmation(request):
             # Determine current term and best fee assignment if we have a student
             from django.db.models import Sum as _Sum
             today = timezone.now().date()
-            current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+            current_term = academic_calendar.current_term(today)
             outstanding_assignment = None
             if student and current_term and student.class_group:
                 fee_assignments = FeeAssignment.objects.filter(class_group=student.class_group, term=current_term)
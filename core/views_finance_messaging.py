@@ -17,6 +17,7 @@ def is_finance(user):
     return user.is_authenticated and getattr(user, 'role', None) in ['clerk', 'admin']
 
 from .forms import MessagingForm
+from .services import academic_calendar
 
 @login_required
 @user_passes_test(is_finance)
@@ -34,7 +35,7 @@ def finance_messaging_page(request):
         if form.data.getlist('recipient'):
             if form.is_valid() and (form.cleaned_data.get('send_email') or form.cleaned_data.get('send_sms')):
                 today = timezone.now().date()
-                current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('-start_date').first()
+                current_term = academic_calendar.current_term(today)
                 recipient_users = form.cleaned_data['recipient']
                 subject = form.cleaned_data['subject']
                 message_template = form.cleaned_data['message']
@@ -49,8 +50,8 @@ def finance_messaging_page(request):
                 # Resolve school name
                 school_name = getattr(settings, 'SCHOOL_NAME', 'Your School')
                 try:
-                    from landing.models import SiteSettings
-                    s = SiteSettings.objects.first()
+                    from landing.site_settings import get_site_settings
+                    s = get_site_settings()
                     if s and s.school_name:
                         school_name = s.school_name
                 except Exception:
@@ -1,12 +1,13 @@
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
-from .models import FeePayment, Student, FeeAssignment, Term, MpesaTransaction
+from .models import FeePayment, Student, FeeAssignment, MpesaTransaction
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from django.db.models import Sum as _Sum
 from decimal import Decimal
 from .mpesa_utils import query_stk_status
+from .services import academic_calendar
 
 def is_admin(user):
     return user.is_authenticated and getattr(user, 'role', None) == 'admin'
@@ -76,7 +77,7 @@ def verify_payment_by_reference(request):
 
             # Determine current term and link a fee assignment if possible
             today = timezone.now().date()
-            current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+            current_term = academic_calendar.current_term(today)
             outstanding_assignment = None
             if current_term and resolved_student.class_group_id:
                 fee_assignments = FeeAssignment.objects.filter(class_group=resolved_student.class_group, term=current_term)
@@ -159,7 +160,7 @@ def verify_payment_by_reference(request):
 
         # Find current term and an outstanding assignment
         today = timezone.now().date()
-        current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+        current_term = academic_calendar.current_term(today)
         outstanding_assignment = None
         if current_term and resolved_student.class_group_id:
             fee_assignments = FeeAssignment.objects.filter(class_group=resolved_student.class_group, term=current_term)
@@ -233,7 +234,7 @@ def reconcile_pending_stk(request):
                     continue
 
                 today = timezone.now().date()
-                current_term = Term.objects.filter(start_date__lte=today, end_date__gte=today).order_by('start_date').first()
+                current_term = academic_calendar.current_term(today)
                 outstanding_assignment = None
                 if current_term and resolved_student.class_group_id:
                     fee_assignments = FeeAssignment.objects.filter(class_group=resolved_student.class_group, term=current_term)
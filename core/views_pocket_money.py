@@ -1,14 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Sum, Q
+from django.db.models import Q
 from django.http import JsonResponse
 from django.core.paginator import Paginator
 from django.utils import timezone
-from decimal import Decimal
 
 from .models import PocketMoney, Student, User
 from .forms import PocketMoneyForm, PocketMoneyFilterForm
+from .services import pocket_ledger, student_search
 
 
 def is_admin_or_clerk(user):
@@ -56,21 +56,17 @@ def pocket_money_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Calculate summary statistics
-    total_deposits = transactions.filter(transaction_type='deposit', status='approved').aggregate(
-        total=Sum('amount'))['total'] or Decimal('0.00')
-    total_withdrawals = transactions.filter(transaction_type='withdrawal', status='approved').aggregate(
-        total=Sum('amount'))['total'] or Decimal('0.00')
-    net_balance = total_deposits - total_withdrawals
+    # Summary statistics of the filtered rows in one conditional aggregate
+    totals = pocket_ledger.totals(transactions)
     
     context = {
         'page_obj': page_obj,
         'filter_form': filter_form,
         'search_query': search_query,
-        'total_deposits': total_deposits,
-        'total_withdrawals': total_withdrawals,
-        'net_balance': net_balance,
-        'total_transactions': transactions.count(),
+        'total_deposits': totals['deposits'],
+        'total_withdrawals': totals['withdrawals'],
+        'net_balance': totals['deposits'] - totals['withdrawals'],
+        'total_transactions': totals['count'],
     }
     
     return render(request, 'finance/pocket_money_list.html', context)
@@ -85,7 +81,7 @@ def pocket_money_add(request):
         if form.is_valid():
             transaction = form.save(commit=False)
             transaction.processed_by = request.user
-            transaction.save()
+            pocket_ledger.save(transaction)
             
             messages.success(request, f'Pocket money {transaction.get_transaction_type_display().lower()} of KES {transaction.amount} for {transaction.student} has been recorded successfully.')
             return redirect('pocket_money_list')
@@ -122,7 +118,7 @@ def pocket_money_edit(request, transaction_id):
         if form.is_valid():
             updated_transaction = form.save(commit=False)
             updated_transaction.processed_by = request.user  # Update processed_by to current user
-            updated_transaction.save()
+            pocket_ledger.save(updated_transaction)
             
             messages.success(request, f'Pocket money transaction for {updated_transaction.student} has been updated successfully.')
             return redirect('pocket_money_list')
@@ -147,7 +143,7 @@ def pocket_money_delete(request, transaction_id):
     
     if request.method == 'POST':
         student_name = str(transaction.student)
-        transaction.delete()
+        pocket_ledger.delete(transaction)
         messages.success(request, f'Pocket money transaction for {student_name} has been deleted successfully.')
         return redirect('pocket_money_list')
     
@@ -163,26 +159,8 @@ def student_pocket_money_balance(request, student_id):
     try:
         student = get_object_or_404(Student, id=student_id)
         
-        # Calculate balance
-        deposits = PocketMoney.objects.filter(
-            student=student, 
-            transaction_type='deposit', 
-            status='approved'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        withdrawals = PocketMoney.objects.filter(
-            student=student, 
-            transaction_type='withdrawal', 
-            status='approved'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        adjustments = PocketMoney.objects.filter(
-            student=student, 
-            transaction_type='adjustment', 
-            status='approved'
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        
-        balance = deposits - withdrawals + adjustments
+        # Running balance kept by the pocket money ledger
+        totals = pocket_ledger.balance_for(student)
         
         # Get recent transactions
         recent_transactions = PocketMoney.objects.filter(
@@ -206,10 +184,10 @@ def student_pocket_money_balance(request, student_id):
             'student_name': student.full_name,
             'admission_no': student.admission_no,
             'class_group': str(student.class_group) if student.class_group else 'N/A',
-            'balance': float(balance),
-            'deposits': float(deposits),
-            'withdrawals': float(withdrawals),
-            'adjustments': float(adjustments),
+            'balance': float(totals['balance']),
+            'deposits': float(totals['deposits']),
+            'withdrawals': float(totals['withdrawals']),
+            'adjustments': float(totals['adjustments']),
             'recent_transactions': transactions_data
         })
         
@@ -226,37 +204,16 @@ def search_students_ajax(request):
     """AJAX endpoint for auto-searching students by name or admission number."""
     query = request.GET.get('q', '').strip()
     
-    print(f"Search query: '{query}'")  # Debug log
-    
     if len(query) < 2:
         return JsonResponse({'students': []})
     
-    # Search by admission number or name (case-insensitive)
-    # Optimize: select only required fields and avoid per-student balance computation here
-    students_qs = (
-        Student.objects
-        .select_related('user', 'class_group')
-        .only('id', 'admission_no', 'class_group__name', 'user__first_name', 'user__last_name')
-        .filter(
-            Q(admission_no__icontains=query) |
-            Q(user__first_name__icontains=query) |
-            Q(user__last_name__icontains=query) |
-            Q(user__username__icontains=query)
-        )
-        .exclude(user__isnull=True)
-        .order_by('user__first_name', 'user__last_name')[:10]  # Limit to 10 results for snappier UX
+    # Ranked prefix/fuzzy lookup on the student search index (names, admission numbers)
+    students_list = student_search.search_students(
+        query,
+        limit=10,  # Limit to 10 results for snappier UX
+        queryset=Student.objects.select_related('user', 'class_group').exclude(user__isnull=True),
     )
 
-    students_list = list(students_qs)
-    print(f"Found {len(students_list)} students")  # Debug log
-
-    # If no students found, print a small sample for debugging
-    if not students_list:
-        sample = list(Student.objects.select_related('user').exclude(user__isnull=True)[:3])
-        print(f"Sample students in database: {len(sample)}")
-        for s in sample:
-            print(f"- {getattr(s.user, 'first_name', '')} {getattr(s.user, 'last_name', '')} ({s.admission_no})")
-
     students_data = []
     for student in students_list:
         students_data.append({
@@ -280,15 +237,8 @@ def pocket_money_student_summary(request, student_id):
     # Get all transactions for this student
     transactions = PocketMoney.objects.filter(student=student).order_by('-transaction_date')
     
-    # Calculate balances
-    deposits = transactions.filter(transaction_type='deposit', status='approved').aggregate(
-        total=Sum('amount'))['total'] or Decimal('0.00')
-    withdrawals = transactions.filter(transaction_type='withdrawal', status='approved').aggregate(
-        total=Sum('amount'))['total'] or Decimal('0.00')
-    adjustments = transactions.filter(transaction_type='adjustment', status='approved').aggregate(
-        total=Sum('amount'))['total'] or Decimal('0.00')
-    
-    current_balance = deposits - withdrawals + adjustments
+    # Running balance kept by the pocket money ledger
+    totals = pocket_ledger.balance_for(student)
     
     # Pagination for transactions
     paginator = Paginator(transactions, 20)
@@ -298,11 +248,11 @@ def pocket_money_student_summary(request, student_id):
     context = {
         'student': student,
         'page_obj': page_obj,
-        'current_balance': current_balance,
-        'total_deposits': deposits,
-        'total_withdrawals': withdrawals,
-        'total_adjustments': adjustments,
-        'total_transactions': transactions.count(),
+        'current_balance': totals['balance'],
+        'total_deposits': totals['deposits'],
+        'total_withdrawals': totals['withdrawals'],
+        'total_adjustments': totals['adjustments'],
+        'total_transactions': paginator.count,
     }
     
     return render(request, 'finance/student_pocket_money_summary.html', context)
@@ -3,8 +3,9 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from django.db.models import Sum, Q
 
-from .models import FeePayment, PocketMoney, FeeAssignment, Term
-from landing.models import SiteSettings
+from .models import FeePayment, PocketMoney, FeeAssignment
+from landing.site_settings import get_site_settings
+from .services import academic_calendar, fee_ledger
 
 
 def is_admin_or_clerk(user):
@@ -27,7 +28,7 @@ def fee_payment_receipt(request, payment_id: int):
         relevant_term = payment.fee_assignment.term
     if not relevant_term:
         pay_date = payment.payment_date.date() if payment.payment_date else timezone.now().date()
-        relevant_term = Term.objects.filter(start_date__lte=pay_date, end_date__gte=pay_date).order_by('start_date').first()
+        relevant_term = academic_calendar.current_term(pay_date)
 
     # Fetch all fee assignments for the student's class in that term
     assignments = FeeAssignment.objects.select_related('fee_category', 'class_group', 'term').filter(
@@ -35,21 +36,23 @@ def fee_payment_receipt(request, payment_id: int):
         term=relevant_term
     )
 
+    # Approved payments made BEFORE this one, per assignment, in one grouped query
+    paid_before_map = dict(
+        FeePayment.objects.filter(
+            student=student,
+            fee_assignment__in=assignments,
+            status='approved',
+            payment_date__lt=payment.payment_date,
+        ).values_list('fee_assignment_id').annotate(total=Sum('amount_paid'))
+    )
+
     rows = []
     assigned_total = 0
     paid_total_after = 0
     balance_total = 0
 
     for fa in assignments:
-        # Sum approved payments BEFORE this payment timestamp for this assignment
-        paid_before = (
-            FeePayment.objects.filter(
-                student=student,
-                fee_assignment=fa,
-                status='approved',
-                payment_date__lt=payment.payment_date,
-            ).aggregate(total=Sum('amount_paid'))['total'] or 0
-        )
+        paid_before = paid_before_map.get(fa.id) or 0
         # Allocation of this payment to this assignment
         this_alloc = payment.amount_paid if payment.fee_assignment_id == fa.id else 0
         paid_after = paid_before + this_alloc
@@ -66,7 +69,11 @@ def fee_payment_receipt(request, payment_id: int):
             'balance': balance,
         })
 
-    settings = SiteSettings.objects.first()
+    # Balance brought forward from earlier terms, read from the StudentBalance ledger
+    ledger = fee_ledger.balance_for(student, relevant_term) if relevant_term else None
+    brought_forward = float(ledger.carried_forward) if ledger else 0
+
+    settings = get_site_settings()
     context = {
         'payment': payment,
         'site_settings': settings,
@@ -75,6 +82,8 @@ def fee_payment_receipt(request, payment_id: int):
         'assigned_total': assigned_total,
         'paid_total_after': paid_total_after,
         'balance_total': balance_total,
+        'brought_forward': brought_forward,
+        'total_outstanding': brought_forward + balance_total,
         'relevant_term': relevant_term,
     }
     template_name = 'receipts/fee_payment_receipt.html'
@@ -90,7 +99,7 @@ def pocket_money_receipt(request, transaction_id: int):
         PocketMoney.objects.select_related('student__user', 'student__class_group', 'processed_by'),
         id=transaction_id,
     )
-    settings = SiteSettings.objects.first()
+    settings = get_site_settings()
     context = {
         'transaction': txn,
         'site_settings': settings,
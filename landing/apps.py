@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LandingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'landing'
+
+    def ready(self):
+        # Import signals so they are registered
+        import landing.signals  # noqa: F401
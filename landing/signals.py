@@ -0,0 +1,18 @@
+import logging
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import SiteSettings
+from . import site_settings
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def invalidate_site_settings(sender, **kwargs):
+    try:
+        site_settings.invalidate()
+    except Exception as e:
+        logger.warning("SiteSettings cache invalidation failed: %s", e)
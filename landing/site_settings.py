@@ -0,0 +1,35 @@
+"""Cached accessor for the SiteSettings singleton.
+
+Every request renders templates that need the settings row, so reads are served
+from a per-process memo. A version number in the shared cache tells each process
+when its memo is stale; saving or deleting SiteSettings bumps it (see
+landing.signals), so the hot path costs one cache get and no database query.
+"""
+import threading
+
+from core.services import cache_versions
+
+from .models import SiteSettings
+
+VERSION_KEY = cache_versions.register("site_settings:version")
+
+_lock = threading.Lock()
+_memo = {'version': None, 'value': None}
+
+
+def get_site_settings():
+    """Return the current SiteSettings (or None if none exist yet). Treat it as read-only."""
+    version = cache_versions.current(VERSION_KEY)
+    if version is not None and _memo['version'] == version:
+        return _memo['value']
+    with _lock:
+        value = SiteSettings.objects.order_by('-updated_at').first()
+        _memo['version'] = version
+        _memo['value'] = value
+    return value
+
+
+def invalidate():
+    """Make every process reload SiteSettings on its next read."""
+    cache_versions.bump(VERSION_KEY)
+    _memo['version'] = None
@@ -1,9 +1,10 @@
 from django.shortcuts import render
-from .models import SiteSettings, GalleryImage, Category
+from .models import GalleryImage, Category
+from .site_settings import get_site_settings
 
 def landing_page(request):
     # Fetch singleton settings (or use defaults if none exist yet)
-    settings = SiteSettings.objects.order_by('-updated_at').first()
+    settings = get_site_settings()
     context = {
         'school_name': getattr(settings, 'school_name', 'Greenwood High'),
         'school_aim': getattr(settings, 'school_aim', 'To nurture and inspire every student to reach their full potential.'),